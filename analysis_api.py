@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+API d'analyse sans interface graphique (n'importe ni tkinter ni, hors téléchargement, aiohttp).
+
+Entrées : position et vaisseau (PlayerContext), filtres (AnalysisFilters) et instantané des jeux de
+données (DataSnapshot). Sorties : résultats typés (dataclasses, to_dict() pour le JSON).
+Les moteurs d'optimizer_logic / shipyard_logic / outfitting_logic reçoivent tout en paramètre :
+aucun réglage global n'est relu pendant le calcul. Utilisée par l'onglet Analyse et par
+la ligne de commande (`python -m optimizer_cli`).
+"""
+import logging
+import math
+from dataclasses import dataclass, field, asdict, fields
+
+from constants import (
+    DEFAULT_RADIUS, DEFAULT_MAX_AGE_DAYS, DEFAULT_MAX_STATION_DISTANCE_LS,
+    DEFAULT_INCLUDE_PLANETARY, DEFAULT_INCLUDE_FLEET_CARRIERS,
+    DEFAULT_MAX_STATIONS_FOR_TRADE_LOOPS, DEFAULT_MAX_GENERAL_TRADE_ROUTES, DEFAULT_TOP_N_IMPORTS_FILTER,
+    RESET_DEFAULT_SORT_OPTION,
+    KEY_RADIUS, KEY_MAX_AGE_DAYS, KEY_MAX_STATION_DISTANCE_LS, KEY_INCLUDE_PLANETARY,
+    KEY_INCLUDE_FLEET_CARRIERS, KEY_SORT_OPTION, KEY_MAX_STATIONS_FOR_TRADE_LOOPS,
+    KEY_MAX_GENERAL_TRADE_ROUTES, KEY_TOP_N_IMPORTS_FILTER, KEY_CUSTOM_JOURNAL_DIR
+)
+import dataset_manager
+import journal_parser
+import journal_state
+import optimizer_logic
+import outfitting_logic
+import settings_manager
+import shipyard_logic
+from operation_errors import OperationCancelledError
+
+logger = logging.getLogger(__name__)
+
+SORT_OPTIONS = ('d', 'b', 's') # Distance LY, bénéfice, distance LS (comme l'onglet Analyse)
+
+
+# ---- Entrées ----
+
+@dataclass
+class PlayerContext:
+    """Position et vaisseau du joueur. `pad_size` : 1/2/3, ou '?' si inconnu (pas de filtre de pad)."""
+    system: str = "?"
+    station: str = "?"
+    ship_type: str = "Unknown"
+    cargo_capacity: int = 0
+    pad_size: object = "?"
+
+    @property
+    def pad_size_int(self):
+        return int(self.pad_size) if str(self.pad_size).isdigit() else None
+
+    @property
+    def has_station(self):
+        return bool(self.station) and self.station not in ("?", "No Events")
+
+
+@dataclass
+class AnalysisFilters:
+    max_station_dist_ls: float = DEFAULT_MAX_STATION_DISTANCE_LS
+    include_planetary: bool = DEFAULT_INCLUDE_PLANETARY
+    include_fleet_carriers: bool = DEFAULT_INCLUDE_FLEET_CARRIERS
+    sort_by: str = RESET_DEFAULT_SORT_OPTION
+    radius_ly: float = DEFAULT_RADIUS
+    max_age_days: int = DEFAULT_MAX_AGE_DAYS
+    max_stations_for_round_trips: int = DEFAULT_MAX_STATIONS_FOR_TRADE_LOOPS
+    max_general_trade_routes: int = DEFAULT_MAX_GENERAL_TRADE_ROUTES
+    top_n_imports: int = DEFAULT_TOP_N_IMPORTS_FILTER
+
+    @classmethod
+    def from_settings(cls, **overrides):
+        """Filtres issus des réglages de l'application ; les arguments non None les remplacent."""
+        def _get(key, default, cast):
+            try: return cast(settings_manager.get_setting(key, default))
+            except (TypeError, ValueError): return default
+        filters = cls(
+            max_station_dist_ls=_get(KEY_MAX_STATION_DISTANCE_LS, DEFAULT_MAX_STATION_DISTANCE_LS, float),
+            include_planetary=bool(settings_manager.get_setting(KEY_INCLUDE_PLANETARY, DEFAULT_INCLUDE_PLANETARY)),
+            include_fleet_carriers=bool(settings_manager.get_setting(KEY_INCLUDE_FLEET_CARRIERS, DEFAULT_INCLUDE_FLEET_CARRIERS)),
+            sort_by=str(settings_manager.get_setting(KEY_SORT_OPTION, RESET_DEFAULT_SORT_OPTION)),
+            radius_ly=_get(KEY_RADIUS, DEFAULT_RADIUS, float),
+            max_age_days=_get(KEY_MAX_AGE_DAYS, DEFAULT_MAX_AGE_DAYS, int),
+            max_stations_for_round_trips=_get(KEY_MAX_STATIONS_FOR_TRADE_LOOPS, DEFAULT_MAX_STATIONS_FOR_TRADE_LOOPS, int),
+            max_general_trade_routes=_get(KEY_MAX_GENERAL_TRADE_ROUTES, DEFAULT_MAX_GENERAL_TRADE_ROUTES, int),
+            top_n_imports=_get(KEY_TOP_N_IMPORTS_FILTER, DEFAULT_TOP_N_IMPORTS_FILTER, int)
+        )
+        for name, value in overrides.items():
+            if value is not None:
+                setattr(filters, name, value)
+        return filters
+
+
+@dataclass
+class DataSnapshot:
+    """Jeux de données utilisés par une analyse (lecture seule, voir dataset_manager). None si absents."""
+    departure: object = None
+    local_market: object = None
+    shipyard: object = None
+    outfitting: object = None
+
+    @classmethod
+    def from_datasets(cls):
+        """Instantané des jeux de données publiés (sections décompressées à la demande, sans téléchargement)."""
+        return cls(
+            departure=dataset_manager.get_dataset(dataset_manager.DATASET_DEPARTURE),
+            local_market=dataset_manager.get_dataset(dataset_manager.DATASET_LOCAL_MARKET),
+            shipyard=dataset_manager.get_dataset(dataset_manager.DATASET_SHIPYARD),
+            outfitting=dataset_manager.get_dataset(dataset_manager.DATASET_OUTFITTING)
+        )
+
+    def departure_offers(self):
+        return list(self.departure.get('offers', [])) if self.departure else []
+
+    def has_local_market(self):
+        return bool(self.local_market and self.local_market.get('station_markets'))
+
+
+# ---- Résultats ----
+
+class _Result:
+    def to_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class MissionSourcingResult(_Result):
+    needs: dict
+    total_reward: float
+    full_options: list = field(default_factory=list) # Stations couvrant tous les besoins, triées ('cost', 'profit' ajoutés)
+    partial_options: list = field(default_factory=list)
+    complementary_sources: dict = field(default_factory=dict) # marchandise -> meilleure source restante
+
+    @property
+    def total_units(self):
+        return sum(self.needs.values())
+
+
+@dataclass
+class RoundTripResult(_Result):
+    pickup_system: str
+    pickup_station: str
+    outbound_trades: list = field(default_factory=list) # Station actuelle -> station d'achat des missions
+    return_trades: list = field(default_factory=list)
+
+    @property
+    def total_profit(self):
+        return sum(trade['total_profit'] for trade in self.outbound_trades + self.return_trades)
+
+
+@dataclass
+class GeneralTradesResult(_Result):
+    system: str
+    station: str
+    routes: list = field(default_factory=list)
+
+
+@dataclass
+class HopResult(_Result):
+    source_system: str
+    source_station: str
+    options: list = field(default_factory=list)
+
+
+@dataclass
+class StationSearchResult(_Result):
+    query: list
+    stations: list = field(default_factory=list)
+
+
+@dataclass
+class AnalysisResult(_Result):
+    player: PlayerContext
+    filters: AnalysisFilters
+    missions: MissionSourcingResult = None # None sans mission active
+    round_trips: list = field(default_factory=list)
+    general_trades: GeneralTradesResult = None # Seulement sans mission active (comme l'onglet Analyse)
+
+
+# ---- Chargement des entrées ----
+
+def resolve_journal_dir():
+    """Répertoire des journaux (réglage personnalisé, sinon détection automatique) ou None."""
+    return journal_parser.find_journal_dir(settings_manager.get_setting(KEY_CUSTOM_JOURNAL_DIR))
+
+
+def load_player_context(**overrides):
+    """
+    Position et vaisseau lus dans le journal ; les arguments non None (system, station, ship_type,
+    cargo_capacity, pad_size) les remplacent. Le journal n'est pas lu si système, station, vaisseau et soute
+    sont fournis ; la taille de pad est alors déduite du vaisseau (tailles personnalisées comprises).
+    """
+    player = PlayerContext(**{f.name: overrides[f.name] for f in fields(PlayerContext) if overrides.get(f.name) is not None})
+    if any(overrides.get(name) is None for name in ('system', 'station', 'ship_type', 'cargo_capacity')):
+        system, station, ship_type, cargo_capacity, pad_size, _journal_dir, _materials = journal_parser.get_player_state_data()
+        for name, value in (('system', system), ('station', station), ('ship_type', ship_type), ('cargo_capacity', cargo_capacity)):
+            if overrides.get(name) is None:
+                setattr(player, name, value)
+        if overrides.get('pad_size') is None and overrides.get('ship_type') is None:
+            player.pad_size = pad_size
+    if overrides.get('pad_size') is None and overrides.get('ship_type') is not None:
+        player.pad_size = journal_parser.get_ship_pad_size(player.ship_type)
+    return player
+
+
+def load_mission_needs(journal_dir=None):
+    """(besoins {marchandise: quantité}, récompense totale) des missions actives ; ({}, 0) sans journal."""
+    journal_dir = journal_dir or resolve_journal_dir()
+    if not journal_dir:
+        return {}, 0
+    return journal_state.get_mission_needs_view(journal_dir)
+
+
+async def refresh_market_data(http_session, player, filters, cancel_event=None, progress_callback=None, force_refresh=False):
+    """Met à jour les données de marché (téléchargement si périmées) puis retourne un nouvel instantané."""
+    import api_handler # Import local : seule cette fonction a besoin d'aiohttp
+    await api_handler.update_databases_if_needed(
+        http_session, player.system, player.station, filters.radius_ly, filters.max_age_days,
+        filters.include_fleet_carriers, cancel_event, progress_callback, force_refresh=force_refresh
+    )
+    return DataSnapshot.from_datasets()
+
+
+# ---- Moteurs ----
+
+def _option_cost(needs, option):
+    return sum(needs.get(name, 0) * price for name, price in option['commodities'].items())
+
+
+def source_mission_commodities(needs, total_reward, player, filters, snapshot, cancel_event=None):
+    """Stations où acheter les marchandises des missions, triées selon `filters.sort_by`."""
+    full_opts, partial_opts, complement_opts = optimizer_logic.generate_purchase_suggestions(
+        needs, snapshot.local_market, snapshot.departure, player.pad_size, filters.max_station_dist_ls,
+        filters.include_planetary, filters.include_fleet_carriers, player.system, cancel_event=cancel_event
+    )
+    return finish_mission_sourcing(needs, total_reward, full_opts, partial_opts, complement_opts, filters.sort_by)
+
+
+def finish_mission_sourcing(needs, total_reward, full_opts, partial_opts, complement_opts, sort_by):
+    """Coût / bénéfice de chaque option puis tri des options complètes (commun à l'analyse et au mode flotte)."""
+    for option in full_opts:
+        option['cost'] = _option_cost(needs, option)
+        option['profit'] = total_reward - option['cost']
+    for option in partial_opts:
+        option['cost'] = _option_cost(needs, option)
+    if sort_by == 'b':
+        full_opts.sort(key=lambda option: -option['profit'])
+    elif sort_by == 's':
+        full_opts.sort(key=lambda option: option.get('distance_ls', float('inf')))
+    else:
+        full_opts.sort(key=lambda option: option['distance_ly'])
+    return MissionSourcingResult(dict(needs), total_reward, full_opts, partial_opts, complement_opts)
+
+
+def round_trip_candidates(sourcing, limit):
+    """Stations d'achat (sans doublon) pour lesquelles chercher des échanges aller-retour."""
+    candidates, seen = [], set()
+    for option in sourcing.full_options or sourcing.partial_options:
+        if len(seen) >= limit:
+            break
+        key = (option['system_name'], option['station_name'])
+        if key not in seen:
+            candidates.append(option); seen.add(key)
+    return candidates
+
+
+async def find_round_trip(pickup_system, pickup_station, mission_units, player, filters, snapshot, http_session=None, cancel_event=None):
+    """Échanges aller (station actuelle -> station d'achat) et retour. Sans session HTTP : données en cache seulement."""
+    station_markets = snapshot.local_market.get('station_markets', {}) if snapshot.local_market else {}
+    pickup_is_current = pickup_system == player.system and pickup_station == player.station
+    pickup_offers = None
+    if not pickup_is_current and pickup_station in station_markets.get(pickup_system, {}).get('stations_data', {}):
+        pickup_offers = station_markets[pickup_system]['stations_data'][pickup_station].get('sells_to_player', [])
+    elif pickup_is_current and snapshot.departure:
+        pickup_offers = [{'commodityName': o.get('commodityName'), 'commodity_localised': o.get('commodity_localised', o.get('commodityName')), 'price': o.get('buyPrice', 0), 'stock': o.get('stock', 0), 'quantity_at_station': o.get('stock', 0)}
+                         for o in snapshot.departure.get('offers', []) if o.get('buyPrice', 0) > 0 and o.get('stock', 0) > 0]
+    elif http_session is not None:
+        import api_handler
+        pickup_offers = await api_handler.get_station_specific_market_data(
+            http_session, pickup_system, pickup_station, max_days_ago=filters.max_age_days,
+            include_fleet_carriers=filters.include_fleet_carriers, player_action='buy', cancel_event=cancel_event
+        )
+    outbound_trades, return_trades = await optimizer_logic.suggest_round_trip_opportunities(
+        http_session, player.system, player.station, pickup_system, pickup_station, mission_units,
+        player.cargo_capacity, snapshot.departure_offers(), pickup_offers or [], snapshot.local_market,
+        filters.max_age_days, filters.include_fleet_carriers, cancel_event=cancel_event
+    )
+    return RoundTripResult(pickup_system, pickup_station, outbound_trades, return_trades)
+
+
+async def find_round_trips(sourcing, player, filters, snapshot, http_session=None, cancel_event=None):
+    results = []
+    for option in round_trip_candidates(sourcing, filters.max_stations_for_round_trips):
+        if cancel_event and cancel_event.is_set():
+            raise OperationCancelledError("Round trip search cancelled.")
+        results.append(await find_round_trip(option['system_name'], option['station_name'], sourcing.total_units,
+                                             player, filters, snapshot, http_session, cancel_event))
+    return results
+
+
+async def find_general_trades(player, filters, snapshot, http_session=None, cancel_event=None):
+    """Meilleures routes commerciales autour de la station actuelle (sans mission)."""
+    routes = await optimizer_logic.find_general_market_trades(
+        http_session, player.system, player.station, snapshot.departure_offers(), snapshot.local_market,
+        player.cargo_capacity, filters.max_station_dist_ls, filters.include_planetary, filters.include_fleet_carriers,
+        player.pad_size_int, filters.max_age_days, filters.include_fleet_carriers, cancel_event=cancel_event,
+        max_routes_to_display=filters.max_general_trade_routes, top_n_imports_filter=filters.top_n_imports
+    )
+    return GeneralTradesResult(player.system, player.station, routes[:filters.max_general_trade_routes])
+
+
+def station_exports(system_name, station_name, snapshot):
+    """Ce que la station vend (données de départ si c'est la station de départ, sinon cache local)."""
+    departure = snapshot.departure
+    if departure and departure.get("system") == system_name and departure.get("station") == station_name:
+        return list(departure.get("offers", []))
+    station_markets = snapshot.local_market.get("station_markets", {}) if snapshot.local_market else {}
+    station_data = station_markets.get(system_name, {}).get("stations_data", {}).get(station_name)
+    return list(station_data.get("sells_to_player", [])) if station_data else []
+
+
+async def plan_next_hop(source_system, source_station, player, filters, snapshot, max_ly_per_hop=None, http_session=None, cancel_event=None):
+    """Meilleures ventes depuis une station source (planificateur multi-sauts)."""
+    options = await optimizer_logic.find_best_outbound_trades_for_hop(
+        http_session, source_system, source_station, player.cargo_capacity, player.pad_size_int,
+        max_ly_per_hop if max_ly_per_hop is not None else filters.radius_ly, filters.max_station_dist_ls,
+        filters.include_planetary, filters.include_fleet_carriers,
+        station_exports(source_system, source_station, snapshot), snapshot.local_market, cancel_event=cancel_event
+    )
+    return HopResult(source_system, source_station, options or [])
+
+
+def _system_coords(system_name, *datasets_and_keys):
+    for data, systems_key in datasets_and_keys:
+        if data and system_name in data.get(systems_key, {}):
+            coords = data[systems_key][system_name].get("coords")
+            if coords:
+                return coords
+    return None
+
+
+def find_ship(ship_name, player, filters, snapshot, max_distance_ly=None):
+    """Stations vendant `ship_name` (nom affiché ou nom EDSM)."""
+    coords = _system_coords(player.system, (snapshot.shipyard, "systems_with_shipyards"), (snapshot.outfitting, "systems_with_outfitting"))
+    ship_index = dataset_manager.get_index(dataset_manager.DATASET_SHIPYARD, "ship_systems", shipyard_logic.build_ship_systems_index) \
+        if snapshot.shipyard is dataset_manager.get_dataset(dataset_manager.DATASET_SHIPYARD) else None
+    stations = shipyard_logic.find_stations_selling_ship(
+        ship_name_to_find=ship_name, all_shipyard_data=snapshot.shipyard, current_player_system_coords=coords,
+        max_distance_ly_filter=max_distance_ly, include_planetary=filters.include_planetary,
+        include_fleet_carriers=filters.include_fleet_carriers, max_station_dist_ls=filters.max_station_dist_ls,
+        ship_systems_index=ship_index
+    )
+    return StationSearchResult([ship_name], stations)
+
+
+def find_modules(module_ids, player, filters, snapshot, max_distance_ly=None):
+    """Stations vendant tous les modules `module_ids` (symboles en minuscules)."""
+    coords = _system_coords(player.system, (snapshot.outfitting, "systems_with_outfitting"), (snapshot.shipyard, "systems_with_shipyards"))
+    module_index = dataset_manager.get_index(dataset_manager.DATASET_OUTFITTING, "module_systems", outfitting_logic.build_module_systems_index) \
+        if snapshot.outfitting is dataset_manager.get_dataset(dataset_manager.DATASET_OUTFITTING) else None
+    stations = outfitting_logic.find_stations_with_modules(
+        [module_id.lower() for module_id in module_ids], snapshot.outfitting, current_player_system_coords=coords,
+        max_distance_ly_filter=max_distance_ly, include_planetary=filters.include_planetary,
+        include_fleet_carriers=filters.include_fleet_carriers, max_station_dist_ls=filters.max_station_dist_ls,
+        module_systems_index=module_index
+    )
+    return StationSearchResult(list(module_ids), stations)
+
+
+async def run_analysis(player, filters, snapshot, needs=None, total_reward=0, http_session=None, cancel_event=None):
+    """
+    Analyse complète de l'onglet Analyse : approvisionnement des missions et allers-retours,
+    ou, sans mission active, routes commerciales générales.
+    """
+    result = AnalysisResult(player, filters)
+    if needs:
+        result.missions = source_mission_commodities(needs, total_reward, player, filters, snapshot, cancel_event)
+        result.round_trips = await find_round_trips(result.missions, player, filters, snapshot, http_session, cancel_event)
+    elif snapshot.departure or snapshot.has_local_market():
+        result.general_trades = await find_general_trades(player, filters, snapshot, http_session, cancel_event)
+    else:
+        logger.warning("Headless analysis: no market data available for general trade search.")
+    return result
+
+
+def json_safe(value):
+    """Valeurs compatibles JSON strict : infinis/NaN -> None, ensembles et tuples -> listes, Mapping -> dict."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, _Result) or hasattr(value, '__dataclass_fields__'):
+        value = asdict(value)
+    if isinstance(value, dict) or hasattr(value, 'items'):
+        return {str(key): json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [json_safe(item) for item in value]
+    return value
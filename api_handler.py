@@ -1,9 +1,8 @@
 #!/usr/bin/env python3
 import asyncio
 import aiohttp
-import json
-import os
 import logging
+import time
 from datetime import datetime, timezone
 from collections import defaultdict
 import threading
@@ -13,35 +12,56 @@ from constants import (
     DEPARTURE_DATA_FILE, LOCAL_SELLERS_DATA_FILE,
     FLEET_CARRIER_STATION_TYPES # Bien que non utilisé ici, il est bon de savoir qu'il existe pour optimizer_logic
 )
+import dataset_manager
+import http_recorder
+import perf_metrics
+import perf_trace
+import market_region_cache
+import price_history
 
-logger = logging.getLogger(__name__)
+from operation_errors import OperationCancelledError # Ré-exportée : api_handler.OperationCancelledError
 
-class OperationCancelledError(Exception):
-    """Exception personnalisée pour les opérations annulées."""
-    pass
+logger = logging.getLogger(__name__)
 
+@perf_trace.traced("api.ardent")
+@perf_metrics.tracked_request("ardent")
 async def fetch_json(session, url, params: dict = None, cancel_event: threading.Event = None):
     if cancel_event and cancel_event.is_set():
         logger.info(f"Operation cancelled before fetching {url}")
         raise OperationCancelledError(f"Fetching URL cancelled: {url}")
 
     log_params = f" with params: {params}" if params else ""
+    perf_trace.annotate(url=url)
+    if http_recorder.is_replaying(): # Session enregistrée : aucune requête réseau
+        data = await http_recorder.replay_fetch(http_recorder.SERVICE_ARDENT, url, params)
+        if cancel_event and cancel_event.is_set():
+            raise OperationCancelledError(f"Fetching URL cancelled: {url}")
+        return data
     logger.debug(f"Fetching URL: {url}{log_params}")
+    started = time.monotonic()
     try:
         async with session.get(url, headers=HEADERS, params=params, timeout=aiohttp.ClientTimeout(total=45)) as response: # Timeout augmenté
             if cancel_event and cancel_event.is_set():
                 logger.info(f"Operation cancelled during fetching {url}")
                 raise OperationCancelledError(f"Fetching URL cancelled: {url}")
             response.raise_for_status()
-            return await response.json()
+            data = await response.json()
+            perf_trace.annotate(status=response.status)
+            http_recorder.record_exchange(http_recorder.SERVICE_ARDENT, url, params, started, response.status, data)
+            return data
     except aiohttp.ClientResponseError as e:
         logger.error(f"API ClientResponseError for {url}{log_params}: {e.status} {e.message}")
+        perf_trace.annotate(status=e.status)
+        http_recorder.record_exchange(http_recorder.SERVICE_ARDENT, url, params, started, e.status, error={
+            "kind": "content_type" if isinstance(e, aiohttp.ContentTypeError) else "http", "message": e.message, "headers": dict(e.headers or {})})
         raise
     except aiohttp.ClientConnectorError as e:
         logger.error(f"API ClientConnectorError for {url}{log_params}: {e}")
+        http_recorder.record_exchange(http_recorder.SERVICE_ARDENT, url, params, started, None, error={"kind": "connection", "message": e.strerror or str(e), "errno": e.errno})
         raise
     except asyncio.TimeoutError:
         logger.error(f"API Timeout (45s) for {url}{log_params}")
+        http_recorder.record_exchange(http_recorder.SERVICE_ARDENT, url, params, started, None, error={"kind": "timeout", "message": "Timeout (45s)"})
         raise
     except OperationCancelledError:
         raise
@@ -50,6 +70,7 @@ async def fetch_json(session, url, params: dict = None, cancel_event: threading.
         raise
 
 
+@perf_trace.traced("db.departure_download")
 async def download_departure_market_data(
     system_name,
     station_name,
@@ -116,8 +137,9 @@ async def download_departure_market_data(
                 "offers": list(offers.values()),
                 "updatedAt": datetime.now(timezone.utc).isoformat()
             }
-            with open(DEPARTURE_DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(departure_data, f, indent=2)
+            # Publié immédiatement, écrit sur disque en arrière-plan
+            dataset_manager.save_dataset(dataset_manager.DATASET_DEPARTURE, departure_data, counts={"offers": len(departure_data["offers"])})
+            price_history.record_departure_market(departure_data)
             logger.info(f"Raw (unfiltered by client at save time) departure market data for {station_name} saved to {DEPARTURE_DATA_FILE}.")
             if progress_callback: progress_callback("Starting data saved.", 100)
             return departure_data
@@ -129,13 +151,15 @@ async def download_departure_market_data(
             return None
 
 
+@perf_trace.traced("db.local_market_download")
 async def download_local_sellers_data(
     system_name,
     radius_ly,
     max_days_ago: int,                 # Non utilisé pour l'appel API, conservé pour info
     include_fleet_carriers: bool,    # Non utilisé pour l'appel API, conservé pour info
     cancel_event: threading.Event = None,
-    progress_callback=None
+    progress_callback=None,
+    previous_data=None               # Région en cache : ses systèmes encore frais (< max_days_ago) sont repris tels quels
 ):
     if cancel_event and cancel_event.is_set(): raise OperationCancelledError("Local sellers data download cancelled.")
     if not system_name or "?" in system_name or "Journal not found" in system_name or "Error" in system_name:
@@ -156,14 +180,40 @@ async def download_local_sellers_data(
             
             if progress_callback: progress_callback(f"{len(nearby_systems_list)} nearby systems found.", 10)
 
+            now_iso = datetime.now(timezone.utc).isoformat()
             local_market_overview = {
                 "sourceSystem": system_name, "radius": radius_ly,
-                "systems": {s['systemName']: {'distance': s['distance']} for s in nearby_systems_list if 'systemName' in s and 'distance' in s},
+                "systems": {s['systemName']: {'distance': s['distance'], 'fetchedAt': None} for s in nearby_systems_list if 'systemName' in s and 'distance' in s},
                 "station_markets": {},
-                "updatedAt": datetime.now(timezone.utc).isoformat()
+                "updatedAt": now_iso
             }
+
+            # Remise à niveau : on reprend les systèmes de la région en cache téléchargés il y a moins de max_days_ago
+            reused_systems_count = 0
+            if previous_data:
+                previous_systems = previous_data.get('systems', {})
+                previous_markets = previous_data.get('station_markets', {})
+                for sys_name, sys_info in local_market_overview['systems'].items():
+                    previous_info = previous_systems.get(sys_name) or {}
+                    # fetchedAt vide : échec lors du téléchargement précédent, à retenter ; absent : ancienne région, datée par updatedAt
+                    fetched_at = previous_info['fetchedAt'] if 'fetchedAt' in previous_info else (previous_data.get('updatedAt') if sys_name in previous_systems else None)
+                    fetched_dt = datetime.fromisoformat(fetched_at.replace('Z', '+00:00')) if fetched_at else None
+                    if fetched_dt is None or (datetime.now(timezone.utc) - fetched_dt).total_seconds() >= max_days_ago * 86400:
+                        continue
+                    sys_info['fetchedAt'] = fetched_at
+                    if sys_name in previous_markets:
+                        local_market_overview['station_markets'][sys_name] = {
+                            'distance': sys_info['distance'],
+                            'stations_data': previous_markets[sys_name].get('stations_data', {})
+                        }
+                    reused_systems_count += 1
+                logger.info(f"Region top-up for {system_name}: {reused_systems_count}/{len(local_market_overview['systems'])} systems still fresh, reused from cache.")
+
+            systems_to_fetch = [name for name, info in local_market_overview['systems'].items() if info['fetchedAt'] is None]
+            fetched_systems = set()
             semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
-            total_systems_to_fetch = len(local_market_overview['systems'])
+            perf_metrics.set_gauge(perf_metrics.HTTP_CONCURRENCY_LIMIT, CONCURRENCY_LIMIT, "local_market")
+            total_systems_to_fetch = len(systems_to_fetch)
             processed_systems_count = 0
 
             async def fetch_full_market_for_system(sys_name_to_fetch, current_progress_base):
@@ -231,13 +281,13 @@ async def download_local_sellers_data(
                         raise
                     except Exception as fetch_exc:
                         logger.warning(f"Failed to fetch full market data for {sys_name_to_fetch}: {fetch_exc}")
-                        return sys_name_to_fetch, {}
+                        return sys_name_to_fetch, None # Échec : fetchedAt reste vide, le système sera retenté
 
             tasks = []
             current_progress_base = 10
             progress_per_system = (90 - current_progress_base) / total_systems_to_fetch if total_systems_to_fetch > 0 else 0
 
-            for i, name in enumerate(local_market_overview['systems'].keys()):
+            for i, name in enumerate(systems_to_fetch):
                  tasks.append(fetch_full_market_for_system(name, current_progress_base + (i * progress_per_system)))
             
             markets_processed_count = 0
@@ -254,6 +304,10 @@ async def download_local_sellers_data(
                     current_iter_progress = current_progress_base + (processed_systems_count * progress_per_system)
                     progress_callback(f"Local data: {system_name_result} ({processed_systems_count}/{total_systems_to_fetch})", int(current_iter_progress))
 
+                if system_market_data_result is not None:
+                    local_market_overview['systems'][system_name_result]['fetchedAt'] = now_iso
+                    fetched_systems.add(system_name_result)
+
                 if system_market_data_result:
                     # On stocke toutes les stations qui ont au moins une offre (achat ou vente)
                     filtered_station_data = {
@@ -270,10 +324,16 @@ async def download_local_sellers_data(
                         logger.debug(f"No market data kept for system {system_name_result} (all stations empty).")
 
 
-            logger.info(f"Full local market data (unfiltered by client at save time) for {markets_processed_count}/{len(local_market_overview['systems'])} nearby systems saved.")
+            fetched_at_values = [info['fetchedAt'] for info in local_market_overview['systems'].values() if info['fetchedAt']]
+            local_market_overview['oldestFetchedAt'] = min(fetched_at_values, key=lambda v: datetime.fromisoformat(v.replace('Z', '+00:00'))) if fetched_at_values else now_iso
+
+            logger.info(f"Full local market data (unfiltered by client at save time) for {markets_processed_count}/{total_systems_to_fetch} fetched systems saved ({reused_systems_count} reused from the region cache).")
             if progress_callback: progress_callback("Local data saved.", 100)
-            with open(LOCAL_SELLERS_DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(local_market_overview, f, indent=2)
+            counts = {"systems": len(local_market_overview['systems']),
+                      "stations": sum(len(sys_data.get('stations_data', {})) for sys_data in local_market_overview['station_markets'].values())}
+            dataset_manager.save_dataset(dataset_manager.DATASET_LOCAL_MARKET, local_market_overview, counts=counts) # Publié immédiatement, écrit sur disque en arrière-plan
+            market_region_cache.store_region(local_market_overview, counts=counts)
+            price_history.record_local_market(local_market_overview, systems=fetched_systems)
             return local_market_overview
         except OperationCancelledError:
             logger.info("Local sellers data download was cancelled.")
@@ -283,6 +343,7 @@ async def download_local_sellers_data(
             if progress_callback: progress_callback(f"Erreur: {e}", 100)
             return None
 
+@perf_trace.traced("db.update")
 async def update_databases_if_needed(
     http_session, 
     current_system,
@@ -307,20 +368,23 @@ async def update_databases_if_needed(
     refresh_departure = True
     if force_refresh:
         logger.info("Forcing refresh of departure data due to user request.")
-    elif os.path.exists(DEPARTURE_DATA_FILE) and current_station and current_station != "?":
+    elif dataset_manager.dataset_exists(dataset_manager.DATASET_DEPARTURE) and current_station and current_station != "?":
         try:
-            with open(DEPARTURE_DATA_FILE, 'r', encoding='utf-8') as f: data = json.load(f)
-            updated_at_str = data.get('updatedAt')
+            meta = (dataset_manager.get_dataset_header(dataset_manager.DATASET_DEPARTURE) or {}).get("meta", {}) # En-tête seul : pas de décompression
+            updated_at_str = meta.get('updatedAt')
             if updated_at_str:
                 updated_at = datetime.fromisoformat(updated_at_str.replace('Z', '+00:00'))
                 age_seconds = (datetime.now(timezone.utc) - updated_at).total_seconds()
-                if data.get('system') == current_system and data.get('station') == current_station and age_seconds < (max_age_days_param * 86400):
-                    departure_market_json = data; refresh_departure = False
+                if meta.get('system') == current_system and meta.get('station') == current_station and age_seconds < (max_age_days_param * 86400):
+                    departure_market_json = dataset_manager.get_dataset(dataset_manager.DATASET_DEPARTURE)
+                    refresh_departure = departure_market_json is None
                     logger.info(f"Using recent departure data from {DEPARTURE_DATA_FILE}.")
                     if progress_callback_main: progress_callback_main("Recent departure data found.", 5)
                 else: logger.info(f"Departure data is old (age {age_seconds/86400:.1f}d > {max_age_days_param}d), or for a different station/system. Will refresh.")
             else: logger.info("Departure data cache is missing 'updatedAt'. Will refresh.")
         except Exception as e_cache: logger.warning(f"Error reading departure cache {DEPARTURE_DATA_FILE} ({e_cache}), will refresh.")
+    if current_station and current_station != "?":
+        perf_trace.count_cache("departure", not refresh_departure)
 
     if cancel_event and cancel_event.is_set(): raise OperationCancelledError("Database update cancelled.")
 
@@ -333,10 +397,8 @@ async def update_databases_if_needed(
             cancel_event=cancel_event,
             progress_callback=create_prefixed_callback("Start", progress_callback_main, 0, 10)
         )
-    elif (not current_station or current_station == "?") and os.path.exists(DEPARTURE_DATA_FILE):
-        try:
-            with open(DEPARTURE_DATA_FILE, 'r', encoding='utf-8') as f: departure_market_json = json.load(f)
-        except: pass 
+    elif (not current_station or current_station == "?") and dataset_manager.dataset_exists(dataset_manager.DATASET_DEPARTURE):
+        departure_market_json = dataset_manager.get_dataset(dataset_manager.DATASET_DEPARTURE)
     elif not current_station or current_station == "?":
          logger.info("Skipping departure data refresh: current station is unknown.")
 
@@ -346,43 +408,61 @@ async def update_databases_if_needed(
     refresh_local = True
     if force_refresh:
         logger.info("Forcing refresh of local sellers data due to user request.")
-    elif os.path.exists(LOCAL_SELLERS_DATA_FILE) and current_system and current_system != "?":
+    elif dataset_manager.dataset_exists(dataset_manager.DATASET_LOCAL_MARKET) and current_system and current_system != "?":
         try:
-            with open(LOCAL_SELLERS_DATA_FILE, 'r', encoding='utf-8') as f: data = json.load(f)
-            if "station_markets" not in data or "systems" not in data: 
-                logger.info("Old or incompatible local_sellers_data.json structure detected. Forcing refresh.")
+            header = dataset_manager.get_dataset_header(dataset_manager.DATASET_LOCAL_MARKET) # En-tête seul : pas de décompression
+            if not header or header.get("sectionsKey") != "station_markets": 
+                logger.info(f"Missing or incompatible {LOCAL_SELLERS_DATA_FILE} snapshot detected. Forcing refresh.")
             else: 
-                updated_at_str = data.get('updatedAt')
+                meta = header["meta"]
+                updated_at_str = meta.get('updatedAt')
                 if updated_at_str:
-                    updated_at = datetime.fromisoformat(updated_at_str.replace('Z', '+00:00'))
-                    age_seconds = (datetime.now(timezone.utc) - updated_at).total_seconds()
-                    if data.get('sourceSystem') == current_system and data.get('radius', 0) >= radius_val and age_seconds < (max_age_days_param * 86400):
-                        local_market_json_new_structure = data; refresh_local = False
-                        logger.info(f"Using recent local data (new structure) from {LOCAL_SELLERS_DATA_FILE} (radius {data.get('radius',0)} LY).")
+                    age_seconds = market_region_cache.region_age_seconds(meta) # Âge du système le plus ancien de la sphère
+                    if meta.get('sourceSystem') == current_system and meta.get('radius', 0) >= radius_val and age_seconds < (max_age_days_param * 86400):
+                        local_market_json_new_structure = dataset_manager.get_dataset(dataset_manager.DATASET_LOCAL_MARKET) # Pas de relecture si inchangé
+                        refresh_local = local_market_json_new_structure is None
+                        logger.info(f"Using recent local data (new structure) from {LOCAL_SELLERS_DATA_FILE} (radius {meta.get('radius',0)} LY, {header['counts'].get('stations', '?')} stations).")
                         if progress_callback_main: progress_callback_main("Données locales récentes trouvées.", 15)
-                    else: logger.info(f"Local data (new structure) is old (age {age_seconds/86400:.1f}d > {max_age_days_param}d), different system, or insufficient radius ({data.get('radius',0)} < {radius_val}). Will refresh.")
+                    else: logger.info(f"Local data (new structure) is old (age {age_seconds/86400:.1f}d > {max_age_days_param}d), different system, or insufficient radius ({meta.get('radius',0)} < {radius_val}). Will refresh.")
                 else: logger.info("Local data cache (new structure) is missing 'updatedAt'. Will refresh.")
         except Exception as e_cache: logger.warning(f"Error reading local cache {LOCAL_SELLERS_DATA_FILE} ({e_cache}), will refresh.")
 
+    # Cache de régions : une sphère fraîche est réactivée sans téléchargement, une sphère périmée sert de base à une remise à niveau
+    previous_region_data, download_radius = None, radius_val
+    if refresh_local and not force_refresh and current_system and current_system != "?":
+        with perf_trace.span("db.region_cache"):
+            try:
+                market_region_cache.adopt_active_snapshot() # Garde la sphère active avant qu'elle ne soit remplacée
+                region = market_region_cache.find_region_any_radius(current_system)
+                if region and region.get('radius', 0) >= radius_val and market_region_cache.region_age_seconds(region) < (max_age_days_param * 86400):
+                    local_market_json_new_structure = market_region_cache.activate_region(current_system)
+                    refresh_local = local_market_json_new_structure is None
+                    if not refresh_local and progress_callback_main: progress_callback_main("Données locales récentes trouvées (cache de régions).", 15)
+                elif region:
+                    previous_region_data = market_region_cache.load_region(current_system)
+                    download_radius = max(radius_val, region.get('radius', 0))
+                    logger.info(f"Cached market region for {current_system} (radius {region.get('radius')} LY) is stale or too small, topping it up.")
+            except Exception as e_region: logger.warning(f"Error reading the market region cache ({e_region}), will download the full sphere.")
+        perf_trace.count_cache("market_region", not refresh_local)
+    if current_system and current_system != "?":
+        perf_trace.count_cache("local_market", not refresh_local)
 
     if cancel_event and cancel_event.is_set(): raise OperationCancelledError("Database update cancelled.")
 
     if refresh_local and current_system and current_system != "?":
-        logger.info(f"Refreshing local data for {current_system} (radius {radius_val} LY).")
+        logger.info(f"Refreshing local data for {current_system} (radius {download_radius} LY).")
         local_market_json_new_structure = await download_local_sellers_data(
-            current_system, radius_val,
+            current_system, download_radius,
             max_days_ago=max_age_days_param,
             include_fleet_carriers=include_fleet_carriers_val,
             cancel_event=cancel_event,
-            progress_callback=create_prefixed_callback("Local", progress_callback_main, 10, 100)
+            progress_callback=create_prefixed_callback("Local", progress_callback_main, 10, 100),
+            previous_data=previous_region_data
         )
-    elif (not current_system or current_system == "?") and os.path.exists(LOCAL_SELLERS_DATA_FILE):
-        try:
-            with open(LOCAL_SELLERS_DATA_FILE, 'r', encoding='utf-8') as f:
-                loaded_data = json.load(f)
-                if "station_markets" in loaded_data:
-                    local_market_json_new_structure = loaded_data
-        except: pass
+    elif (not current_system or current_system == "?") and dataset_manager.dataset_exists(dataset_manager.DATASET_LOCAL_MARKET):
+        loaded_data = dataset_manager.get_dataset(dataset_manager.DATASET_LOCAL_MARKET)
+        if loaded_data and "station_markets" in loaded_data:
+            local_market_json_new_structure = loaded_data
     elif not current_system or current_system == "?":
         logger.info("Skipping local data refresh: current system is unknown.")
 
@@ -0,0 +1,5 @@
+"""
+Outils de mesure des performances (hors application) : galaxie synthétique et micro-benchmarks.
+
+À lancer depuis la racine du dépôt, ex. `python -m benchmarks.run_benchmarks --scale small`.
+"""
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Banc de mesure hors ligne des téléchargements : download_local_sellers_data (Ardent),
+download_regional_shipyard_data et download_regional_outfitting_data (EDSM), contre mock_services.
+
+    python -m benchmarks.download_benchmark --scale small --latency-ms 40 --jitter-ms 20
+    python -m benchmarks.download_benchmark --error-rate 0.05 --rate-limit 30 --json report.json
+
+Pour chaque téléchargement : temps total, requêtes servies et requêtes/s, réponses par code HTTP,
+puis complétude face à la galaxie de référence. Le marché local est relancé avec la région
+précédente (previous_data) tant qu'il manque des systèmes, jusqu'à --max-passes : le nombre de
+passes et les requêtes supplémentaires mesurent la reprise après erreurs. Les jeux de données sont
+écrits dans un dossier de travail temporaire (--work-dir), jamais dans celui de l'application.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import api_handler
+import outfitting_db_manager
+import price_history
+import shipyard_db_manager
+import snapshot_store
+from benchmarks import mock_services, synthetic_galaxy
+
+logger = logging.getLogger(__name__)
+
+CRAWLERS = ("local_market", "shipyard", "outfitting")
+DEFAULT_MAX_PASSES = 3
+DEFAULT_RADIUS_LY = 60.0
+
+
+def _market_stations(local_market):
+    return {(system_name, station_name): (len(station["sells_to_player"]), len(station["buys_from_player"]))
+            for system_name, system_market in (local_market or {}).get("station_markets", {}).items()
+            for station_name, station in system_market.get("stations_data", {}).items()}
+
+
+def _regional_stations(data, systems_key, items_key):
+    return {(system_name, station["stationName"]): len(station.get(items_key, []))
+            for system_name, system in (data or {}).get(systems_key, {}).items() for station in system.get("stations", [])}
+
+
+def completeness(expected, got):
+    """Part des stations attendues retrouvées à l'identique (même nombre d'offres, de vaisseaux ou de modules)."""
+    matched = sum(1 for key, value in expected.items() if got.get(key) == value)
+    return {"expected_stations": len(expected), "matched_stations": matched, "missing_stations": len(expected) - matched,
+            "ratio": round(matched / len(expected), 4) if expected else 1.0}
+
+
+def _pass_report(server, wall_s, result_completeness):
+    stats = server.stats.snapshot()
+    return {"wall_s": round(wall_s, 3), "requests": stats["requests"],
+            "requests_per_s": round(stats["requests"] / wall_s, 1) if wall_s > 0 else 0.0,
+            "by_status": stats["by_status"], "peak_in_flight": stats["peak_in_flight"],
+            "bytes_received": stats["bytes_sent"], "completeness": result_completeness}
+
+
+def run_local_market(server, galaxy, radius_ly, max_passes):
+    center = galaxy["center_system"]
+    expected = _market_stations(synthetic_galaxy.local_market_data(galaxy, center, radius_ly))
+    passes = []
+    previous = None
+    for _ in range(max_passes):
+        server.stats.reset()
+        start = time.perf_counter()
+        # max_days_ago=1 : les systèmes déjà téléchargés (fetchedAt renseigné) sont repris, les autres retentés
+        result = asyncio.run(api_handler.download_local_sellers_data(center, radius_ly, 1, True, previous_data=previous))
+        wall_s = time.perf_counter() - start
+        if result is None: # Liste des systèmes en échec : la région précédente reste en place
+            passes.append({**_pass_report(server, wall_s, completeness(expected, _market_stations(previous))), "failed": True})
+            continue
+        passes.append(_pass_report(server, wall_s, completeness(expected, _market_stations(result))))
+        if all(info.get("fetchedAt") for info in result.get("systems", {}).values()):
+            break
+        previous = result
+    return passes
+
+
+def run_regional(server, galaxy, radius_ly, crawler):
+    center = galaxy["center_system"]
+    if crawler == "shipyard":
+        expected = _regional_stations(synthetic_galaxy.shipyard_data(galaxy, center, radius_ly), "systems_with_shipyards", "ships")
+        download, systems_key, items_key = shipyard_db_manager.download_regional_shipyard_data, "systems_with_shipyards", "ships"
+    else:
+        expected = _regional_stations(synthetic_galaxy.outfitting_data(galaxy, center, radius_ly), "systems_with_outfitting", "modules")
+        download, systems_key, items_key = outfitting_db_manager.download_regional_outfitting_data, "systems_with_outfitting", "modules"
+    server.stats.reset()
+    start = time.perf_counter()
+    result = asyncio.run(download(center, radius_ly))
+    wall_s = time.perf_counter() - start
+    # Pas de reprise incrémentale pour EDSM : une seule passe
+    return [_pass_report(server, wall_s, completeness(expected, _regional_stations(result, systems_key, items_key)))]
+
+
+def print_report(crawler, passes):
+    for pass_idx, report in enumerate(passes, start=1):
+        c = report["completeness"]
+        statuses = ", ".join(f"{status}: {count}" for status, count in report["by_status"].items())
+        print(f"{crawler:13} pass {pass_idx}: {report['wall_s']:8.2f}s {report['requests']:7d} req {report['requests_per_s']:8.1f} req/s "
+              f"peak {report['peak_in_flight']:3d} in flight | {statuses} | stations {c['matched_stations']}/{c['expected_stations']} ({c['ratio']:.1%})"
+              f"{' | FAILED' if report.get('failed') else ''}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmarks.download_benchmark", description="Offline benchmark of the market, shipyard and outfitting downloads.")
+    parser.add_argument("--scale", choices=synthetic_galaxy.SCALE_PRESETS, default="small", help="Synthetic galaxy preset (default: small)")
+    parser.add_argument("--stations", type=int, help="Override the preset station count")
+    parser.add_argument("--seed", type=int, default=0, help="Galaxy seed")
+    parser.add_argument("--fixtures", help="Recorded responses JSON served before the synthetic galaxy")
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS_LY, help=f"Download radius in LY (default: {DEFAULT_RADIUS_LY})")
+    parser.add_argument("--crawler", action="append", choices=CRAWLERS, help="Run only this download (repeatable)")
+    parser.add_argument("--max-passes", type=int, default=DEFAULT_MAX_PASSES, help="Local market passes until complete (default: 3)")
+    parser.add_argument("--work-dir", help="Directory for the downloaded datasets (default: temporary, removed afterwards)")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the downloaders' logs")
+    mock_services.add_fault_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Les erreurs simulées sont journalisées une à une par les téléchargements : silencieux sauf -v
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        faults = mock_services.faults_from_args(args)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    params = dict(synthetic_galaxy.SCALE_PRESETS[args.scale])
+    if args.stations is not None:
+        params["stations"] = args.stations
+    galaxy = synthetic_galaxy.generate_galaxy(seed=args.seed, **params)
+    fixtures = mock_services.load_fixtures(args.fixtures) if args.fixtures else None
+    if args.json: # Chemin relatif au dossier de lancement, pas au dossier de travail
+        args.json = os.path.abspath(args.json)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="edmo_download_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    previous_cwd = os.getcwd()
+    report = {"galaxy": {"seed": args.seed, **params, "center_system": galaxy["center_system"]}, "radius_ly": args.radius,
+              "faults": vars(faults), "crawlers": {}}
+    print(f"Galaxy s{params['stations']}-seed{args.seed}, center '{galaxy['center_system']}', radius {args.radius} LY, faults {vars(faults)}")
+    try:
+        os.chdir(work_dir) # Les jeux de données (chemins relatifs) sont écrits ici
+        with mock_services.MockServer(mock_services.create_app(galaxy, fixtures, faults)) as server, \
+                mock_services.redirect_endpoints(server.base_url):
+            for crawler in args.crawler or CRAWLERS:
+                if crawler == "local_market":
+                    passes = run_local_market(server, galaxy, args.radius, max(1, args.max_passes))
+                else:
+                    passes = run_regional(server, galaxy, args.radius, crawler)
+                report["crawlers"][crawler] = {
+                    "passes": passes,
+                    "total_wall_s": round(sum(p["wall_s"] for p in passes), 3),
+                    "total_requests": sum(p["requests"] for p in passes),
+                    "recovered": passes[-1]["completeness"]["ratio"] == 1.0,
+                }
+                print_report(crawler, passes)
+    finally:
+        # Écritures en arrière-plan (chemins relatifs) terminées dans le dossier de travail, avant d'en sortir
+        price_history.flush_pending_rows()
+        snapshot_store.flush_pending_writes()
+        os.chdir(previous_cwd)
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Serveur aiohttp local qui imite les points d'accès Ardent v2 et EDSM utilisés par les téléchargements
+(api_handler, shipyard_db_manager, outfitting_db_manager), pour les mesurer sans réseau.
+
+Les réponses viennent d'une galaxie synthétique (synthetic_galaxy) ou d'un fichier de réponses
+enregistrées (--fixtures, prioritaire). Latence, gigue, taux d'erreur et limitation de débit (429 +
+Retry-After) sont réglables et tirés d'une graine. Ardent est servi sous /v2/, EDSM sous /edsm/ :
+redirect_endpoints() y redirige api_handler et edsm_api_handler le temps d'une mesure.
+
+    python -m benchmarks.mock_services --scale small --latency-ms 40 --rate-limit 20
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import random
+import socket
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from aiohttp import web
+
+import api_handler
+import edsm_api_handler
+from benchmarks import synthetic_galaxy
+
+logger = logging.getLogger(__name__)
+
+ARDENT_PREFIX = "/v2/"
+EDSM_PREFIX = "/edsm/"
+MOCK_UPDATED_AT = synthetic_galaxy.SYNTHETIC_UPDATED_AT
+
+
+@dataclass
+class FaultProfile:
+    """Conditions réseau simulées (même profil pour Ardent et EDSM, limites de débit séparées)."""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0 # Latence tirée uniformément dans [latency - jitter, latency + jitter]
+    error_rate: float = 0.0 # Part des requêtes en 503
+    rate_limit_rps: float = 0.0 # 0 : pas de limite ; sinon seau à jetons par service
+    rate_limit_burst: int = 10
+    seed: int = 0
+
+
+class _TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate, self.capacity = rate, max(1, burst)
+        self.tokens, self.last = float(self.capacity), time.monotonic()
+
+    def take(self):
+        """(accepté, secondes avant le prochain jeton)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate
+
+
+class MockStats:
+    """Compteurs du serveur, remis à zéro entre deux mesures (reset)."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.by_route = {}
+        self.by_status = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.bytes_sent = 0
+
+    def snapshot(self):
+        return {"requests": self.requests, "by_route": dict(self.by_route), "by_status": {str(k): v for k, v in sorted(self.by_status.items())},
+                "peak_in_flight": self.peak_in_flight, "bytes_sent": self.bytes_sent}
+
+
+class GalaxyResponder:
+    """Réponses Ardent/EDSM dérivées d'une galaxie synthétique (construites à la demande, puis gardées)."""
+
+    def __init__(self, galaxy):
+        self.galaxy = galaxy
+        self.systems = galaxy["systems"]
+        self._system_ids = {name: idx + 1 for idx, name in enumerate(self.systems)}
+        self._commodity_lists = {}
+
+    def _station(self, system_name, station_name):
+        system = self.systems.get(system_name)
+        if system is None:
+            return None
+        return next((s for s in system["stations"] if s["stationName"] == station_name), None)
+
+    # ---- Ardent v2 ----
+    def ardent_nearby(self, system_name, max_distance):
+        center = self.systems.get(system_name)
+        if center is None:
+            return 404, {"error": "System not found", "systemName": system_name}
+        nearby = []
+        for name, system in self.systems.items():
+            distance = synthetic_galaxy.distance_ly(center["coords"], system["coords"])
+            if distance <= max_distance:
+                nearby.append({"systemAddress": self._system_ids[name], "systemName": name, "systemX": system["coords"]["x"],
+                               "systemY": system["coords"]["y"], "systemZ": system["coords"]["z"], "distance": round(distance, 2),
+                               "updatedAt": MOCK_UPDATED_AT})
+        nearby.sort(key=lambda s: s["distance"])
+        return 200, nearby
+
+    def ardent_commodities(self, system_name, direction):
+        system = self.systems.get(system_name)
+        if system is None:
+            return 404, {"error": "System not found", "systemName": system_name}
+        key = (system_name, direction)
+        if key not in self._commodity_lists:
+            catalog = self.galaxy["commodities"]
+            items = []
+            for station in system["stations"]:
+                for commodity_idx, buy_price, stock, sell_price, demand in station["market"]:
+                    if (direction == "exports" and not (buy_price > 0 and stock > 0)) or (direction == "imports" and not (sell_price > 0 and demand > 0)):
+                        continue
+                    items.append({
+                        "commodityName": catalog[commodity_idx]["name"], "marketId": station["marketId"],
+                        "stationName": station["stationName"], "stationType": station["type"],
+                        "distanceToArrival": station["distanceToArrival"], "maxLandingPadSize": station["maxLandingPadSize"],
+                        "systemAddress": self._system_ids[system_name], "systemName": system_name,
+                        "buyPrice": buy_price, "stock": stock, "sellPrice": sell_price, "demand": demand,
+                        "meanPrice": catalog[commodity_idx]["base_price"], "updatedAt": MOCK_UPDATED_AT,
+                    })
+            self._commodity_lists[key] = items
+        return 200, self._commodity_lists[key]
+
+    # ---- EDSM ----
+    def edsm_sphere_systems(self, system_name, radius, min_radius=0.0):
+        center = self.systems.get(system_name)
+        if center is None:
+            return 200, {} # EDSM : objet vide pour un système inconnu
+        result = []
+        for name, system in self.systems.items():
+            distance = synthetic_galaxy.distance_ly(center["coords"], system["coords"])
+            if min_radius <= distance <= radius:
+                result.append({"distance": round(distance, 2), "name": name, "coords": dict(system["coords"])})
+        return 200, result
+
+    def edsm_stations(self, system_name):
+        system = self.systems.get(system_name)
+        if system is None:
+            return 200, []
+        return 200, {"id": self._system_ids[system_name], "name": system_name, "stations": [
+            {"id": station["marketId"] % 1_000_000, "marketId": station["marketId"], "type": station["edsmType"],
+             "name": station["stationName"], "distanceToArrival": station["distanceToArrival"], "haveMarket": bool(station["market"]),
+             "haveShipyard": bool(station["ships"]), "haveOutfitting": bool(station["modules"])}
+            for station in system["stations"]
+        ]}
+
+    def edsm_shipyard(self, system_name, station_name):
+        station = self._station(system_name, station_name)
+        if station is None or not station["ships"]:
+            return 200, {}
+        return 200, {"id": self._system_ids[system_name], "name": system_name, "marketId": station["marketId"],
+                     "sId": station["marketId"] % 1_000_000, "sName": station_name,
+                     "ships": [{"id": idx, "name": ship} for idx, ship in enumerate(station["ships"])]}
+
+    def edsm_outfitting(self, system_name, station_name):
+        station = self._station(system_name, station_name)
+        if station is None or not station["modules"]:
+            return 200, {}
+        modules = self.galaxy["modules"]
+        return 200, {"id": self._system_ids[system_name], "name": system_name, "marketId": station["marketId"],
+                     "sId": station["marketId"] % 1_000_000, "sName": station_name,
+                     "outfitting": [dict(modules[idx]) for idx in station["modules"]]}
+
+
+def load_fixtures(path):
+    """
+    Réponses enregistrées : {"responses": [{"path": "/v2/system/name/Sol/nearby", "status": 200, "body": ...}]}.
+    Le chemin seul sert de clé (les paramètres de requête sont ignorés).
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {entry["path"]: (entry.get("status", 200), entry.get("body")) for entry in data.get("responses", [])}
+
+
+def create_app(galaxy=None, fixtures=None, faults=None):
+    """Application aiohttp du serveur factice ; app["stats"] (MockStats) compte les requêtes servies."""
+    faults = faults or FaultProfile()
+    responder = GalaxyResponder(galaxy) if galaxy is not None else None
+    rnd = random.Random(faults.seed)
+    buckets = {prefix: _TokenBucket(faults.rate_limit_rps, faults.rate_limit_burst) for prefix in (ARDENT_PREFIX, EDSM_PREFIX)} \
+        if faults.rate_limit_rps > 0 else {}
+    stats = MockStats()
+
+    @web.middleware
+    async def fault_middleware(request, handler):
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        stats.by_route[route] = stats.by_route.get(route, 0) + 1
+        try:
+            bucket = buckets.get(ARDENT_PREFIX if request.path.startswith(ARDENT_PREFIX) else EDSM_PREFIX)
+            if bucket is not None:
+                accepted, retry_after = bucket.take()
+                if not accepted:
+                    response = web.json_response({"error": "Too Many Requests"}, status=429,
+                                                 headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+                    return _count(response)
+            if faults.latency_ms or faults.jitter_ms:
+                delay_ms = rnd.uniform(faults.latency_ms - faults.jitter_ms, faults.latency_ms + faults.jitter_ms)
+                await asyncio.sleep(max(0.0, delay_ms) / 1000)
+            if faults.error_rate and rnd.random() < faults.error_rate:
+                return _count(web.json_response({"error": "Service Unavailable (simulated)"}, status=503))
+            return _count(await handler(request))
+        except web.HTTPException as e: # 400/404 levées par les gestionnaires
+            stats.by_status[e.status] = stats.by_status.get(e.status, 0) + 1
+            raise
+        finally:
+            stats.in_flight -= 1
+
+    def _count(response):
+        stats.by_status[response.status] = stats.by_status.get(response.status, 0) + 1
+        stats.bytes_sent += len(response.body or b"") if isinstance(response.body, (bytes, bytearray)) else 0
+        return response
+
+    def _respond(request, build):
+        if fixtures and request.path in fixtures:
+            status, body = fixtures[request.path]
+        elif responder is not None:
+            status, body = build()
+        else:
+            status, body = 404, {"error": "No fixture for this path", "path": request.path}
+        return web.json_response(body, status=status)
+
+    def _float_param(request, name, default):
+        try:
+            return float(request.query.get(name, default))
+        except ValueError:
+            raise web.HTTPBadRequest(text=f"Invalid {name}")
+
+    async def ardent_nearby(request):
+        return _respond(request, lambda: responder.ardent_nearby(request.match_info["system"], _float_param(request, "maxDistance", 100)))
+
+    async def ardent_commodities(request):
+        direction = request.match_info["direction"]
+        if direction not in ("exports", "imports"):
+            raise web.HTTPNotFound()
+        return _respond(request, lambda: responder.ardent_commodities(request.match_info["system"], direction))
+
+    async def edsm_sphere_systems(request):
+        return _respond(request, lambda: responder.edsm_sphere_systems(request.query.get("systemName", ""), _float_param(request, "radius", 50),
+                                                                       _float_param(request, "minRadius", 0)))
+
+    async def edsm_stations(request):
+        return _respond(request, lambda: responder.edsm_stations(request.query.get("systemName", "")))
+
+    async def edsm_shipyard(request):
+        return _respond(request, lambda: responder.edsm_shipyard(request.query.get("systemName", ""), request.query.get("stationName", "")))
+
+    async def edsm_outfitting(request):
+        return _respond(request, lambda: responder.edsm_outfitting(request.query.get("systemName", ""), request.query.get("stationName", "")))
+
+    app = web.Application(middlewares=[fault_middleware])
+    app["stats"] = stats
+    app.router.add_get(ARDENT_PREFIX + "system/name/{system}/nearby", ardent_nearby)
+    app.router.add_get(ARDENT_PREFIX + "system/name/{system}/commodities/{direction}", ardent_commodities)
+    app.router.add_get(EDSM_PREFIX + "api-v1/sphere-systems", edsm_sphere_systems)
+    app.router.add_get(EDSM_PREFIX + "api-system-v1/stations", edsm_stations)
+    app.router.add_get(EDSM_PREFIX + "api-system-v1/stations/shipyard", edsm_shipyard)
+    app.router.add_get(EDSM_PREFIX + "api-system-v1/stations/outfitting", edsm_outfitting)
+    return app
+
+
+class MockServer:
+    """Serveur factice dans un thread (sa propre boucle asyncio) : le client mesuré garde la sienne."""
+
+    def __init__(self, app, host="127.0.0.1", port=0):
+        self.app, self.host, self.port = app, host, port
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._startup_error = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def stats(self):
+        return self.app["stats"]
+
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((self.host, self.port))
+        self.port = sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, args=(sock,), name="MockServices", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._startup_error:
+            raise self._startup_error
+        return self
+
+    def _serve(self, sock):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._runner = web.AppRunner(self.app, access_log=None)
+            self._loop.run_until_complete(self._runner.setup())
+            self._loop.run_until_complete(web.SockSite(self._runner, sock).start())
+        except Exception as e:
+            self._startup_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def stop(self):
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+@contextlib.contextmanager
+def redirect_endpoints(base_url):
+    """Redirige api_handler (Ardent) et edsm_api_handler (EDSM) vers le serveur factice, puis restaure."""
+    previous = api_handler.BASE_URL, edsm_api_handler.EDSM_BASE_URL
+    api_handler.BASE_URL = f"{base_url}{ARDENT_PREFIX}"
+    edsm_api_handler.EDSM_BASE_URL = f"{base_url}{EDSM_PREFIX}"
+    try:
+        yield
+    finally:
+        api_handler.BASE_URL, edsm_api_handler.EDSM_BASE_URL = previous
+
+
+def add_fault_arguments(parser):
+    group = parser.add_argument_group("simulated network conditions")
+    group.add_argument("--latency-ms", type=float, default=0.0, help="Mean response latency (ms)")
+    group.add_argument("--jitter-ms", type=float, default=0.0, help="Latency jitter, uniform +/- (ms)")
+    group.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503 (0-1)")
+    group.add_argument("--rate-limit", type=float, default=0.0, help="Requests/s per service before 429 (0 = unlimited)")
+    group.add_argument("--burst", type=int, default=10, help="Rate limiter burst size")
+    group.add_argument("--fault-seed", type=int, default=0, help="Seed for latency and error draws")
+
+
+def faults_from_args(args):
+    if not 0 <= args.error_rate <= 1:
+        raise ValueError(f"--error-rate must be between 0 and 1, got {args.error_rate}")
+    return FaultProfile(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit, args.burst, args.fault_seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.mock_services", description="Local stand-in for the Ardent v2 and EDSM APIs.")
+    parser.add_argument("--scale", choices=synthetic_galaxy.SCALE_PRESETS, default="small", help="Synthetic galaxy preset")
+    parser.add_argument("--seed", type=int, default=0, help="Galaxy seed")
+    parser.add_argument("--fixtures", help="Recorded responses JSON (served before the synthetic galaxy)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    galaxy = synthetic_galaxy.generate_preset(args.scale, args.seed)
+    app = create_app(galaxy, load_fixtures(args.fixtures) if args.fixtures else None, faults_from_args(args))
+    logger.info(f"Mock services: center system '{galaxy['center_system']}', Ardent at http://{args.host}:{args.port}{ARDENT_PREFIX}, "
+                f"EDSM at http://{args.host}:{args.port}{EDSM_PREFIX} ({asdict(faults_from_args(args))})")
+    web.run_app(app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks des moteurs d'analyse sur une galaxie synthétique (voir synthetic_galaxy).
+
+    python -m benchmarks.run_benchmarks --scale medium                 # mesure + comparaison à la référence
+    python -m benchmarks.run_benchmarks --scale medium --save-baseline # enregistre la référence
+    python -m benchmarks.run_benchmarks --scale small --check          # code 1 si régression
+
+Chaque moteur est appelé une fois à vide (tris en place et caches de l'appelant), puis --repeat fois
+chronométré (perf_counter, ramasse-miettes suspendu, min et médiane), puis une fois sous tracemalloc pour le pic mémoire.
+Une empreinte du résultat est comparée à celle de la référence : une optimisation qui change les
+résultats est signalée. La référence (benchmarks/baseline.json par défaut) dépend de la machine :
+l'enregistrer sur la machine où l'on compare, avant la modification du moteur.
+"""
+import argparse
+import asyncio
+import gc
+import hashlib
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import optimizer_logic
+import outfitting_logic
+import shipyard_logic
+from analysis_api import json_safe
+from benchmarks import synthetic_galaxy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.10 # +10 % sur le temps minimal ou le pic mémoire = régression
+TIME_NOISE_FLOOR_S = 0.001 # Écarts absolus plus petits ignorés (bruit de l'horloge et du système)
+MEMORY_NOISE_FLOOR_KIB = 64
+
+# Profil du joueur pour tous les moteurs : gros cargo, pad L, filtres larges
+BENCH_CARGO_TONS = 720
+BENCH_PAD_SIZE = 3
+BENCH_MAX_STATION_DIST_LS = 5000.0
+BENCH_RADIUS_LY = 60.0
+BENCH_MAX_ROUTES = 20
+BENCH_TOP_N_IMPORTS = 10
+BENCH_SHIP_NAME = "Python"
+BENCH_MODULE_IDS = ["int_engine_size5_class5", "int_hyperdrive_size5_class5", "int_cargorack_size6_class1"]
+
+
+class BenchContext:
+    """Données dérivées de la galaxie, construites une fois par échelle et partagées par les benchmarks."""
+
+    def __init__(self, galaxy):
+        self.galaxy = galaxy
+        self.system, self.station = synthetic_galaxy.departure_station(galaxy)
+        self.center_coords = dict(galaxy["systems"][self.system]["coords"])
+        self.local_market = synthetic_galaxy.local_market_data(galaxy)
+        self.departure = synthetic_galaxy.departure_data(galaxy, self.system, self.station)
+        self.shipyard = synthetic_galaxy.shipyard_data(galaxy)
+        self.outfitting = synthetic_galaxy.outfitting_data(galaxy)
+        self.needs = synthetic_galaxy.mission_needs(galaxy, count=5, seed=galaxy["seed"])
+        self.ship_systems_index = shipyard_logic.build_ship_systems_index(self.shipyard)
+        self.module_systems_index = outfitting_logic.build_module_systems_index(self.outfitting)
+        # Achats possibles à la station de départ, au format des offres du marché local
+        self.departure_buys = [
+            {"commodityName": offer["commodityName"], "commodity_localised": offer["commodity_localised"],
+             "price": offer["buyPrice"], "quantity_at_station": offer["stock"]}
+            for offer in self.departure["offers"] if offer["buyPrice"] > 0 and offer["stock"] > 0
+        ]
+        self.destination_imports = [
+            station_data["buys_from_player"]
+            for system_market in self.local_market["station_markets"].values()
+            for station_data in system_market["stations_data"].values() if station_data["buys_from_player"]
+        ]
+
+    def describe(self):
+        return {
+            "systems": len(self.galaxy["systems"]),
+            "stations": sum(len(system["stations"]) for system in self.galaxy["systems"].values()),
+            "market_entries": sum(len(station["market"]) for system in self.galaxy["systems"].values() for station in system["stations"]),
+            "departure": f"{self.station} ({self.system})",
+            "departure_offers": len(self.departure["offers"]),
+            "mission_needs": self.needs,
+        }
+
+
+def bench_calculate_profitable_trades(ctx):
+    """Départ -> chaque station du marché local (jointure + remplissage de la soute)."""
+    return [optimizer_logic.calculate_profitable_trades(ctx.departure_buys, imports, BENCH_CARGO_TONS) for imports in ctx.destination_imports]
+
+
+def bench_find_general_market_trades(ctx):
+    return asyncio.run(optimizer_logic.find_general_market_trades(
+        None, ctx.system, ctx.station, ctx.departure["offers"], ctx.local_market, BENCH_CARGO_TONS,
+        BENCH_MAX_STATION_DIST_LS, True, True, BENCH_PAD_SIZE, 30, True,
+        max_routes_to_display=BENCH_MAX_ROUTES, top_n_imports_filter=BENCH_TOP_N_IMPORTS
+    ))
+
+
+def bench_find_best_outbound_trades_for_hop(ctx):
+    return asyncio.run(optimizer_logic.find_best_outbound_trades_for_hop(
+        None, ctx.system, ctx.station, BENCH_CARGO_TONS, BENCH_PAD_SIZE, BENCH_RADIUS_LY,
+        BENCH_MAX_STATION_DIST_LS, True, True, ctx.departure["offers"], ctx.local_market
+    ))
+
+
+def bench_generate_purchase_suggestions(ctx):
+    return optimizer_logic.generate_purchase_suggestions(
+        ctx.needs, ctx.local_market, ctx.departure, BENCH_PAD_SIZE, BENCH_MAX_STATION_DIST_LS, True, True, ctx.system
+    )
+
+
+def bench_find_stations_selling_ship(ctx):
+    return shipyard_logic.find_stations_selling_ship(BENCH_SHIP_NAME, ctx.shipyard, ctx.center_coords, BENCH_RADIUS_LY)
+
+
+def bench_find_stations_selling_ship_indexed(ctx):
+    return shipyard_logic.find_stations_selling_ship(BENCH_SHIP_NAME, ctx.shipyard, ctx.center_coords, BENCH_RADIUS_LY,
+                                                     ship_systems_index=ctx.ship_systems_index)
+
+
+def bench_find_stations_with_modules(ctx):
+    return outfitting_logic.find_stations_with_modules(BENCH_MODULE_IDS, ctx.outfitting, ctx.center_coords, BENCH_RADIUS_LY)
+
+
+def bench_find_stations_with_modules_indexed(ctx):
+    return outfitting_logic.find_stations_with_modules(BENCH_MODULE_IDS, ctx.outfitting, ctx.center_coords, BENCH_RADIUS_LY,
+                                                       module_systems_index=ctx.module_systems_index)
+
+
+BENCHMARKS = {
+    "calculate_profitable_trades": bench_calculate_profitable_trades,
+    "find_general_market_trades": bench_find_general_market_trades,
+    "find_best_outbound_trades_for_hop": bench_find_best_outbound_trades_for_hop,
+    "generate_purchase_suggestions": bench_generate_purchase_suggestions,
+    "find_stations_selling_ship": bench_find_stations_selling_ship,
+    "find_stations_selling_ship[index]": bench_find_stations_selling_ship_indexed,
+    "find_stations_with_modules": bench_find_stations_with_modules,
+    "find_stations_with_modules[index]": bench_find_stations_with_modules_indexed,
+}
+
+
+def _canonical(value):
+    # Listes de chaînes triées : certaines viennent d'un set (ex. modulesMatched), dont l'ordre
+    # change d'un processus à l'autre avec le hachage aléatoire des chaînes
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, list):
+        items = [_canonical(v) for v in value]
+        return sorted(items) if items and all(isinstance(v, str) for v in items) else items
+    return value
+
+
+def result_digest(result):
+    """Empreinte stable du résultat d'un moteur (détecte un changement de résultats)."""
+    encoded = json.dumps(_canonical(json_safe(result)), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+
+def _result_size(result):
+    if isinstance(result, tuple): # generate_purchase_suggestions : (complètes, partielles, complémentaires)
+        return sum(len(part) for part in result)
+    return len(result)
+
+
+def measure(benchmark, ctx, repeat):
+    """Temps (min/médiane sur `repeat` appels) et pic mémoire (appel séparé sous tracemalloc) d'un benchmark."""
+    result = benchmark(ctx) # Échauffement : tris en place du cache, imports paresseux
+    timings = []
+    gc.collect()
+    gc.disable() # Comme timeit : une collecte pendant un appel fausserait la mesure
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            benchmark(ctx)
+            timings.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        start_current, _ = tracemalloc.get_traced_memory()
+        benchmark(ctx)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "min_s": round(min(timings), 6),
+        "median_s": round(statistics.median(timings), 6),
+        "runs": repeat,
+        "peak_kib": round((peak - start_current) / 1024, 1),
+        "result_size": _result_size(result),
+        "result_digest": result_digest(result),
+    }
+
+
+def compare(current, reference, tolerance):
+    """Verdict d'un benchmark face à la référence : 'new', 'ok', 'faster', 'REGRESSION' ou 'RESULT CHANGED'."""
+    if not reference:
+        return "new", ""
+    notes = []
+    time_delta = current["min_s"] - reference["min_s"]
+    memory_delta = current["peak_kib"] - reference["peak_kib"]
+    time_ratio = time_delta / reference["min_s"] if reference["min_s"] > 0 else 0.0
+    memory_ratio = memory_delta / reference["peak_kib"] if reference["peak_kib"] > 0 else 0.0
+    notes.append(f"time {time_ratio:+.1%}, memory {memory_ratio:+.1%}")
+    if current["result_digest"] != reference.get("result_digest"):
+        return "RESULT CHANGED", "; ".join(notes)
+    slower = time_ratio > tolerance and time_delta > TIME_NOISE_FLOOR_S
+    heavier = memory_ratio > tolerance and memory_delta > MEMORY_NOISE_FLOOR_KIB
+    if slower or heavier:
+        return "REGRESSION", "; ".join(notes)
+    if time_ratio < -tolerance and -time_delta > TIME_NOISE_FLOOR_S:
+        return "faster", "; ".join(notes)
+    return "ok", "; ".join(notes)
+
+
+def scale_key(params, seed):
+    return f"s{params['stations']}-c{params['commodities_min']}-{params['commodities_max']}-seed{seed}"
+
+
+def environment():
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "platform": platform.platform(), "machine": platform.machine()}
+
+
+def load_baseline(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"environment": None, "scales": {}}
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Unreadable baseline {path}: {e}")
+        return {"environment": None, "scales": {}}
+
+
+def save_baseline(path, baseline, key, params, report):
+    baseline["environment"] = environment()
+    baseline.setdefault("scales", {})[key] = {"params": params, "recordedAt": datetime.now(timezone.utc).isoformat(), "results": report}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmarks.run_benchmarks", description="Optimizer micro-benchmarks on a synthetic galaxy.")
+    parser.add_argument("--scale", choices=synthetic_galaxy.SCALE_PRESETS, default="small", help="Galaxy size preset (default: small)")
+    parser.add_argument("--stations", type=int, help="Override the preset station count")
+    parser.add_argument("--commodities-min", type=int, help="Override the preset min commodities per station")
+    parser.add_argument("--commodities-max", type=int, help="Override the preset max commodities per station")
+    parser.add_argument("--seed", type=int, default=0, help="Generator seed (default: 0)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help=f"Timed runs per benchmark (default: {DEFAULT_REPEAT})")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, metavar="NAME", help="Run only this benchmark (repeatable)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline for this scale and seed")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help=f"Allowed slowdown/memory growth ratio (default: {DEFAULT_TOLERANCE})")
+    parser.add_argument("--check", action="store_true", help="Exit with code 1 on a regression or a changed result")
+    parser.add_argument("--json", metavar="PATH", help="Also write the report as JSON")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr, format="%(levelname)s %(name)s: %(message)s")
+    params = dict(synthetic_galaxy.SCALE_PRESETS[args.scale])
+    for name in ("stations", "commodities_min", "commodities_max"):
+        if getattr(args, name) is not None:
+            params[name] = getattr(args, name)
+    key = scale_key(params, args.seed)
+
+    start = time.perf_counter()
+    galaxy = synthetic_galaxy.generate_galaxy(seed=args.seed, **params)
+    ctx = BenchContext(galaxy)
+    print(f"Galaxy {key}: {json.dumps(ctx.describe(), ensure_ascii=False)} (built in {time.perf_counter() - start:.1f}s)")
+
+    baseline = load_baseline(args.baseline)
+    if baseline.get("environment") and baseline["environment"] != environment():
+        print(f"Warning: baseline recorded on another environment: {baseline['environment']}")
+    reference_results = baseline.get("scales", {}).get(key, {}).get("results", {})
+
+    report = {}
+    failed = False
+    print(f"{'benchmark':38} {'min ms':>10} {'median ms':>10} {'peak KiB':>10} {'results':>8}  verdict")
+    for name, benchmark in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        report[name] = measure(benchmark, ctx, max(1, args.repeat))
+        verdict, notes = compare(report[name], reference_results.get(name), args.tolerance)
+        failed = failed or verdict in ("REGRESSION", "RESULT CHANGED")
+        r = report[name]
+        print(f"{name:38} {r['min_s'] * 1000:10.2f} {r['median_s'] * 1000:10.2f} {r['peak_kib']:10.1f} {r['result_size']:8d}  {verdict} {notes}".rstrip())
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"scale": key, "params": params, "environment": environment(), "results": report}, f, indent=2)
+    if args.save_baseline:
+        if args.only: # Garder les mesures des autres benchmarks de cette échelle
+            report = {**reference_results, **report}
+        save_baseline(args.baseline, baseline, key, params, report)
+        print(f"Baseline saved for {key} in {args.baseline}")
+    return 1 if args.check and failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Galaxie synthétique reproductible (graine) pour les benchmarks.
+
+generate_galaxy() tire des systèmes, des stations et leurs marchés ; les fonctions *_data() en
+dérivent les structures des jeux de données de l'application (marché local, station de départ,
+chantiers navals, équipement), au même format que les téléchargements Ardent/EDSM. Même graine et
+mêmes paramètres donnent les mêmes données, octet pour octet.
+"""
+import math
+import random
+
+from constants import EDDN_SHIP_SYMBOL_NAMES
+
+# Échelles nommées (stations, marchandises par station min/max)
+SCALE_PRESETS = {
+    "small": {"stations": 100, "commodities_min": 50, "commodities_max": 120},
+    "medium": {"stations": 2000, "commodities_min": 80, "commodities_max": 250},
+    "large": {"stations": 20000, "commodities_min": 150, "commodities_max": 350},
+}
+SYNTHETIC_UPDATED_AT = "2025-01-01T00:00:00+00:00" # Fixe : les résultats ne dépendent pas de l'heure
+
+# (type Ardent/marché, type EDSM, pad max, poids de tirage)
+_STATION_TYPES = [
+    ("Coriolis", "Coriolis Starport", "L", 18),
+    ("Orbis", "Orbis Starport", "L", 8),
+    ("Ocellus", "Ocellus Starport", "L", 5),
+    ("AsteroidBase", "Asteroid base", "L", 3),
+    ("Outpost", "Outpost", "M", 22),
+    ("CraterOutpost", "Planetary Outpost", "M", 16),
+    ("CraterPort", "Planetary Port", "L", 8),
+    ("FleetCarrier", "Fleet Carrier", "L", 20),
+]
+_REAL_COMMODITIES = [
+    "Gold", "Silver", "Palladium", "Platinum", "Osmium", "Tritium", "Bertrandite", "Indite",
+    "Gallite", "Coltan", "Lepidolite", "Bauxite", "Water", "Hydrogen Fuel", "Liquid Oxygen",
+    "Tea", "Coffee", "Grain", "Fish", "Animal Meat", "Fruit And Vegetables", "Beer", "Wine",
+    "Liquor", "Tobacco", "Consumer Technology", "Domestic Appliances", "Clothing",
+    "Basic Medicines", "Advanced Medicines", "Agri-Medicines", "Performance Enhancers",
+    "Progenitor Cells", "Polymers", "Semiconductors", "Superconductors", "Titanium", "Aluminium",
+    "Copper", "Steel", "Power Generators", "Water Purifiers", "Mineral Extractors",
+    "Auto-Fabricators", "Robotics", "Computer Components", "Building Fabricators",
+    "Surface Stabilisers", "Structural Regulators", "Evacuation Shelter", "Survival Equipment",
+    "Pesticides", "Fertilizer", "Explosives", "Hydrogen Peroxide", "Land Enrichment Systems",
+]
+_MODULE_FAMILIES = [
+    ("int_engine", "Thrusters"), ("int_hyperdrive", "Frame Shift Drive"), ("int_powerplant", "Power Plant"),
+    ("int_powerdistributor", "Power Distributor"), ("int_lifesupport", "Life Support"),
+    ("int_sensors", "Sensors"), ("int_shieldgenerator", "Shield Generator"),
+    ("int_fueltank", "Fuel Tank"), ("int_cargorack", "Cargo Rack"), ("int_fuelscoop", "Fuel Scoop"),
+    ("int_hullreinforcement", "Hull Reinforcement Package"), ("int_repairer", "Auto Field-Maintenance Unit"),
+]
+_HARDPOINT_FAMILIES = [
+    ("hpt_pulselaser", "Pulse Laser"), ("hpt_beamlaser", "Beam Laser"), ("hpt_multicannon", "Multi-Cannon"),
+    ("hpt_cannon", "Cannon"), ("hpt_railgun", "Rail Gun"), ("hpt_minelauncher", "Mine Launcher"),
+]
+_CLASS_LETTERS = {1: "E", 2: "D", 3: "C", 4: "B", 5: "A"}
+_SECTOR_WORDS = ["Synuefe", "Wregoe", "Col 285", "HIP", "Outotz", "Pru Aescs", "Eol Prou", "Hyades"]
+
+
+def commodity_catalog(size, rnd):
+    """Catalogue de marchandises : [{name, localised, base_price}], noms réels puis synthétiques."""
+    catalog = []
+    for i in range(size):
+        localised = _REAL_COMMODITIES[i] if i < len(_REAL_COMMODITIES) else f"Synthetic Goods {i:03d}"
+        # Prix de base log-uniforme, de quelques dizaines à ~100 000 Cr
+        base_price = int(math.exp(rnd.uniform(math.log(40), math.log(100000))))
+        catalog.append({"name": localised.lower().replace(" ", "").replace("-", ""), "localised": localised, "base_price": base_price})
+    return catalog
+
+
+def module_catalog():
+    """Modules au format EDSM ({id, name}) : internes tailles 1-8 classes A-E, armes 3 tailles x 3 montures."""
+    modules = []
+    for module_prefix, display_name in _MODULE_FAMILIES:
+        for size in range(1, 9):
+            for class_digit, class_letter in _CLASS_LETTERS.items():
+                modules.append({"id": f"{module_prefix}_size{size}_class{class_digit}", "name": f"{size}{class_letter} {display_name}"})
+    for module_prefix, display_name in _HARDPOINT_FAMILIES:
+        for mount in ("fixed", "gimbal", "turret"):
+            for size_word in ("small", "medium", "large"):
+                modules.append({"id": f"{module_prefix}_{mount}_{size_word}", "name": f"{display_name} ({mount}, {size_word})"})
+    return modules
+
+
+def _market_entries(catalog, count, rnd):
+    """Marché d'une station : tuples (indice marchandise, buyPrice, stock, sellPrice, demand)."""
+    entries = []
+    for commodity_idx in rnd.sample(range(len(catalog)), count):
+        base_price = catalog[commodity_idx]["base_price"]
+        if rnd.random() < 0.45: # Exportation : le joueur achète (sous le prix de base)
+            buy_price = max(1, int(base_price * rnd.uniform(0.55, 0.98)))
+            entries.append((commodity_idx, buy_price, rnd.randint(1, 60000), int(buy_price * 0.96), 0))
+        else: # Importation : le joueur vend (au-dessus du prix de base)
+            entries.append((commodity_idx, 0, 0, int(base_price * rnd.uniform(0.95, 1.6)), rnd.randint(1, 40000)))
+    return entries
+
+
+def generate_galaxy(stations=1000, commodities_min=50, commodities_max=350, seed=0,
+                    radius_ly=60.0, stations_per_system=3.0, shipyard_ratio=0.35, outfitting_ratio=0.5):
+    """
+    Tire une galaxie de `stations` stations réparties uniformément dans une sphère de `radius_ly`
+    autour du système central (premier système, coordonnées 0,0,0).
+
+    Retourne {"seed", "center_system", "commodities", "modules", "systems": {nom: {"coords",
+    "stations": [{stationName, marketId, type, edsmType, maxLandingPadSize, distanceToArrival,
+    market, ships, modules}]}}}. Les marchés sont gardés en tuples (voir _market_entries) pour
+    tenir 20 000 stations en mémoire ; les *_data() les développent au format des jeux de données.
+    """
+    if stations < 1 or not 1 <= commodities_min <= commodities_max:
+        raise ValueError(f"Invalid galaxy size: stations={stations}, commodities={commodities_min}-{commodities_max}")
+    rnd = random.Random(seed)
+    catalog = commodity_catalog(max(commodities_max, len(_REAL_COMMODITIES)), rnd)
+    modules = module_catalog()
+    ship_names = sorted(set(EDDN_SHIP_SYMBOL_NAMES.values()))
+    type_weights = [entry[3] for entry in _STATION_TYPES]
+
+    systems = {}
+    system_count = max(1, round(stations / stations_per_system))
+    for system_idx in range(system_count):
+        if system_idx == 0:
+            coords = {"x": 0.0, "y": 0.0, "z": 0.0}
+        else: # Tirage uniforme dans la sphère (rayon en racine cubique)
+            r = radius_ly * rnd.random() ** (1 / 3)
+            theta = rnd.uniform(0, 2 * math.pi)
+            cos_phi = rnd.uniform(-1, 1)
+            sin_phi = math.sqrt(1 - cos_phi * cos_phi)
+            coords = {"x": round(r * sin_phi * math.cos(theta), 5), "y": round(r * sin_phi * math.sin(theta), 5), "z": round(r * cos_phi, 5)}
+        name = f"{rnd.choice(_SECTOR_WORDS)} {chr(65 + system_idx % 26)}{chr(65 + system_idx // 26 % 26)}-{system_idx}"
+        systems[name] = {"coords": coords, "stations": []}
+
+    system_names = list(systems)
+    for station_idx in range(stations):
+        # Les premières stations vont dans le système central (station de départ garantie)
+        system_name = system_names[0] if station_idx < 2 else rnd.choice(system_names)
+        ardent_type, edsm_type, pad_letter = _STATION_TYPES[0][:3] if station_idx == 0 else \
+            rnd.choices(_STATION_TYPES, weights=type_weights)[0][:3]
+        station = {
+            "stationName": f"{'Carrier' if ardent_type == 'FleetCarrier' else 'Station'} {station_idx:05d}",
+            "marketId": 3_200_000_000 + station_idx,
+            "type": ardent_type,
+            "edsmType": edsm_type,
+            "maxLandingPadSize": pad_letter,
+            "distanceToArrival": round(math.exp(rnd.uniform(math.log(5), math.log(250000))), 2),
+            "market": _market_entries(catalog, rnd.randint(commodities_min, commodities_max), rnd),
+            "ships": sorted(rnd.sample(ship_names, rnd.randint(4, len(ship_names)))) if rnd.random() < shipyard_ratio else [],
+            "modules": sorted(rnd.sample(range(len(modules)), rnd.randint(30, len(modules)))) if rnd.random() < outfitting_ratio else [],
+        }
+        systems[system_name]["stations"].append(station)
+
+    return {"seed": seed, "center_system": system_names[0], "commodities": catalog, "modules": modules, "systems": systems}
+
+
+def generate_preset(scale, seed=0):
+    """generate_galaxy() avec une échelle de SCALE_PRESETS ('small', 'medium', 'large')."""
+    if scale not in SCALE_PRESETS:
+        raise ValueError(f"Unknown scale '{scale}' (expected one of {', '.join(SCALE_PRESETS)})")
+    return generate_galaxy(seed=seed, **SCALE_PRESETS[scale])
+
+
+def distance_ly(coords_a, coords_b):
+    return math.sqrt(sum((coords_a[axis] - coords_b[axis]) ** 2 for axis in ("x", "y", "z")))
+
+
+def departure_station(galaxy):
+    """(système, station) de départ : première station du système central."""
+    center = galaxy["center_system"]
+    return center, galaxy["systems"][center]["stations"][0]["stationName"]
+
+
+def local_market_data(galaxy, center_system=None, radius_ly=None):
+    """Jeu de données du marché local (structure de LOCAL_SELLERS_DATA_FILE) autour de `center_system`."""
+    center_system = center_system or galaxy["center_system"]
+    center_coords = galaxy["systems"][center_system]["coords"]
+    catalog = galaxy["commodities"]
+    data = {"sourceSystem": center_system, "radius": radius_ly, "updatedAt": SYNTHETIC_UPDATED_AT, "systems": {}, "station_markets": {}}
+    for system_name, system in galaxy["systems"].items():
+        distance = round(distance_ly(center_coords, system["coords"]), 2)
+        if radius_ly is not None and distance > radius_ly:
+            continue
+        data["systems"][system_name] = {"distance": distance, "fetchedAt": SYNTHETIC_UPDATED_AT}
+        stations_data = {}
+        for station in system["stations"]:
+            sells, buys = [], []
+            for commodity_idx, buy_price, stock, sell_price, demand in station["market"]:
+                commodity = catalog[commodity_idx]
+                if buy_price > 0 and stock > 0:
+                    sells.append({"commodityName": commodity["name"], "commodity_localised": commodity["localised"],
+                                  "price": buy_price, "stock": stock, "quantity_at_station": stock})
+                if sell_price > 0 and demand > 0:
+                    buys.append({"commodityName": commodity["name"], "commodity_localised": commodity["localised"],
+                                 "price": sell_price, "demand": demand, "quantity_at_station": demand})
+            if sells or buys:
+                stations_data[station["stationName"]] = {
+                    "sells_to_player": sells, "buys_from_player": buys,
+                    "details": {"maxLandingPadSize": station["maxLandingPadSize"], "distanceToArrival": station["distanceToArrival"],
+                                "stationType": station["type"]}
+                }
+        if stations_data:
+            data["station_markets"][system_name] = {"distance": distance, "stations_data": stations_data}
+    return data
+
+
+def departure_data(galaxy, system_name=None, station_name=None):
+    """Jeu de données de la station de départ ({system, station, updatedAt, offers}), comme download_departure_market_data."""
+    if system_name is None:
+        system_name, station_name = departure_station(galaxy)
+    station = next(s for s in galaxy["systems"][system_name]["stations"] if s["stationName"] == station_name)
+    catalog = galaxy["commodities"]
+    offers = []
+    for commodity_idx, buy_price, stock, sell_price, demand in station["market"]:
+        commodity = catalog[commodity_idx]
+        offers.append({
+            "commodityName": commodity["name"], "commodity_localised": commodity["localised"],
+            "buyPrice": buy_price, "stock": stock, "sellPrice": sell_price, "demand": demand,
+            "maxLandingPadSize": station["maxLandingPadSize"], "distanceToArrival": station["distanceToArrival"],
+            "stationType": station["type"],
+        })
+    return {"system": system_name, "station": station_name, "offers": offers, "updatedAt": SYNTHETIC_UPDATED_AT}
+
+
+def _regional_stations(galaxy, center_system, radius_ly, key):
+    center_coords = galaxy["systems"][center_system]["coords"]
+    for system_name, system in galaxy["systems"].items():
+        if radius_ly is not None and distance_ly(center_coords, system["coords"]) > radius_ly:
+            continue
+        stations = [station for station in system["stations"] if station[key]]
+        if stations:
+            yield system_name, system, stations
+
+
+def shipyard_data(galaxy, center_system=None, radius_ly=None):
+    """Jeu de données des chantiers navals (structure de shipyard_db_manager, noms de vaisseaux EDSM)."""
+    center_system = center_system or galaxy["center_system"]
+    data = {"sourceSystem": center_system, "radius": radius_ly, "updatedAt": SYNTHETIC_UPDATED_AT, "systems_with_shipyards": {}}
+    for system_name, system, stations in _regional_stations(galaxy, center_system, radius_ly, "ships"):
+        data["systems_with_shipyards"][system_name] = {"coords": dict(system["coords"]), "stations": [
+            {"stationName": station["stationName"], "marketId": station["marketId"], "ships": list(station["ships"]),
+             "distanceToArrival": station["distanceToArrival"], "type": station["edsmType"]}
+            for station in stations
+        ]}
+    return data
+
+
+def outfitting_data(galaxy, center_system=None, radius_ly=None):
+    """Jeu de données de l'équipement (structure d'outfitting_db_manager, modules EDSM {id, name})."""
+    center_system = center_system or galaxy["center_system"]
+    modules = galaxy["modules"]
+    data = {"sourceSystem": center_system, "radius": radius_ly, "updatedAt": SYNTHETIC_UPDATED_AT, "systems_with_outfitting": {}}
+    for system_name, system, stations in _regional_stations(galaxy, center_system, radius_ly, "modules"):
+        data["systems_with_outfitting"][system_name] = {"coords": dict(system["coords"]), "stations": [
+            {"stationName": station["stationName"], "marketId": station["marketId"], "type": station["edsmType"],
+             "distanceToArrival": station["distanceToArrival"], "modules": [dict(modules[idx]) for idx in station["modules"]]}
+            for station in stations
+        ]}
+    return data
+
+
+def mission_needs(galaxy, count=5, seed=0):
+    """Besoins de missions plausibles ({nom de marchandise en minuscules: quantité}) parmi les marchandises exportées."""
+    rnd = random.Random(seed)
+    exported = sorted({galaxy["commodities"][entry[0]]["name"] for system in galaxy["systems"].values()
+                       for station in system["stations"] for entry in station["market"] if entry[1] > 0})
+    return {name: rnd.choice((10, 25, 50, 100, 200, 400)) for name in rnd.sample(exported, min(count, len(exported)))}
+
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Import en masse d'un dump galaxie local (JSON ou JSONL, compressé gzip ou non) vers les caches
+marché, chantiers navals et équipement, sans aucun appel réseau.
+
+Format attendu : un système par enregistrement, comme les dumps publiés par Spansh (galaxy_stations.json.gz) :
+    {"name", "coords": {"x", "y", "z"}, "stations": [{"name", "type", "distanceToArrival", "marketId",
+     "landingPads", "market": {"commodities", "updateTime"}, "shipyard": {"ships"}, "outfitting": {"modules"}}]}
+Le fichier est décodé au fil de l'eau, un enregistrement à la fois (tableau JSON ou lignes JSONL),
+donc en mémoire bornée quelle que soit sa taille ; un enregistrement invalide ou tronqué est compté
+et ignoré, le décodage reprend à l'enregistrement suivant. Seuls les systèmes dans la boîte englobante puis
+la sphère demandées sont gardés. Leurs sections sont compressées par lots dans des fichiers de travail
+(snapshot_store.SnapshotBuilder) et un point de reprise est écrit après chaque lot : un import
+interrompu (annulation, crash) reprend là où il s'était arrêté.
+
+Utilisation hors interface :
+    python bulk_importer.py galaxy_stations.json.gz --center Sol --radius 500
+"""
+import argparse
+import gzip
+import io
+import json
+import math
+import os
+import time
+import uuid
+import logging
+from datetime import datetime, timezone
+
+from constants import (
+    BULK_IMPORT_STATE_FILE, BULK_IMPORT_WORK_DIR, BULK_IMPORT_READ_CHUNK_CHARS,
+    BULK_IMPORT_CHECKPOINT_SYSTEMS, BULK_IMPORT_MAX_RECORD_CHARS, BULK_IMPORT_PROGRESS_INTERVAL_S,
+    PRICE_HISTORY_RETENTION_DAYS, SHIPYARD_DATA_FILE, OUTFITTING_DATA_FILE
+)
+import dataset_manager
+import market_region_cache
+import price_history
+import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+STORE_MARKET = "market"
+STORE_SHIPYARD = "shipyard"
+STORE_OUTFITTING = "outfitting"
+
+_STORE_SECTIONS_KEYS = {
+    STORE_MARKET: market_region_cache.REGION_SECTIONS_KEY,
+    STORE_SHIPYARD: dataset_manager.DATASET_SECTIONS_KEYS[dataset_manager.DATASET_SHIPYARD],
+    STORE_OUTFITTING: dataset_manager.DATASET_SECTIONS_KEYS[dataset_manager.DATASET_OUTFITTING],
+}
+
+# Types de station des dumps -> noms utilisés par Ardent / EDSM dans le reste de l'application
+_STATION_TYPE_MAP = {
+    "Drake-Class Carrier": "FleetCarrier",
+    "Settlement": "OdysseySettlement",
+    "Odyssey Settlement": "OdysseySettlement",
+}
+
+_SEPARATORS = " \t\r\n,[]"
+
+
+class BulkImportCancelledError(Exception):
+    """Import en masse annulé ; le point de reprise est conservé."""
+    pass
+
+
+def _open_dump_text(path):
+    """Ouvre le dump en texte (gzip détecté par son en-tête). Retourne (fichier brut, flux texte)."""
+    raw = open(path, 'rb')
+    is_gzip = raw.read(2) == b"\x1f\x8b"
+    raw.seek(0)
+    binary = gzip.GzipFile(fileobj=raw, mode='rb') if is_gzip else raw
+    return raw, io.TextIOWrapper(binary, encoding='utf-8', errors='replace')
+
+
+def _resync(text_stream, buffer, pos, consumed):
+    """
+    Avance jusqu'à la prochaine ligne commençant par '{' (début d'enregistrement dans les dumps JSONL et
+    les tableaux à un système par ligne), sans garder en mémoire plus d'un bloc.
+    Retourne (buffer, pos, consumed), ou None à la fin du dump.
+    """
+    while True:
+        newline = buffer.find("\n", pos)
+        while newline != -1:
+            start = newline + 1
+            while start < len(buffer) and buffer[start] in " \t\r":
+                start += 1
+            if start == len(buffer):
+                break # Début de la ligne pas encore lu
+            if buffer[start] == "{":
+                return buffer, start, consumed
+            newline = buffer.find("\n", start)
+        keep_from = newline if newline != -1 else len(buffer)
+        more = text_stream.read(BULK_IMPORT_READ_CHUNK_CHARS)
+        if not more:
+            return None
+        consumed += keep_from
+        buffer, pos = buffer[keep_from:] + more, 0
+
+
+def iter_dump_records(text_stream, start_offset=0, on_skipped=None):
+    """
+    Décode les enregistrements JSON un par un (éléments d'un tableau ou lignes JSONL).
+    Produit (enregistrement, position) où position est le nombre de caractères décodés après
+    l'enregistrement : la passer en `start_offset` pour reprendre juste après lui.
+    Un enregistrement invalide (ligne complète mal formée, tronqué en fin de fichier, ou plus long que
+    BULK_IMPORT_MAX_RECORD_CHARS sans pouvoir être décodé) est ignoré : on_skipped(position, raison)
+    est appelé et le décodage reprend à l'enregistrement suivant.
+    """
+    decoder = json.JSONDecoder()
+    consumed = 0 # Caractères situés avant buffer[0]
+    while consumed < start_offset: # Reprise : avancer sans parser le JSON
+        chunk = text_stream.read(min(start_offset - consumed, BULK_IMPORT_READ_CHUNK_CHARS))
+        if not chunk:
+            return
+        consumed += len(chunk)
+
+    buffer, pos = "", 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+            pos += 1
+        if pos >= len(buffer):
+            consumed += len(buffer)
+            buffer, pos = text_stream.read(BULK_IMPORT_READ_CHUNK_CHARS), 0
+            if not buffer:
+                return
+            continue
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            line_end = buffer.find("\n", pos)
+            line = buffer[pos:line_end].rstrip().rstrip(",") if line_end != -1 else ""
+            malformed = line.startswith("{") and line.endswith("}") # Ligne complète d'un enregistrement, pourtant invalide
+            if not malformed and len(buffer) - pos < BULK_IMPORT_MAX_RECORD_CHARS:
+                more = text_stream.read(BULK_IMPORT_READ_CHUNK_CHARS)
+                if more: # Enregistrement à cheval sur deux blocs : on garde seulement la partie non consommée
+                    consumed += pos
+                    buffer, pos = buffer[pos:] + more, 0
+                    continue
+                reason = f"truncated record ({e.msg})"
+            elif malformed:
+                reason = f"malformed record ({e.msg})"
+            else:
+                reason = f"record longer than {BULK_IMPORT_MAX_RECORD_CHARS} characters ({e.msg})"
+            if on_skipped:
+                on_skipped(consumed + pos, reason)
+            resynced = _resync(text_stream, buffer, pos + 1, consumed)
+            if resynced is None:
+                return
+            buffer, pos, consumed = resynced
+            continue
+        pos = end
+        yield record, consumed + pos
+
+
+def bounding_box(center_coords, radius_ly):
+    """Boîte englobante ((min_x, min_y, min_z), (max_x, max_y, max_z)) de la sphère demandée."""
+    return (tuple(center_coords[axis] - radius_ly for axis in "xyz"),
+            tuple(center_coords[axis] + radius_ly for axis in "xyz"))
+
+
+def _iso_time(value):
+    """'2024-05-01 12:34:56+00' (dumps) -> ISO 8601 UTC, ou None."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+def _max_pad(station):
+    pads = station.get("landingPads") or {}
+    for pad_key, pad_size in (("large", "L"), ("medium", "M"), ("small", "S")):
+        if pads.get(pad_key):
+            return pad_size
+    return None
+
+
+def _convert_market_station(station):
+    """Station du dump -> entrée stations_data de LOCAL_SELLERS (même structure que les téléchargements Ardent)."""
+    sells_to_player, buys_from_player = [], []
+    for commodity in (station.get("market") or {}).get("commodities", []):
+        symbol = commodity.get("symbol") or commodity.get("name")
+        if not symbol:
+            continue
+        name, localised = symbol.lower(), commodity.get("name", symbol)
+        buy_price, stock = commodity.get("buyPrice", 0), commodity.get("stock", 0)
+        sell_price, demand = commodity.get("sellPrice", 0), commodity.get("demand", 0)
+        if buy_price > 0 and stock > 0:
+            sells_to_player.append({'commodityName': name, 'commodity_localised': localised, 'price': buy_price,
+                                    'stock': stock, 'quantity_at_station': stock})
+        if sell_price > 0 and demand > 0:
+            buys_from_player.append({'commodityName': name, 'commodity_localised': localised, 'price': sell_price,
+                                     'demand': demand, 'quantity_at_station': demand})
+    if not sells_to_player and not buys_from_player:
+        return None
+    return {
+        'sells_to_player': sells_to_player, 'buys_from_player': buys_from_player,
+        'details': {
+            'maxLandingPadSize': _max_pad(station),
+            'distanceToArrival': station.get("distanceToArrival"),
+            'stationType': _STATION_TYPE_MAP.get(station.get("type"), station.get("type") or 'Unknown')
+        }
+    }
+
+
+def _module_display_name(module):
+    """Nom au format EDSM ('5A Thrusters') pour que module_catalog_data retrouve taille et classe."""
+    name = module.get("name") or module.get("symbol") or ""
+    if module.get("class") is not None and module.get("rating"):
+        return f"{module['class']}{module['rating']} {name}"
+    return name
+
+
+def convert_system(record, distance):
+    """
+    Convertit un système du dump. Retourne {store: section} pour les caches concernés, plus
+    "fetchedAt" (plus ancienne mise à jour de marché) et "price_rows" pour l'historique des prix.
+    """
+    system_name = record["name"]
+    coords = record.get("coords")
+    stations_data, shipyard_stations, outfitting_stations, price_rows, market_times = {}, [], [], [], []
+    for station in record.get("stations") or []:
+        station_name = station.get("name")
+        if not station_name:
+            continue
+        station_type = _STATION_TYPE_MAP.get(station.get("type"), station.get("type"))
+
+        market_entry = _convert_market_station(station)
+        if market_entry:
+            stations_data[station_name] = market_entry
+            updated_at = _iso_time((station.get("market") or {}).get("updateTime"))
+            if updated_at:
+                market_times.append(updated_at)
+                observed_at = int(datetime.fromisoformat(updated_at).timestamp())
+                price_rows.extend((observed_at, system_name, station_name, c.get("symbol", "").lower(),
+                                   c.get("buyPrice", 0), c.get("sellPrice", 0), c.get("stock", 0), c.get("demand", 0))
+                                  for c in station["market"].get("commodities", []) if c.get("symbol"))
+
+        ships = [ship.get("name") for ship in (station.get("shipyard") or {}).get("ships", []) if ship.get("name")]
+        if ships:
+            shipyard_stations.append({"stationName": station_name, "marketId": station.get("marketId"), "ships": ships,
+                                      "distanceToArrival": station.get("distanceToArrival"), "type": station_type})
+
+        modules = [{"id": module["symbol"].lower(), "name": _module_display_name(module)}
+                   for module in (station.get("outfitting") or {}).get("modules", []) if module.get("symbol")]
+        if modules:
+            outfitting_stations.append({"stationName": station_name, "marketId": station.get("marketId"), "type": station_type,
+                                        "distanceToArrival": station.get("distanceToArrival"), "modules": modules})
+
+    sections = {}
+    if stations_data:
+        sections[STORE_MARKET] = {'distance': distance, 'stations_data': stations_data}
+    if shipyard_stations:
+        sections[STORE_SHIPYARD] = {"coords": coords, "stations": shipyard_stations}
+    if outfitting_stations:
+        sections[STORE_OUTFITTING] = {"coords": coords, "stations": outfitting_stations}
+    return {"sections": sections, "fetchedAt": min(market_times) if market_times else None, "price_rows": price_rows}
+
+
+def resolve_center_coords(center_system):
+    """Coordonnées galactiques du système centre, depuis le dernier saut/position indexé du journal (StarPos)."""
+    try:
+        import journal_index
+        events = journal_index.query_events(["FSDJump", "Location", "CarrierJump"], system=center_system, limit=1, newest_first=True)
+    except Exception as e:
+        logger.warning(f"Bulk import: could not query the journal index for {center_system}: {e}")
+        return None
+    if events and isinstance(events[0].get("StarPos"), list) and len(events[0]["StarPos"]) == 3:
+        x, y, z = events[0]["StarPos"]
+        return {"x": x, "y": y, "z": z}
+    return None
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _load_state(signature, params):
+    """Point de reprise s'il correspond au même dump et aux mêmes paramètres, sinon None."""
+    if not os.path.exists(BULK_IMPORT_STATE_FILE):
+        return None
+    try:
+        with open(BULK_IMPORT_STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Bulk import: checkpoint {BULK_IMPORT_STATE_FILE} unreadable ({e}), starting over.")
+        return None
+    if state.get("source") != signature or state.get("params") != params:
+        logger.info("Bulk import: checkpoint belongs to another dump or region, starting over.")
+        return None
+    return state
+
+
+def _save_state(state):
+    snapshot_store.atomic_write_bytes(BULK_IMPORT_STATE_FILE, json.dumps(state).encode('utf-8'))
+
+
+def _clear_state():
+    try: os.remove(BULK_IMPORT_STATE_FILE)
+    except OSError: pass
+
+
+def import_bulk_dump(dump_path, center_system, radius_ly, center_coords=None, stores=(STORE_MARKET, STORE_SHIPYARD, STORE_OUTFITTING),
+                     record_price_history=True, resume=True, activate_market=False, cancel_event=None, progress_callback=None):
+    """
+    Importe la sphère de `radius_ly` AL autour de `center_system` depuis `dump_path`.
+    - Marché : ajouté au cache de régions (market_region_cache), réactivé dès que le joueur est au centre
+      (ou tout de suite avec `activate_market`).
+    - Chantiers navals / équipement : remplacent les jeux de données SHIPYARD / OUTFITTING.
+    `center_coords` ({"x", "y", "z"}) est lu dans le journal si absent. Retourne un résumé (dict).
+    """
+    center_coords = center_coords or resolve_center_coords(center_system)
+    if not center_coords:
+        raise ValueError(f"Coordinates of {center_system} unknown (not in the journal index); pass them explicitly.")
+    (min_x, min_y, min_z), (max_x, max_y, max_z) = bounding_box(center_coords, radius_ly)
+    cx, cy, cz = center_coords["x"], center_coords["y"], center_coords["z"]
+
+    signature = _source_signature(dump_path)
+    params = {"center": center_system, "coords": center_coords, "radius": radius_ly, "stores": sorted(stores)}
+    state = _load_state(signature, params) if resume else None
+    if state and not all(os.path.exists(os.path.join(BULK_IMPORT_WORK_DIR, f"{store}.part")) for store in stores):
+        logger.warning("Bulk import: work files missing for the checkpoint, starting over.")
+        state = None
+    if state:
+        logger.info(f"Bulk import: resuming {dump_path} at character {state['offset']} ({state['records']} records already scanned).")
+    else:
+        state = {"source": signature, "params": params, "offset": 0, "records": 0, "skipped_records": 0, "builders": {},
+                 "market_systems": {}, "counts": dict({store: 0 for store in stores}, market_stations=0)}
+    state.setdefault("import_id", uuid.uuid4().hex[:12]) # Identifie les lots de l'historique des prix de cet import
+    state.setdefault("skipped_records", 0)
+
+    os.makedirs(BULK_IMPORT_WORK_DIR, exist_ok=True)
+    builders = {store: snapshot_store.SnapshotBuilder(os.path.join(BULK_IMPORT_WORK_DIR, f"{store}.part"), state["builders"].get(store))
+                for store in stores}
+    market_systems = state["market_systems"] # Système -> {"distance", "fetchedAt"} (champ "systems" du cache marché)
+    retention_cutoff = time.time() - PRICE_HISTORY_RETENTION_DAYS * 86400
+    pending_price_rows, kept_since_checkpoint, last_progress = [], 0, 0.0
+
+    def _checkpoint(offset):
+        if record_price_history and pending_price_rows:
+            # Lot nommé par son point de départ : rejoué après un arrêt entre cet ajout et _save_state, il repart
+            # du même offset et price_history n'en garde que la version la plus complète (pas de doublons)
+            price_history.append_rows(pending_price_rows, "bulk_import", batch_id=f"{state['import_id']}:{state['offset']}")
+            pending_price_rows.clear()
+        state["builders"] = {store: builder.checkpoint() for store, builder in builders.items()}
+        state["offset"] = offset
+        _save_state(state)
+
+    def _on_skipped(position, reason):
+        state["skipped_records"] += 1
+        logger.warning(f"Bulk import: {reason} at character {position} of {dump_path}, skipped.")
+
+    raw, text_stream = _open_dump_text(dump_path)
+    offset = processed_offset = state["offset"]
+    try:
+        for record, offset in iter_dump_records(text_stream, state["offset"], _on_skipped):
+            if cancel_event and cancel_event.is_set():
+                _checkpoint(processed_offset) # L'enregistrement courant n'est pas traité : il sera relu à la reprise
+                raise BulkImportCancelledError(f"Bulk import cancelled after {state['records']} records; it can be resumed.")
+            processed_offset = offset
+            state["records"] += 1
+            if progress_callback and time.monotonic() - last_progress >= BULK_IMPORT_PROGRESS_INTERVAL_S:
+                last_progress = time.monotonic()
+                progress_callback(f"{state['records']} systems scanned, {len(market_systems)} markets kept", int(raw.tell() * 100 / max(1, signature["size"])))
+
+            coords = record.get("coords") if isinstance(record, dict) else None
+            if not coords or not record.get("name"):
+                continue
+            x, y, z = coords.get("x"), coords.get("y"), coords.get("z")
+            if x is None or y is None or z is None or not (min_x <= x <= max_x and min_y <= y <= max_y and min_z <= z <= max_z):
+                continue # Filtre boîte englobante (comparaisons seules), puis sphère exacte
+            distance = math.sqrt((x - cx) ** 2 + (y - cy) ** 2 + (z - cz) ** 2)
+            if distance > radius_ly:
+                continue
+
+            converted = convert_system(record, round(distance, 2))
+            for store, section in converted["sections"].items():
+                if store in builders:
+                    if record["name"] not in builders[store]:
+                        state["counts"][store] += 1
+                        if store == STORE_MARKET:
+                            state["counts"]["market_stations"] += len(section["stations_data"])
+                    builders[store].add_section(record["name"], section)
+            if STORE_MARKET in converted["sections"] and STORE_MARKET in builders:
+                market_systems[record["name"]] = {"distance": round(distance, 2), "fetchedAt": converted["fetchedAt"]}
+            pending_price_rows.extend(row for row in converted["price_rows"] if row[0] >= retention_cutoff)
+
+            if converted["sections"]:
+                kept_since_checkpoint += 1
+                if kept_since_checkpoint >= BULK_IMPORT_CHECKPOINT_SYSTEMS:
+                    _checkpoint(offset)
+                    kept_since_checkpoint = 0
+        _checkpoint(offset)
+    finally:
+        text_stream.close()
+        raw.close()
+
+    summary = _finish_import(builders, state, center_system, radius_ly, activate_market)
+    _clear_state()
+    if progress_callback: progress_callback(f"Import finished: {summary}", 100)
+    logger.info(f"Bulk import of {dump_path} finished: {summary}")
+    return summary
+
+
+def _finish_import(builders, state, center_system, radius_ly, activate_market):
+    """Écrit les snapshots finaux et les publie (cache de régions, jeux de données chantiers / équipement)."""
+    now_iso = datetime.now(timezone.utc).isoformat()
+    meta = {"sourceSystem": center_system, "radius": radius_ly, "updatedAt": now_iso, "source": "bulk_import"}
+    summary = {"records_scanned": state["records"], "records_skipped": state["skipped_records"]}
+    snapshot_store.flush_pending_writes() # Une écriture différée en attente écraserait les fichiers importés
+
+    if STORE_MARKET in builders:
+        market_systems = state["market_systems"]
+        fetched_at_values = [info["fetchedAt"] for info in market_systems.values() if info["fetchedAt"]]
+        market_meta = dict(meta, oldestFetchedAt=min(fetched_at_values) if fetched_at_values else now_iso)
+        region_tmp_path = os.path.join(BULK_IMPORT_WORK_DIR, "market_region.snap")
+        builders[STORE_MARKET].finish(region_tmp_path, market_meta, {"systems": market_systems}, _STORE_SECTIONS_KEYS[STORE_MARKET],
+                                      {"systems": len(market_systems), "stations": state["counts"]["market_stations"]})
+        market_region_cache.adopt_region_file(region_tmp_path)
+        if activate_market:
+            market_region_cache.activate_region(center_system)
+        summary["market_systems"] = len(market_systems)
+
+    for store, dataset_name, path in ((STORE_SHIPYARD, dataset_manager.DATASET_SHIPYARD, SHIPYARD_DATA_FILE),
+                                      (STORE_OUTFITTING, dataset_manager.DATASET_OUTFITTING, OUTFITTING_DATA_FILE)):
+        if store in builders:
+            builders[store].finish(path, dict(meta), None, _STORE_SECTIONS_KEYS[store], {"systems": state["counts"][store]})
+            dataset_manager.invalidate(dataset_name)
+            summary[f"{store}_systems"] = state["counts"][store]
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a local galaxy dump (JSON/JSONL, optionally gzip) into the data caches.")
+    parser.add_argument("dump", help="Path to the dump, e.g. galaxy_stations.json.gz")
+    parser.add_argument("--center", required=True, help="Center system name")
+    parser.add_argument("--radius", type=float, required=True, help="Radius in LY")
+    parser.add_argument("--coords", nargs=3, type=float, metavar=("X", "Y", "Z"), help="Center coordinates (default: from the journal)")
+    parser.add_argument("--stores", default="market,shipyard,outfitting", help="Comma-separated: market, shipyard, outfitting")
+    parser.add_argument("--no-price-history", action="store_true", help="Do not record market prices in the price history")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--activate", action="store_true", help="Make the imported market region the active local market data")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    coords = dict(zip("xyz", args.coords)) if args.coords else None
+    stores = tuple(store.strip() for store in args.stores.split(",") if store.strip())
+
+    def _print_progress(message, percentage):
+        print(f"\r[{percentage:3d}%] {message}", end="", flush=True)
+
+    summary = import_bulk_dump(args.dump, args.center, args.radius, center_coords=coords, stores=stores,
+                               record_price_history=not args.no_price_history, resume=not args.restart,
+                               activate_market=args.activate, progress_callback=_print_progress)
+    print()
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -10,13 +10,20 @@ EDSM_BASE_URL = "https://www.edsm.net/"
 EDSM_HEADERS = {"User-Agent": "MissionOptimizer/2.1 (wdsnakedrake@gmail.com) ShipyardFeature"}
 
 # ---- Noms de Fichiers ----
-DEPARTURE_DATA_FILE = 'departure_market_data.json'
-LOCAL_SELLERS_DATA_FILE = 'local_sellers_data.json'
-SHIPYARD_DATA_FILE = 'shipyard_data.json' # Pour l'onglet Chantier Naval
-OUTFITTING_DATA_FILE = 'outfitting_data.json'
+# Caches de données au format snapshot compressé (voir snapshot_store)
+DEPARTURE_DATA_FILE = 'departure_market_data.snap'
+LOCAL_SELLERS_DATA_FILE = 'local_sellers_data.snap'
+SHIPYARD_DATA_FILE = 'shipyard_data.snap' # Pour l'onglet Chantier Naval
+OUTFITTING_DATA_FILE = 'outfitting_data.snap'
 SETTINGS_FILE = 'settings.json'
 LOG_FILE = 'mission_optimizer.log'
 MULTI_HOP_ROUTE_CACHE_FILE = 'multihop_route_cache.json' # <<< NOUVELLE LIGNE
+JOURNAL_STATE_CHECKPOINT_FILE = 'journal_state_checkpoint.json' # État joueur dérivé des journaux (démarrage rapide)
+JOURNAL_INDEX_DB_FILE = 'journal_index.sqlite3' # Index SQLite de tous les événements du journal
+PRICE_HISTORY_DIR = 'price_history' # Partitions journalières de l'historique des prix
+MARKET_REGION_CACHE_DIR = 'market_regions' # Cache LRU de plusieurs sphères de marché locales
+BULK_IMPORT_STATE_FILE = 'bulk_import_state.json' # Point de reprise de l'import en masse
+BULK_IMPORT_WORK_DIR = 'bulk_import_work' # Fichiers de travail de l'import en masse
 
 # ---- Paramètres par Défaut ----
 DEFAULT_RADIUS = 80.0
@@ -30,6 +37,9 @@ DEFAULT_MAX_STATIONS_FOR_TRADE_LOOPS = 5
 DEFAULT_MAX_GENERAL_TRADE_ROUTES = 5
 DEFAULT_TOP_N_IMPORTS_FILTER = 30
 DEFAULT_LANGUAGE = "en"
+DEFAULT_MARKET_REGION_CACHE_BUDGET_MB = 200 # Budget disque du cache de régions de marché
+DEFAULT_EDDN_LISTENER_ENABLED = False # Écoute du flux EDDN (nécessite pyzmq)
+DEFAULT_EDDN_RELAY_URL = "tcp://eddn.edcd.io:9500"
 DEFAULT_SHIPYARD_RADIUS_LY = 50.0 # Rayon spécifique pour la recherche de chantiers navals
 DEFAULT_SHIPYARD_MAX_AGE_DAYS = 7 # Peut être différent pour la BD des chantiers navals
 DEFAULT_OUTFITTING_RADIUS_LY = 50.0
@@ -105,6 +115,9 @@ KEY_MAX_STATIONS_FOR_TRADE_LOOPS = 'max_stations_for_trade_loops'
 KEY_MAX_GENERAL_TRADE_ROUTES = 'max_general_trade_routes'
 KEY_TOP_N_IMPORTS_FILTER = 'top_n_imports_filter'
 KEY_LANGUAGE = 'language'
+KEY_MARKET_REGION_CACHE_BUDGET_MB = 'market_region_cache_budget_mb'
+KEY_EDDN_LISTENER_ENABLED = 'eddn_listener_enabled'
+KEY_EDDN_RELAY_URL = 'eddn_relay_url'
 # KEY_SHIPYARD_RADIUS = 'shipyard_radius' # À décommenter si vous voulez un setting séparé pour le rayon du chantier
 
 # ---- Constantes de Style pour GUI (utilisées par gui_analysis_tab) ----
@@ -181,7 +194,7 @@ STATION_TYPE_TO_PAD_SIZE_LETTER = {
 }
 
 # ---- Pour l'onglet Outfitting ----
-OUTFITTING_DATA_FILE = 'outfitting_data.json'
+OUTFITTING_DATA_FILE = 'outfitting_data.snap'
 
 # Catégories d'équipement (Clé interne -> Nom affichable)
 # Les clés internes seront utilisées dans module_catalog_data.py
@@ -363,4 +376,95 @@ def get_material_limit(material_name_internal_lower, category=None, grade=None):
     
     return MATERIAL_LIMITS.get(category, {}).get(grade, 0)
 
-# --- Fin Engineering Materials Data ---
\ No newline at end of file
+# --- Fin Engineering Materials Data ---
+
+# ---- Surveillance du Journal en Direct ----
+JOURNAL_WATCHER_POLL_INTERVAL_S = 1.0 # Intervalle du fallback par polling (et timeout du select inotify)
+JOURNAL_WATCHER_LOCATION_EVENTS = ["Docked", "Location", "FSDJump", "CarrierJump", "Undocked", "Liftoff"]
+JOURNAL_WATCHER_SHIP_EVENTS = ["Loadout"]
+JOURNAL_WATCHER_MISSION_EVENTS = ["Missions", "MissionAccepted", "CargoDepot", "MissionCompleted", "MissionFailed", "MissionAbandoned"]
+JOURNAL_WATCHER_MATERIALS_EVENTS = ["Materials", "MaterialCollected", "MaterialDiscarded", "MaterialTrade", "EngineerCraft",
+                                    "EngineerContribution", "Synthesis", "TechnologyBroker", "ScientificResearch"] # Instantané + deltas
+JOURNAL_WATCHER_MARKET_EVENTS = ["Market"]
+JOURNAL_REVERSE_READ_BLOCK_SIZE = 64 * 1024 # Taille des blocs lus depuis la fin des fichiers journaux
+JOURNAL_STATE_CHECKPOINT_VERSION = 3
+JOURNAL_PARALLEL_CHUNK_BYTES = 4 * 1024 * 1024 # Taille des tranches de fichier confiées à chaque processus
+JOURNAL_PARALLEL_MIN_BYTES = 16 * 1024 * 1024 # En dessous, le parsing séquentiel reste plus rapide que le pool
+JOURNAL_INDEX_UPDATE_INTERVAL_S = 30.0 # Réindexation périodique (en plus des réveils par le watcher)
+JOURNAL_INDEX_BATCH_SIZE = 2000 # Lignes insérées par executemany
+
+# ---- Snapshots des Caches de Données ----
+SNAPSHOT_FORMAT_VERSION = 2 # 2 : index des sections dans le corps, en-tête court (1 reste lisible)
+SNAPSHOT_COMPRESSION_LEVEL = 6 # zlib : bon compromis taille / temps d'écriture
+SNAPSHOT_WRITE_COALESCE_DELAY_S = 0.5 # Fenêtre de fusion des écritures successives d'un même cache
+SNAPSHOT_FLUSH_TIMEOUT_S = 30.0 # Attente maximale des écritures en attente à la fermeture
+
+# ---- Enregistrement / Rejeu des Sessions HTTP (http_recorder) ----
+SESSION_BUNDLE_FORMAT_VERSION = 1
+SESSION_BUNDLE_COMPRESSION_LEVEL = 6 # zlib, par corps de réponse (stocké une fois par empreinte)
+
+# ---- Traces de Performance (perf_trace) ----
+PERF_TRACE_FILE = 'performance_traces.jsonl' # À côté de LOG_FILE : étapes puis bilan de chaque opération
+PERF_TRACE_MAX_BYTES = 5 * 1024 * 1024 # Au-delà, le fichier est renommé en .1 (une seule sauvegarde)
+PERF_TRACE_MAX_SPANS = 20000 # Étapes détaillées gardées par opération (au-delà : statistiques par étape seulement)
+PERF_TRACE_SLOWEST_STAGES = 8 # Étapes les plus lentes listées dans le bilan
+PERF_TRACE_RECENT_OPERATIONS = 20 # Opérations terminées gardées en mémoire pour le panneau de performance
+PERF_TRACE_FLUSH_TIMEOUT_S = 5 # Attente maximale des traces en file d'écriture à la fermeture
+
+# ---- Panneau de Performance (perf_metrics, gui_performance_tab) ----
+PERF_METRICS_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000) # Bornes des histogrammes (ms)
+PERF_PANEL_REFRESH_MS = 1000 # Rafraîchissement du panneau, seulement quand son onglet est affiché
+PERF_PANEL_LAG_PROBE_MS = 250 # Intervalle de la sonde de retard de la boucle d'événements Tk
+
+# ---- Capture de Profil à la Demande (profiler_capture) ----
+PROFILER_FILE_PREFIX = 'profile' # profile_<opération>_<date>_<trace>.pstats et _allocations.txt, à côté de LOG_FILE
+PROFILER_TRACEMALLOC_FRAMES = 10 # Profondeur des piles gardées par tracemalloc pendant la capture
+PROFILER_TOP_ALLOCATIONS = 30 # Lignes de chaque section du rapport
+
+# ---- Historique des Prix ----
+PRICE_HISTORY_RETENTION_DAYS = 90
+PRICE_HISTORY_FLUSH_TIMEOUT_S = 10 # Attente maximale de la file d'ingestion à la fermeture
+
+# ---- Import en Masse (dumps galaxie) ----
+BULK_IMPORT_READ_CHUNK_CHARS = 1024 * 1024 # Texte décompressé lu par bloc
+BULK_IMPORT_CHECKPOINT_SYSTEMS = 500 # Systèmes retenus entre deux points de reprise (lot)
+BULK_IMPORT_MAX_RECORD_CHARS = 32 * 1024 * 1024 # Au-delà, un enregistrement non décodable est ignoré (mémoire bornée)
+BULK_IMPORT_PROGRESS_INTERVAL_S = 0.5
+
+# ---- Flux Temps Réel EDDN ----
+EDDN_SCHEMA_COMMODITY = "https://eddn.edcd.io/schemas/commodity/3"
+EDDN_SCHEMA_SHIPYARD = "https://eddn.edcd.io/schemas/shipyard/2"
+EDDN_SCHEMA_OUTFITTING = "https://eddn.edcd.io/schemas/outfitting/2"
+EDDN_RECV_TIMEOUT_MS = 1000 # Permet au thread de réception de vérifier l'arrêt
+EDDN_RECV_HIGH_WATER_MARK = 2000 # Messages gardés par ZeroMQ avant abandon côté relais
+EDDN_QUEUE_MAX_MESSAGES = 5000 # File bornée entre réception et application (backpressure)
+EDDN_BATCH_MAX_MESSAGES = 500 # Messages appliqués par lot (une nouvelle version de jeu de données par lot)
+EDDN_BATCH_MAX_DELAY_S = 15.0
+EDDN_REGION_PERSIST_INTERVAL_S = 600 # Écriture coalescée de la sphère modifiée dans le cache de régions
+EDDN_MAX_MESSAGE_AGE_S = 3600 # Messages plus anciens ignorés (relais en retard, rejeu)
+EDDN_MAX_CLOCK_SKEW_S = 300 # Horodatages dans le futur tolérés
+# Symboles de vaisseaux EDDN (journal) -> noms EDSM utilisés dans SHIPYARD_DATA_FILE
+EDDN_SHIP_SYMBOL_NAMES = {
+    "sidewinder": "Sidewinder", "eagle": "Eagle", "hauler": "Hauler", "adder": "Adder",
+    "empire_eagle": "Imperial Eagle", "viper": "Viper Mk III", "cobramkiii": "Cobra Mk III",
+    "viper_mkiv": "Viper Mk IV", "diamondback": "Diamondback Scout", "cobramkiv": "Cobra Mk IV",
+    "type6": "Type-6 Transporter", "dolphin": "Dolphin", "diamondbackxl": "Diamondback Explorer",
+    "empire_courier": "Imperial Courier", "independant_trader": "Keelback", "asp_scout": "Asp Scout",
+    "vulture": "Vulture", "asp": "Asp Explorer", "federation_dropship": "Federal Dropship",
+    "type7": "Type-7 Transporter", "typex": "Alliance Chieftain", "federation_dropship_mkii": "Federal Assault Ship",
+    "empire_trader": "Imperial Clipper", "typex_2": "Alliance Crusader", "typex_3": "Alliance Challenger",
+    "federation_gunship": "Federal Gunship", "krait_light": "Krait Phantom", "krait_mkii": "Krait Mk II",
+    "orca": "Orca", "ferdelance": "Fer-de-Lance", "mamba": "Mamba", "python": "Python",
+    "python_nx": "Python Mk II", "type8": "Type-8 Transporter", "type9": "Type-9 Heavy",
+    "belugaliner": "Beluga Liner", "type9_military": "Type-10 Defender", "anaconda": "Anaconda",
+    "federation_corvette": "Federal Corvette", "cutter": "Imperial Cutter", "corsair": "Corsair",
+    "mandalay": "Mandalay", "cobramkv": "Cobra Mk V"
+}
+
+# ---- Service Local de l'Optimiseur (optimizer_service) ----
+OPTIMIZER_SERVICE_HOST = "127.0.0.1" # Local uniquement par défaut (--host pour le partager sur le réseau du groupe)
+OPTIMIZER_SERVICE_PORT = 8765
+OPTIMIZER_SERVICE_CACHE_ENTRIES = 256 # Réponses gardées (clé : requête + versions des jeux de données)
+OPTIMIZER_SERVICE_WORKERS = 4 # Threads de calcul (les requêtes ne bloquent pas la boucle aiohttp)
+OPTIMIZER_SERVICE_CLIENT_TIMEOUT_S = 120
+OPTIMIZER_SERVICE_CLIENT_MARKETS = 8 # Données de marché gardées par position de client (/refresh), les plus anciennes oubliées
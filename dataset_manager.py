@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Gestionnaire central des jeux de données en mémoire (marché local, départ, chantiers, équipement).
+
+Chaque jeu de données est chargé une fois depuis son snapshot et gardé en mémoire avec ses index
+dérivés, tant que le fichier n'a pas changé (taille + mtime) et qu'aucune invalidation explicite
+(fin de rafraîchissement) n'a été signalée. Les données téléchargées sont publiées ici immédiatement
+(save_dataset) et écrites sur disque en arrière-plan par snapshot_store.
+Les anciens caches JSON (même nom, extension .json) sont convertis en snapshot au premier accès puis supprimés.
+Les données sont remises en lecture seule (MappingProxyType au premier niveau, sections en Mapping
+lazy) et peuvent être partagées entre threads : ne pas les modifier.
+"""
+import json
+import os
+import logging
+import threading
+from types import MappingProxyType
+
+from constants import DEPARTURE_DATA_FILE, LOCAL_SELLERS_DATA_FILE, SHIPYARD_DATA_FILE, OUTFITTING_DATA_FILE
+import perf_trace
+import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+DATASET_DEPARTURE = "departure"
+DATASET_LOCAL_MARKET = "local_market"
+DATASET_SHIPYARD = "shipyard"
+DATASET_OUTFITTING = "outfitting"
+
+DATASET_FILES = {
+    DATASET_DEPARTURE: DEPARTURE_DATA_FILE,
+    DATASET_LOCAL_MARKET: LOCAL_SELLERS_DATA_FILE,
+    DATASET_SHIPYARD: SHIPYARD_DATA_FILE,
+    DATASET_OUTFITTING: OUTFITTING_DATA_FILE,
+}
+
+DATASET_SECTIONS_KEYS = {
+    DATASET_DEPARTURE: None,
+    DATASET_LOCAL_MARKET: "station_markets",
+    DATASET_SHIPYARD: "systems_with_shipyards",
+    DATASET_OUTFITTING: "systems_with_outfitting",
+}
+
+_datasets = {} # nom -> {"signature", "data", "version", "indexes", "pending_write", "counts"}
+_datasets_lock = threading.RLock()
+_version_counter = 0
+_header_counts = {} # nom -> (signature, compteurs de l'en-tête), pour dataset_stats()
+_legacy_checked = False
+
+
+def _legacy_json_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _legacy_counts(name, data):
+    """Compteurs d'en-tête d'un ancien cache JSON (mêmes champs que ceux des téléchargements)."""
+    if name == DATASET_DEPARTURE:
+        return {"offers": len(data.get("offers", []))}
+    sections = data.get(DATASET_SECTIONS_KEYS[name]) or {}
+    if name == DATASET_LOCAL_MARKET:
+        return {"systems": len(data.get("systems") or sections),
+                "stations": sum(len(sys_data.get("stations_data", {})) for sys_data in sections.values())}
+    return {"stations": sum(len(sys_data.get("stations", [])) for sys_data in sections.values())}
+
+
+def migrate_legacy_files():
+    """
+    Convertit (une fois par processus) les caches JSON d'avant le format snapshot : le .json est réécrit
+    en .snap s'il n'y en a pas encore, puis supprimé. Un .json illisible est supprimé, un échec d'écriture le garde.
+    """
+    global _legacy_checked
+    with _datasets_lock: # RLock : appelable sous le verrou
+        if _legacy_checked:
+            return
+        _legacy_checked = True
+        for name, path in DATASET_FILES.items():
+            legacy_path = _legacy_json_path(path)
+            if legacy_path == path or not os.path.exists(legacy_path):
+                continue
+            if not os.path.exists(path):
+                try:
+                    with open(legacy_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    if not isinstance(data, dict):
+                        raise ValueError("not a JSON object")
+                    snapshot_store.write_snapshot(path, data, DATASET_SECTIONS_KEYS[name], _legacy_counts(name, data))
+                    logger.info(f"Dataset '{name}': legacy cache {legacy_path} converted to {path}.")
+                except (json.JSONDecodeError, UnicodeDecodeError, ValueError, AttributeError) as e:
+                    logger.warning(f"Dataset '{name}': legacy cache {legacy_path} unreadable ({e}), discarding it.")
+                except OSError as e:
+                    logger.warning(f"Dataset '{name}': could not convert legacy cache {legacy_path}: {e}")
+                    continue
+            try:
+                os.remove(legacy_path)
+            except OSError as e:
+                logger.warning(f"Dataset '{name}': could not remove legacy cache {legacy_path}: {e}")
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+def _current_entry(name):
+    """Entrée à jour pour `name` (à appeler sous _datasets_lock). Recharge le snapshot si le fichier a changé."""
+    global _version_counter
+    migrate_legacy_files()
+    path = DATASET_FILES[name]
+    signature = _file_signature(path)
+    entry = _datasets.get(name)
+    if entry is not None and (entry["pending_write"] or entry["signature"] == signature):
+        perf_trace.count_cache("dataset", True)
+        return entry # Données publiées en attente d'écriture : le fichier sur disque est encore l'ancien
+
+    perf_trace.count_cache("dataset", False)
+    with perf_trace.span("db.load_snapshot", dataset=name):
+        data = snapshot_store.load_snapshot(path) if signature else None
+    _version_counter += 1
+    entry = _datasets[name] = {
+        "signature": signature,
+        "data": MappingProxyType(data) if data is not None else None,
+        "version": _version_counter,
+        "indexes": {},
+        "pending_write": False,
+        "counts": None
+    }
+    logger.info(f"Dataset '{name}' (re)loaded from {path} (version {entry['version']}, {'present' if data is not None else 'missing'}).")
+    return entry
+
+
+def get_dataset(name):
+    """Retourne le jeu de données `name` (lecture seule) ou None s'il n'existe pas. Aucun reparsing si le fichier est inchangé."""
+    with _datasets_lock:
+        return _current_entry(name)["data"]
+
+
+def get_dataset_version(name):
+    """Numéro de version du jeu de données chargé (change à chaque rechargement)."""
+    with _datasets_lock:
+        return _current_entry(name)["version"]
+
+
+def get_index(name, index_name, builder):
+    """
+    Retourne l'index dérivé `index_name` du jeu de données `name`, construit par `builder(data)`
+    une seule fois par version des données. Retourne None si le jeu de données est absent.
+    """
+    with _datasets_lock:
+        entry = _current_entry(name)
+        if entry["data"] is None:
+            return None
+        perf_trace.count_cache("dataset_index", index_name in entry["indexes"])
+        if index_name not in entry["indexes"]:
+            with perf_trace.span("optimizer.build_index", dataset=name, index=index_name):
+                entry["indexes"][index_name] = builder(entry["data"])
+            logger.debug(f"Dataset '{name}': index '{index_name}' built for version {entry['version']}.")
+        return entry["indexes"][index_name]
+
+
+def dataset_exists(name):
+    """True si le jeu de données est disponible (fichier présent ou données publiées en attente d'écriture)."""
+    with _datasets_lock:
+        migrate_legacy_files()
+        entry = _datasets.get(name)
+        if entry is not None and entry["pending_write"]:
+            return True
+    return os.path.exists(DATASET_FILES[name])
+
+
+def get_dataset_header(name):
+    """
+    En-tête du jeu de données ({"meta", "counts", "sectionsKey"}) pour les vérifications de fraîcheur.
+    Lit seulement l'en-tête du fichier, sauf si des données publiées n'y sont pas encore écrites.
+    """
+    with _datasets_lock:
+        migrate_legacy_files()
+        entry = _datasets.get(name)
+        if entry is not None and entry["pending_write"]:
+            meta, _rest = snapshot_store.split_snapshot_fields(entry["data"], DATASET_SECTIONS_KEYS[name])
+            return {"meta": meta, "counts": dict(entry["counts"] or {}), "sectionsKey": DATASET_SECTIONS_KEYS[name]}
+    return snapshot_store.read_snapshot_header(DATASET_FILES[name])
+
+
+def dataset_stats():
+    """
+    État de chaque jeu de données pour le panneau de performance : chargé ou non, version, index construits,
+    écriture en attente, taille du fichier et compteurs de son en-tête. Ne charge aucune donnée.
+    """
+    stats = {}
+    migrate_legacy_files()
+    for name, path in DATASET_FILES.items():
+        signature = _file_signature(path)
+        with _datasets_lock:
+            entry = _datasets.get(name)
+            loaded = entry is not None and entry["data"] is not None
+            stats[name] = {"loaded": loaded, "version": entry["version"] if loaded else None,
+                           "indexes": sorted(entry["indexes"]) if loaded else [],
+                           "pending_write": bool(entry and entry["pending_write"]),
+                           "file_bytes": signature[0] if signature else None,
+                           "counts": dict(entry["counts"]) if entry is not None and entry["counts"] else None}
+        if stats[name]["counts"] is None and signature is not None:
+            cached = _header_counts.get(name)
+            if cached is None or cached[0] != signature: # En-tête relu seulement si le fichier a changé
+                cached = _header_counts[name] = (signature, (snapshot_store.read_snapshot_header(path) or {}).get("counts"))
+            stats[name]["counts"] = cached[1]
+    return stats
+
+
+def _snapshot_copy(value):
+    """Copie des dicts et listes ; les Mapping en lecture seule (sections lazy, données publiées) sont partagés."""
+    if isinstance(value, dict):
+        return {key: _snapshot_copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_snapshot_copy(item) for item in value]
+    return value
+
+
+def save_dataset(name, data, counts=None):
+    """
+    Fin de rafraîchissement : publie une copie de `data` immédiatement pour tous les lecteurs, puis la
+    fait écrire en arrière-plan (écriture atomique, demandes rapprochées fusionnées). L'appelant garde
+    son `data` : le modifier ensuite ne touche ni les lecteurs ni l'écriture en cours.
+    """
+    _publish(name, _snapshot_copy(data), counts)
+
+
+def _publish(name, data, counts):
+    """Publie et fait écrire `data`, qui ne doit plus être modifié par personne (copie faite ou données neuves)."""
+    global _version_counter
+    with _datasets_lock:
+        _version_counter += 1
+        version = _version_counter
+        _datasets[name] = {
+            "signature": None, "data": MappingProxyType(data), "version": version,
+            "indexes": {}, "pending_write": True, "counts": counts
+        }
+
+    def _on_written(path):
+        with _datasets_lock:
+            entry = _datasets.get(name)
+            if entry is not None and entry["version"] == version:
+                # Le fichier correspond maintenant aux données en mémoire : pas de relecture
+                entry["signature"], entry["pending_write"] = _file_signature(path), False
+
+    snapshot_store.schedule_snapshot_write(DATASET_FILES[name], data, DATASET_SECTIONS_KEYS[name], counts, _on_written)
+    logger.info(f"Dataset '{name}' published (version {version}), disk write scheduled.")
+
+
+def update_dataset(name, updater):
+    """
+    Mise à jour atomique d'un jeu de données publié : `updater(data, counts)` reçoit les données courantes
+    (lecture seule) et ses compteurs, et retourne (nouvelles données, compteurs) ou None si rien ne change.
+    Aucune autre publication ne peut s'intercaler entre la lecture et la publication. Retourne True si publié.
+    """
+    with _datasets_lock:
+        entry = _current_entry(name)
+        if entry["data"] is None:
+            return False
+        counts = entry["counts"]
+        if counts is None: # Chargé depuis le disque : compteurs de l'en-tête
+            counts = (snapshot_store.read_snapshot_header(DATASET_FILES[name]) or {}).get("counts", {})
+        result = updater(entry["data"], dict(counts))
+        if result is None:
+            return False
+        new_data, new_counts = result
+        _publish(name, new_data, new_counts) # Nouvelles données de l'updater, qui ne les garde pas : pas de copie
+        return True
+
+
+def invalidate(name=None):
+    """Événement de fin de rafraîchissement : oublie le jeu de données `name` (ou tous) et ses index."""
+    with _datasets_lock:
+        if name is None:
+            _datasets.clear()
+        else:
+            _datasets.pop(name, None)
+    logger.debug(f"Dataset cache invalidated: {name or 'all'}.")
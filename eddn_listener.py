@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Écoute optionnelle d'un relais EDDN (ou compatible) : messages JSON compressés zlib sur ZeroMQ (SUB).
+
+Les messages commodity / shipyard / outfitting sont validés puis appliqués par lots aux jeux de données
+actifs (marché local, chantiers navals, équipement), uniquement pour les systèmes des régions en cache :
+l'optimiseur voit des prix quasi temps réel sans aucun polling. Chaque lot publie une seule nouvelle
+version par jeu de données (dataset_manager.update_dataset, qui porte l'état courant et l'écrit) ; seules
+les sections modifiées sont recompressées à l'écriture. La copie de la sphère dans le cache de régions est
+coalescée : au plus une écriture par EDDN_REGION_PERSIST_INTERVAL_S, au changement de région et à l'arrêt.
+Backpressure : file bornée entre réception et application (les messages les plus anciens sont abandonnés
+quand elle est pleine) et high-water mark ZeroMQ côté socket.
+pyzmq est optionnel : sans lui, l'écoute est simplement indisponible. L'URL du relais est un réglage,
+un éditeur local (publish_stand_in) permet de tester sans le réseau.
+"""
+import atexit
+import json
+import queue
+import threading
+import time
+import zlib
+import logging
+from datetime import datetime, timezone
+
+try:
+    import zmq
+except ImportError: # pyzmq non installé : écoute EDDN désactivée
+    zmq = None
+
+from constants import (
+    EDDN_SCHEMA_COMMODITY, EDDN_SCHEMA_SHIPYARD, EDDN_SCHEMA_OUTFITTING,
+    EDDN_RECV_TIMEOUT_MS, EDDN_RECV_HIGH_WATER_MARK, EDDN_QUEUE_MAX_MESSAGES,
+    EDDN_BATCH_MAX_MESSAGES, EDDN_BATCH_MAX_DELAY_S, EDDN_MAX_MESSAGE_AGE_S, EDDN_MAX_CLOCK_SKEW_S, EDDN_REGION_PERSIST_INTERVAL_S,
+    EDDN_SHIP_SYMBOL_NAMES, DEFAULT_EDDN_RELAY_URL
+)
+import dataset_manager
+import market_region_cache
+import price_history
+
+logger = logging.getLogger(__name__)
+
+KIND_COMMODITY = "commodity"
+KIND_SHIPYARD = "shipyard"
+KIND_OUTFITTING = "outfitting"
+_SCHEMA_KINDS = {EDDN_SCHEMA_COMMODITY: KIND_COMMODITY, EDDN_SCHEMA_SHIPYARD: KIND_SHIPYARD, EDDN_SCHEMA_OUTFITTING: KIND_OUTFITTING}
+_FLEET_CARRIER_MIN_MARKET_ID = 3700000000 # Les marketId des Fleet Carriers commencent à 3.7e9
+
+_message_queue = queue.Queue(maxsize=EDDN_QUEUE_MAX_MESSAGES)
+_stop_event = threading.Event()
+_threads = []
+_stats_lock = threading.Lock()
+_stats = {"received": 0, "accepted": 0, "rejected": 0, "dropped": 0, "applied": 0, "outside_regions": 0, "batches": 0}
+_region_lock = threading.Lock()
+_pending_region = None # {"data", "counts", "since"} : sphère modifiée pas encore copiée dans le cache de régions
+
+
+class EddnValidationError(ValueError):
+    """Message EDDN invalide ou hors schémas pris en charge."""
+    pass
+
+
+def is_available():
+    return zmq is not None
+
+
+def _count(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def get_stats():
+    """Compteurs de l'écoute (reçus, acceptés, rejetés, abandonnés, appliqués, lots) et taille de la file."""
+    with _stats_lock:
+        return dict(_stats, queued=_message_queue.qsize(), running=any(t.is_alive() for t in _threads))
+
+
+# ---- Décodage / validation ----
+
+def encode_message(schema_ref, message, header=None):
+    """Enveloppe EDDN compressée zlib (pour l'éditeur local et les tests)."""
+    envelope = {"$schemaRef": schema_ref, "header": header or {"uploaderID": "local", "softwareName": "stand-in", "softwareVersion": "1"},
+                "message": message}
+    return zlib.compress(json.dumps(envelope).encode('utf-8'))
+
+
+def _parse_timestamp(value):
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise EddnValidationError(f"invalid timestamp {value!r}")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _require(condition, reason):
+    if not condition:
+        raise EddnValidationError(reason)
+
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def validate_envelope(envelope):
+    """
+    Valide une enveloppe EDDN décodée. Retourne (type, message normalisé) ; lève EddnValidationError.
+    Le message normalisé contient : system, station, market_id, timestamp (datetime UTC) et
+    commodities / ships / modules selon le type.
+    """
+    _require(isinstance(envelope, dict), "envelope is not an object")
+    kind = _SCHEMA_KINDS.get(envelope.get("$schemaRef"))
+    _require(kind is not None, f"unsupported schema {envelope.get('$schemaRef')!r}") # Schémas /test compris
+    message = envelope.get("message")
+    _require(isinstance(message, dict), "missing message")
+    system, station = message.get("systemName"), message.get("stationName")
+    _require(isinstance(system, str) and system, "missing systemName")
+    _require(isinstance(station, str) and station, "missing stationName")
+    market_id = message.get("marketId")
+    _require(market_id is None or _is_count(market_id), "invalid marketId")
+    timestamp = _parse_timestamp(message.get("timestamp"))
+    age_s = (datetime.now(timezone.utc) - timestamp).total_seconds()
+    _require(-EDDN_MAX_CLOCK_SKEW_S <= age_s <= EDDN_MAX_MESSAGE_AGE_S, f"timestamp out of range ({age_s:.0f}s old)")
+    normalized = {"system": system, "station": station, "market_id": market_id, "timestamp": timestamp}
+
+    if kind == KIND_COMMODITY:
+        commodities = message.get("commodities")
+        _require(isinstance(commodities, list), "missing commodities")
+        normalized["commodities"] = []
+        for commodity in commodities:
+            _require(isinstance(commodity, dict) and isinstance(commodity.get("name"), str) and commodity["name"], "invalid commodity entry")
+            for field in ("buyPrice", "sellPrice", "stock", "demand"):
+                _require(_is_count(commodity.get(field)), f"invalid {field} for {commodity['name']}")
+            normalized["commodities"].append(commodity)
+    elif kind == KIND_SHIPYARD:
+        ships = message.get("ships")
+        _require(isinstance(ships, list) and all(isinstance(s, str) for s in ships), "invalid ships list")
+        normalized["ships"] = ships
+    else:
+        modules = message.get("modules")
+        _require(isinstance(modules, list) and all(isinstance(m, str) for m in modules), "invalid modules list")
+        normalized["modules"] = modules
+    return kind, normalized
+
+
+def decode_and_validate(payload):
+    """Octets reçus (zlib + JSON) -> (type, message normalisé). Lève EddnValidationError."""
+    try:
+        envelope = json.loads(zlib.decompress(payload))
+    except (zlib.error, ValueError) as e:
+        raise EddnValidationError(f"undecodable payload: {e}")
+    return validate_envelope(envelope)
+
+
+# ---- Application aux jeux de données ----
+
+def _station_is_newer(previous_details, timestamp, fallback=None):
+    """True si `timestamp` est postérieur aux données connues (date de la station, sinon `fallback`)."""
+    previous = (previous_details or {}).get("marketUpdatedAt") or fallback
+    try:
+        return not previous or _parse_timestamp(previous) < timestamp
+    except EddnValidationError:
+        return True
+
+
+def _update_sections(sections, updates):
+    """Nouvelle version du mapping de sections (LazySectionMap ou dict) avec `updates`, sans modifier l'original."""
+    if hasattr(sections, "with_updates"):
+        return sections.with_updates(updates)
+    return {**sections, **updates}
+
+
+def _apply_commodities(data, counts, messages):
+    systems = data.get("systems", {})
+    station_markets = data.get("station_markets", {})
+    updates, price_rows, applied = {}, [], 0
+    for msg in messages:
+        if msg["system"] not in systems:
+            _count("outside_regions")
+            continue
+        section = updates.get(msg["system"])
+        if section is None:
+            previous = station_markets.get(msg["system"]) or {}
+            section = {"distance": previous.get("distance", systems[msg["system"]].get("distance")),
+                       "stations_data": dict(previous.get("stations_data", {}))}
+        previous_station = section["stations_data"].get(msg["station"]) or {}
+        if not _station_is_newer(previous_station.get("details"), msg["timestamp"], systems[msg["system"]].get("fetchedAt")):
+            continue # Message plus ancien que les données connues pour cette station
+        details = dict(previous_station.get("details") or {})
+        details.setdefault("stationType", "FleetCarrier" if (msg["market_id"] or 0) >= _FLEET_CARRIER_MIN_MARKET_ID else "Unknown")
+        details["marketUpdatedAt"] = msg["timestamp"].isoformat()
+        sells_to_player, buys_from_player = [], []
+        observed_at = int(msg["timestamp"].timestamp())
+        for commodity in msg["commodities"]:
+            name = commodity["name"].lower()
+            localised = commodity.get("localisedName") or name
+            if commodity["buyPrice"] > 0 and commodity["stock"] > 0:
+                sells_to_player.append({'commodityName': name, 'commodity_localised': localised, 'price': commodity["buyPrice"],
+                                        'stock': commodity["stock"], 'quantity_at_station': commodity["stock"]})
+            if commodity["sellPrice"] > 0 and commodity["demand"] > 0:
+                buys_from_player.append({'commodityName': name, 'commodity_localised': localised, 'price': commodity["sellPrice"],
+                                         'demand': commodity["demand"], 'quantity_at_station': commodity["demand"]})
+            price_rows.append((observed_at, msg["system"], msg["station"], name, commodity["buyPrice"], commodity["sellPrice"],
+                               commodity["stock"], commodity["demand"]))
+        if msg["station"] not in section["stations_data"]:
+            counts["stations"] = counts.get("stations", 0) + 1
+        section["stations_data"][msg["station"]] = {"sells_to_player": sells_to_player, "buys_from_player": buys_from_player, "details": details}
+        updates[msg["system"]] = section
+        applied += 1
+    if not updates:
+        return None
+    new_data = dict(data, station_markets=_update_sections(station_markets, updates))
+    price_history.record_rows_async(price_rows, "eddn")
+    _count("applied", applied)
+    return new_data, counts
+
+
+def _system_in_region(system_name, data, sections_key):
+    """Système couvert par le jeu de données : déjà présent, ou dans la sphère du marché local de même centre."""
+    if system_name in data.get(sections_key, {}):
+        return True
+    local = dataset_manager.get_dataset(dataset_manager.DATASET_LOCAL_MARKET)
+    if not local or local.get("sourceSystem") != data.get("sourceSystem"):
+        return False
+    system_info = local.get("systems", {}).get(system_name)
+    return system_info is not None and system_info.get("distance", float("inf")) <= data.get("radius", 0)
+
+
+def _apply_station_lists(data, counts, messages, sections_key, list_key, convert):
+    """Chantiers navals / équipement : remplace la liste (`list_key`) de la station dans la section du système."""
+    sections = data.get(sections_key, {})
+    updates, applied = {}, 0
+    for msg in messages:
+        if not _system_in_region(msg["system"], data, sections_key):
+            _count("outside_regions")
+            continue
+        section = updates.get(msg["system"])
+        if section is None:
+            previous = sections.get(msg["system"]) or {}
+            section = {"coords": previous.get("coords"), "stations": [dict(st) for st in previous.get("stations", [])]}
+        station = next((st for st in section["stations"] if st.get("stationName") == msg["station"]), None)
+        if station is None:
+            station = {"stationName": msg["station"], "marketId": msg["market_id"], "distanceToArrival": None,
+                       "type": "FleetCarrier" if (msg["market_id"] or 0) >= _FLEET_CARRIER_MIN_MARKET_ID else None}
+            section["stations"].append(station)
+            counts["stations"] = counts.get("stations", 0) + 1
+        elif not _station_is_newer({"marketUpdatedAt": station.get("updatedAt")}, msg["timestamp"]):
+            continue
+        station[list_key] = convert(msg, station)
+        station["updatedAt"] = msg["timestamp"].isoformat()
+        updates[msg["system"]] = section
+        applied += 1
+    if not updates:
+        return None
+    _count("applied", applied)
+    return dict(data, **{sections_key: _update_sections(sections, updates)}), counts
+
+
+def _convert_ships(msg, _station):
+    return [EDDN_SHIP_SYMBOL_NAMES.get(symbol.lower(), symbol) for symbol in msg["ships"]]
+
+
+def _convert_modules(msg, station):
+    known_names = {module.get("id"): module.get("name") for module in station.get("modules", []) if isinstance(module, dict)}
+    return [{"id": symbol.lower(), "name": known_names.get(symbol.lower(), symbol.lower())} for symbol in msg["modules"]]
+
+
+def apply_batch(batch):
+    """Applique un lot de messages validés [(type, message)] ; une seule publication par jeu de données."""
+    by_kind = {KIND_COMMODITY: {}, KIND_SHIPYARD: {}, KIND_OUTFITTING: {}}
+    for kind, msg in batch: # Dans un lot, seul le message le plus récent par station compte
+        key = (msg["system"], msg["station"])
+        if key not in by_kind[kind] or by_kind[kind][key]["timestamp"] < msg["timestamp"]:
+            by_kind[kind][key] = msg
+
+    if by_kind[KIND_COMMODITY]:
+        messages = list(by_kind[KIND_COMMODITY].values())
+        if dataset_manager.update_dataset(dataset_manager.DATASET_LOCAL_MARKET, lambda data, counts: _apply_commodities(data, counts, messages)):
+            _note_region_update(dataset_manager.get_dataset(dataset_manager.DATASET_LOCAL_MARKET),
+                                (dataset_manager.get_dataset_header(dataset_manager.DATASET_LOCAL_MARKET) or {}).get("counts"))
+    if by_kind[KIND_SHIPYARD]:
+        messages = list(by_kind[KIND_SHIPYARD].values())
+        dataset_manager.update_dataset(dataset_manager.DATASET_SHIPYARD, lambda data, counts: _apply_station_lists(
+            data, counts, messages, "systems_with_shipyards", "ships", _convert_ships))
+    if by_kind[KIND_OUTFITTING]:
+        messages = list(by_kind[KIND_OUTFITTING].values())
+        dataset_manager.update_dataset(dataset_manager.DATASET_OUTFITTING, lambda data, counts: _apply_station_lists(
+            data, counts, messages, "systems_with_outfitting", "modules", _convert_modules))
+    _count("batches")
+
+
+def _note_region_update(data, counts):
+    """Retient la dernière version de la sphère modifiée ; persist_region() la copie dans le cache de régions."""
+    global _pending_region
+    if data is None:
+        return
+    with _region_lock:
+        previous = _pending_region
+        same_region = previous is not None and previous["data"].get("sourceSystem") == data.get("sourceSystem")
+        _pending_region = {"data": data, "counts": counts, "since": previous["since"] if same_region else time.monotonic()}
+    if previous is not None and not same_region: # Changement de région : l'ancienne est écrite tout de suite
+        market_region_cache.store_region(previous["data"], previous["counts"])
+
+
+def persist_region(force=False):
+    """
+    Copie la sphère modifiée par EDDN dans le cache de régions si EDDN_REGION_PERSIST_INTERVAL_S est écoulé,
+    si la sphère active a changé (nouveau téléchargement) ou si `force`. Retourne True si une écriture est demandée.
+    """
+    global _pending_region
+    with _region_lock:
+        pending = _pending_region
+        if pending is None:
+            return False
+        active = dataset_manager.get_dataset(dataset_manager.DATASET_LOCAL_MARKET)
+        region_changed = active is None or active.get("sourceSystem") != pending["data"].get("sourceSystem")
+        if not (force or region_changed or time.monotonic() - pending["since"] >= EDDN_REGION_PERSIST_INTERVAL_S):
+            return False
+        _pending_region = None
+    market_region_cache.store_region(pending["data"], pending["counts"])
+    return True
+
+
+atexit.register(persist_region, force=True) # Avant snapshot_store.flush_pending_writes (atexit : ordre inverse)
+
+
+# ---- Threads ----
+
+def enqueue_payload(payload):
+    """Valide un message reçu et le met en file ; si la file est pleine, le plus ancien est abandonné."""
+    _count("received")
+    try:
+        item = decode_and_validate(payload)
+    except EddnValidationError as e:
+        _count("rejected")
+        logger.debug(f"EDDN: message rejected ({e}).")
+        return False
+    while True:
+        try:
+            _message_queue.put_nowait(item)
+            break
+        except queue.Full:
+            try:
+                _message_queue.get_nowait()
+                _count("dropped")
+            except queue.Empty:
+                pass
+    _count("accepted")
+    return True
+
+
+def _receiver_loop(relay_url):
+    context = zmq.Context.instance()
+    socket = context.socket(zmq.SUB)
+    socket.setsockopt(zmq.SUBSCRIBE, b"")
+    socket.setsockopt(zmq.RCVHWM, EDDN_RECV_HIGH_WATER_MARK)
+    socket.setsockopt(zmq.RCVTIMEO, EDDN_RECV_TIMEOUT_MS)
+    socket.connect(relay_url)
+    logger.info(f"EDDN: listening to {relay_url}.")
+    try:
+        while not _stop_event.is_set():
+            try:
+                payload = socket.recv()
+            except zmq.Again:
+                continue # Délai de réception écoulé : vérifier l'arrêt
+            enqueue_payload(payload)
+    except zmq.ZMQError as e:
+        logger.error(f"EDDN: receiver stopped on ZeroMQ error: {e}")
+    finally:
+        socket.close(linger=0)
+        logger.info("EDDN receiver stopped.")
+
+
+def _applier_loop():
+    while not _stop_event.is_set():
+        batch, deadline = [], time.monotonic() + EDDN_BATCH_MAX_DELAY_S
+        while len(batch) < EDDN_BATCH_MAX_MESSAGES and not _stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_message_queue.get(timeout=min(remaining, 1.0)))
+            except queue.Empty:
+                continue
+        if batch:
+            try:
+                apply_batch(batch)
+                logger.debug(f"EDDN: batch of {len(batch)} messages applied.")
+            except Exception:
+                logger.exception("EDDN: failed to apply a batch of messages.")
+        persist_region()
+    logger.info("EDDN applier stopped.")
+
+
+def start_listener(relay_url=DEFAULT_EDDN_RELAY_URL):
+    """Démarre la réception et l'application par lots (idempotent). Retourne False si pyzmq est absent."""
+    global _threads
+    if zmq is None:
+        logger.warning("EDDN listener unavailable: pyzmq is not installed.")
+        return False
+    if any(t.is_alive() for t in _threads):
+        return True
+    _stop_event.clear()
+    _threads = [threading.Thread(target=_receiver_loop, args=(relay_url,), name="EddnReceiver", daemon=True),
+                threading.Thread(target=_applier_loop, name="EddnApplier", daemon=True)]
+    for thread in _threads:
+        thread.start()
+    return True
+
+
+def stop_listener(timeout=5.0):
+    _stop_event.set()
+    for thread in _threads:
+        thread.join(timeout)
+    persist_region(force=True)
+
+
+def publish_stand_in(bind_url, payloads, interval_s=0.0, settle_s=0.5):
+    """
+    Éditeur local de remplacement (tests, démonstrations) : publie `payloads` (voir encode_message)
+    sur `bind_url` (ex. "tcp://127.0.0.1:9500"), au format du relais EDDN.
+    """
+    if zmq is None:
+        raise RuntimeError("pyzmq is required for the stand-in publisher.")
+    socket = zmq.Context.instance().socket(zmq.PUB)
+    socket.bind(bind_url)
+    try:
+        time.sleep(settle_s) # Laisse les abonnés se connecter (les messages PUB antérieurs sont perdus)
+        for payload in payloads:
+            socket.send(payload)
+            if interval_s:
+                time.sleep(interval_s)
+    finally:
+        socket.close(linger=1000)
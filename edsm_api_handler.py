@@ -3,9 +3,13 @@ import asyncio
 import aiohttp
 import logging
 import threading
+import time
 
 # Importer les constantes nécessaires
 from constants import EDSM_BASE_URL, EDSM_HEADERS # Assurez-vous qu'elles sont définies dans constants.py
+import http_recorder
+import perf_metrics
+import perf_trace
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +17,8 @@ class OperationCancelledError(Exception):
     """Exception personnalisée pour les opérations annulées."""
     pass
 
+@perf_trace.traced("api.edsm")
+@perf_metrics.tracked_request("edsm")
 async def fetch_edsm_json(session, url, params: dict = None, cancel_event: threading.Event = None):
     """
     Fonction pour récupérer des données JSON depuis l'API EDSM.
@@ -22,7 +28,14 @@ async def fetch_edsm_json(session, url, params: dict = None, cancel_event: threa
         raise OperationCancelledError(f"Fetching EDSM URL cancelled: {url}")
 
     log_params = f" with params: {params}" if params else ""
+    perf_trace.annotate(url=url)
+    if http_recorder.is_replaying(): # Session enregistrée : aucune requête réseau
+        content = await http_recorder.replay_fetch(http_recorder.SERVICE_EDSM, url, params)
+        if cancel_event and cancel_event.is_set():
+            raise OperationCancelledError(f"Fetching EDSM URL cancelled: {url}")
+        return content
     logger.debug(f"Fetching EDSM URL: {url}{log_params}")
+    started = time.monotonic()
     try:
         # Utiliser EDSM_HEADERS ici
         async with session.get(url, headers=EDSM_HEADERS, params=params, timeout=aiohttp.ClientTimeout(total=60)) as response:
@@ -34,10 +47,15 @@ async def fetch_edsm_json(session, url, params: dict = None, cancel_event: threa
             
             # EDSM retourne parfois un array vide [] ou un objet vide {} comme réponse valide
             content = await response.json()
+            perf_trace.annotate(status=response.status)
+            http_recorder.record_exchange(http_recorder.SERVICE_EDSM, url, params, started, response.status, content)
             return content
             
     except aiohttp.ClientResponseError as e:
         logger.error(f"EDSM API ClientResponseError for {url}{log_params}: {e.status} {e.message}")
+        perf_trace.annotate(status=e.status)
+        http_recorder.record_exchange(http_recorder.SERVICE_EDSM, url, params, started, e.status, error={
+            "kind": "content_type" if isinstance(e, aiohttp.ContentTypeError) else "http", "message": e.message, "headers": dict(e.headers or {})})
         try:
             error_content = await e.response.json() # Tenter de lire le corps de l'erreur
             logger.error(f"EDSM Error content: {error_content}")
@@ -47,9 +65,11 @@ async def fetch_edsm_json(session, url, params: dict = None, cancel_event: threa
         raise # Relancer l'exception d'origine pour que l'appelant la gère
     except aiohttp.ClientConnectorError as e:
         logger.error(f"EDSM API ClientConnectorError for {url}{log_params}: {e}")
+        http_recorder.record_exchange(http_recorder.SERVICE_EDSM, url, params, started, None, error={"kind": "connection", "message": e.strerror or str(e), "errno": e.errno})
         raise
     except asyncio.TimeoutError:
         logger.error(f"EDSM API Timeout (60s) for {url}{log_params}")
+        http_recorder.record_exchange(http_recorder.SERVICE_EDSM, url, params, started, None, error={"kind": "timeout", "message": "Timeout (60s)"})
         raise
     except OperationCancelledError:
         raise # Relancer directement
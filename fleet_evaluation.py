@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Évaluation de plusieurs profils de vaisseau (soute, taille de pad, filtres) en une seule passe.
+
+Les jointures coûteuses ne dépendent pas du vaisseau : marchandises rentables entre la station
+actuelle et chaque station voisine (optimizer_logic.rank_potential_trades) et offres de chaque
+station pour les marchandises des missions. Elles sont calculées une fois sur l'instantané partagé ;
+chaque profil n'applique ensuite que son masque de stations (pad, distance LS, planétaires, FC)
+et sa soute (optimizer_logic.fill_cargo_with_trades). Les résultats sont identiques à ceux de
+find_general_market_trades / generate_purchase_suggestions lancés profil par profil (hors appels
+API de secours : le mode flotte travaille sur les données en cache).
+"""
+import logging
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field, asdict
+
+from constants import PLANETARY_STATION_TYPES, FLEET_CARRIER_STATION_TYPES, STATION_PAD_SIZE_MAP
+import analysis_api
+import optimizer_logic
+import perf_trace
+from operation_errors import OperationCancelledError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ShipProfile:
+    """Profil évalué : `filters` None = filtres communs de l'évaluation."""
+    name: str
+    cargo_capacity: int
+    pad_size: object = "?"
+    filters: analysis_api.AnalysisFilters = None
+
+    @property
+    def pad_size_int(self):
+        return int(self.pad_size) if str(self.pad_size).isdigit() else None
+
+
+@dataclass
+class ProfileEvaluation(analysis_api._Result):
+    name: str
+    cargo_capacity: int
+    pad_size: object
+    filters: analysis_api.AnalysisFilters
+    general_trades: list = field(default_factory=list)
+    missions: analysis_api.MissionSourcingResult = None
+
+    @property
+    def best_route_profit(self):
+        return max((route['total_profit'] for route in self.general_trades), default=0)
+
+
+@dataclass
+class FleetEvaluationResult(analysis_api._Result):
+    system: str
+    station: str
+    profiles: list = field(default_factory=list)
+    timings: dict = field(default_factory=dict) # Secondes : jointures partagées / masques et soutes par profil
+
+    def profit_table(self):
+        """Une ligne par profil : meilleur bénéfice de route générale et d'approvisionnement des missions."""
+        rows = []
+        for evaluation in self.profiles:
+            missions = evaluation.missions
+            rows.append({
+                "profile": evaluation.name, "cargo_capacity": evaluation.cargo_capacity, "pad_size": evaluation.pad_size,
+                "best_route_profit": evaluation.best_route_profit, "routes": len(evaluation.general_trades),
+                "mission_full_options": len(missions.full_options) if missions else None,
+                "mission_partial_options": len(missions.partial_options) if missions else None,
+                "best_mission_profit": max((option['profit'] for option in missions.full_options), default=None) if missions else None,
+                "mission_trips": -(-missions.total_units // evaluation.cargo_capacity) if missions and evaluation.cargo_capacity > 0 else None
+            })
+        return rows
+
+
+def load_profiles(profile_dicts, base_filters):
+    """Profils depuis des dicts ({"name", "cargo_capacity", "pad_size", "filters": {...}}) ; ValueError si invalides."""
+    profiles = []
+    for index, entry in enumerate(profile_dicts):
+        if not isinstance(entry, dict) or not isinstance(entry.get("cargo_capacity"), int):
+            raise ValueError(f"Profile #{index + 1}: an object with an integer 'cargo_capacity' is required")
+        filter_overrides = entry.get("filters") or {}
+        filters = None
+        if filter_overrides:
+            try:
+                filters = analysis_api.AnalysisFilters(**{**asdict(base_filters), **filter_overrides})
+            except TypeError as e:
+                raise ValueError(f"Profile #{index + 1}: invalid filters ({e})") from e
+        profiles.append(ShipProfile(str(entry.get("name") or f"profile-{index + 1}"), entry["cargo_capacity"], entry.get("pad_size", "?"), filters))
+    return profiles
+
+
+# ---- Jointures partagées ----
+
+def _station_pad_int(raw_pad):
+    return STATION_PAD_SIZE_MAP.get(str(raw_pad).upper(), raw_pad if isinstance(raw_pad, int) else None)
+
+
+def _float_or_inf(value):
+    if value is None:
+        return float('inf')
+    try: return float(value)
+    except (ValueError, TypeError): return float('inf')
+
+
+def _station_passes(filters, player_pad_int, station_type, pad_int, dist_ls):
+    """Masque de station d'un profil (mêmes règles que les moteurs d'optimizer_logic)."""
+    if not filters.include_planetary and station_type in PLANETARY_STATION_TYPES: return False
+    if not filters.include_fleet_carriers and station_type in FLEET_CARRIER_STATION_TYPES: return False
+    if player_pad_int is not None and (pad_int is None or pad_int < player_pad_int): return False
+    return dist_ls <= filters.max_station_dist_ls
+
+
+def _market_stations(local_market):
+    """Stations du cache local avec leurs attributs de filtrage, dans l'ordre de parcours des moteurs."""
+    stations = []
+    if not local_market or not isinstance(local_market.get('station_markets'), Mapping):
+        return stations
+    for system_name, system_content in local_market['station_markets'].items():
+        if not isinstance(system_content.get('stations_data'), dict):
+            continue
+        for station_name, station_data in system_content['stations_data'].items():
+            details = station_data.get('details', {})
+            stations.append({
+                "system": system_name, "station": station_name, "data": station_data,
+                "distance_ly": system_content.get('distance', float('inf')),
+                "type": details.get('stationType', 'Unknown'), "pad_int": _station_pad_int(details.get('maxLandingPadSize')),
+                "distance_ls": _float_or_inf(details.get('distanceToArrival'))
+            })
+    return stations
+
+
+class _TradeJoin:
+    """Jointures des routes générales, partagées par tous les profils (A->X par valeur de top N importations)."""
+
+    def __init__(self, departure_offers, stations, cancel_event):
+        self.stations = stations
+        self.cancel_event = cancel_event
+        self.buys_at_a = [{'commodityName': o.get('commodityName'), 'commodity_localised': o.get('commodity_localised', o.get('commodityName')), 'price': o.get('buyPrice'), 'quantity_at_station': o.get('stock')}
+                          for o in departure_offers if o.get('buyPrice', 0) > 0 and o.get('stock', 0) > 0]
+        self.sells_to_a = [{'commodityName': o.get('commodityName'), 'commodity_localised': o.get('commodity_localised', o.get('commodityName')), 'price': o.get('sellPrice'), 'quantity_at_station': o.get('demand')}
+                           for o in departure_offers if o.get('sellPrice', 0) > 0 and o.get('demand', 0) > 0]
+        self._a_to_x = {} # top N -> [classement par station]
+        self._x_to_a = None
+
+    def _check_cancel(self, index):
+        if self.cancel_event and self.cancel_event.is_set() and index % 50 == 0:
+            raise OperationCancelledError("Fleet evaluation cancelled.")
+
+    def a_to_x(self, top_n_imports):
+        if top_n_imports not in self._a_to_x:
+            ranked = []
+            for index, station in enumerate(self.stations):
+                self._check_cancel(index)
+                imports = station["data"].get('buys_from_player', [])
+                top_imports = sorted(imports, key=lambda item: item.get('price', 0), reverse=True)[:top_n_imports] if imports else []
+                ranked.append(optimizer_logic.rank_potential_trades(self.buys_at_a, top_imports) if self.buys_at_a and top_imports else [])
+            self._a_to_x[top_n_imports] = ranked
+        return self._a_to_x[top_n_imports]
+
+    def x_to_a(self):
+        if self._x_to_a is None:
+            ranked = []
+            for index, station in enumerate(self.stations):
+                self._check_cancel(index)
+                exports = station["data"].get('sells_to_player', [])
+                ranked.append(optimizer_logic.rank_potential_trades(exports, self.sells_to_a) if self.sells_to_a and exports else [])
+            self._x_to_a = ranked
+        return self._x_to_a
+
+
+def _mission_offer_rows(needs, snapshot, fallback_system):
+    """Offres des stations pour les marchandises des missions (stock suffisant), attributs de filtrage inclus."""
+    rows = [] # ((station, système), distance_ly, marchandise, prix, type, pad, distance_ls)
+    def _add(offers, system_name, station_name, distance_ly, details, from_departure):
+        for offer in offers:
+            name = offer.get('commodityName', '').lower()
+            if not name or name not in needs:
+                continue
+            if from_departure:
+                price, stock, distance_ls = offer.get('buyPrice', 0), offer.get('stock', 0), 0.0
+            else:
+                price, stock = offer.get('price', 0), offer.get('stock', offer.get('quantity_at_station', 0))
+                distance_ls = _float_or_inf(offer.get('distanceToArrival', details.get('distanceToArrival')))
+            if stock >= needs[name] and price > 0:
+                rows.append(((station_name, system_name), distance_ly, name, price, offer.get('stationType', details.get('stationType', 'Unknown')),
+                             _station_pad_int(offer.get('maxLandingPadSize', details.get('maxLandingPadSize'))), distance_ls))
+    for station in _market_stations(snapshot.local_market):
+        offers = station["data"].get('sells_to_player')
+        if isinstance(offers, list):
+            _add(offers, station["system"], station["station"], station["distance_ly"], station["data"].get('details', {}), False)
+    departure = snapshot.departure
+    if departure and isinstance(departure.get('offers'), list):
+        offers = departure['offers']
+        details = {'stationType': offers[0].get('stationType', 'Unknown'), 'maxLandingPadSize': offers[0].get('maxLandingPadSize')} if offers else {}
+        _add(offers, departure.get('system', fallback_system), departure.get('station', "?"), 0.0, details, True)
+    return rows
+
+
+# ---- Évaluation par profil ----
+
+def _profile_general_trades(join, system_name, station_name, filters, pad_int, cargo):
+    routes = []
+    current_label = station_name or system_name
+    a_to_x = join.a_to_x(filters.top_n_imports)
+    for station, ranked in zip(join.stations, a_to_x):
+        if ranked and _station_passes(filters, pad_int, station["type"], station["pad_int"], station["distance_ls"]):
+            for trade in optimizer_logic.fill_cargo_with_trades(ranked, cargo):
+                routes.append({'route_type_display': f"{current_label} -> {station['station']} ({station['system']})", 'is_A_to_X': True,
+                               'source_system': system_name, 'source_station': station_name or "Current Location",
+                               'dest_system': station['system'], 'dest_station': station['station'],
+                               'dest_ly_dist': station['distance_ly'], 'dest_ls_dist': station['distance_ls'], **trade})
+    for index, (station, ranked) in enumerate(zip(join.stations, join.x_to_a())):
+        if ranked and _station_passes(filters, pad_int, station["type"], station["pad_int"], station["distance_ls"]):
+            for trade in optimizer_logic.fill_cargo_with_trades(ranked, cargo):
+                routes.append({'route_type_display': f"{station['station']} ({station['system']}) -> {current_label}", 'is_A_to_X': False,
+                               'source_system': station['system'], 'source_station': station['station'],
+                               'source_ly_dist': station['distance_ly'], 'source_ls_dist': station['distance_ls'],
+                               'dest_system': system_name, 'dest_station': station_name or "Current Location",
+                               '_station_index': index, **trade})
+    routes.sort(key=lambda route: route.get('total_profit', 0), reverse=True)
+    top_routes = routes[:filters.max_general_trade_routes]
+    for route in top_routes: # Aller préliminaire A -> X pour les routes X -> A (comme find_general_market_trades)
+        station_index = route.pop('_station_index', None)
+        if station_index is not None and join.buys_at_a:
+            preliminary = optimizer_logic.fill_cargo_with_trades(a_to_x[station_index], cargo)
+            if preliminary:
+                route['preliminary_outbound_leg'] = preliminary[:1]
+    return top_routes
+
+
+def _profile_missions(rows, needs, total_reward, filters, pad_int):
+    station_candidates = {}
+    for station_key, distance_ly, name, price, station_type, station_pad_int, distance_ls in rows:
+        if _station_passes(filters, pad_int, station_type, station_pad_int, distance_ls):
+            candidate = station_candidates.setdefault(station_key, {'distance_ly': distance_ly, 'commodities': {}, 'pad_size_int': station_pad_int,
+                                                                    'distance_ls': distance_ls, 'stationType': station_type})
+            candidate['commodities'][name] = price
+    full_opts, partial_opts, complement_opts = optimizer_logic.assemble_supply_options(needs, station_candidates)
+    return analysis_api.finish_mission_sourcing(needs, total_reward, full_opts, partial_opts, complement_opts, filters.sort_by)
+
+
+@perf_trace.traced("optimizer.fleet")
+def evaluate_fleet(profiles, system_name, station_name, snapshot, base_filters, needs=None, total_reward=0, cancel_event=None):
+    """
+    Évalue tous les profils sur le même instantané : routes générales (toujours) et approvisionnement
+    des missions (si `needs`). Retourne un FleetEvaluationResult (voir profit_table()).
+    """
+    started = time.perf_counter()
+    stations = _market_stations(snapshot.local_market)
+    join = _TradeJoin(snapshot.departure_offers(), stations, cancel_event)
+    for top_n_imports in {(profile.filters or base_filters).top_n_imports for profile in profiles}:
+        join.a_to_x(top_n_imports)
+    join.x_to_a()
+    mission_rows = _mission_offer_rows(needs, snapshot, system_name) if needs else None
+    shared_seconds = time.perf_counter() - started
+
+    result = FleetEvaluationResult(system_name, station_name)
+    for profile in profiles:
+        if cancel_event and cancel_event.is_set():
+            raise OperationCancelledError("Fleet evaluation cancelled.")
+        filters = profile.filters or base_filters
+        evaluation = ProfileEvaluation(profile.name, profile.cargo_capacity, profile.pad_size, filters)
+        evaluation.general_trades = _profile_general_trades(join, system_name, station_name, filters, profile.pad_size_int, profile.cargo_capacity)
+        if mission_rows is not None:
+            evaluation.missions = _profile_missions(mission_rows, needs, total_reward, filters, profile.pad_size_int)
+        result.profiles.append(evaluation)
+    total_seconds = time.perf_counter() - started
+    result.timings = {"stations": len(stations), "shared_join_s": round(shared_seconds, 4), "total_s": round(total_seconds, 4)}
+    logger.info(f"Fleet evaluation: {len(profiles)} profiles over {len(stations)} stations in {total_seconds:.3f}s.")
+    return result
@@ -7,7 +7,6 @@ import threading
 import asyncio
 import math
 import os
-import json
 import aiohttp
 
 from constants import (
@@ -28,9 +27,14 @@ from constants import (
 )
 import settings_manager
 import journal_parser
+import journal_state
+import journal_watcher
 import api_handler
 from api_handler import OperationCancelledError
 import optimizer_logic
+import analysis_api
+import perf_trace
+import dataset_manager
 import language as lang_module
 import shipyard_db_manager
 
@@ -195,6 +199,25 @@ def refresh_location_and_ship_display():
     threading.Thread(target=_task, daemon=True).start()
 
 
+def _on_journal_update(update_type, event_data):
+    """ Callback du journal_watcher (thread du watcher) : applique l'événement à l'état joueur sans re-parser les journaux. """
+    global CURRENT_SYSTEM_ANALYSIS, CURRENT_STATION_ANALYSIS, CURRENT_SHIP_TYPE_ANALYSIS
+    global CURRENT_CARGO_CAPACITY_ANALYSIS, CURRENT_PAD_SIZE_ANALYSIS
+
+    if update_type == journal_watcher.UPDATE_LOCATION:
+        CURRENT_SYSTEM_ANALYSIS, CURRENT_STATION_ANALYSIS = journal_parser.get_current_location_from_events([event_data])
+    elif update_type == journal_watcher.UPDATE_SHIP:
+        CURRENT_SHIP_TYPE_ANALYSIS, CURRENT_CARGO_CAPACITY_ANALYSIS, CURRENT_PAD_SIZE_ANALYSIS = \
+            journal_parser.get_ship_info_from_loadout_event(event_data)
+    else:
+        return
+
+    if s_shared_root and s_shared_root.winfo_exists():
+        s_shared_root.after(0, _update_gui_with_player_info,
+                            CURRENT_SYSTEM_ANALYSIS, CURRENT_STATION_ANALYSIS, CURRENT_SHIP_TYPE_ANALYSIS,
+                            CURRENT_CARGO_CAPACITY_ANALYSIS, CURRENT_PAD_SIZE_ANALYSIS, EFFECTIVE_JOURNAL_DIR_ANALYSIS)
+
+
 def update_commodities_display_in_gui(needs_dict):
     global commod_list, total_lbl, s_shared_root
     if not all([commod_list, total_lbl, s_shared_root]):
@@ -340,15 +363,20 @@ def on_update_db_pressed():
 
         def _run_in_thread():
             loop = None
+            trace_operation = perf_trace.start_operation("db_refresh", system=CURRENT_SYSTEM_ANALYSIS, station=CURRENT_STATION_ANALYSIS, radius_ly=radius_to_use)
+            trace_status = perf_trace.STATUS_OK
             try:
                 loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop); loop.run_until_complete(_async_db_update_task_wrapper())
+                if s_cancel_main_event.is_set(): trace_status = perf_trace.STATUS_CANCELLED
             except Exception as e_thread: # 'e_thread' est défini ici
+                trace_status = perf_trace.STATUS_ERROR
                 logger.exception("Unhandled error running async DB update task in thread:"); msg_err_thread = lang_module.get_string("status_db_update_thread_error", error=e_thread)
                 if not s_cancel_main_event.is_set() and s_update_status_func:
                     s_update_status_func(msg_err_thread, -1, target_status_label_widget=status_lbl)
                 if text_out_mission_supply: text_out_mission_supply.config(state=tk.NORMAL); text_out_mission_supply.insert(tk.END, msg_err_thread + "\n"); text_out_mission_supply.config(state=tk.DISABLED)
             finally:
                 if loop and not loop.is_closed(): loop.close()
+                trace_operation.finish(trace_status)
                 if s_shared_root and s_shared_root.winfo_exists(): s_shared_root.after(0, set_analysis_buttons_state, False, False, "main")
         threading.Thread(target=_run_in_thread, daemon=True).start()
     except ValueError as ve:
@@ -388,13 +416,12 @@ async def async_analysis_task_local(http_session, radius_ly_param, max_db_age_da
         logger.info(f"Analysis using journal directory: {EFFECTIVE_JOURNAL_DIR_ANALYSIS}")
         try: num_journal_files_for_missions = int(settings_manager.get_setting(KEY_NUM_JOURNAL_FILES_MISSIONS, DEFAULT_NUM_JOURNAL_FILES_MISSIONS))
         except ValueError: num_journal_files_for_missions = DEFAULT_NUM_JOURNAL_FILES_MISSIONS
-        journal_events_for_missions = journal_parser.load_journal_events(EFFECTIVE_JOURNAL_DIR_ANALYSIS, num_files_to_check=num_journal_files_for_missions)
+        # Magasin d'état partagé : checkpoint + vue mémorisée, recalculée seulement si le journal a changé
+        if journal_state.get_location_view(EFFECTIVE_JOURNAL_DIR_ANALYSIS) is None: mission_supply_output_segments.append((lang_module.get_string("materials_no_journal_events_status") + f" (checked {num_journal_files_for_missions} files)\n", None))
         if cancel_event.is_set(): raise OperationCancelledError("Analysis cancelled (after loading journal).")
-        if not journal_events_for_missions: mission_supply_output_segments.append((lang_module.get_string("materials_no_journal_events_status") + f" (checked {num_journal_files_for_missions} files)\n", None))
         
-        needed_commodities = {}; total_rewards_from_missions = 0
         progress_callback_gui(lang_module.get_string("status_parsing_missions"), 10)
-        if journal_events_for_missions: needed_commodities, total_rewards_from_missions = journal_parser.parse_active_missions(journal_events_for_missions)
+        needed_commodities, total_rewards_from_missions = journal_state.get_mission_needs_view(EFFECTIVE_JOURNAL_DIR_ANALYSIS)
         
         if s_shared_root: s_shared_root.after(0, lambda nd=needed_commodities: update_commodities_display_in_gui(nd)) # Capturer needed_commodities
         if cancel_event.is_set(): raise OperationCancelledError("Analysis cancelled (after parsing missions).")
@@ -412,6 +439,11 @@ async def async_analysis_task_local(http_session, radius_ly_param, max_db_age_da
         
         if s_shared_root and db_status_label: s_shared_root.after(0, lambda: db_status_label.config(text=optimizer_logic.get_last_db_update_time_str()))
         current_progress_after_db = db_update_end_progress
+        # Entrées de l'API d'analyse (sans Tk) : les moteurs reçoivent position, filtres et données en paramètre
+        analysis_player = analysis_api.PlayerContext(CURRENT_SYSTEM_ANALYSIS, CURRENT_STATION_ANALYSIS, CURRENT_SHIP_TYPE_ANALYSIS, CURRENT_CARGO_CAPACITY_ANALYSIS, CURRENT_PAD_SIZE_ANALYSIS)
+        analysis_filters = analysis_api.AnalysisFilters.from_settings(max_station_dist_ls=max_station_dist_ls_param, include_planetary=include_planetary_param, include_fleet_carriers=include_fleet_carriers_param,
+                                                                      sort_by=sort_by_param, radius_ly=radius_ly_param, max_age_days=max_db_age_days_param, max_stations_for_round_trips=MAX_STATIONS_FOR_ROUND_TRIPS)
+        analysis_snapshot = analysis_api.DataSnapshot(departure=departure_data, local_market=local_data)
         
         if needed_commodities:
             mission_supply_output_segments.extend([(lang_module.get_string("missions_needs_label", count=len(needed_commodities), total_units=sum(needed_commodities.values())), None), (f"{total_rewards_from_missions:,.0f} CR", TAG_REWARD), ("\n", None)])
@@ -424,11 +456,8 @@ async def async_analysis_task_local(http_session, radius_ly_param, max_db_age_da
                  if needed_commodities: mission_supply_output_segments.append((lang_module.get_string("status_db_update_local_error") + " (for mission sourcing)\n", None)); logger.warning("Could not get valid local market data for mission item sourcing.")
             
             progress_callback_gui(lang_module.get_string("status_analyzing_purchase_options"), current_progress_after_db + 5)
-            full_opts, partial_opts, complement_opts = optimizer_logic.generate_purchase_suggestions(needed_commodities, local_data, departure_data, CURRENT_PAD_SIZE_ANALYSIS, max_station_dist_ls_param, include_planetary_param, include_fleet_carriers_param, CURRENT_SYSTEM_ANALYSIS, cancel_event=cancel_event)
-            profit_calc = lambda data: total_rewards_from_missions - sum(needed_commodities.get(cn,0) * cp for cn,cp in data['commodities'].items()); sort_key_func_full = lambda x: x['distance_ly'];
-            if sort_by_param == 'b': sort_key_func_full = lambda x: -profit_calc(x)
-            elif sort_by_param == 's': sort_key_func_full = lambda x: x.get('distance_ls', float('inf'))
-            full_opts.sort(key=sort_key_func_full)
+            sourcing = analysis_api.source_mission_commodities(needed_commodities, total_rewards_from_missions, analysis_player, analysis_filters, analysis_snapshot, cancel_event=cancel_event)
+            full_opts, partial_opts, complement_opts = sourcing.full_options, sourcing.partial_options, sourcing.complementary_sources # Options complètes déjà triées
             
             # Boucle pour full_opts
             if full_opts:
@@ -515,12 +544,7 @@ async def async_analysis_task_local(http_session, radius_ly_param, max_db_age_da
 
             # Logique des routes commerciales aller-retour
             trade_routes_output_segments.extend([("=" * 60 + "\n", None), (lang_module.get_string("missions_round_trip_header") + "\n", TAG_HEADER), ("=" * 60 + "\n\n", None)])
-            candidate_stations_for_loops_info = []; seen_for_loops = set()
-            opts_for_loops = full_opts if full_opts else (partial_opts if partial_opts else [])
-            for opt_data in opts_for_loops:
-                if len(seen_for_loops) >= MAX_STATIONS_FOR_ROUND_TRIPS: break
-                key = (opt_data['system_name'], opt_data['station_name'])
-                if key not in seen_for_loops: candidate_stations_for_loops_info.append(opt_data); seen_for_loops.add(key)
+            candidate_stations_for_loops_info = analysis_api.round_trip_candidates(sourcing, MAX_STATIONS_FOR_ROUND_TRIPS)
             
             num_loop_candidates = len(candidate_stations_for_loops_info); loop_start_progress = current_progress_after_db + 20; loop_end_progress = current_progress_after_db + 40
             if not candidate_stations_for_loops_info: trade_routes_output_segments.append((lang_module.get_string("missions_no_stations_for_round_trip")+"\n", None))
@@ -533,19 +557,8 @@ async def async_analysis_task_local(http_session, radius_ly_param, max_db_age_da
                     pickup_sys = station_info_for_loop['system_name']; pickup_sta = station_info_for_loop['station_name']
                     progress_callback_gui(f"Analyzing round trip for {pickup_sta} ({idx+1}/{num_loop_candidates})...", int(current_loop_prog_val))
 
-                    player_buys_from_pickup_offers = [] # Réinitialiser pour chaque station
-                    station_b_is_current_station_a = (pickup_sys == CURRENT_SYSTEM_ANALYSIS and pickup_sta == CURRENT_STATION_ANALYSIS)
-                    if not station_b_is_current_station_a and local_data and pickup_sys in local_data.get('station_markets', {}) and pickup_sta in local_data['station_markets'][pickup_sys].get('stations_data', {}):
-                        station_detail_b = local_data['station_markets'][pickup_sys]['stations_data'][pickup_sta]
-                        player_buys_from_pickup_offers = station_detail_b.get('sells_to_player', [])
-                    elif station_b_is_current_station_a and departure_data: # Si la station de pickup est la station actuelle
-                        player_buys_from_pickup_offers = [{'commodityName': o.get('commodityName'), 'commodity_localised': o.get('commodity_localised', o.get('commodityName')), 'price': o.get('buyPrice', 0), 'stock': o.get('stock', 0), 'quantity_at_station': o.get('stock', 0)} for o in departure_data.get('offers', []) if o.get('buyPrice', 0) > 0 and o.get('stock', 0) > 0]
-                    else: # Données non en cache, appel API
-                        player_buys_from_pickup_offers = await api_handler.get_station_specific_market_data(http_session, pickup_sys, pickup_sta, max_days_ago=max_db_age_days_param, include_fleet_carriers=include_fleet_carriers_param, player_action='buy', cancel_event=cancel_event)
-                    if player_buys_from_pickup_offers is None: player_buys_from_pickup_offers = [] # S'assurer que c'est une liste
-
-                    departure_offers_for_loop = departure_data.get('offers', []) if departure_data else []
-                    outbound_trades_list, return_trades_list = await optimizer_logic.suggest_round_trip_opportunities(http_session, CURRENT_SYSTEM_ANALYSIS, CURRENT_STATION_ANALYSIS, pickup_sys, pickup_sta, sum(needed_commodities.values()), CURRENT_CARGO_CAPACITY_ANALYSIS, departure_offers_for_loop, player_buys_from_pickup_offers, local_data, max_db_age_days_param, include_fleet_carriers_param, cancel_event=cancel_event) # include_fc_param était manquant
+                    round_trip = await analysis_api.find_round_trip(pickup_sys, pickup_sta, sum(needed_commodities.values()), analysis_player, analysis_filters, analysis_snapshot, http_session, cancel_event)
+                    outbound_trades_list, return_trades_list = round_trip.outbound_trades, round_trip.return_trades
                     trade_routes_output_segments.extend([("\n" + "—" * 50 + "\n", None), (lang_module.get_string("missions_trade_ops_for_trip_to", station_name=pickup_sta, system_name=pickup_sys) + "\n", TAG_SUBHEADER), (lang_module.get_string("missions_outbound_from_to", current_station=CURRENT_STATION_ANALYSIS or CURRENT_SYSTEM_ANALYSIS, pickup_station=pickup_sta) + "\n", None)])
                     total_outbound_profit_leg = 0
                     if outbound_trades_list:
@@ -561,7 +574,7 @@ async def async_analysis_task_local(http_session, radius_ly_param, max_db_age_da
                     else: trade_routes_output_segments.append(("    "+lang_module.get_string("missions_no_profitable_return")+"\n", None))
 
         else: # Pas de needed_commodities (pas de missions)
-            if not journal_events_for_missions: mission_supply_output_segments.append((lang_module.get_string("materials_no_journal_events_status") + "\n", None)) # Utiliser une clé plus générique
+            if journal_state.get_location_view(EFFECTIVE_JOURNAL_DIR_ANALYSIS) is None: mission_supply_output_segments.append((lang_module.get_string("materials_no_journal_events_status") + "\n", None)) # Utiliser une clé plus générique
             else: mission_supply_output_segments.append((lang_module.get_string("no_active_missions_found") + "\n", TAG_SUBHEADER))
             
             general_trade_start_progress = current_progress_after_db + 5
@@ -570,7 +583,7 @@ async def async_analysis_task_local(http_session, radius_ly_param, max_db_age_da
                 trade_routes_output_segments.append((lang_module.get_string("status_db_update_local_error") + " (for general trade search)\n", None)); logger.warning("Insufficient market data available for general trade search.")
             else:
                 logger.info(f"Initiating general market trade search. Current Cargo: {CURRENT_CARGO_CAPACITY_ANALYSIS}t")
-                general_trades = await optimizer_logic.find_general_market_trades(http_session, CURRENT_SYSTEM_ANALYSIS, CURRENT_STATION_ANALYSIS, departure_data.get('offers') if departure_data else [], local_data, CURRENT_CARGO_CAPACITY_ANALYSIS, max_station_dist_ls_param, include_planetary_param, include_fleet_carriers_param, CURRENT_PAD_SIZE_ANALYSIS, max_db_age_days_param, include_fleet_carriers_param, cancel_event=cancel_event)
+                general_trades = (await analysis_api.find_general_trades(analysis_player, analysis_filters, analysis_snapshot, http_session, cancel_event)).routes
                 max_general_routes_to_show = int(settings_manager.get_setting(KEY_MAX_GENERAL_TRADE_ROUTES, DEFAULT_MAX_GENERAL_TRADE_ROUTES))
                 trade_routes_output_segments.extend([("=" * 60 + "\n", None), (lang_module.get_string("general_market_trade_routes_header", count=max_general_routes_to_show) + "\n", TAG_HEADER), ("=" * 60 + "\n\n", None)])
                 if general_trades:
@@ -637,10 +650,15 @@ async def async_analysis_task_local(http_session, radius_ly_param, max_db_age_da
             final_mission_segs = list(mission_supply_output_segments)
             final_trade_segs = list(trade_routes_output_segments)
 
-            s_shared_root.after(0, _update_text_outputs_from_thread_final_inner, final_mission_segs, final_trade_segs, final_status_msg_text, analysis_error_occurred, was_cancelled_flag)
+            s_shared_root.after(0, _update_text_outputs_from_thread_final_inner, final_mission_segs, final_trade_segs, final_status_msg_text, analysis_error_occurred, was_cancelled_flag, perf_trace.current_operation())
+
+def _update_text_outputs_from_thread_final_inner(mission_segs, trade_segs, final_status_ui_param, an_error_occurred_param, was_cancelled_param, trace_operation=None):
+    """Fonction interne appelée par .after() pour mettre à jour l'UI finale (rendu compté dans la trace de l'analyse)."""
+    with perf_trace.use(trace_operation), perf_trace.span("ui.render_results"):
+        _render_analysis_outputs(mission_segs, trade_segs, final_status_ui_param, an_error_occurred_param, was_cancelled_param)
 
-def _update_text_outputs_from_thread_final_inner(mission_segs, trade_segs, final_status_ui_param, an_error_occurred_param, was_cancelled_param):
-    """Fonction interne appelée par .after() pour mettre à jour l'UI finale."""
+
+def _render_analysis_outputs(mission_segs, trade_segs, final_status_ui_param, an_error_occurred_param, was_cancelled_param):
     global commod_sugg_btn, text_out_mission_supply, text_out_round_trip, status_lbl, s_update_status_func # Accès aux widgets et fonctions
     
     current_status_to_show_final = final_status_ui_param
@@ -714,6 +732,8 @@ def on_launch_analysis_pressed():
             current_radius_ly = float(s_radius_var.get()); current_max_db_age_days = int(s_age_var.get()); current_max_station_dist_ls = float(s_station_dist_var.get())
             current_sort_by = s_sort_var.get(); current_include_planetary = s_include_planetary_var.get(); current_include_fleet_carriers = s_include_fleet_carriers_var.get()
             loop = None
+            trace_operation = perf_trace.start_operation("analysis", system=CURRENT_SYSTEM_ANALYSIS, station=CURRENT_STATION_ANALYSIS, radius_ly=current_radius_ly)
+            trace_status = perf_trace.STATUS_OK
             try:
                 loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
                 async def main_coro():
@@ -721,14 +741,19 @@ def on_launch_analysis_pressed():
                     async with aiohttp.ClientSession(headers=async_headers) as http_session:
                          await async_analysis_task_local(http_session, current_radius_ly, current_max_db_age_days, current_max_station_dist_ls, current_sort_by, current_include_planetary, current_include_fleet_carriers, s_cancel_main_event, _analysis_progress_callback)
                 loop.run_until_complete(main_coro())
-            except OperationCancelledError: logger.info("Analysis (thread wrapper) was cancelled.")
+            except OperationCancelledError: logger.info("Analysis (thread wrapper) was cancelled."); trace_status = perf_trace.STATUS_CANCELLED
             except Exception as e_thread_async: # 'e_thread_async' est défini ici
+                trace_status = perf_trace.STATUS_ERROR
                 logger.exception("Critical error in async analysis execution (thread):"); error_message_for_ui = lang_module.get_string("async_analysis_error", error=e_thread_async)
                 if not s_cancel_main_event.is_set() and s_shared_root:
                      s_shared_root.after(0, _handle_thread_exception_ui_local, error_message_for_ui, False, status_lbl, e_val=e_thread_async) # Passer e_val
             finally:
                 if loop and not loop.is_closed(): loop.close()
-                if s_shared_root and s_shared_root.winfo_exists(): s_shared_root.after(0, lambda: set_analysis_buttons_state(False, False, "main"))
+                if s_shared_root and s_shared_root.winfo_exists():
+                    trace_operation.leave_thread()
+                    s_shared_root.after(0, lambda: set_analysis_buttons_state(False, False, "main"))
+                    s_shared_root.after(0, trace_operation.finish, trace_status) # Après le rendu des résultats (déjà planifié) : inclus dans la trace
+                else: trace_operation.finish(trace_status)
                 logger.info("Async analysis thread (outer function) completed.")
         threading.Thread(target=_run_async_analysis_in_thread, daemon=True).start()
     except ValueError as ve_settings: # 've_settings' est défini ici
@@ -793,9 +818,10 @@ def on_commodities_suggestions_pressed():
     notebook_sugg = ttk.Notebook(commod_sugg_window); notebook_sugg.pack(expand=True, fill='both', padx=10, pady=5)
     sugg_status_label_widget = ttk.Label(commod_sugg_window, text=lang_module.get_string("commod_sugg_status_loading"), style="Status.TLabel"); sugg_status_label_widget.pack(fill=tk.X, padx=10, pady=(0,5))
     local_data_cache = None
-    if os.path.exists(LOCAL_SELLERS_DATA_FILE):
+    if dataset_manager.dataset_exists(dataset_manager.DATASET_LOCAL_MARKET):
         try:
-            with open(LOCAL_SELLERS_DATA_FILE, 'r', encoding='utf-8') as f: local_data_cache = json.load(f)
+            local_data_cache = dataset_manager.get_dataset(dataset_manager.DATASET_LOCAL_MARKET) # Partagé, seuls les systèmes consultés sont décompressés
+            if local_data_cache is None: raise ValueError(f"invalid snapshot {LOCAL_SELLERS_DATA_FILE}")
         except Exception as e: # 'e' est défini ici
             logger.error(f"Could not load {LOCAL_SELLERS_DATA_FILE} for suggestions: {e}"); sugg_status_label_widget.config(text=lang_module.get_string("commod_sugg_error_loading_local", error=e))
             if commod_sugg_window and commod_sugg_window.winfo_exists(): _on_sugg_close()
@@ -944,6 +970,9 @@ def create_analysis_tab(notebook_parent, shared_elements_dict):
     s_sort_treeview_column_general_func = shared_elements_dict["sort_treeview_column_func"]
     s_update_journal_dir_display_label_func = shared_elements_dict.get("update_journal_dir_display_label_func") # Récupérer la fonction
 
+    journal_watcher.subscribe(_on_journal_update, [journal_watcher.UPDATE_LOCATION, journal_watcher.UPDATE_SHIP])
+    journal_state.subscribe_mission_needs(lambda needs, _reward: update_commodities_display_in_gui(needs)) # Besoins mis à jour en direct
+
     # Référence à la fenêtre des paramètres (si passée, pour le parentage des dialogues)
     # s_settings_window_ref = shared_elements_dict.get("settings_window_instance_ref") # Exemple
 
@@ -22,6 +22,7 @@ from constants import (
     KEY_INCLUDE_PLANETARY, KEY_INCLUDE_FLEET_CARRIERS, KEY_LANGUAGE,
     KEY_CUSTOM_JOURNAL_DIR, KEY_CUSTOM_PAD_SIZES, KEY_SORT_OPTION,
     DEFAULT_LANGUAGE,
+    KEY_EDDN_LISTENER_ENABLED, KEY_EDDN_RELAY_URL, DEFAULT_EDDN_RELAY_URL,
     PURCHASABLE_SHIPS_LIST,
     DEFAULT_SHIPYARD_RADIUS_LY,
     DEFAULT_OUTFITTING_RADIUS_LY,
@@ -32,6 +33,11 @@ from constants import (
 )
 import settings_manager
 import journal_parser
+import journal_index
+import price_history
+import eddn_listener
+import journal_state
+import journal_watcher
 import language as lang_module
 import optimizer_logic
 import shipyard_db_manager
@@ -44,6 +50,7 @@ import gui_shipyard_tab
 import gui_outfitting_tab
 import gui_materials_tab
 import gui_multihop_trade_tab # <<< NOUVEL IMPORT
+import gui_performance_tab
 import gui_settings_window
 
 logger = logging.getLogger(__name__)
@@ -272,6 +279,7 @@ def update_gui_text_after_language_change():
             if num_tabs > 3: notebook.tab(3, text=lang_module.get_string("outfitting_tab_title"))
             if num_tabs > 4: notebook.tab(4, text=lang_module.get_string("materials_tab_title"))
             if num_tabs > 5: notebook.tab(5, text=lang_module.get_string("multihop_trade_tab_title")) # <<< NOUVELLE LIGNE
+            if num_tabs > 6: notebook.tab(6, text=lang_module.get_string("performance_tab_title"))
 
             if current_tab_idx != -1 and current_tab_idx < num_tabs and notebook.winfo_exists(): # Re-vérifier winfo_exists
                 notebook.select(current_tab_idx)
@@ -285,6 +293,7 @@ def update_gui_text_after_language_change():
     if hasattr(gui_outfitting_tab, 'update_outfitting_tab_texts'): gui_outfitting_tab.update_outfitting_tab_texts()
     if hasattr(gui_materials_tab, 'update_materials_tab_texts'): gui_materials_tab.update_materials_tab_texts()
     if hasattr(gui_multihop_trade_tab, 'update_multihop_trade_tab_texts'): gui_multihop_trade_tab.update_multihop_trade_tab_texts() # <<< NOUVELLE LIGNE
+    if hasattr(gui_performance_tab, 'update_performance_tab_texts'): gui_performance_tab.update_performance_tab_texts()
 
     if gui_settings_window.settings_window and gui_settings_window.settings_window.winfo_exists():
         gui_settings_window.settings_window.destroy()
@@ -448,6 +457,7 @@ def create_main_window(main_root):
     gui_outfitting_tab.create_outfitting_tab(notebook, shared_gui_elements)
     gui_materials_tab.create_materials_tab(notebook, shared_gui_elements)
     gui_multihop_trade_tab.create_multihop_trade_tab(notebook, shared_gui_elements) # <<< NOUVELLE LIGNE
+    gui_performance_tab.create_performance_tab(notebook, shared_gui_elements)
 
     notebook.pack(expand=True, fill='both', pady=(0, 5))
 
@@ -460,6 +470,12 @@ def create_main_window(main_root):
     _set_buttons_state(False)
     if hasattr(gui_analysis_tab, 'refresh_location_and_ship_display'):
         root.after(100, gui_analysis_tab.refresh_location_and_ship_display)
+    journal_state.attach_to_watcher()
+    journal_watcher.start_watching() # Suit les nouveaux événements une fois le répertoire du journal résolu
+    journal_index.start_background_ingester() # Index SQLite de l'historique complet, construit en arrière-plan
+    price_history.start_market_json_ingest() # Historique des prix alimenté par Market.json
+    if settings_manager.get_setting(KEY_EDDN_LISTENER_ENABLED, False):
+        eddn_listener.start_listener(settings_manager.get_setting(KEY_EDDN_RELAY_URL, DEFAULT_EDDN_RELAY_URL)) # Prix quasi temps réel (pyzmq optionnel)
     root.after(200, update_gui_text_after_language_change)
     logger.debug("Main GUI window creation complete with Elite Dangerous styling.")
 
@@ -14,6 +14,7 @@ from constants import (
 )
 import language as lang_module
 import journal_parser
+import journal_state
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +24,7 @@ materials_tab_status_lbl = None # Pour le timestamp/statut
 treeviews = {} # Dictionnaire pour stocker les treeviews par catégorie
 refresh_materials_button_widget = None # Référence au bouton de rafraîchissement
 s_shared_root = None # Référence à la fenêtre racine de l'application
+material_rows = {} # catégorie -> {nom interne: (iid, values, tags)} des lignes affichées, pour ne repeindre que les changements
 
 MATERIAL_ROW_TAGS_CONFIG = [
     ('percent_0_9', ED_MAT_DARK_RED, ED_MAT_TEXT_ON_DARK),
@@ -144,6 +146,7 @@ def create_materials_tab(notebook_widget, shared_elements_dict):
         
         treeviews[category] = tree
     
+    journal_state.subscribe_materials(_on_materials_changed)
     logger.info("Materials tab created.")
     # Appel initial pour charger les matériaux si souhaité (ex: après un délai)
     # if s_shared_root:
@@ -152,8 +155,30 @@ def create_materials_tab(notebook_widget, shared_elements_dict):
     return materials_tab_page_frame # Retourner le frame principal de l'onglet
 
 
+def _build_material_row(category, mat_const_data):
+    """Retourne (nom interne, values, tags, grade, nom affiché) d'une ligne de matériau."""
+    mat_name_internal_lower = mat_const_data["Name"].lower()
+    mat_grade = mat_const_data["Grade"]
+    mat_name_display = mat_const_data.get("Name_Localised", mat_name_internal_lower.capitalize())
+
+    player_mat_data = materials_data_store.get(category, {}).get(mat_name_internal_lower, {})
+    quantity = player_mat_data.get("Count", 0)
+    limit = get_material_limit(mat_name_internal_lower, category, mat_grade)
+    
+    percentage_float = 0.0
+    if limit > 0:
+        percentage_float = min(100.0, (quantity / limit) * 100.0) # Assurer que ça ne dépasse pas 100% pour la couleur
+    percentage_str = f"{percentage_float:.1f}%"
+    
+    row_tag_name = get_row_tag_for_percentage(percentage_float)
+    # S'assurer que `tags` est un tuple, même s'il est vide ou contient un seul élément.
+    current_tags = (row_tag_name,) if row_tag_name else ()
+    values = (mat_name_display, mat_grade, quantity, limit, percentage_str)
+    return mat_name_internal_lower, values, current_tags, mat_grade, mat_name_display
+
+
 def update_materials_display():
-    global materials_data_store, treeviews, materials_tab_status_lbl
+    global materials_data_store, treeviews, materials_tab_status_lbl, material_rows
 
     if not treeviews:
         logger.warning("Materials display update called but treeviews not ready.")
@@ -165,46 +190,33 @@ def update_materials_display():
         for category, tree in treeviews.items():
              if tree.winfo_exists():
                 for i in tree.get_children(): tree.delete(i)
+        material_rows = {}
         return
 
+    rows_repainted = 0
     for category, tree in treeviews.items():
         if not tree.winfo_exists(): continue
-        for i in tree.get_children(): tree.delete(i)
-
-        all_mats_in_cat = ALL_MATERIALS_DATA.get(category, [])
-        items_to_display = []
-
-        for mat_const_data in all_mats_in_cat:
-            mat_name_internal_lower = mat_const_data["Name"].lower()
-            mat_grade = mat_const_data["Grade"]
-            mat_name_display = mat_const_data.get("Name_Localised", mat_name_internal_lower.capitalize())
-
-            player_mat_data = materials_data_store.get(category, {}).get(mat_name_internal_lower, {})
-            quantity = player_mat_data.get("Count", 0)
-            limit = get_material_limit(mat_name_internal_lower, category, mat_grade)
-            
-            percentage_float = 0.0
-            if limit > 0:
-                percentage_float = min(100.0, (quantity / limit) * 100.0) # Assurer que ça ne dépasse pas 100% pour la couleur
-            percentage_str = f"{percentage_float:.1f}%"
-            
-            row_tag_name = get_row_tag_for_percentage(percentage_float)
-            # S'assurer que `tags` est un tuple, même s'il est vide ou contient un seul élément.
-            current_tags = (row_tag_name,) if row_tag_name else ()
-
-            items_to_display.append({
-                "name_display": mat_name_display, "grade": mat_grade, "quantity": quantity,
-                "limit": limit, "percentage_str": percentage_str,
-                "percentage_float": percentage_float, "tag": current_tags
-            })
-        
-        items_to_display.sort(key=lambda x: (x["grade"], x["name_display"].lower()))
-
-        for item_data in items_to_display:
-            tree.insert("", tk.END, values=(
-                item_data["name_display"], item_data["grade"], item_data["quantity"],
-                item_data["limit"], item_data["percentage_str"]
-            ), tags=item_data["tag"])
+        displayed_rows = material_rows.get(category)
+        new_rows = [_build_material_row(category, mat_const_data) for mat_const_data in ALL_MATERIALS_DATA.get(category, [])]
+
+        if displayed_rows is None or len(displayed_rows) != len(new_rows) or not all(tree.exists(row[0]) for row in displayed_rows.values()):
+            # Premier affichage (ou arbre vidé) : insertion complète, triée par grade puis nom
+            for i in tree.get_children(): tree.delete(i)
+            displayed_rows = material_rows[category] = {}
+            for mat_name_internal_lower, values, tags, _grade, _name in sorted(new_rows, key=lambda row: (row[3], row[4].lower())):
+                iid = tree.insert("", tk.END, values=values, tags=tags)
+                displayed_rows[mat_name_internal_lower] = (iid, values, tags)
+            rows_repainted += len(new_rows)
+            continue
+
+        # Mise à jour en place des seules lignes modifiées (conserve l'ordre de tri choisi par l'utilisateur)
+        for mat_name_internal_lower, values, tags, _grade, _name in new_rows:
+            iid, displayed_values, displayed_tags = displayed_rows[mat_name_internal_lower]
+            if values != displayed_values or tags != displayed_tags:
+                tree.item(iid, values=values, tags=tags)
+                displayed_rows[mat_name_internal_lower] = (iid, values, tags)
+                rows_repainted += 1
+    logger.debug(f"Materials display: {rows_repainted} rows repainted.")
 
     if materials_tab_status_lbl and materials_tab_status_lbl.winfo_exists():
         timestamp = materials_data_store.get("timestamp", "N/A")
@@ -218,6 +230,17 @@ def update_materials_display():
         materials_tab_status_lbl.config(text=lang_module.get_string('materials_status_updated_at', timestamp=formatted_timestamp))
 
 
+def _on_materials_changed(new_materials):
+    """ Callback de journal_state : registre des matériaux modifié (instantané ou delta) -> repeint des lignes changées. """
+    def _apply():
+        global materials_data_store
+        materials_data_store = new_materials
+        update_materials_display()
+
+    if s_shared_root and s_shared_root.winfo_exists():
+        s_shared_root.after(0, _apply)
+
+
 def refresh_materials_data_display(shared_elements):
     global materials_data_store, materials_tab_status_lbl, refresh_materials_button_widget, s_shared_root
     
@@ -251,15 +274,11 @@ def refresh_materials_data_display(shared_elements):
             if not effective_journal_dir or effective_journal_dir in ["Not Found", "Auto-detecting...", "Error processing journals", "No Journal Dir"]:
                 error_occurred_msg = lang_module.get_string("materials_journal_dir_not_found_error")
             else:
-                events = journal_parser.load_journal_events(effective_journal_dir, num_files_to_check=20) # Lire plus de fichiers pour l'event Materials
-                if not events:
-                    logger.warning("No journal events found for materials parsing.")
-                    error_occurred_msg = lang_module.get_string("materials_no_journal_events_status")
-                else:
-                    current_mats_from_journal_local = journal_parser.get_current_materials_from_events(events)
-                    if not (current_mats_from_journal_local and current_mats_from_journal_local.get("timestamp")):
-                        logger.warning("Failed to refresh materials: 'Materials' event not found or empty in recent logs.")
-                        error_occurred_msg = lang_module.get_string("materials_event_not_found_warning")
+                # Vue partagée du magasin d'état journal (aucune relecture si rien n'a changé)
+                current_mats_from_journal_local = journal_state.get_materials_view(effective_journal_dir)
+                if not (current_mats_from_journal_local and current_mats_from_journal_local.get("timestamp")):
+                    logger.warning("Failed to refresh materials: 'Materials' event not found or empty in recent logs.")
+                    error_occurred_msg = lang_module.get_string("materials_event_not_found_warning")
         except Exception as e:
             logger.exception("Exception during materials data fetching task:")
             error_occurred_msg = lang_module.get_string("materials_error_refreshing", error=str(e))
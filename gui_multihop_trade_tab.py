@@ -25,7 +25,9 @@ from constants import (
 import api_handler
 from api_handler import OperationCancelledError
 import optimizer_logic
+import perf_trace
 import settings_manager
+import journal_watcher
 
 logger = logging.getLogger(__name__)
 
@@ -129,6 +131,20 @@ def _load_saved_route():
             return False
     return False
 
+def _on_journal_update(update_type, event_data):
+    """Callback du journal_watcher : signale l'arrivée à la destination d'une étape de l'itinéraire."""
+    if event_data.get("event") != "Docked":
+        return
+    docked_station = event_data.get("StationName")
+    docked_system = event_data.get("StarSystem")
+    for leg in current_planning_state["planned_route_legs"]:
+        if leg.get("dest_station") == docked_station and leg.get("dest_system") == docked_system:
+            logger.info(f"Docked at destination of leg {leg.get('hop_num')}: {docked_station} ({docked_system})")
+            if s_shared_root_multihop and s_shared_root_multihop.winfo_exists():
+                s_shared_root_multihop.after(0, _update_status_local, lang_module.get_string(
+                    "multihop_status_docked_at_leg_dest", station_name=docked_station, leg_num=leg.get("hop_num")))
+            break
+
 # --- Fonctions de l'UI (existantes, avec modifications mineures si besoin) ---
 def _update_status_local(message, percentage=None, indeterminate=False):
     # ... (inchangée)
@@ -276,6 +292,8 @@ def _plan_next_hop():
         loop = None
         found_trades_local = []
         error_message_local = None
+        trace_operation = perf_trace.start_operation("hop_plan", hop=hop_num, system=source_system, station=source_station)
+        trace_status = perf_trace.STATUS_OK
 
         try:
             loop = asyncio.new_event_loop()
@@ -341,8 +359,10 @@ def _plan_next_hop():
 
         except OperationCancelledError as oce:
             error_message_local = lang_module.get_string("multihop_status_route_cancelled")
+            trace_status = perf_trace.STATUS_CANCELLED
             logger.info(f"Hop planning task cancelled: {oce}")
         except Exception as e:
+            trace_status = perf_trace.STATUS_ERROR
             logger.exception(f"Error during hop {hop_num} planning task:")
             error_message_local = lang_module.get_string("materials_error_refreshing", error=str(e))
         finally:
@@ -353,16 +373,22 @@ def _plan_next_hop():
                     _update_status_local(error_message_local, -1)
                     if "cancelled" not in error_message_local.lower() and s_shared_root_multihop:
                          messagebox.showerror(lang_module.get_string("error_dialog_title"), error_message_local, parent=s_shared_root_multihop)
-                elif found_trades_local:
-                    _populate_suggestions_tree(found_trades_local)
                 else:
-                    _update_status_local(lang_module.get_string("multihop_status_no_trades_found"), 100)
-                    _populate_suggestions_tree([])
+                    with perf_trace.use(trace_operation), perf_trace.span("ui.render_hop_suggestions", suggestions=len(found_trades_local)):
+                        if found_trades_local:
+                            _populate_suggestions_tree(found_trades_local)
+                        else:
+                            _update_status_local(lang_module.get_string("multihop_status_no_trades_found"), 100)
+                            _populate_suggestions_tree([])
+                trace_operation.finish(trace_status)
 
                 if s_set_buttons_state_func_global: s_set_buttons_state_func_global(operation_running=False)
             
             if s_shared_root_multihop and s_shared_root_multihop.winfo_exists():
+                trace_operation.leave_thread()
                 s_shared_root_multihop.after(0, _finalize_hop_ui)
+            else:
+                trace_operation.finish(trace_status)
 
     threading.Thread(target=_task_for_hop_planning, daemon=True).start()
 
@@ -660,6 +686,7 @@ def create_multihop_trade_tab(notebook_widget, shared_elements_dict):
     tab_content_area.rowconfigure(2, weight=1) # summary_frame
     tab_content_area.rowconfigure(3, weight=0) # multihop_status_lbl
 
+    journal_watcher.subscribe(_on_journal_update, [journal_watcher.UPDATE_LOCATION])
     logger.info("Multi-Hop Trade Planner tab UI elements created.")
     return multihop_tab_page_frame_ref
 
@@ -15,6 +15,8 @@ import gui_main # Accès à sort_treeview_column_general et _set_buttons_state
 import module_catalog_data
 import outfitting_db_manager
 import outfitting_logic
+import dataset_manager
+import perf_trace
 
 logger = logging.getLogger(__name__)
 
@@ -240,15 +242,20 @@ def on_update_outfitting_db_pressed():
         
         def _run_in_thread():
             loop = None
+            trace_operation = perf_trace.start_operation("outfitting_refresh", system=current_system, radius_ly=radius_to_use)
+            trace_status = perf_trace.STATUS_OK
             try: 
                 loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
                 loop.run_until_complete(_async_task())
+                if s_cancel_outfitting_event.is_set(): trace_status = perf_trace.STATUS_CANCELLED
             except Exception as e_thread: 
+                trace_status = perf_trace.STATUS_ERROR
                 logger.exception("Erreur thread MàJ BD Équipement:"); msg_err = lang_module.get_string("status_outfitting_db_thread_error", error=e_thread)
                 if not s_cancel_outfitting_event.is_set() and s_update_status_func_global:
                      s_update_status_func_global(msg_err, -1, target_status_label_widget=outfitting_search_status_lbl)
             finally:
                 if loop and not loop.is_closed(): loop.close()
+                trace_operation.finish(trace_status)
                 if s_root and s_root.winfo_exists():
                     s_root.after(0, gui_main._set_buttons_state, False, False)
                     s_root.after(0, set_outfitting_buttons_state, False, False, "outfitting_search")
@@ -297,7 +304,8 @@ def on_find_outfitting_pressed():
             requested_module_ids=module_ids_to_search, all_outfitting_data=local_outfitting_db,
             current_player_system_coords=current_sys_coords, max_distance_ly_filter=dist_ly_filter,
             include_planetary=s_include_planetary_var.get(), include_fleet_carriers=s_include_fleet_carriers_var.get(),
-            max_station_dist_ls=dist_ls_filter
+            max_station_dist_ls=dist_ls_filter,
+            module_systems_index=dataset_manager.get_index(dataset_manager.DATASET_OUTFITTING, "module_systems", outfitting_logic.build_module_systems_index)
         )
         if outfitting_notebook: outfitting_notebook.select(outfitting_results_frame)
         if found_stations:
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Onglet "Performance" : opérations en cours et récentes (perf_trace) et métriques en direct (perf_metrics) :
+requêtes en cours par hôte, limite de concurrence des téléchargements, latences, caches, jeux de données,
+mémoire du processus, durées des étapes de l'optimiseur et retard de la boucle d'événements Tk.
+Rafraîchi toutes les PERF_PANEL_REFRESH_MS, seulement quand l'onglet est affiché. Le bouton de profil arme
+profiler_capture pour la prochaine analyse, le prochain plan de saut ou la prochaine mise à jour des données.
+"""
+import tkinter as tk
+from tkinter import ttk
+from tkinter.scrolledtext import ScrolledText
+import logging
+import time
+from datetime import datetime
+
+from constants import (
+    PERF_PANEL_REFRESH_MS, PERF_PANEL_LAG_PROBE_MS,
+    ED_MEDIUM_GREY, ED_WHITE_TEXT, BASE_FONT_FAMILY, BASE_FONT_SIZE
+)
+import language as lang_module
+import dataset_manager
+import perf_metrics
+import perf_trace
+import profiler_capture
+
+logger = logging.getLogger(__name__)
+
+MAX_STAGE_LINES = 12
+
+s_shared_root = None
+s_notebook = None
+perf_tab_page_frame = None
+perf_status_lbl = None
+perf_reset_button = None
+perf_profile_button = None
+perf_profile_lbl = None
+operations_tree = None
+metrics_text = None
+
+OPERATION_COLUMNS = ("op_name", "op_status", "op_started", "op_duration", "op_breakdown")
+
+
+def create_performance_tab(notebook_widget, shared_elements_dict):
+    global s_shared_root, s_notebook, perf_tab_page_frame, perf_status_lbl, perf_reset_button, operations_tree, metrics_text
+    global perf_profile_button, perf_profile_lbl
+
+    s_shared_root = shared_elements_dict.get("root")
+    s_notebook = notebook_widget
+
+    perf_tab_page_frame = ttk.Frame(notebook_widget, style='TFrame')
+    notebook_widget.add(perf_tab_page_frame, text=lang_module.get_string("performance_tab_title"))
+
+    main_content_frame = ttk.Frame(perf_tab_page_frame, padding="5 5 5 5")
+    main_content_frame.pack(expand=True, fill=tk.BOTH)
+    main_content_frame.columnconfigure(0, weight=1)
+    main_content_frame.rowconfigure(1, weight=1)
+    main_content_frame.rowconfigure(2, weight=2)
+
+    controls_frame = ttk.Frame(main_content_frame)
+    controls_frame.grid(row=0, column=0, sticky="ew", pady=(0, 5))
+    perf_reset_button = ttk.Button(controls_frame, text=lang_module.get_string("performance_reset_button"), command=_on_reset_pressed, style="TButton")
+    perf_reset_button.pack(side=tk.LEFT, padx=(0, 5))
+    perf_profile_button = ttk.Button(controls_frame, text=lang_module.get_string("performance_profile_next_button"), command=_on_profile_pressed, style="TButton")
+    perf_profile_button.pack(side=tk.LEFT, padx=(0, 5))
+    perf_status_lbl = ttk.Label(controls_frame, text="", style="Status.TLabel", anchor=tk.W)
+    perf_status_lbl.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+    # Opérations en cours puis terminées
+    perf_profile_lbl = ttk.Label(main_content_frame, text="", style="Status.TLabel", anchor=tk.W)
+    perf_profile_lbl.grid(row=3, column=0, sticky="ew", pady=(5, 0))
+
+    operations_frame = ttk.Frame(main_content_frame)
+    operations_frame.grid(row=1, column=0, sticky="nsew", pady=(0, 5))
+    tree_scroll_y = ttk.Scrollbar(operations_frame, orient=tk.VERTICAL)
+    operations_tree = ttk.Treeview(operations_frame, columns=OPERATION_COLUMNS, show="headings", height=6,
+                                   yscrollcommand=tree_scroll_y.set, style="Treeview")
+    tree_scroll_y.config(command=operations_tree.yview)
+    _set_operation_headings()
+    operations_tree.column("op_name", width=140, anchor=tk.W, stretch=tk.NO)
+    operations_tree.column("op_status", width=90, anchor=tk.CENTER, stretch=tk.NO)
+    operations_tree.column("op_started", width=80, anchor=tk.CENTER, stretch=tk.NO)
+    operations_tree.column("op_duration", width=80, anchor=tk.E, stretch=tk.NO)
+    operations_tree.column("op_breakdown", width=400, anchor=tk.W, stretch=tk.YES)
+    tree_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
+    operations_tree.pack(expand=True, fill=tk.BOTH)
+
+    metrics_text = ScrolledText(main_content_frame, height=20, bg=ED_MEDIUM_GREY, fg=ED_WHITE_TEXT, insertbackground=ED_WHITE_TEXT,
+                                relief='flat', borderwidth=1, wrap=tk.NONE, font=(BASE_FONT_FAMILY, BASE_FONT_SIZE), state=tk.DISABLED)
+    metrics_text.grid(row=2, column=0, sticky="nsew")
+
+    if s_shared_root:
+        s_shared_root.after(PERF_PANEL_LAG_PROBE_MS, _probe_event_loop_lag, time.perf_counter() + PERF_PANEL_LAG_PROBE_MS / 1000)
+        s_shared_root.after(PERF_PANEL_REFRESH_MS, _refresh_loop)
+    logger.info("Performance tab created.")
+    return perf_tab_page_frame
+
+
+def _set_operation_headings():
+    operations_tree.heading("op_name", text=lang_module.get_string("performance_operation_header"))
+    operations_tree.heading("op_status", text=lang_module.get_string("performance_status_header"))
+    operations_tree.heading("op_started", text=lang_module.get_string("performance_started_header"))
+    operations_tree.heading("op_duration", text=lang_module.get_string("performance_duration_header"))
+    operations_tree.heading("op_breakdown", text=lang_module.get_string("performance_breakdown_header"))
+
+
+def _probe_event_loop_lag(expected_at):
+    """Sonde : un after() programmé à `expected_at` ; son retard mesure l'encombrement de la boucle Tk."""
+    if not (s_shared_root and s_shared_root.winfo_exists()):
+        return
+    now = time.perf_counter()
+    lag_ms = max(0.0, (now - expected_at) * 1000)
+    perf_metrics.observe(perf_metrics.TK_EVENT_LAG_MS, lag_ms)
+    perf_metrics.set_gauge(perf_metrics.TK_EVENT_LAG_MS, round(lag_ms, 1))
+    s_shared_root.after(PERF_PANEL_LAG_PROBE_MS, _probe_event_loop_lag, now + PERF_PANEL_LAG_PROBE_MS / 1000)
+
+
+def _is_tab_visible():
+    try:
+        return s_notebook is not None and s_notebook.select() == str(perf_tab_page_frame)
+    except tk.TclError:
+        return False
+
+
+def _refresh_loop():
+    if not (s_shared_root and s_shared_root.winfo_exists()):
+        return
+    if _is_tab_visible():
+        try:
+            refresh_performance_display()
+        except Exception as e: # Un échec d'affichage ne doit pas arrêter le rafraîchissement
+            logger.exception(f"Performance panel refresh failed: {e}")
+    s_shared_root.after(PERF_PANEL_REFRESH_MS, _refresh_loop)
+
+
+def _on_reset_pressed():
+    perf_metrics.reset()
+    refresh_performance_display()
+
+
+def _on_profile_pressed():
+    if profiler_capture.is_armed():
+        profiler_capture.disarm()
+    else:
+        profiler_capture.arm()
+    _update_profile_widgets()
+
+
+def _update_profile_widgets():
+    """Bouton armer / annuler et emplacement de la dernière capture."""
+    armed = profiler_capture.is_armed()
+    if perf_profile_button and perf_profile_button.winfo_exists():
+        perf_profile_button.config(text=lang_module.get_string("performance_profile_cancel_button" if armed else "performance_profile_next_button"))
+    if perf_profile_lbl and perf_profile_lbl.winfo_exists():
+        result = profiler_capture.last_result()
+        if armed:
+            text = lang_module.get_string("performance_profile_armed")
+        elif result:
+            text = lang_module.get_string("performance_profile_saved", operation=result["operation"], report=result["report"])
+        else:
+            text = ""
+        perf_profile_lbl.config(text=text)
+
+
+def _format_bytes(value):
+    if value is None:
+        return "-"
+    for unit in ("B", "KB", "MB"):
+        if value < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GB"
+
+
+def _format_ms(value):
+    if value is None:
+        return "-"
+    return f"{value / 1000:.2f} s" if value >= 1000 else f"{value:.0f} ms"
+
+
+def _histogram_line(label, histogram):
+    return (f"  {label:<28} {histogram['count']:>7}  mean {_format_ms(histogram['mean']):>8}  p50 {_format_ms(histogram['p50']):>8}  "
+            f"p95 {_format_ms(histogram['p95']):>8}  max {_format_ms(histogram['max']):>8}")
+
+
+def _operation_row(operation):
+    summary = operation["summary"]
+    status = operation["status"] or lang_module.get_string("performance_status_running")
+    try:
+        started = datetime.fromisoformat(operation["startedAt"]).astimezone().strftime("%H:%M:%S")
+    except (TypeError, ValueError):
+        started = "-"
+    breakdown = ", ".join(f"{category} {_format_ms(ms)}" for category, ms in summary["time_by_category_ms"].items())
+    return operation["name"], status, started, _format_ms(summary["duration_ms"]), breakdown
+
+
+def format_metrics_report(snapshot, datasets):
+    """Rapport texte du panneau à partir de perf_metrics.snapshot() et dataset_manager.dataset_stats()."""
+    counters, gauges, histograms = snapshot["counters"], snapshot["gauges"], snapshot["histograms"]
+    lines = [lang_module.get_string("performance_section_network")]
+    in_flight = gauges.get(perf_metrics.HTTP_IN_FLIGHT, {})
+    if in_flight:
+        lines.append("  " + lang_module.get_string("performance_in_flight") + " " +
+                     ", ".join(f"{host}: {count}" for host, count in sorted(in_flight.items())))
+    limits = gauges.get(perf_metrics.HTTP_CONCURRENCY_LIMIT, {})
+    if limits:
+        lines.append("  " + lang_module.get_string("performance_concurrency_limit") + " " +
+                     ", ".join(f"{crawler}: {limit}" for crawler, limit in sorted(limits.items())))
+    for service, histogram in sorted(histograms.get(perf_metrics.HTTP_LATENCY_MS, {}).items()):
+        lines.append(_histogram_line(service, histogram))
+    outcomes = counters.get(perf_metrics.HTTP_RESPONSES, {})
+    if outcomes:
+        lines.append("  " + lang_module.get_string("performance_responses") + " " +
+                     ", ".join(f"{label} {count}" for label, count in sorted(outcomes.items())))
+    if len(lines) == 1:
+        lines.append("  " + lang_module.get_string("performance_no_data"))
+
+    lines += ["", lang_module.get_string("performance_section_caches")]
+    hits, misses = counters.get(perf_metrics.CACHE_HITS, {}), counters.get(perf_metrics.CACHE_MISSES, {})
+    for cache in sorted(set(hits) | set(misses)):
+        total = hits.get(cache, 0) + misses.get(cache, 0)
+        lines.append(f"  {cache:<28} {hits.get(cache, 0):>7} hit {misses.get(cache, 0):>7} miss  {hits.get(cache, 0) / total:>6.1%}")
+    if not (hits or misses):
+        lines.append("  " + lang_module.get_string("performance_no_data"))
+
+    lines += ["", lang_module.get_string("performance_section_memory")]
+    lines.append("  " + lang_module.get_string("performance_process_memory") + " " + _format_bytes(snapshot["process_memory_bytes"]))
+    for name, stats in datasets.items():
+        state = (lang_module.get_string("performance_dataset_loaded", version=stats["version"]) if stats["loaded"]
+                 else lang_module.get_string("performance_dataset_not_loaded"))
+        if stats["pending_write"]:
+            state += ", " + lang_module.get_string("performance_dataset_pending_write")
+        counts = ", ".join(f"{key} {value}" for key, value in (stats["counts"] or {}).items())
+        indexes = f" | index: {', '.join(stats['indexes'])}" if stats["indexes"] else ""
+        lines.append(f"  {name:<14} {_format_bytes(stats['file_bytes']):>10}  {state}{' | ' + counts if counts else ''}{indexes}")
+
+    lines += ["", lang_module.get_string("performance_section_stages")]
+    stages = histograms.get(perf_metrics.STAGE_MS, {})
+    slowest = sorted(stages.items(), key=lambda item: item[1]["mean"] * item[1]["count"], reverse=True)
+    optimizer_stages = [item for item in slowest if item[0].startswith("optimizer.")] # Étapes de calcul d'abord, puis les autres
+    other_stages = [item for item in slowest if not item[0].startswith("optimizer.")]
+    for name, histogram in (optimizer_stages + other_stages)[:MAX_STAGE_LINES]:
+        lines.append(_histogram_line(name, histogram))
+    if not stages:
+        lines.append("  " + lang_module.get_string("performance_no_data"))
+
+    lines += ["", lang_module.get_string("performance_section_event_loop")]
+    lag = histograms.get(perf_metrics.TK_EVENT_LAG_MS, {}).get(None)
+    if lag:
+        lines.append(_histogram_line(lang_module.get_string("performance_event_lag"), lag))
+    else:
+        lines.append("  " + lang_module.get_string("performance_no_data"))
+    return "\n".join(lines)
+
+
+def refresh_performance_display():
+    if not (operations_tree and operations_tree.winfo_exists()):
+        return
+    operations = perf_trace.active_operations() + perf_trace.recent_operations()
+    operations_tree.delete(*operations_tree.get_children())
+    for operation in operations:
+        operations_tree.insert("", tk.END, values=_operation_row(operation))
+
+    report = format_metrics_report(perf_metrics.snapshot(), dataset_manager.dataset_stats())
+    y_position = metrics_text.yview()[0]
+    metrics_text.config(state=tk.NORMAL)
+    metrics_text.delete('1.0', tk.END)
+    metrics_text.insert(tk.END, report)
+    metrics_text.yview_moveto(y_position) # Garder la position de lecture d'un rafraîchissement à l'autre
+    metrics_text.config(state=tk.DISABLED)
+    if perf_status_lbl and perf_status_lbl.winfo_exists():
+        perf_status_lbl.config(text=lang_module.get_string("performance_status_updated_at", timestamp=datetime.now().strftime("%H:%M:%S")))
+    _update_profile_widgets()
+
+
+def update_performance_tab_texts():
+    if not (s_shared_root and s_shared_root.winfo_exists()):
+        logger.warning("Cannot update performance tab texts: root window does not exist.")
+        return
+    if perf_reset_button and perf_reset_button.winfo_exists():
+        perf_reset_button.config(text=lang_module.get_string("performance_reset_button"))
+    if operations_tree and operations_tree.winfo_exists():
+        _set_operation_headings()
+    _update_profile_widgets()
+    if _is_tab_visible():
+        refresh_performance_display()
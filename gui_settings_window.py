@@ -19,6 +19,7 @@ from constants import (
     DEFAULT_MAX_STATIONS_FOR_TRADE_LOOPS, KEY_MAX_STATIONS_FOR_TRADE_LOOPS,
     DEFAULT_MAX_GENERAL_TRADE_ROUTES, KEY_MAX_GENERAL_TRADE_ROUTES,
     DEFAULT_TOP_N_IMPORTS_FILTER, KEY_TOP_N_IMPORTS_FILTER,
+    DEFAULT_MARKET_REGION_CACHE_BUDGET_MB, KEY_MARKET_REGION_CACHE_BUDGET_MB,
     DEFAULT_SHIPYARD_RADIUS_LY # Si le rayon du chantier est un setting ici
     # KEY_SHIPYARD_RADIUS # Si vous ajoutez une clé dédiée pour le rayon du chantier
 )
@@ -46,6 +47,7 @@ s_include_fleet_carriers_var = None
 s_journal_dir_label_var = None
 s_language_var = None
 s_sort_var = None # Si l'option de tri est aussi gérée/affichée ici
+s_region_cache_budget_var = None # Propre à cette fenêtre (pas de widget équivalent dans les onglets)
 
 # Référence à la fonction de mise à jour de la langue de l'UI principale
 s_update_main_gui_texts_func = None
@@ -68,6 +70,7 @@ def on_save_settings_pressed():
     try:
         r = float(s_radius_var.get()); a = int(s_age_var.get()); sd = float(s_station_dist_var.get())
         sr_val = float(s_shipyard_radius_var.get())
+        rcb = float(s_region_cache_budget_var.get()) if s_region_cache_budget_var else None
         ip = s_include_planetary_var.get(); ifc = s_include_fleet_carriers_var.get()
         sv_val = s_sort_var.get() if s_sort_var else RESET_DEFAULT_SORT_OPTION # Fallback si s_sort_var n'est pas passé
         selected_lang_code = s_language_var.get()
@@ -76,6 +79,7 @@ def on_save_settings_pressed():
         if sr_val <= 0: raise ValueError(lang_module.get_string("error_radius_positive") + " (Shipyard)")
         if a < 0: raise ValueError(lang_module.get_string("error_db_age_non_negative"))
         if sd < 0: raise ValueError(lang_module.get_string("error_station_dist_non_negative"))
+        if rcb is not None and rcb < 0: raise ValueError(lang_module.get_string("error_region_cache_budget_non_negative"))
         if sv_val not in ['d', 'b', 's']: raise ValueError("Invalid sort option.")
         if selected_lang_code not in lang_module.get_available_languages(): raise ValueError("Invalid language code.")
 
@@ -90,6 +94,7 @@ def on_save_settings_pressed():
         settings_manager.update_setting(KEY_INCLUDE_PLANETARY, ip)
         settings_manager.update_setting(KEY_INCLUDE_FLEET_CARRIERS, ifc)
         settings_manager.update_setting(KEY_SORT_OPTION, sv_val)
+        if rcb is not None: settings_manager.update_setting(KEY_MARKET_REGION_CACHE_BUDGET_MB, rcb) # Appliqué à la prochaine mise en cache d'une région
         
         current_lang_in_settings = settings_manager.get_setting(KEY_LANGUAGE)
         lang_changed = current_lang_in_settings != selected_lang_code
@@ -138,6 +143,7 @@ def on_restore_defaults_pressed():
         if s_sort_var: s_sort_var.set(RESET_DEFAULT_SORT_OPTION)
         s_language_var.set(RESET_DEFAULT_LANGUAGE)
         s_shipyard_radius_var.set(str(DEFAULT_SHIPYARD_RADIUS_LY))
+        if s_region_cache_budget_var: s_region_cache_budget_var.set(str(DEFAULT_MARKET_REGION_CACHE_BUDGET_MB))
 
 
         # Mise à jour des settings dans settings_manager
@@ -147,6 +153,7 @@ def on_restore_defaults_pressed():
         settings_manager.update_setting(KEY_CUSTOM_JOURNAL_DIR, RESET_DEFAULT_CUSTOM_JOURNAL_DIR); settings_manager.update_setting(KEY_NUM_JOURNAL_FILES_MISSIONS, DEFAULT_NUM_JOURNAL_FILES_MISSIONS)
         settings_manager.update_setting(KEY_MAX_STATIONS_FOR_TRADE_LOOPS, DEFAULT_MAX_STATIONS_FOR_TRADE_LOOPS); settings_manager.update_setting(KEY_MAX_GENERAL_TRADE_ROUTES, DEFAULT_MAX_GENERAL_TRADE_ROUTES)
         settings_manager.update_setting(KEY_TOP_N_IMPORTS_FILTER, DEFAULT_TOP_N_IMPORTS_FILTER)
+        settings_manager.update_setting(KEY_MARKET_REGION_CACHE_BUDGET_MB, DEFAULT_MARKET_REGION_CACHE_BUDGET_MB)
         
         current_lang_in_settings = settings_manager.get_setting(KEY_LANGUAGE)
         lang_changed_by_reset = current_lang_in_settings != RESET_DEFAULT_LANGUAGE
@@ -187,6 +194,7 @@ def create_settings_window(shared_elements):
     """ Crée et affiche la fenêtre des paramètres. """
     global settings_window, settings_status_label
     global s_root, s_radius_var, s_age_var, s_station_dist_var, s_shipyard_radius_var, s_include_planetary_var, s_include_fleet_carriers_var, s_journal_dir_label_var, s_language_var, s_sort_var
+    global s_region_cache_budget_var
     global s_update_main_gui_texts_func, s_update_status_func_main, s_set_buttons_state_main_func
 
     # Stocker les références partagées
@@ -215,7 +223,7 @@ def create_settings_window(shared_elements):
     settings_window.resizable(False, False)
 
     root_x, root_y, root_width, root_height = s_root.winfo_x(), s_root.winfo_y(), s_root.winfo_width(), s_root.winfo_height()
-    win_width, win_height = 450, 650
+    win_width, win_height = 450, 680
     pos_x, pos_y = root_x + (root_width // 2) - (win_width // 2), root_y + (root_height // 2) - (win_height // 2)
     settings_window.geometry(f'{win_width}x{win_height}+{pos_x}+{pos_y}')
     settings_window.transient(s_root); settings_window.grab_set()
@@ -246,6 +254,8 @@ def create_settings_window(shared_elements):
     ttk.Label(param_grid, text=lang_module.get_string("settings_db_age_label")).grid(row=1, column=0, sticky=tk.W, padx=2, pady=3); ttk.Entry(param_grid, width=10, textvariable=s_age_var).grid(row=1, column=1, sticky=tk.EW, padx=2, pady=3)
     ttk.Label(param_grid, text=lang_module.get_string("settings_max_station_dist_label")).grid(row=2, column=0, sticky=tk.W, padx=2, pady=3); ttk.Entry(param_grid, width=10, textvariable=s_station_dist_var).grid(row=2, column=1, sticky=tk.EW, padx=2, pady=3)
     ttk.Label(param_grid, text=lang_module.get_string("settings_shipyard_radius_label")).grid(row=3, column=0, sticky=tk.W, padx=2, pady=3); ttk.Entry(param_grid, width=10, textvariable=s_shipyard_radius_var).grid(row=3, column=1, sticky=tk.EW, padx=2, pady=3)
+    s_region_cache_budget_var = tk.StringVar(value=str(settings_manager.get_setting(KEY_MARKET_REGION_CACHE_BUDGET_MB, DEFAULT_MARKET_REGION_CACHE_BUDGET_MB)))
+    ttk.Label(param_grid, text=lang_module.get_string("settings_region_cache_budget_label")).grid(row=4, column=0, sticky=tk.W, padx=2, pady=3); ttk.Entry(param_grid, width=10, textvariable=s_region_cache_budget_var).grid(row=4, column=1, sticky=tk.EW, padx=2, pady=3)
 
     cb_frame = ttk.Frame(search_params_lf); cb_frame.pack(fill=tk.X, pady=(8,5))
     ttk.Checkbutton(cb_frame, text=lang_module.get_string("settings_include_planetary_cb"), variable=s_include_planetary_var).pack(anchor=tk.W, padx=2, pady=2)
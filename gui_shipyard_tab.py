@@ -14,6 +14,8 @@ from constants import (
 )
 import shipyard_db_manager
 import shipyard_logic
+import dataset_manager
+import perf_trace
 import language as lang_module
 import gui_main 
 
@@ -109,16 +111,21 @@ def on_update_shipyard_db_pressed():
 
         def _run_in_thread():
             loop = None
+            trace_operation = perf_trace.start_operation("shipyard_refresh", system=current_system, radius_ly=radius_to_use)
+            trace_status = perf_trace.STATUS_OK
             try:
                 loop = asyncio.new_event_loop(); asyncio.set_event_loop(loop)
                 loop.run_until_complete(_async_shipyard_db_update_task())
+                if s_cancel_shipyard_event.is_set(): trace_status = perf_trace.STATUS_CANCELLED
             except Exception as e_thread:
+                trace_status = perf_trace.STATUS_ERROR
                 logger.exception("Erreur non gérée lors de l'exécution de la tâche async de MàJ BD chantier naval:")
                 msg_err_thread = lang_module.get_string("status_shipyard_db_update_thread_error", error=e_thread)
                 if not s_cancel_shipyard_event.is_set() and s_update_status_func:
                     s_update_status_func(msg_err_thread, -1, target_status_label_widget=shipyard_status_lbl)
             finally:
                 if loop and not loop.is_closed(): loop.close()
+                trace_operation.finish(trace_status)
                 if s_root and s_root.winfo_exists():
                      s_root.after(0, gui_main._set_buttons_state, False, False)
                      s_root.after(0, set_shipyard_buttons_state, False, False, "shipyard")
@@ -172,7 +179,7 @@ def on_find_ship_pressed():
                  shipyard_data.get("systems_with_shipyards", {}).get(current_system, {}).get("coords"): # Vérifier que le système source a des coordonnées
                  current_sys_coords = shipyard_data["systems_with_shipyards"][current_system]["coords"]
             else:
-                 logger.warning(f"Coordonnées du système actuel '{current_system}' non trouvées dans les données de shipyard_data.json. Le tri par distance pourrait ne pas fonctionner comme prévu.")
+                 logger.warning(f"Coordonnées du système actuel '{current_system}' non trouvées dans les données de chantier naval. Le tri par distance pourrait ne pas fonctionner comme prévu.")
 
 
         max_dist_ly_str = s_shipyard_radius_var.get() if s_shipyard_radius_var and s_shipyard_radius_var.get() else s_radius_var.get()
@@ -198,7 +205,8 @@ def on_find_ship_pressed():
             max_distance_ly_filter=max_dist_ly_val,
             max_station_dist_ls=max_station_dist_ls_val,
             include_planetary=include_planetary_val,
-            include_fleet_carriers=include_fc_val
+            include_fleet_carriers=include_fc_val,
+            ship_systems_index=dataset_manager.get_index(dataset_manager.DATASET_SHIPYARD, "ship_systems", shipyard_logic.build_ship_systems_index)
         )
 
         if found_stations:
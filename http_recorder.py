@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Enregistrement et rejeu des appels HTTP des API (fetch_json Ardent, fetch_edsm_json EDSM).
+
+En enregistrement, chaque requête (URL, paramètres, code, durée) est ajoutée à exchanges.jsonl d'un
+dossier de session, et chaque corps de réponse est stocké compressé sous son empreinte SHA-256
+(objects/ab/abcd….json.z : une réponse identique n'est stockée qu'une fois). En rejeu, les mêmes
+requêtes reçoivent les réponses enregistrées, dans l'ordre d'enregistrement pour une même requête,
+avec les durées d'origine (timing "original") ou sans attente ("fast"). Les erreurs enregistrées
+(codes HTTP avec leurs en-têtes, réponses non JSON, délais dépassés, connexions impossibles) sont
+rejouées aussi, sous forme des exceptions aiohttp que les appelants attrapent.
+
+aiohttp est optionnel (inspection des sessions sans lui : les erreurs rejouées sont alors des
+ReplayedHTTPError) : api_handler et edsm_api_handler appellent record_exchange() et
+replay_fetch() ; l'activation se fait par start_recording() / start_replay() (voir --record-session
+et --replay-session de main_app et optimizer_cli).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+try:
+    import aiohttp
+    from multidict import CIMultiDict, CIMultiDictProxy
+    from yarl import URL
+except ImportError: # Sans aiohttp : erreurs rejouées en ReplayedHTTPError
+    aiohttp = None
+
+from constants import SESSION_BUNDLE_FORMAT_VERSION, SESSION_BUNDLE_COMPRESSION_LEVEL
+
+logger = logging.getLogger(__name__)
+
+SERVICE_ARDENT = "ardent"
+SERVICE_EDSM = "edsm"
+REPLAY_TIMING_ORIGINAL = "original"
+REPLAY_TIMING_FAST = "fast"
+REPLAY_TIMINGS = (REPLAY_TIMING_ORIGINAL, REPLAY_TIMING_FAST)
+MANIFEST_FILE = "manifest.json"
+EXCHANGES_FILE = "exchanges.jsonl"
+OBJECTS_DIR = "objects"
+
+_lock = threading.Lock() # Les appels viennent de boucles asyncio de threads différents (GUI)
+_recorder = None
+_player = None
+
+
+class ReplayError(Exception):
+    """Rejeu impossible ou réponse d'erreur rejouée."""
+    pass
+
+
+class ReplayMissError(ReplayError):
+    """Requête absente de la session rejouée."""
+    pass
+
+
+class ReplayedHTTPError(ReplayError):
+    """Erreur enregistrée, rejouée sans aiohttp (avec aiohttp : voir _replayed_exception)."""
+
+    def __init__(self, status, message, url, headers=None):
+        super().__init__(f"{status} {message} (replayed) for {url}")
+        self.status = status
+        self.headers = headers or {}
+        self.message = message
+
+
+def request_key(service, url, params):
+    """Clé d'une requête : service, URL et paramètres triés (valeurs en texte, comme dans l'URL)."""
+    return service, url, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+
+
+def _object_path(bundle_dir, digest):
+    return os.path.join(bundle_dir, OBJECTS_DIR, digest[:2], f"{digest}.json.z")
+
+
+def read_manifest(bundle_dir):
+    """Métadonnées d'une session (format, dates, compteurs, contexte de l'enregistrement)."""
+    with open(os.path.join(bundle_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SESSION_BUNDLE_FORMAT_VERSION:
+        raise ReplayError(f"Unsupported session bundle format {manifest.get('format')} in {bundle_dir}")
+    return manifest
+
+
+def _write_manifest(bundle_dir, manifest):
+    temp_path = os.path.join(bundle_dir, MANIFEST_FILE + ".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, os.path.join(bundle_dir, MANIFEST_FILE))
+
+
+class _SessionRecorder:
+    def __init__(self, bundle_dir, label, context):
+        self.bundle_dir = bundle_dir
+        os.makedirs(os.path.join(bundle_dir, OBJECTS_DIR), exist_ok=True)
+        if os.path.exists(os.path.join(bundle_dir, EXCHANGES_FILE)):
+            raise ReplayError(f"Session bundle {bundle_dir} already contains a recording")
+        self.started_monotonic = time.monotonic()
+        self.manifest = {"format": SESSION_BUNDLE_FORMAT_VERSION, "label": label, "context": context,
+                         "startedAt": datetime.now(timezone.utc).isoformat(), "finishedAt": None,
+                         "exchanges": 0, "objects": 0, "bytesRaw": 0, "bytesStored": 0}
+        _write_manifest(bundle_dir, self.manifest) # Présent dès le début : session lisible même après un arrêt brutal
+        self.exchanges_file = open(os.path.join(bundle_dir, EXCHANGES_FILE), "a", encoding="utf-8")
+        self.known_objects = set()
+
+    def _store_body(self, body):
+        encoded = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(encoded).hexdigest()
+        self.manifest["bytesRaw"] += len(encoded)
+        if digest not in self.known_objects:
+            path = _object_path(self.bundle_dir, digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                compressed = zlib.compress(encoded, SESSION_BUNDLE_COMPRESSION_LEVEL)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(compressed)
+                os.replace(path + ".tmp", path)
+                self.manifest["objects"] += 1
+                self.manifest["bytesStored"] += len(compressed)
+            self.known_objects.add(digest)
+        return digest
+
+    def record(self, service, url, params, started, duration, status, body, error):
+        entry = {"seq": self.manifest["exchanges"], "service": service, "method": "GET", "url": url,
+                 "params": {str(k): str(v) for k, v in (params or {}).items()},
+                 "offset_s": round(started - self.started_monotonic, 6), "duration_s": round(duration, 6), "status": status}
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry["body"] = self._store_body(body)
+        self.exchanges_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.exchanges_file.flush()
+        self.manifest["exchanges"] += 1
+
+    def close(self):
+        self.exchanges_file.close()
+        self.manifest["finishedAt"] = datetime.now(timezone.utc).isoformat()
+        _write_manifest(self.bundle_dir, self.manifest)
+        return dict(self.manifest)
+
+
+class _SessionPlayer:
+    def __init__(self, bundle_dir, timing):
+        self.bundle_dir = bundle_dir
+        self.timing = timing
+        self.manifest = read_manifest(bundle_dir)
+        self.queues = {}
+        for entry in read_exchanges(bundle_dir):
+            self.queues.setdefault(request_key(entry["service"], entry["url"], entry["params"]), deque()).append(entry)
+        self.bodies = {} # empreinte -> octets JSON (décodés à chaque service : l'appelant peut modifier le résultat)
+        self.stats = {"served": 0, "misses": 0, "reused": 0}
+
+    def next_entry(self, key):
+        queue = self.queues.get(key)
+        if not queue:
+            return None
+        if len(queue) > 1:
+            return queue.popleft()
+        entry = queue[0] # La dernière réponse reste servie aux appels suivants
+        if entry.get("_served"):
+            self.stats["reused"] += 1
+        entry["_served"] = True
+        return entry
+
+    def body(self, digest):
+        encoded = self.bodies.get(digest)
+        if encoded is None:
+            with open(_object_path(self.bundle_dir, digest), "rb") as f:
+                encoded = zlib.decompress(f.read())
+            if hashlib.sha256(encoded).hexdigest() != digest:
+                raise ReplayError(f"Corrupted object {digest} in {self.bundle_dir}")
+            self.bodies[digest] = encoded
+        return json.loads(encoded)
+
+
+def start_recording(bundle_dir, label=None, context=None):
+    """
+    Active l'enregistrement des appels API dans `bundle_dir` (créé ; doit être vide de tout enregistrement).
+    `context` (JSON) est gardé dans le manifeste : position, filtres… pour reproduire l'analyse au rejeu.
+    """
+    global _recorder
+    with _lock:
+        if _recorder is not None or _player is not None:
+            raise ReplayError("A session is already being recorded or replayed")
+        _recorder = _SessionRecorder(bundle_dir, label, context)
+    logger.info(f"HTTP session recording started in {bundle_dir}")
+
+
+def start_replay(bundle_dir, timing=REPLAY_TIMING_FAST):
+    """Active le rejeu de la session `bundle_dir` : plus aucun appel réseau par fetch_json / fetch_edsm_json."""
+    global _player
+    if timing not in REPLAY_TIMINGS:
+        raise ValueError(f"Unknown replay timing '{timing}' (expected one of {', '.join(REPLAY_TIMINGS)})")
+    player = _SessionPlayer(bundle_dir, timing)
+    with _lock:
+        if _recorder is not None or _player is not None:
+            raise ReplayError("A session is already being recorded or replayed")
+        _player = player
+    logger.info(f"HTTP session replay started from {bundle_dir} ({player.manifest['exchanges']} exchanges, timing: {timing})")
+
+
+def stop():
+    """Arrête l'enregistrement ou le rejeu en cours ; retourne son bilan (ou None)."""
+    global _recorder, _player
+    with _lock:
+        recorder, player = _recorder, _player
+        _recorder = _player = None
+    if recorder is not None:
+        summary = recorder.close()
+        logger.info(f"HTTP session recording stopped: {summary['exchanges']} exchanges, {summary['objects']} objects, "
+                    f"{summary['bytesRaw']} bytes stored as {summary['bytesStored']}")
+        return summary
+    if player is not None:
+        logger.info(f"HTTP session replay stopped: {player.stats}")
+        return dict(player.stats)
+    return None
+
+
+def is_recording():
+    return _recorder is not None
+
+
+def is_replaying():
+    return _player is not None
+
+
+def record_exchange(service, url, params, started, status=200, body=None, error=None):
+    """
+    Ajoute un échange à la session enregistrée (sans effet hors enregistrement). `started` vient de
+    time.monotonic() au début de l'appel ; `error` : {"kind": "http"|"content_type"|"timeout"|"connection",
+    "message"}, plus "headers" (http, content_type : Retry-After…) et "errno" (connection).
+    """
+    recorder = _recorder
+    if recorder is None:
+        return
+    duration = time.monotonic() - started
+    try:
+        with _lock:
+            recorder.record(service, url, params, started, duration, status, body, error)
+    except (OSError, TypeError, ValueError) as e: # Un échec d'archivage ne doit pas casser le téléchargement
+        logger.error(f"Could not record exchange for {url}: {e}")
+
+
+async def replay_fetch(service, url, params):
+    """Réponse enregistrée pour cette requête (ou son erreur rejouée). Lève ReplayMissError si absente."""
+    player = _player
+    if player is None:
+        raise ReplayError("No session is being replayed")
+    with _lock:
+        entry = player.next_entry(request_key(service, url, params))
+        if entry is None:
+            player.stats["misses"] += 1
+        else:
+            player.stats["served"] += 1
+    if entry is None:
+        logger.warning(f"Replay miss: {service} {url} {params or ''}")
+        raise ReplayMissError(f"No recorded response for {url} {params or ''}")
+    if player.timing == REPLAY_TIMING_ORIGINAL and entry["duration_s"] > 0:
+        await asyncio.sleep(entry["duration_s"])
+    error = entry.get("error")
+    if error is not None:
+        if error.get("kind") == "timeout":
+            raise asyncio.TimeoutError(f"Timeout (replayed) for {url}")
+        raise _replayed_exception(error, entry.get("status"), url)
+    return player.body(entry["body"])
+
+
+def _replayed_exception(error, status, url):
+    """
+    Exception d'origine reconstruite : aiohttp.ClientResponseError (code et en-têtes, dont Retry-After),
+    aiohttp.ContentTypeError ou aiohttp.ClientConnectorError ; ReplayedHTTPError sans aiohttp.
+    """
+    message = error.get("message", "")
+    if aiohttp is None:
+        return ReplayedHTTPError(status, message, url, error.get("headers"))
+    target = URL(url)
+    if error.get("kind") == "connection":
+        connection_key = SimpleNamespace(host=target.host, port=target.port, is_ssl=target.scheme == "https", ssl=True)
+        return aiohttp.ClientConnectorError(connection_key, OSError(error.get("errno"), message))
+    exception_class = aiohttp.ContentTypeError if error.get("kind") == "content_type" else aiohttp.ClientResponseError
+    request_info = aiohttp.RequestInfo(target, "GET", CIMultiDictProxy(CIMultiDict()), target)
+    return exception_class(request_info, (), status=status, message=message, headers=CIMultiDictProxy(CIMultiDict(error.get("headers") or {})))
+
+
+def read_exchanges(bundle_dir):
+    """Échanges d'une session (dicts de exchanges.jsonl, corps non chargés), pour inspection."""
+    read_manifest(bundle_dir)
+    exchanges = []
+    with open(os.path.join(bundle_dir, EXCHANGES_FILE), "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                exchanges.append(json.loads(line))
+            except json.JSONDecodeError: # Dernière ligne tronquée d'une session interrompue
+                logger.warning(f"Skipping a truncated exchange line in {bundle_dir}")
+    return exchanges
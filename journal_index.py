@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Index SQLite de tous les événements des fichiers Journal.*.log du répertoire des journaux.
+
+Chaque événement est indexé par horodatage, type, système, station et MarketID (les événements
+sans position, ex. MarketBuy, héritent de la dernière position connue). L'indexation est incrémentale
+(offset et date de modification par fichier : un fichier tronqué ou remplacé est réindexé) et tourne dans un thread d'arrière-plan ; les requêtes passent par
+journal_parser.query_journal_events().
+"""
+import json
+import os
+import logging
+import sqlite3
+import threading
+
+from constants import JOURNAL_INDEX_DB_FILE, JOURNAL_INDEX_UPDATE_INTERVAL_S, JOURNAL_INDEX_BATCH_SIZE
+import journal_parser
+import journal_watcher
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, indexed_offset INTEGER NOT NULL, mtime REAL);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT, event TEXT, system TEXT, station TEXT, market_id INTEGER,
+    file TEXT, file_offset INTEGER, data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_event_timestamp ON events(event, timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_system ON events(system);
+CREATE INDEX IF NOT EXISTS idx_events_station ON events(station);
+CREATE INDEX IF NOT EXISTS idx_events_market_id ON events(market_id);
+"""
+
+_index_lock = threading.Lock() # Un seul écrivain à la fois
+_ingester_thread = None
+_ingester_stop_event = None
+_ingester_wake_event = threading.Event()
+
+
+def _connect():
+    conn = sqlite3.connect(JOURNAL_INDEX_DB_FILE, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL") # Lectures possibles pendant l'ingestion
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _index_file(conn, filepath, start_offset, position):
+    """Indexe les lignes complètes de `filepath` à partir de `start_offset`. `position` = [system, station] courant (mis à jour)."""
+    fname = os.path.basename(filepath)
+    rows, offset, count = [], start_offset, 0
+    with open(filepath, 'rb') as f:
+        f.seek(start_offset)
+        for line_content in f:
+            if not line_content.endswith(b"\n"):
+                break # Ligne en cours d'écriture
+            line_offset, offset = offset, offset + len(line_content)
+            if not line_content.strip():
+                continue
+            try:
+                event_data = json.loads(line_content)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            location = journal_parser.location_from_event(event_data)
+            if location: # Undocked / Liftoff n'ont pas toujours StarSystem : le système reste le précédent
+                position[0], position[1] = location[0] or position[0], location[1]
+            system = event_data.get("StarSystem") or position[0]
+            station = event_data.get("StationName") or position[1]
+            market_id = event_data.get("MarketID")
+            rows.append((event_data.get("timestamp"), event_data.get("event"), system, station,
+                         market_id if isinstance(market_id, int) else None,
+                         fname, line_offset, line_content.decode('utf-8', errors='ignore').strip()))
+            if len(rows) >= JOURNAL_INDEX_BATCH_SIZE:
+                conn.executemany("INSERT INTO events (timestamp, event, system, station, market_id, file, file_offset, data) VALUES (?,?,?,?,?,?,?,?)", rows)
+                count += len(rows); rows = []
+    if rows:
+        conn.executemany("INSERT INTO events (timestamp, event, system, station, market_id, file, file_offset, data) VALUES (?,?,?,?,?,?,?,?)", rows)
+        count += len(rows)
+    conn.execute("INSERT OR REPLACE INTO files (name, indexed_offset, mtime) VALUES (?, ?, ?)", (fname, offset, os.path.getmtime(filepath)))
+    return count
+
+
+def update_index(journal_dir):
+    """Indexe les données de journal non encore indexées. Retourne le nombre d'événements ajoutés."""
+    if not journal_dir or not os.path.isdir(journal_dir):
+        return 0
+    with _index_lock:
+        conn = _connect()
+        try:
+            if _get_meta(conn, "journal_dir") != journal_dir:
+                logger.info(f"Journal index: (re)building index for {journal_dir}")
+                conn.execute("DELETE FROM events"); conn.execute("DELETE FROM files")
+                _set_meta(conn, "journal_dir", journal_dir)
+                _set_meta(conn, "last_system", ""); _set_meta(conn, "last_station", "")
+                conn.commit()
+
+            indexed = {name: (offset, mtime) for name, offset, mtime in conn.execute("SELECT name, indexed_offset, mtime FROM files")}
+            position = [_get_meta(conn, "last_system") or None, _get_meta(conn, "last_station") or None]
+            added = 0
+            for filepath in journal_parser._list_journal_files(journal_dir, newest_first=False):
+                fname = os.path.basename(filepath)
+                start_offset, indexed_mtime = indexed.get(fname, (0, None))
+                try:
+                    stat = os.stat(filepath)
+                    if stat.st_size < start_offset or (indexed_mtime is not None and stat.st_mtime < indexed_mtime):
+                        logger.info(f"Journal index: {fname} was truncated or replaced, reindexing it.")
+                        conn.execute("DELETE FROM events WHERE file = ?", (fname,))
+                        start_offset = 0
+                    elif stat.st_size == start_offset:
+                        continue
+                    added += _index_file(conn, filepath, start_offset, position)
+                except OSError as e:
+                    logger.warning(f"Journal index: cannot index {filepath}: {e}")
+                    continue
+                _set_meta(conn, "last_system", position[0] or ""); _set_meta(conn, "last_station", position[1] or "")
+                conn.commit() # Un commit par fichier : une interruption ne perd que le fichier en cours
+            if added:
+                logger.info(f"Journal index: {added} events added.")
+            return added
+        finally:
+            conn.close()
+
+
+def query_events(event_types=None, since=None, until=None, system=None, station=None, market_id=None, limit=1000, newest_first=False):
+    """Requête sur l'index. Retourne une liste d'événements (dict) triés par horodatage."""
+    clauses, params = [], []
+    if event_types:
+        if isinstance(event_types, str): event_types = [event_types]
+        clauses.append(f"event IN ({','.join('?' * len(event_types))})"); params.extend(event_types)
+    if since: clauses.append("timestamp >= ?"); params.append(since)
+    if until: clauses.append("timestamp < ?"); params.append(until)
+    if system: clauses.append("system = ?"); params.append(system)
+    if station: clauses.append("station = ?"); params.append(station)
+    if market_id is not None: clauses.append("market_id = ?"); params.append(market_id)
+    sql = "SELECT data FROM events"
+    if clauses: sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY timestamp {'DESC' if newest_first else 'ASC'}, id {'DESC' if newest_first else 'ASC'}"
+    if limit: sql += " LIMIT ?"; params.append(int(limit))
+    conn = _connect()
+    try:
+        return [json.loads(row[0]) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def _ingester_loop(stop_event):
+    while not stop_event.is_set():
+        journal_dir = journal_watcher._resolve_journal_dir()
+        if journal_dir:
+            try:
+                update_index(journal_dir)
+            except sqlite3.Error as e:
+                logger.error(f"Journal index: SQLite error during ingestion: {e}")
+            except Exception:
+                logger.exception("Journal index: unexpected error during ingestion")
+        _ingester_wake_event.wait(JOURNAL_INDEX_UPDATE_INTERVAL_S)
+        _ingester_wake_event.clear()
+    logger.info("Journal index ingester stopped.")
+
+
+def _on_journal_update(update_type, event_data):
+    _ingester_wake_event.set() # Indexer sans attendre le prochain intervalle
+
+
+def start_background_ingester():
+    """Démarre l'indexation en arrière-plan (idempotent) ; elle se réveille aussi sur les notifications du journal_watcher."""
+    global _ingester_thread, _ingester_stop_event
+    if _ingester_thread and _ingester_thread.is_alive():
+        return
+    _ingester_stop_event = threading.Event()
+    journal_watcher.subscribe(_on_journal_update)
+    _ingester_thread = threading.Thread(target=_ingester_loop, args=(_ingester_stop_event,), name="JournalIndexer", daemon=True)
+    _ingester_thread.start()
+    logger.info("Journal index ingester started.")
+
+
+def stop_background_ingester():
+    if _ingester_stop_event:
+        _ingester_stop_event.set()
+        _ingester_wake_event.set()
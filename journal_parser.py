@@ -3,19 +3,27 @@ import json
 import os
 import re
 import logging
+import signal
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone # Import timezone
 # Assurez-vous que constants.py contient KEY_CUSTOM_JOURNAL_DIR, SHIP_PAD_SIZE, etc.
 # et les nouvelles constantes de matériaux (MATERIAL_CATEGORIES, MATERIALS_LOOKUP, get_material_limit)
 from constants import (
     SHIP_PAD_SIZE, STATION_PAD_SIZE_MAP, KEY_CUSTOM_JOURNAL_DIR,
-    MATERIAL_CATEGORIES, MATERIALS_LOOKUP # get_material_limit est utilisé implicitement via MATERIALS_LOOKUP ici
+    MATERIAL_CATEGORIES, MATERIALS_LOOKUP, get_material_limit,
+    JOURNAL_REVERSE_READ_BLOCK_SIZE, JOURNAL_PARALLEL_CHUNK_BYTES, JOURNAL_PARALLEL_MIN_BYTES
 )
+import perf_trace
 import settings_manager
 
 logger = logging.getLogger(__name__)
 
 EFFECTIVE_JOURNAL_DIR = "Auto-detecting..."
 
+# Extrait le type d'événement directement sur la ligne brute, sans décoder le JSON
+_EVENT_TYPE_RE = re.compile(rb'"event"\s*:\s*"([^"]+)"')
+
 
 def find_journal_dir(preferred_dir=None):
     if preferred_dir:
@@ -67,37 +75,197 @@ def find_journal_dir(preferred_dir=None):
     return None
 
 
-def load_journal_events(journal_dir_path, num_files_to_check=10):
-    events = []
-    if not journal_dir_path or not os.path.isdir(journal_dir_path):
-        logger.error(f"load_journal_events: Invalid or non-existent journal directory: {journal_dir_path}")
-        return []
-    logger.info(f"load_journal_events: Reading from {journal_dir_path}")
+def _list_journal_files(journal_dir_path, newest_first=True):
+    """Liste les chemins des fichiers Journal.*.log triés par date de modification."""
+    journal_files = [os.path.join(journal_dir_path, f) for f in os.listdir(journal_dir_path) if f.startswith("Journal.") and f.endswith(".log")]
+    journal_files.sort(key=os.path.getmtime, reverse=newest_first)
+    return journal_files
+
+
+def _iter_lines_reversed(filepath, block_size=JOURNAL_REVERSE_READ_BLOCK_SIZE):
+    """Génère les lignes (bytes) d'un fichier de la dernière à la première, en lisant par blocs depuis la fin."""
+    with open(filepath, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            lines = (f.read(read_size) + remainder).split(b"\n")
+            remainder = lines.pop(0) # Début de ligne éventuellement coupé : complété par le bloc précédent
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+        if remainder.strip():
+            yield remainder
+
+
+def find_latest_event(journal_dir_path, event_types, max_files=10):
+    """
+    Retourne le plus récent événement dont le type est dans `event_types`, ou None.
+    Les fichiers sont lus à l'envers par blocs et la lecture s'arrête au premier événement trouvé :
+    le coût ne dépend pas de la longueur de la session.
+    """
+    if isinstance(event_types, str):
+        event_types = [event_types]
+    wanted_types = {ev_type.encode('utf-8') for ev_type in event_types}
     try:
-        journal_files = [f for f in os.listdir(journal_dir_path) if f.startswith("Journal.") and f.endswith(".log")]
-        journal_files.sort(key=lambda f: os.path.getmtime(os.path.join(journal_dir_path, f)), reverse=True)
-        logger.info(f"load_journal_events: Found {len(journal_files)} journal files.")
+        journal_files = _list_journal_files(journal_dir_path)
     except Exception as e:
-        logger.exception(f"load_journal_events: Error accessing {journal_dir_path}: {e}")
-        return []
-    
-    files_to_process = journal_files[:num_files_to_check] 
-    logger.info(f"load_journal_events: Will attempt to read last {len(files_to_process)} journal files: {files_to_process}")
-    for fname in reversed(files_to_process): 
-        filepath = os.path.join(journal_dir_path, fname)
+        logger.exception(f"find_latest_event: Error listing journal files in {journal_dir_path}: {e}")
+        return None
+
+    for filepath in journal_files[:max_files]:
         try:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                for line_content in f:
-                    try:
-                        events.append(json.loads(line_content))
-                    except json.JSONDecodeError:
-                        logger.warning(f"Skipping invalid JSON line in {fname}")
-        except Exception as e:
-            logger.exception(f"Error reading or parsing {fname}: {e}")
-    logger.info(f"load_journal_events: Total events loaded: {len(events)} from {len(files_to_process)} files.");
+            for raw_line in _iter_lines_reversed(filepath):
+                try:
+                    event_data = _decode_journal_line(raw_line, wanted_types)
+                except json.JSONDecodeError:
+                    continue
+                if event_data is not None and event_data.get('event') in event_types:
+                    logger.debug(f"find_latest_event: Found '{event_data.get('event')}' in {os.path.basename(filepath)}")
+                    return event_data
+        except OSError as e:
+            logger.warning(f"find_latest_event: Error reading {filepath}: {e}")
+    logger.info(f"find_latest_event: No {list(event_types)} event found in the last {min(max_files, len(journal_files))} journal files.")
+    return None
+
+
+def _decode_journal_line(raw_line, wanted_types=None):
+    """
+    Décode une ligne brute (bytes). Si `wanted_types` (set de bytes) est fourni, le type
+    d'événement est vérifié sur la ligne brute et les lignes non pertinentes ne sont jamais décodées.
+    Les octets UTF-8 invalides sont ignorés, comme à la lecture en mode texte. Retourne l'événement ou None.
+    """
+    if wanted_types is not None:
+        type_match = _EVENT_TYPE_RE.search(raw_line)
+        if not type_match or type_match.group(1) not in wanted_types:
+            return None
+    return json.loads(raw_line.decode('utf-8', errors='ignore'))
+
+
+def read_journal_events_from(filepath, start_offset=0, wanted_events=None):
+    """
+    Lit les événements d'un fichier journal à partir de `start_offset` (octets).
+    Seules les lignes complètes sont consommées : retourne (events, end_offset) pour reprendre plus tard.
+    """
+    wanted_types = {ev_type.encode('utf-8') for ev_type in wanted_events} if wanted_events else None
+    events = []
+    end_offset = start_offset
+    with open(filepath, 'rb') as f:
+        f.seek(start_offset)
+        for line_content in f:
+            if not line_content.endswith(b"\n"):
+                break # Ligne en cours d'écriture par le jeu
+            end_offset += len(line_content)
+            if not line_content.strip():
+                continue
+            try:
+                event_data = _decode_journal_line(line_content, wanted_types)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping invalid JSON line in {os.path.basename(filepath)}")
+                continue
+            if event_data is not None:
+                events.append(event_data)
+    return events, end_offset
+
+
+def _split_file_into_line_ranges(filepath, chunk_size=JOURNAL_PARALLEL_CHUNK_BYTES):
+    """
+    Découpe un fichier en plages [start, end) alignées sur les fins de ligne.
+    La dernière ligne incomplète (en cours d'écriture) est exclue : `end` de la dernière plage est l'offset de reprise.
+    """
+    with open(filepath, 'rb') as f:
+        # Offset juste après le dernier saut de ligne (lecture du fichier à l'envers par blocs)
+        position = complete_size = f.seek(0, os.SEEK_END)
+        while position > 0:
+            read_size = min(JOURNAL_REVERSE_READ_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            last_newline = f.read(read_size).rfind(b"\n")
+            if last_newline >= 0:
+                complete_size = position + last_newline + 1
+                break
+        else:
+            complete_size = 0
+
+        ranges, start = [], 0
+        while start < complete_size:
+            if start + chunk_size < complete_size:
+                f.seek(start + chunk_size - 1)
+                f.readline() # Aller jusqu'à la fin de la ligne coupée par la limite de tranche
+                end = f.tell()
+            else:
+                end = complete_size
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parse_journal_range(task):
+    """Worker du pool : décode (avec préfiltre) les lignes d'une plage d'un fichier. Doit rester au niveau module (pickle)."""
+    filepath, start, end, wanted_events = task
+    wanted_types = {ev_type.encode('utf-8') for ev_type in wanted_events} if wanted_events else None
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    events = []
+    for line_content in data.split(b"\n"):
+        if not line_content.strip():
+            continue
+        try:
+            event_data = _decode_journal_line(line_content, wanted_types)
+        except json.JSONDecodeError:
+            continue
+        if event_data is not None:
+            events.append(event_data)
     return events
 
 
+def _init_parse_worker():
+    """
+    Initialisation des processus du pool. Le logging n'y est volontairement pas configuré (le fichier de
+    log tournant appartient au processus principal, les workers ne journalisent rien) ; Ctrl+C est laissé
+    au processus principal, qui arrête le pool.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def load_journal_files_parallel(filepaths, wanted_events=None, max_workers=None):
+    """
+    Ingestion en masse : les fichiers (et les gros fichiers par plages de lignes) sont répartis
+    sur un ProcessPoolExecutor, filtrés dans les workers puis fusionnés dans l'ordre chronologique.
+    `filepaths` doit être trié du plus ancien au plus récent. Retourne (events, {filepath: end_offset}).
+    Sous JOURNAL_PARALLEL_MIN_BYTES, le travail est fait dans le processus courant.
+    """
+    tasks, end_offsets = [], {}
+    total_bytes = 0
+    for filepath in filepaths:
+        try:
+            ranges = _split_file_into_line_ranges(filepath)
+        except OSError as e:
+            logger.warning(f"load_journal_files_parallel: Cannot read {filepath}: {e}")
+            continue
+        end_offsets[filepath] = ranges[-1][1] if ranges else 0
+        for start, end in ranges:
+            tasks.append((filepath, start, end, list(wanted_events) if wanted_events else None))
+            total_bytes += end - start
+
+    if total_bytes < JOURNAL_PARALLEL_MIN_BYTES or len(tasks) < 2:
+        results = [_parse_journal_range(task) for task in tasks]
+    else:
+        logger.info(f"load_journal_files_parallel: {len(filepaths)} files, {total_bytes / 1048576:.1f} MB split into {len(tasks)} ranges, using a process pool.")
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_parse_worker) as pool:
+            results = list(pool.map(_parse_journal_range, tasks)) # map conserve l'ordre des plages
+
+    events = [event_data for range_events in results for event_data in range_events]
+    # Les plages sont déjà dans l'ordre fichier/offset ; le tri stable ne corrige que les fichiers dont le mtime ne suit pas l'horodatage
+    events.sort(key=lambda ev: ev.get('timestamp', ''))
+    logger.info(f"load_journal_files_parallel: {len(events)} events loaded from {len(filepaths)} files.")
+    return events, end_offsets
+
+
 def get_ship_pad_size(ship_type_name):
     current_custom_ship_pad_sizes = settings_manager.get_custom_pad_sizes() 
     if not ship_type_name or ship_type_name in ["Unknown", "Journal not found", "Error", "Error - No Journal"]:
@@ -122,88 +290,65 @@ def get_latest_ship_info(journal_dir_path):
     if not journal_dir_path or not os.path.isdir(journal_dir_path):
         logger.error(f"Invalid journal directory path for get_latest_ship_info: {journal_dir_path}")
         return "Error - No Journal", 0, "?"
-    try:
-        journal_files = [f for f in os.listdir(journal_dir_path) if f.startswith("Journal.") and f.endswith(".log")]
-        journal_files.sort(key=lambda f: os.path.getmtime(os.path.join(journal_dir_path, f)))
-    except Exception as e:
-        logger.exception(f"Error listing journal files in get_latest_ship_info: {e}")
-        return "Error", 0, "?"
-
-    latest_loadout_event = None
-    for fname in reversed(journal_files[-5:]): 
-        filepath = os.path.join(journal_dir_path, fname)
-        try:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
-            for line in reversed(lines): 
-                try:
-                    event = json.loads(line)
-                    if event.get('event') == 'Loadout':
-                        latest_loadout_event = event
-                        logger.debug(f"Found Loadout event in {fname}")
-                        break 
-                except json.JSONDecodeError:
-                    continue
-            if latest_loadout_event:
-                break
-        except Exception as e:
-            logger.warning(f"Error reading or processing file {fname} for Loadout event: {e}")
-            continue
+    latest_loadout_event = find_latest_event(journal_dir_path, 'Loadout', max_files=5)
     
     if latest_loadout_event:
-        ship_type_raw = latest_loadout_event.get('Ship', 'Unknown')
-        if ship_type_raw == 'Unknown' and 'ShipName' in latest_loadout_event:
-            ship_type_raw = latest_loadout_event.get('ShipName')
+        return get_ship_info_from_loadout_event(latest_loadout_event)
 
-        ship_type_loc = latest_loadout_event.get('Ship_Localised', ship_type_raw)
-        
-        if ship_type_loc:
-            ship_type = str(ship_type_loc).replace('_', ' ').title()
-        elif ship_type_raw :
-            ship_type = str(ship_type_raw).replace('_', ' ').title()
-        else:
-            ship_type = "Unknown"
-
-        cargo_capacity_raw = latest_loadout_event.get('CargoCapacity', 0)
-        try: 
-            cargo_capacity = int(cargo_capacity_raw)
-            if cargo_capacity < 0: cargo_capacity = 0 
-        except (ValueError, TypeError): 
-            logger.warning(f"Invalid cargo capacity value '{cargo_capacity_raw}', defaulting to 0.")
-            cargo_capacity = 0
-        logger.info(f"Ship from Loadout: {ship_type}, Cargo: {cargo_capacity}")
+    logger.warning("No Loadout event found in recent journal files.")
+    ship_type = "Journal not found"
+    return ship_type, cargo_capacity, get_ship_pad_size(ship_type)
+
+
+def get_ship_info_from_loadout_event(loadout_event):
+    """Extrait (ship_type, cargo_capacity, pad_size) d'un événement 'Loadout'."""
+    ship_type_raw = loadout_event.get('Ship', 'Unknown')
+    if ship_type_raw == 'Unknown' and 'ShipName' in loadout_event:
+        ship_type_raw = loadout_event.get('ShipName')
+
+    ship_type_loc = loadout_event.get('Ship_Localised', ship_type_raw)
+    
+    if ship_type_loc:
+        ship_type = str(ship_type_loc).replace('_', ' ').title()
+    elif ship_type_raw :
+        ship_type = str(ship_type_raw).replace('_', ' ').title()
     else:
-        ship_type = "Journal not found"
-        logger.warning("No Loadout event found in recent journal files.")
+        ship_type = "Unknown"
+
+    cargo_capacity_raw = loadout_event.get('CargoCapacity', 0)
+    try: 
+        cargo_capacity = int(cargo_capacity_raw)
+        if cargo_capacity < 0: cargo_capacity = 0 
+    except (ValueError, TypeError): 
+        logger.warning(f"Invalid cargo capacity value '{cargo_capacity_raw}', defaulting to 0.")
+        cargo_capacity = 0
+    logger.info(f"Ship from Loadout: {ship_type}, Cargo: {cargo_capacity}")
         
     pad_size = get_ship_pad_size(ship_type)
     return ship_type, cargo_capacity, pad_size
 
 
+def location_from_event(event_data):
+    """Retourne (system, station) déduits d'un événement de position, ou None si l'événement n'en est pas un."""
+    event_type = event_data.get("event")
+    if event_type == "Docked":
+        return event_data.get("StarSystem"), event_data.get("StationName")
+    elif event_type == "Location":
+        return event_data.get("StarSystem"), (event_data.get("StationName") if event_data.get("Docked", False) else None)
+    elif event_type in ["FSDJump", "CarrierJump", "Undocked", "Liftoff"]:
+        return event_data.get("StarSystem"), None
+    return None
+
+
 def get_current_location_from_events(events):
-    current_system, current_station, is_docked_flag = None, None, False
+    current_system, current_station = None, None
     for event_data in reversed(events): 
-        event_type = event_data.get("event")
-        if event_type == "Docked":
-            current_system = event_data.get("StarSystem")
-            current_station = event_data.get("StationName")
-            is_docked_flag = True
-            break 
-        elif event_type == "Location":
-            current_system = event_data.get("StarSystem")
-            if event_data.get("Docked", False):
-                current_station = event_data.get("StationName")
-                is_docked_flag = True
-            else: 
-                current_station = None 
-                is_docked_flag = False
-            break 
-        elif event_type in ["FSDJump", "CarrierJump", "Undocked", "Liftoff"]:
-            current_system = event_data.get("StarSystem")
-            current_station = None 
-            is_docked_flag = False
+        location = location_from_event(event_data)
+        if location:
+            current_system, current_station = location
             break
             
+    is_docked_flag = current_station is not None
     final_system = current_system if current_system else "?"
     final_station = current_station if is_docked_flag and current_station else "?"
     
@@ -213,36 +358,136 @@ def get_current_location_from_events(events):
     logger.info(f"Location from events: System='{final_system}', Station='{final_station}', Docked='{is_docked_flag}'")
     return final_system, final_station
 
+def _resolve_material_category(mat_name_internal_lower, category_hint=None):
+    """Catégorie (Raw/Manufactured/Encoded) d'un matériau ; `category_hint` peut être '$MICRORESOURCE_CATEGORY_Encoded;'."""
+    lookup = MATERIALS_LOOKUP.get(mat_name_internal_lower)
+    if lookup:
+        return lookup["Category"]
+    if category_hint:
+        for category_key in MATERIAL_CATEGORIES:
+            if category_key.lower() in str(category_hint).lower():
+                return category_key
+    return None
+
+
+def _apply_material_delta(current_materials, mat_name_journal, delta, category_hint=None, name_localised=None):
+    """Ajoute `delta` (négatif pour une dépense) au stock d'un matériau. Retourne (catégorie, nom) modifié ou None."""
+    if not mat_name_journal or not delta:
+        return None
+    mat_name_internal_lower = mat_name_journal.lower()
+    category_key = _resolve_material_category(mat_name_internal_lower, category_hint)
+    if not category_key:
+        return None # Commodité (ex. ingrédients EngineerCraft) ou matériau inconnu
+    entry = current_materials[category_key].get(mat_name_internal_lower)
+    if entry is None:
+        lookup = MATERIALS_LOOKUP.get(mat_name_internal_lower, {})
+        entry = current_materials[category_key][mat_name_internal_lower] = {
+            "Name": mat_name_journal,
+            "Name_Localised": name_localised or lookup.get("Name_Localised", mat_name_journal),
+            "Count": 0
+        }
+    new_count = max(0, entry.get("Count", 0) + delta)
+    limit = get_material_limit(mat_name_internal_lower, category_key)
+    if limit > 0:
+        new_count = min(new_count, limit) # Le jeu ne stocke pas au-delà de la limite du grade
+    if new_count == entry.get("Count", 0):
+        return None
+    entry["Count"] = new_count
+    return category_key, mat_name_internal_lower
+
+
+def apply_material_event(current_materials, event_data):
+    """
+    Applique un événement du journal au registre des matériaux (modifié sur place).
+    'Materials' (à la connexion) remplace le registre ; les autres événements sont des deltas
+    appliqués par-dessus le dernier instantané. Retourne la liste des (catégorie, nom) modifiés.
+    """
+    event_type = event_data.get("event")
+    if event_type == "Materials":
+        snapshot = _materials_from_snapshot_event(event_data)
+        changed = [(category_key, name) for category_key in MATERIAL_CATEGORIES
+                   for name in set(current_materials.get(category_key, {})) | set(snapshot[category_key])
+                   if current_materials.get(category_key, {}).get(name, {}).get("Count", 0) != snapshot[category_key].get(name, {}).get("Count", 0)]
+        current_materials.clear()
+        current_materials.update(snapshot)
+        return changed
+
+    if current_materials.get("timestamp") is None:
+        return [] # Pas d'instantané de référence : les deltas seuls ne donnent pas un stock fiable
+
+    deltas = [] # (nom, delta, catégorie indicative, nom localisé)
+    if event_type == "MaterialCollected":
+        deltas.append((event_data.get("Name"), event_data.get("Count", 0), event_data.get("Category"), event_data.get("Name_Localised")))
+    elif event_type in ("MaterialDiscarded", "ScientificResearch"):
+        deltas.append((event_data.get("Name"), -event_data.get("Count", 0), event_data.get("Category"), event_data.get("Name_Localised")))
+    elif event_type == "MaterialTrade":
+        paid, received = event_data.get("Paid", {}), event_data.get("Received", {})
+        deltas.append((paid.get("Material"), -paid.get("Quantity", 0), paid.get("Category"), paid.get("Material_Localised")))
+        deltas.append((received.get("Material"), received.get("Quantity", 0), received.get("Category"), received.get("Material_Localised")))
+    elif event_type == "EngineerCraft":
+        for ingredient in event_data.get("Ingredients", []):
+            deltas.append((ingredient.get("Name"), -ingredient.get("Count", 0), None, ingredient.get("Name_Localised")))
+    elif event_type == "EngineerContribution":
+        if event_data.get("Type") == "Materials":
+            deltas.append((event_data.get("Material"), -event_data.get("Quantity", 0), None, event_data.get("Material_Localised")))
+    elif event_type in ("Synthesis", "TechnologyBroker"):
+        for mat_entry in event_data.get("Materials", []):
+            deltas.append((mat_entry.get("Name"), -mat_entry.get("Count", 0), mat_entry.get("Category"), mat_entry.get("Name_Localised")))
+    elif event_type == "MissionCompleted":
+        for mat_entry in event_data.get("MaterialsReward", []):
+            deltas.append((mat_entry.get("Name"), mat_entry.get("Count", 0), mat_entry.get("Category"), mat_entry.get("Name_Localised")))
+    else:
+        return []
+
+    changed = []
+    for mat_name_journal, delta, category_hint, name_localised in deltas:
+        changed_key = _apply_material_delta(current_materials, mat_name_journal, delta, category_hint, name_localised)
+        if changed_key:
+            changed.append(changed_key)
+    if changed:
+        current_materials["timestamp"] = event_data.get("timestamp", current_materials["timestamp"])
+    return changed
+
+
+def _materials_from_snapshot_event(materials_event):
+    current_materials = {
+        "Raw": {}, "Manufactured": {}, "Encoded": {}, "timestamp": materials_event.get("timestamp")
+    }
+    for category_key in MATERIAL_CATEGORIES: 
+        if category_key in materials_event:
+            for mat_entry in materials_event[category_key]:
+                mat_name_journal = mat_entry.get("Name") 
+                if not mat_name_journal:
+                    logger.warning(f"Material entry in category {category_key} is missing 'Name'. Entry: {mat_entry}")
+                    continue
+                
+                mat_name_internal_lower = mat_name_journal.lower()
+
+                current_materials[category_key][mat_name_internal_lower] = {
+                    "Name": mat_name_journal, 
+                    "Name_Localised": mat_entry.get("Name_Localised", mat_name_journal),
+                    "Count": mat_entry.get("Count", 0)
+                }
+    return current_materials
+
+
 def get_current_materials_from_events(events):
+    """Dernier instantané 'Materials' + deltas (MaterialCollected, MaterialTrade, EngineerCraft, ...) écrits depuis."""
     logger.info("get_current_materials_from_events: Searching for 'Materials' event.")
-    latest_materials_event = None
-    for event_data in reversed(events):
-        if event_data.get("event") == "Materials":
-            latest_materials_event = event_data
-            logger.info(f"Found 'Materials' event at timestamp: {event_data.get('timestamp')}")
+    latest_snapshot_index = None
+    for index in range(len(events) - 1, -1, -1):
+        if events[index].get("event") == "Materials":
+            latest_snapshot_index = index
+            logger.info(f"Found 'Materials' event at timestamp: {events[index].get('timestamp')}")
             break
 
     current_materials = {
         "Raw": {}, "Manufactured": {}, "Encoded": {}, "timestamp": None
     }
 
-    if latest_materials_event:
-        current_materials["timestamp"] = latest_materials_event.get("timestamp")
-        for category_key in MATERIAL_CATEGORIES: 
-            if category_key in latest_materials_event:
-                for mat_entry in latest_materials_event[category_key]:
-                    mat_name_journal = mat_entry.get("Name") 
-                    if not mat_name_journal:
-                        logger.warning(f"Material entry in category {category_key} is missing 'Name'. Entry: {mat_entry}")
-                        continue
-                    
-                    mat_name_internal_lower = mat_name_journal.lower()
-
-                    current_materials[category_key][mat_name_internal_lower] = {
-                        "Name": mat_name_journal, 
-                        "Name_Localised": mat_entry.get("Name_Localised", mat_name_journal),
-                        "Count": mat_entry.get("Count", 0)
-                    }
+    if latest_snapshot_index is not None:
+        for event_data in events[latest_snapshot_index:]:
+            apply_material_event(current_materials, event_data)
         logger.info(f"Processed materials data: {len(current_materials['Raw'])} Raw, {len(current_materials['Manufactured'])} Manufactured, {len(current_materials['Encoded'])} Encoded.")
     else:
         logger.warning("No 'Materials' event found in the provided events.")
@@ -264,16 +509,23 @@ def get_player_state_data():
         EFFECTIVE_JOURNAL_DIR = temp_journal_dir
         logger.info(f"Effective journal directory set to: {EFFECTIVE_JOURNAL_DIR}")
         
-        all_events = load_journal_events(EFFECTIVE_JOURNAL_DIR, num_files_to_check=10) 
+        import journal_state # Import local : journal_state dépend de journal_parser
+        # Magasin partagé (checkpoint + vues mémorisées) : seuls les nouveaux événements sont lus
+        location = journal_state.get_location_view(EFFECTIVE_JOURNAL_DIR)
         
-        if all_events:
-            system, station = get_current_location_from_events(all_events)
-            materials_data = get_current_materials_from_events(all_events)
+        if location:
+            system, station = location
+            materials_data = journal_state.get_materials_view(EFFECTIVE_JOURNAL_DIR)
         else:
             logger.warning("No journal events loaded for state parsing.")
             system, station = "No Events", "No Events"
             
-        ship_type, cargo_capacity, pad_size = get_latest_ship_info(EFFECTIVE_JOURNAL_DIR)
+        ship_info = journal_state.get_ship_view(EFFECTIVE_JOURNAL_DIR)
+        if ship_info:
+            ship_type, cargo_capacity = ship_info
+            pad_size = get_ship_pad_size(ship_type) # Recalculé : dépend des tailles personnalisées
+        else:
+            ship_type, cargo_capacity, pad_size = get_latest_ship_info(EFFECTIVE_JOURNAL_DIR)
     else:
         EFFECTIVE_JOURNAL_DIR = "Not Found"
         logger.error("Journal directory could not be determined (custom or auto).")
@@ -311,149 +563,185 @@ def _clean_commodity_name(commodity_field_value, commodity_localised_value=None)
     return cleaned_name if cleaned_name else commodity_field_value.lower() # Dernier recours, la valeur brute en minuscules
 
 
-def parse_active_missions(journal_events):
-    logger.info(f"parse_active_missions: Received {len(journal_events)} events.")
-    missions_dict = {}
-    latest_missions_event = next((ev for ev in reversed(journal_events) if ev.get('event') == 'Missions'), None)
+def _new_mission_entry(mission_data, mission_id, source_event, delivered=0):
+    """Construit l'entrée de suivi d'une mission de collecte, ou None si la marchandise est inexploitable."""
+    commodity_raw = mission_data.get('Commodity') # Ex: $gold_name;
+    commodity_loc = mission_data.get('Commodity_Localised') # Ex: Or
+    internal_commodity_name = _clean_commodity_name(commodity_raw)
+    if not internal_commodity_name:
+        logger.warning(f"Mission {mission_id} (from '{source_event}'): Empty internal commodity name after cleaning. Original Commodity: '{commodity_raw}', Localised: '{commodity_loc}'. Skipping.")
+        return None
+    return {
+        'name': internal_commodity_name, # Utiliser le nom interne nettoyé pour la logique
+        'name_localised': commodity_loc or internal_commodity_name.capitalize(), # Pour affichage
+        'total': mission_data['Count'],
+        'delivered': delivered,
+        'completed': False, 'failed_or_abandoned': False,
+        'reward': mission_data.get('Reward', 0),
+        'destinationSystem': mission_data.get('DestinationSystem', ''),
+        'destinationStation': mission_data.get('DestinationStation', ''),
+        'source_event': source_event
+    }
+
+
+def apply_mission_event(missions_dict, event_data):
+    """
+    Applique un événement du journal à l'état des missions (modifié sur place).
+    Retourne True si l'état a changé. Les événements doivent être fournis dans l'ordre chronologique.
+    """
+    event_type = event_data.get('event')
 
-    if latest_missions_event:
-        logger.info(f"parse_active_missions: Found 'Missions' event with {len(latest_missions_event.get('Active',[]))} active entries.")
-        for mission_data in latest_missions_event.get('Active', []):
+    if event_type == 'Missions':
+        # Instantané écrit par le jeu à la connexion : fait foi pour la liste des missions encore actives
+        active_ids = set()
+        for mission_data in event_data.get('Active', []):
             mission_id = mission_data.get('MissionID')
-            commodity_raw = mission_data.get('Commodity') # Ex: $gold_name;
-            
-            if not mission_id or not commodity_raw or not mission_data.get('Count'):
+            if not mission_id: continue
+            active_ids.add(mission_id)
+            if mission_id in missions_dict:
+                # Déjà suivie : conserver les livraisons comptées, mais prendre le compteur du jeu s'il est plus grand
+                snapshot_delivered = mission_data.get('DeliveredCount', 0)
+                if snapshot_delivered > missions_dict[mission_id].get('delivered', 0):
+                    missions_dict[mission_id]['delivered'] = snapshot_delivered
                 continue
-            
-            commodity_loc = mission_data.get('Commodity_Localised') # Ex: Or
-            
-            # Utiliser la nouvelle fonction de nettoyage
-            internal_commodity_name = _clean_commodity_name(commodity_raw)
-            
-            if not internal_commodity_name:
-                logger.warning(f"Mission {mission_id} (from 'Missions' event): Empty internal commodity name after cleaning. Original Commodity: '{commodity_raw}', Localised: '{commodity_loc}'. Skipping.")
+            if not mission_data.get('Commodity') or not mission_data.get('Count'):
                 continue
-
-            missions_dict[mission_id] = {
-                'name': internal_commodity_name, # Utiliser le nom interne nettoyé pour la logique
-                'name_localised': commodity_loc or internal_commodity_name.capitalize(), # Pour affichage
-                'total': mission_data['Count'],
-                'delivered': mission_data.get('DeliveredCount', 0),
-                'completed': False, 'failed_or_abandoned': False,
-                'reward': mission_data.get('Reward', 0),
-                'destinationSystem': mission_data.get('DestinationSystem', ''),
-                'destinationStation': mission_data.get('DestinationStation', ''),
-                'source_event': 'Missions'
-            }
-            logger.info(f"Mission {mission_id} (from 'Missions'): Internal Name '{internal_commodity_name}', Display '{missions_dict[mission_id]['name_localised']}', Total: {mission_data['Count']}, Delivered: {mission_data.get('DeliveredCount', 0)}")
-    else:
-        logger.info("parse_active_missions: No 'Missions' event found. Relying on individual events.")
-
-    # Traitement des événements individuels (MissionAccepted, CargoDepot, etc.)
-    # pour affiner les données ou capturer des missions non listées dans l'événement 'Missions' global
-    for event_data in journal_events:
-        event_type = event_data.get('event')
-        mission_id = event_data.get('MissionID')
-
-        if not mission_id and event_type in ['MissionAccepted', 'CargoDepot', 'MissionCompleted', 'MissionFailed', 'MissionAbandoned']:
-            continue
-        
-        # Si la mission est déjà marquée comme terminée/échouée à partir de l'événement 'Missions' agrégé,
-        # ignorer les événements individuels plus anciens, sauf s'il s'agit d'une nouvelle acceptation ou d'une mise à jour du dépôt de marchandises.
-        if mission_id in missions_dict and \
-           (missions_dict[mission_id].get('completed') or missions_dict[mission_id].get('failed_or_abandoned')) and \
-           event_type not in ['MissionAccepted', 'CargoDepot']:
-            continue
-        
-        if event_type == 'MissionAccepted':
-            commodity_raw = event_data.get('Commodity')
-            if commodity_raw and event_data.get('Count'):
-                # Ajouter/mettre à jour uniquement si non présent depuis 'Missions' ou si c'est une acceptation plus récente
-                # (difficile à déterminer sans timestamps par mission dans l'événement 'Missions')
-                # Pour l'instant, on écrase si 'Missions' n'a pas fourni cette entrée, ou si on veut prioriser les events individuels.
-                # Si elle vient de 'Missions', on ne la remplace que si c'est pertinent (ex: si 'Missions' est très vieux)
-                # Décision : si 'Missions' est traité en premier, il est probablement plus à jour.
-                # On ajoute ici si la mission N'EST PAS dans `missions_dict` (cas où 'Missions' n'a pas été trouvé ou est incomplet)
-                if mission_id not in missions_dict:
-                    commodity_loc = event_data.get('Commodity_Localised')
-                    internal_commodity_name = _clean_commodity_name(commodity_raw)
-
-                    if not internal_commodity_name:
-                        logger.warning(f"Accepted Mission {mission_id}: Empty internal commodity name. Original: '{commodity_raw}', Localised: '{commodity_loc}'. Skipping.")
-                        continue
-                    
-                    missions_dict[mission_id] = {
-                        'name': internal_commodity_name,
-                        'name_localised': commodity_loc or internal_commodity_name.capitalize(),
-                        'total': event_data['Count'],
-                        'delivered': 0, # Nouveau, donc 0 livré
-                        'completed': False, 'failed_or_abandoned': False,
-                        'reward': event_data.get('Reward', 0),
-                        'destinationSystem': event_data.get('DestinationSystem', ''),
-                        'destinationStation': event_data.get('DestinationStation', ''),
-                        'source_event': 'MissionAccepted'
-                    }
-                    logger.info(f"Processed 'MissionAccepted' for ID {mission_id} (not found in 'Missions' event): Internal Name '{internal_commodity_name}', Count: {event_data['Count']}")
-        
-        elif event_type == 'CargoDepot' and mission_id in missions_dict:
-            if event_data.get('UpdateType') == 'Deliver':
-                mission_entry = missions_dict[mission_id]
-                # ... (logique de mise à jour de 'delivered' comme avant) ...
-                previous_delivered = mission_entry.get('delivered', 0)
-                mission_total_quantity = mission_entry.get('total', float('inf')) 
-                transactional_count = event_data.get('Count', 0)
-                if transactional_count == 0 and 'ItemsDelivered' in event_data:
-                    transactional_count = event_data.get('ItemsDelivered', 0)
-                api_progress = event_data.get('Progress')
-                api_total_items_in_event = event_data.get('TotalItemsToDeliver')
-                new_delivered_cumulative = previous_delivered 
-                if api_progress is not None and api_total_items_in_event is not None and api_progress > 0.0:
-                    try:
-                        if api_total_items_in_event != mission_total_quantity:
-                            logger.warning(f"CargoDepot MissionID {mission_id}: TotalItemsToDeliver in event ({api_total_items_in_event}) != mission total ({mission_total_quantity}). Using mission total for progress.")
-                        calculated_from_progress = round(float(mission_total_quantity) * float(api_progress))
-                        if calculated_from_progress > previous_delivered:
-                            new_delivered_cumulative = calculated_from_progress
-                        elif transactional_count > 0: 
-                            new_delivered_cumulative = previous_delivered + transactional_count
-                    except ValueError:
-                        if transactional_count > 0: new_delivered_cumulative = previous_delivered + transactional_count
+            entry = _new_mission_entry(mission_data, mission_id, 'Missions', delivered=mission_data.get('DeliveredCount', 0))
+            if entry:
+                missions_dict[mission_id] = entry
+                logger.info(f"Mission {mission_id} (from 'Missions'): Internal Name '{entry['name']}', Display '{entry['name_localised']}', Total: {entry['total']}, Delivered: {entry['delivered']}")
+        for mission_id in [m_id for m_id in missions_dict if m_id not in active_ids]:
+            del missions_dict[mission_id] # Terminée/expirée pendant une période non couverte par les journaux lus
+        return True
+
+    mission_id = event_data.get('MissionID')
+    if not mission_id:
+        return False
+
+    # Mission déjà terminée/échouée : seuls une nouvelle acceptation ou un dépôt de marchandises peuvent encore la toucher
+    if mission_id in missions_dict and \
+       (missions_dict[mission_id].get('completed') or missions_dict[mission_id].get('failed_or_abandoned')) and \
+       event_type not in ['MissionAccepted', 'CargoDepot']:
+        return False
+
+    if event_type == 'MissionAccepted':
+        if event_data.get('Commodity') and event_data.get('Count') and mission_id not in missions_dict:
+            entry = _new_mission_entry(event_data, mission_id, 'MissionAccepted')
+            if entry:
+                missions_dict[mission_id] = entry
+                logger.info(f"Processed 'MissionAccepted' for ID {mission_id}: Internal Name '{entry['name']}', Count: {entry['total']}")
+                return True
+        return False
+
+    if event_type == 'CargoDepot' and mission_id in missions_dict:
+        if event_data.get('UpdateType') != 'Deliver':
+            return False
+        mission_entry = missions_dict[mission_id]
+        previous_delivered = mission_entry.get('delivered', 0)
+        mission_total_quantity = mission_entry.get('total', float('inf')) 
+        transactional_count = event_data.get('Count', 0)
+        if transactional_count == 0 and 'ItemsDelivered' in event_data:
+            transactional_count = event_data.get('ItemsDelivered', 0)
+        api_progress = event_data.get('Progress')
+        api_total_items_in_event = event_data.get('TotalItemsToDeliver')
+        new_delivered_cumulative = previous_delivered 
+        if api_progress is not None and api_total_items_in_event is not None and api_progress > 0.0:
+            try:
+                if api_total_items_in_event != mission_total_quantity:
+                    logger.warning(f"CargoDepot MissionID {mission_id}: TotalItemsToDeliver in event ({api_total_items_in_event}) != mission total ({mission_total_quantity}). Using mission total for progress.")
+                calculated_from_progress = round(float(mission_total_quantity) * float(api_progress))
+                if calculated_from_progress > previous_delivered:
+                    new_delivered_cumulative = calculated_from_progress
                 elif transactional_count > 0: 
                     new_delivered_cumulative = previous_delivered + transactional_count
-                final_new_delivered_count = min(new_delivered_cumulative, mission_total_quantity)
-                if final_new_delivered_count > previous_delivered:
-                    mission_entry['delivered'] = final_new_delivered_count
-                    logger.info(f"CargoDepot (Deliver) MissionID {mission_id}: Delivered count updated to {mission_entry['delivered']}.")
-
-        elif event_type == 'MissionCompleted' and mission_id in missions_dict:
-            logger.info(f"Mission {mission_id} completed.")
-            missions_dict[mission_id]['completed'] = True
-            if missions_dict[mission_id].get('total', 0) > missions_dict[mission_id].get('delivered', 0): 
-                missions_dict[mission_id]['delivered'] = missions_dict[mission_id].get('total', 0)
-        
-        elif event_type in ['MissionFailed','MissionAbandoned'] and mission_id in missions_dict:
-            logger.info(f"Mission {mission_id} marked as '{event_type}'.")
-            missions_dict[mission_id]['completed'] = True 
-            missions_dict[mission_id]['failed_or_abandoned'] = True
-
-    remaining_needs = {}
-    total_reward_potential = 0
+            except ValueError:
+                if transactional_count > 0: new_delivered_cumulative = previous_delivered + transactional_count
+        elif transactional_count > 0: 
+            new_delivered_cumulative = previous_delivered + transactional_count
+        final_new_delivered_count = min(new_delivered_cumulative, mission_total_quantity)
+        if final_new_delivered_count > previous_delivered:
+            mission_entry['delivered'] = final_new_delivered_count
+            logger.info(f"CargoDepot (Deliver) MissionID {mission_id}: Delivered count updated to {mission_entry['delivered']}.")
+            return True
+        return False
+
+    if event_type == 'MissionCompleted' and mission_id in missions_dict:
+        logger.info(f"Mission {mission_id} completed.")
+        missions_dict[mission_id]['completed'] = True
+        if missions_dict[mission_id].get('total', 0) > missions_dict[mission_id].get('delivered', 0): 
+            missions_dict[mission_id]['delivered'] = missions_dict[mission_id].get('total', 0)
+        return True
+
+    if event_type in ['MissionFailed','MissionAbandoned'] and mission_id in missions_dict:
+        logger.info(f"Mission {mission_id} marked as '{event_type}'.")
+        missions_dict[mission_id]['completed'] = True 
+        missions_dict[mission_id]['failed_or_abandoned'] = True
+        return True
+
+    return False
+
+
+def mission_needs_contribution(mission_data):
+    """Contribution d'une mission aux besoins : (nom interne, quantité restante, récompense) ou None si rien à livrer."""
+    if not mission_data or mission_data.get('completed', False) or mission_data.get('failed_or_abandoned', False):
+        return None
+    needed_quantity = mission_data.get('total', 0) - mission_data.get('delivered', 0)
+    if needed_quantity <= 0 or not mission_data.get('name'):
+        return None
+    return mission_data['name'], needed_quantity, mission_data.get('reward', 0)
+
+
+def adjust_mission_needs(mission_needs, old_contribution, new_contribution):
+    """
+    Met à jour sur place l'agrégat {"needs": {nom: qté}, "reward": total} avec le changement
+    de contribution d'une seule mission (O(1) au lieu de re-sommer toutes les missions).
+    """
+    needs = mission_needs["needs"]
+    if old_contribution:
+        name, qty, reward = old_contribution
+        needs[name] = needs.get(name, 0) - qty
+        if needs[name] <= 0: del needs[name]
+        mission_needs["reward"] -= reward
+    if new_contribution:
+        name, qty, reward = new_contribution
+        needs[name] = needs.get(name, 0) + qty
+        mission_needs["reward"] += reward
+
+
+def summarize_mission_needs(missions_dict):
+    """Retourne (remaining_needs, total_reward_potential) pour les missions encore actives."""
+    mission_needs = {"needs": {}, "reward": 0}
     for mission_id, mission_data in missions_dict.items():
-        if not mission_data.get('completed', False) and not mission_data.get('failed_or_abandoned', False):
-            needed_quantity = mission_data.get('total', 0) - mission_data.get('delivered', 0)
-            if needed_quantity > 0:
-                # Utiliser le nom interne pour la logique des besoins
-                internal_name_for_logic = mission_data.get('name')
-                if not internal_name_for_logic: 
-                    logger.warning(f"Mission ID {mission_id} has no internal commodity name for needs processing. Skipping."); continue
-                remaining_needs[internal_name_for_logic] = remaining_needs.get(internal_name_for_logic, 0) + needed_quantity
-                total_reward_potential += mission_data.get('reward', 0)
+        adjust_mission_needs(mission_needs, None, mission_needs_contribution(mission_data))
+    remaining_needs, total_reward_potential = mission_needs["needs"], mission_needs["reward"]
                 
     if not remaining_needs:
-        logger.info("parse_active_missions: No active collection missions with outstanding needs found.")
+        logger.info("summarize_mission_needs: No active collection missions with outstanding needs found.")
     else:
-        logger.info(f"parse_active_missions: Final needs (internal names): {remaining_needs}. Total potential reward: {total_reward_potential:,.0f} CR.")
+        logger.info(f"summarize_mission_needs: Final needs (internal names): {remaining_needs}. Total potential reward: {total_reward_potential:,.0f} CR.")
         
-    # Retourner remaining_needs (basé sur les noms internes) et le potentiel de récompense.
     # L'affichage utilisera 'name_localised' stocké dans missions_dict si besoin.
-    return remaining_needs, total_reward_potential
\ No newline at end of file
+    return remaining_needs, total_reward_potential
+
+
+@perf_trace.traced("journal.parse_missions")
+def parse_active_missions(journal_events):
+    """Rejoue les événements fournis (ordre chronologique) et retourne (remaining_needs, total_reward_potential)."""
+    logger.info(f"parse_active_missions: Received {len(journal_events)} events.")
+    missions_dict = {}
+    for event_data in journal_events:
+        apply_mission_event(missions_dict, event_data)
+    return summarize_mission_needs(missions_dict)
+
+
+def query_journal_events(event_types=None, since=None, until=None, system=None, station=None, market_id=None, limit=1000, newest_first=False):
+    """
+    Requête sur l'index SQLite de l'historique complet des journaux (voir journal_index).
+    `since`/`until` sont des horodatages ISO du journal (ex. "2024-05-01T00:00:00Z").
+    """
+    import journal_index # Import local : journal_index dépend de ce module
+    try:
+        return journal_index.query_events(event_types, since, until, system, station, market_id, limit, newest_first)
+    except sqlite3.Error as e:
+        logger.error(f"query_journal_events: index query failed: {e}")
+        return []
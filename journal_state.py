@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+État joueur dérivé des journaux (position, vaisseau, matériaux, missions) avec checkpoint sur disque.
+
+Le checkpoint mémorise le dernier fichier journal traité et l'offset atteint : au redémarrage,
+seuls les événements écrits après ce point sont rejoués. Il est validé contre le répertoire,
+la taille et la date de modification du fichier de référence ; sinon l'état est reconstruit.
+
+C'est le magasin unique de l'état journal pour tout le processus : les onglets lisent des copies
+(get_player_state) ou des vues mémorisées (get_*_view), recalculées seulement quand de nouvelles
+données de journal ont été appliquées. Quand le journal_watcher suit le répertoire, ses notifications
+servent d'invalidation et aucun accès disque n'est fait tant que rien n'a été écrit.
+"""
+import json
+import os
+import copy
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from constants import (
+    JOURNAL_STATE_CHECKPOINT_FILE, JOURNAL_STATE_CHECKPOINT_VERSION,
+    JOURNAL_WATCHER_LOCATION_EVENTS, JOURNAL_WATCHER_SHIP_EVENTS,
+    JOURNAL_WATCHER_MISSION_EVENTS, JOURNAL_WATCHER_MATERIALS_EVENTS,
+    KEY_NUM_JOURNAL_FILES_MISSIONS, DEFAULT_NUM_JOURNAL_FILES_MISSIONS
+)
+import journal_parser
+import journal_watcher
+import perf_trace
+import settings_manager
+import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+STATE_EVENT_TYPES = (JOURNAL_WATCHER_LOCATION_EVENTS + JOURNAL_WATCHER_SHIP_EVENTS +
+                     JOURNAL_WATCHER_MISSION_EVENTS + JOURNAL_WATCHER_MATERIALS_EVENTS)
+
+_state = None # État en mémoire (dernier checkpoint chargé/à jour)
+_state_lock = threading.RLock()
+_generation = 0 # Incrémenté à chaque modification de _state (clé des vues mémorisées)
+_dirty = True # Mis à True par le journal_watcher quand de nouveaux événements sont écrits
+_last_refresh_at = None # time.monotonic() du dernier rattrapage complet
+_views = {} # nom de vue -> (génération, valeur)
+_mission_needs_listeners = [] # callbacks(needs, reward) appelés quand les besoins des missions changent
+_materials_listeners = [] # callbacks(materials) appelés quand le registre des matériaux change
+
+
+def _new_state(journal_dir):
+    return {
+        "version": JOURNAL_STATE_CHECKPOINT_VERSION,
+        "journal_dir": journal_dir,
+        "last_file": None, "last_offset": 0, "last_file_mtime": None,
+        "location": {"system": None, "station": None},
+        "ship": {"ship_type": None, "cargo_capacity": 0},
+        "materials": {"Raw": {}, "Manufactured": {}, "Encoded": {}, "timestamp": None},
+        "missions": {},
+        "mission_needs": {"needs": {}, "reward": 0}, # Agrégat maintenu incrémentalement
+        "savedAt": None
+    }
+
+
+def apply_event(state, event_data):
+    """Applique un événement du journal à l'état (modifié sur place)."""
+    event_type = event_data.get("event")
+    if event_type in JOURNAL_WATCHER_LOCATION_EVENTS:
+        location = journal_parser.location_from_event(event_data)
+        if location: # Undocked / Liftoff n'ont pas toujours StarSystem : le système reste le précédent
+            state["location"] = {"system": location[0] or state["location"].get("system"), "station": location[1]}
+    elif event_type in JOURNAL_WATCHER_SHIP_EVENTS:
+        ship_type, cargo_capacity, _pad = journal_parser.get_ship_info_from_loadout_event(event_data)
+        state["ship"] = {"ship_type": ship_type, "cargo_capacity": cargo_capacity}
+    elif event_type in JOURNAL_WATCHER_MATERIALS_EVENTS:
+        journal_parser.apply_material_event(state["materials"], event_data) # Instantané ou delta
+    elif event_type in JOURNAL_WATCHER_MISSION_EVENTS:
+        if event_type == "MissionCompleted":
+            journal_parser.apply_material_event(state["materials"], event_data) # MaterialsReward
+        mission_id = event_data.get("MissionID")
+        if event_type == "Missions" or not mission_id:
+            # Instantané complet (rare, à la connexion) : recalcul de l'agrégat
+            if journal_parser.apply_mission_event(state["missions"], event_data):
+                needs, reward = journal_parser.summarize_mission_needs(state["missions"])
+                state["mission_needs"] = {"needs": needs, "reward": reward}
+        else:
+            old_contribution = journal_parser.mission_needs_contribution(state["missions"].get(mission_id))
+            if journal_parser.apply_mission_event(state["missions"], event_data):
+                journal_parser.adjust_mission_needs(state["mission_needs"], old_contribution,
+                                                    journal_parser.mission_needs_contribution(state["missions"].get(mission_id)))
+
+
+def load_checkpoint():
+    if not os.path.exists(JOURNAL_STATE_CHECKPOINT_FILE):
+        return None
+    try:
+        with open(JOURNAL_STATE_CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("version") != JOURNAL_STATE_CHECKPOINT_VERSION:
+            logger.info(f"Journal state checkpoint version {state.get('version')} is outdated, ignoring it.")
+            return None
+        # Les clés JSON sont des chaînes : restaurer les MissionID entiers du journal
+        state["missions"] = {int(m_id): m_data for m_id, m_data in state.get("missions", {}).items()}
+        return state
+    except (IOError, json.JSONDecodeError, ValueError, AttributeError) as e:
+        logger.warning(f"Could not load journal state checkpoint {JOURNAL_STATE_CHECKPOINT_FILE}: {e}")
+        return None
+
+
+def save_checkpoint(state):
+    state["savedAt"] = datetime.now(timezone.utc).isoformat()
+    try:
+        # Écriture atomique : un arrêt brutal ne laisse pas un checkpoint corrompu (rescan complet)
+        snapshot_store.atomic_write_bytes(JOURNAL_STATE_CHECKPOINT_FILE, json.dumps(state, separators=(",", ":")).encode('utf-8'))
+        logger.debug(f"Journal state checkpoint saved ({state['last_file']} @ {state['last_offset']}).")
+    except IOError as e:
+        logger.error(f"Error saving journal state checkpoint: {e}")
+
+
+def _is_checkpoint_valid(state, journal_dir):
+    if not state or state.get("journal_dir") != journal_dir or not state.get("last_file"):
+        return False
+    last_path = os.path.join(journal_dir, state["last_file"])
+    try:
+        stat = os.stat(last_path)
+    except OSError:
+        logger.info(f"Journal state checkpoint: reference file {state['last_file']} no longer exists.")
+        return False
+    if stat.st_size < state.get("last_offset", 0) or (state.get("last_file_mtime") and stat.st_mtime < state["last_file_mtime"]):
+        logger.info(f"Journal state checkpoint: reference file {state['last_file']} was truncated or replaced.")
+        return False
+    return True
+
+
+def _catch_up(state, journal_dir, cold_start_files):
+    """Rejoue les événements postérieurs au checkpoint (ou les `cold_start_files` derniers journaux). Retourne le nombre d'événements appliqués."""
+    journal_files = journal_parser._list_journal_files(journal_dir, newest_first=False)
+    if state.get("last_file") and os.path.join(journal_dir, state["last_file"]) in journal_files:
+        start_index = journal_files.index(os.path.join(journal_dir, state["last_file"]))
+        files_to_read = [(journal_files[start_index], state["last_offset"])] + [(path, 0) for path in journal_files[start_index + 1:]]
+    else:
+        # Démarrage à froid : ingestion en masse (pool de processus si le volume le justifie)
+        cold_files = journal_files[-cold_start_files:]
+        logger.info(f"Journal state: cold start, replaying the last {len(cold_files)} journal files.")
+        if not cold_files:
+            return 0
+        events, end_offsets = journal_parser.load_journal_files_parallel(cold_files, STATE_EVENT_TYPES)
+        for event_data in events:
+            apply_event(state, event_data)
+        last_path = cold_files[-1]
+        state["last_file"], state["last_offset"] = os.path.basename(last_path), end_offsets.get(last_path, 0)
+        try:
+            state["last_file_mtime"] = os.path.getmtime(last_path)
+        except OSError as e: # Fichier déplacé entre-temps : le prochain démarrage vérifiera sa taille seulement
+            logger.warning(f"Journal state: cannot read the modification time of {last_path}: {e}")
+            state["last_file_mtime"] = None
+        return len(events)
+
+    applied = 0
+    for filepath, start_offset in files_to_read:
+        try:
+            events, end_offset = journal_parser.read_journal_events_from(filepath, start_offset, STATE_EVENT_TYPES)
+            mtime = os.path.getmtime(filepath)
+        except OSError as e:
+            logger.warning(f"Journal state: error reading {filepath}: {e}")
+            continue
+        for event_data in events:
+            apply_event(state, event_data)
+        applied += len(events)
+        state["last_file"], state["last_offset"], state["last_file_mtime"] = os.path.basename(filepath), end_offset, mtime
+    return applied
+
+
+def _default_cold_start_files():
+    """Nombre de journaux rejoués sans checkpoint : couvre à la fois l'état joueur et les missions."""
+    try: return max(20, int(settings_manager.get_setting(KEY_NUM_JOURNAL_FILES_MISSIONS, DEFAULT_NUM_JOURNAL_FILES_MISSIONS)))
+    except (ValueError, TypeError): return DEFAULT_NUM_JOURNAL_FILES_MISSIONS
+
+
+def _refresh(journal_dir, cold_start_files=None):
+    """Met _state à jour pour `journal_dir` (à appeler sous _state_lock) et le retourne."""
+    global _state, _generation, _dirty, _last_refresh_at
+    watching_since = journal_watcher.watching_since(journal_dir)
+    if not _dirty and _state is not None and _state["journal_dir"] == journal_dir and \
+       watching_since is not None and _last_refresh_at is not None and _last_refresh_at > watching_since:
+        perf_trace.count_cache("journal_state", True)
+        return _state # Aucune nouvelle donnée signalée par le watcher depuis le dernier rattrapage
+    perf_trace.count_cache("journal_state", False)
+
+    _dirty = False # Avant la lecture : une écriture pendant le rattrapage redemandera un passage
+    _last_refresh_at = time.monotonic()
+    state = _state if _state is not None else load_checkpoint()
+    rebuilt = not _is_checkpoint_valid(state, journal_dir)
+    if rebuilt:
+        state = _new_state(journal_dir)
+    previous_position = (state["last_file"], state["last_offset"])
+    previous_needs = copy.deepcopy(_state["mission_needs"]) if _state is not None else None
+    previous_materials = copy.deepcopy(_state["materials"]) if _state is not None else None
+    with perf_trace.span("journal.load", rebuilt=rebuilt) as load_span:
+        applied = _catch_up(state, journal_dir, cold_start_files or _default_cold_start_files())
+        load_span.set(events=applied)
+    if rebuilt or applied or state is not _state:
+        _generation += 1
+    _state = state
+    if (state["last_file"], state["last_offset"]) != previous_position:
+        save_checkpoint(state)
+    logger.info(f"Journal state: {applied} new events applied, position {state['last_file']} @ {state['last_offset']}.")
+    if state["mission_needs"] != previous_needs:
+        _notify_mission_needs(state["mission_needs"])
+    if state["materials"] != previous_materials:
+        _notify_materials(state["materials"])
+    return state
+
+
+def _notify_mission_needs(mission_needs):
+    for callback in list(_mission_needs_listeners):
+        try:
+            callback(dict(mission_needs["needs"]), mission_needs["reward"])
+        except Exception:
+            logger.exception(f"Journal state: mission needs listener {getattr(callback, '__name__', callback)} failed.")
+
+
+def _notify_materials(materials):
+    for callback in list(_materials_listeners):
+        try:
+            callback(copy.deepcopy(materials))
+        except Exception:
+            logger.exception(f"Journal state: materials listener {getattr(callback, '__name__', callback)} failed.")
+
+
+def get_player_state(journal_dir, cold_start_files=None):
+    """
+    Retourne une copie de l'état joueur à jour pour `journal_dir`.
+    Utilise le checkpoint (mémoire puis disque) et ne rejoue que les nouveaux événements.
+    """
+    with _state_lock:
+        return copy.deepcopy(_refresh(journal_dir, cold_start_files))
+
+
+def _get_view(view_name, journal_dir, builder):
+    with _state_lock:
+        state = _refresh(journal_dir)
+        cached = _views.get(view_name)
+        perf_trace.count_cache("journal_view", bool(cached and cached[0] == _generation))
+        if cached and cached[0] == _generation:
+            return copy.deepcopy(cached[1])
+        value = builder(state)
+        _views[view_name] = (_generation, value)
+        logger.debug(f"Journal state: view '{view_name}' recomputed (generation {_generation}).")
+        return copy.deepcopy(value)
+
+
+def get_location_view(journal_dir):
+    """(system, station) avec '?' pour les valeurs inconnues, ou None si aucun journal n'a été lu."""
+    def _build(state):
+        if not state["last_file"]: return None
+        system = state["location"]["system"] or "?"
+        return system, (state["location"]["station"] or "?") if system != "?" else "?"
+    return _get_view("location", journal_dir, _build)
+
+
+def get_ship_view(journal_dir):
+    """(ship_type, cargo_capacity) du dernier Loadout, ou None. La taille de pad dépend des réglages et n'est pas mémorisée."""
+    return _get_view("ship", journal_dir, lambda state: (state["ship"]["ship_type"], state["ship"]["cargo_capacity"]) if state["ship"]["ship_type"] else None)
+
+
+def get_materials_view(journal_dir):
+    return _get_view("materials", journal_dir, lambda state: state["materials"])
+
+
+def get_mission_needs_view(journal_dir):
+    """(remaining_needs, total_reward_potential) des missions actives, lus dans l'agrégat incrémental."""
+    with perf_trace.span("journal.missions"):
+        return _get_view("mission_needs", journal_dir, lambda state: (state["mission_needs"]["needs"], state["mission_needs"]["reward"]))
+
+
+def subscribe_mission_needs(callback):
+    """Abonne `callback(needs, reward)` aux changements des besoins des missions (appelé hors thread Tk)."""
+    _mission_needs_listeners.append(callback)
+
+
+def subscribe_materials(callback):
+    """Abonne `callback(materials)` aux changements du registre des matériaux (appelé hors thread Tk)."""
+    _materials_listeners.append(callback)
+
+
+def _on_journal_update(update_type, event_data):
+    global _dirty
+    _dirty = True
+    if update_type in (journal_watcher.UPDATE_MISSIONS, journal_watcher.UPDATE_MATERIALS) and _state is not None:
+        # Rattrapage immédiat : seules les quelques lignes nouvelles sont lues, les agrégats sont ajustés par delta
+        with _state_lock:
+            _refresh(_state["journal_dir"])
+
+
+def attach_to_watcher():
+    """Utilise les notifications du journal_watcher pour invalider l'état (plus de stat/listing à chaque lecture)."""
+    journal_watcher.subscribe(_on_journal_update)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Surveillance en direct du répertoire des journaux Elite Dangerous.
+
+Un thread d'arrière-plan suit le fichier Journal.*.log le plus récent, décode
+uniquement les nouvelles lignes (lecture incrémentale depuis le dernier offset)
+et publie des mises à jour typées aux abonnés (onglets GUI).
+Utilise inotify sur Linux quand il est disponible, sinon un polling mtime/taille.
+"""
+import json
+import os
+import sys
+import logging
+import threading
+import time
+
+from constants import (
+    JOURNAL_WATCHER_POLL_INTERVAL_S,
+    JOURNAL_WATCHER_LOCATION_EVENTS, JOURNAL_WATCHER_SHIP_EVENTS,
+    JOURNAL_WATCHER_MISSION_EVENTS, JOURNAL_WATCHER_MATERIALS_EVENTS,
+    JOURNAL_WATCHER_MARKET_EVENTS
+)
+import journal_parser
+
+logger = logging.getLogger(__name__)
+
+# ---- Types de mises à jour publiées ----
+UPDATE_LOCATION = "location"
+UPDATE_SHIP = "ship"
+UPDATE_MISSIONS = "missions"
+UPDATE_MATERIALS = "materials"
+UPDATE_MARKET = "market"
+
+EVENT_TO_UPDATE_TYPE = {}
+for _ev in JOURNAL_WATCHER_LOCATION_EVENTS: EVENT_TO_UPDATE_TYPE[_ev] = UPDATE_LOCATION
+for _ev in JOURNAL_WATCHER_SHIP_EVENTS: EVENT_TO_UPDATE_TYPE[_ev] = UPDATE_SHIP
+for _ev in JOURNAL_WATCHER_MISSION_EVENTS: EVENT_TO_UPDATE_TYPE[_ev] = UPDATE_MISSIONS
+for _ev in JOURNAL_WATCHER_MATERIALS_EVENTS: EVENT_TO_UPDATE_TYPE[_ev] = UPDATE_MATERIALS
+for _ev in JOURNAL_WATCHER_MARKET_EVENTS: EVENT_TO_UPDATE_TYPE[_ev] = UPDATE_MARKET
+
+INVALID_JOURNAL_DIR_MARKERS = ["Not Found", "Auto-detecting...", "Error processing journals", "No Journal Dir"]
+
+# ---- inotify (Linux uniquement, via ctypes) ----
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+INOTIFY_AVAILABLE = False
+_libc = None
+if sys.platform.startswith("linux"):
+    try:
+        import ctypes
+        import ctypes.util
+        import select
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        _libc.inotify_init1.argtypes = [ctypes.c_int]
+        _libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        INOTIFY_AVAILABLE = True
+    except (OSError, AttributeError, ImportError) as e:
+        logger.info(f"inotify not available, journal watcher will use polling: {e}")
+        _libc = None
+
+# ---- État du module ----
+_subscribers = [] # Liste de (callback, set(update_types) ou None)
+_subscribers_lock = threading.Lock()
+_watcher_thread = None
+_stop_event = None
+_watched_dir = None # Répertoire effectivement suivi par le thread
+_watching_since = None # time.monotonic() du moment où le suivi de _watched_dir a commencé
+
+
+def subscribe(callback, update_types=None):
+    """
+    Abonne `callback(update_type, event_data)` aux mises à jour du journal.
+    Le callback est appelé depuis le thread du watcher : les abonnés GUI doivent
+    repasser par root.after() pour toucher aux widgets.
+    """
+    with _subscribers_lock:
+        _subscribers.append((callback, set(update_types) if update_types else None))
+    logger.debug(f"Journal watcher: subscriber added ({getattr(callback, '__name__', callback)}) for {update_types or 'all'} updates.")
+
+
+def unsubscribe(callback):
+    with _subscribers_lock:
+        _subscribers[:] = [(cb, types) for cb, types in _subscribers if cb is not callback]
+
+
+def _publish(update_type, event_data):
+    with _subscribers_lock:
+        targets = list(_subscribers)
+    for callback, types in targets:
+        if types is not None and update_type not in types:
+            continue
+        try:
+            callback(update_type, event_data)
+        except Exception:
+            logger.exception(f"Journal watcher: subscriber {getattr(callback, '__name__', callback)} failed on '{update_type}' update.")
+
+
+def _resolve_journal_dir():
+    journal_dir = journal_parser.EFFECTIVE_JOURNAL_DIR
+    if not journal_dir or journal_dir in INVALID_JOURNAL_DIR_MARKERS or not os.path.isdir(journal_dir):
+        return None
+    return journal_dir
+
+
+def _find_latest_journal_file(journal_dir):
+    latest_path, latest_mtime = None, -1.0
+    try:
+        with os.scandir(journal_dir) as it:
+            for entry in it:
+                if entry.name.startswith("Journal.") and entry.name.endswith(".log"):
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except OSError:
+                        continue
+                    if mtime > latest_mtime:
+                        latest_path, latest_mtime = entry.path, mtime
+    except OSError as e:
+        logger.warning(f"Journal watcher: cannot list {journal_dir}: {e}")
+    return latest_path
+
+
+def _open_inotify(journal_dir):
+    if not INOTIFY_AVAILABLE:
+        return None
+    fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        logger.warning("Journal watcher: inotify_init1 failed, falling back to polling.")
+        return None
+    wd = _libc.inotify_add_watch(fd, os.fsencode(journal_dir), IN_MODIFY | IN_CREATE | IN_MOVED_TO)
+    if wd < 0:
+        logger.warning(f"Journal watcher: inotify_add_watch failed on {journal_dir}, falling back to polling.")
+        os.close(fd)
+        return None
+    logger.info(f"Journal watcher: using inotify on {journal_dir}")
+    return fd
+
+
+def _wait_for_change(inotify_fd, stop_event):
+    """Attend une notification inotify (ou le timeout de polling). Retourne True si un fichier a été créé."""
+    if inotify_fd is None:
+        stop_event.wait(JOURNAL_WATCHER_POLL_INTERVAL_S)
+        return False
+    try:
+        readable, _, _ = select.select([inotify_fd], [], [], JOURNAL_WATCHER_POLL_INTERVAL_S)
+    except (OSError, ValueError):
+        return False
+    if not readable:
+        return False
+    file_created = False
+    try:
+        while True:
+            buf = os.read(inotify_fd, 4096)
+            if not buf: break
+            offset = 0
+            while offset + 16 <= len(buf):
+                mask = int.from_bytes(buf[offset + 4:offset + 8], sys.byteorder)
+                name_len = int.from_bytes(buf[offset + 12:offset + 16], sys.byteorder)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    file_created = True
+                offset += 16 + name_len
+    except BlockingIOError:
+        pass
+    except OSError as e:
+        logger.debug(f"Journal watcher: error draining inotify fd: {e}")
+    return file_created
+
+
+def _dispatch_lines(lines, fname):
+    for raw_line in lines:
+        if not raw_line.strip():
+            continue
+        try:
+            event_data = json.loads(raw_line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            logger.warning(f"Journal watcher: skipping invalid JSON line in {fname}")
+            continue
+        update_type = EVENT_TO_UPDATE_TYPE.get(event_data.get("event"))
+        if update_type:
+            logger.debug(f"Journal watcher: '{event_data.get('event')}' -> {update_type} update")
+            _publish(update_type, event_data)
+
+
+def _watch_loop(stop_event):
+    global _watched_dir, _watching_since
+    watched_dir, inotify_fd = None, None
+    current_file, offset, pending = None, 0, b""
+    check_for_new_file = True
+
+    while not stop_event.is_set():
+        journal_dir = _resolve_journal_dir()
+        if journal_dir != watched_dir:
+            if inotify_fd is not None:
+                os.close(inotify_fd); inotify_fd = None
+            watched_dir = _watched_dir = journal_dir
+            current_file, offset, pending = None, 0, b""
+            check_for_new_file = False
+            if watched_dir:
+                inotify_fd = _open_inotify(watched_dir)
+                current_file = _find_latest_journal_file(watched_dir)
+                try:
+                    # L'état initial est chargé par les onglets ; on ne suit que les nouveaux événements.
+                    offset = os.path.getsize(current_file) if current_file else 0
+                except OSError as e:
+                    logger.warning(f"Journal watcher: error reading {current_file}: {e}")
+                    current_file, check_for_new_file = None, True
+                _watching_since = time.monotonic()
+                logger.info(f"Journal watcher: tailing {current_file} from offset {offset}")
+
+        if not watched_dir:
+            stop_event.wait(JOURNAL_WATCHER_POLL_INTERVAL_S)
+            continue
+
+        if current_file:
+            try:
+                size = os.path.getsize(current_file)
+                if size < offset: # Fichier tronqué/recréé
+                    offset, pending = 0, b""
+                if size > offset:
+                    with open(current_file, 'rb') as f:
+                        f.seek(offset)
+                        chunk = f.read(size - offset)
+                    offset += len(chunk)
+                    data = pending + chunk
+                    lines = data.split(b"\n")
+                    pending = lines.pop() # Dernière ligne éventuellement incomplète
+                    _dispatch_lines(lines, os.path.basename(current_file))
+            except OSError as e:
+                logger.warning(f"Journal watcher: error reading {current_file}: {e}")
+                current_file, check_for_new_file = None, True
+
+        if check_for_new_file or inotify_fd is None:
+            latest = _find_latest_journal_file(watched_dir)
+            if latest and latest != current_file:
+                # Nouvelle session de jeu : le fichier précédent a été lu jusqu'au bout ci-dessus.
+                logger.info(f"Journal watcher: new journal file detected: {os.path.basename(latest)}")
+                current_file, offset, pending = latest, 0, b""
+                check_for_new_file = False
+                continue
+
+        check_for_new_file = _wait_for_change(inotify_fd, stop_event)
+
+    if inotify_fd is not None:
+        os.close(inotify_fd)
+    _watched_dir = _watching_since = None
+    logger.info("Journal watcher stopped.")
+
+
+def watching_since(journal_dir):
+    """
+    Retourne le time.monotonic() depuis lequel `journal_dir` est suivi (ses abonnés sont notifiés
+    de toute nouvelle donnée écrite après ce moment), ou None si le watcher ne le suit pas.
+    """
+    if _watcher_thread and _watcher_thread.is_alive() and _watched_dir == journal_dir:
+        return _watching_since
+    return None
+
+
+def start_watching():
+    """Démarre le thread de surveillance (idempotent)."""
+    global _watcher_thread, _stop_event
+    if _watcher_thread and _watcher_thread.is_alive():
+        return
+    _stop_event = threading.Event()
+    _watcher_thread = threading.Thread(target=_watch_loop, args=(_stop_event,), name="JournalWatcher", daemon=True)
+    _watcher_thread.start()
+    logger.info(f"Journal watcher started (inotify={'yes' if INOTIFY_AVAILABLE else 'no'}).")
+
+
+def stop_watching():
+    global _watcher_thread
+    if _stop_event:
+        _stop_event.set()
+    if _watcher_thread and _watcher_thread.is_alive():
+        _watcher_thread.join(timeout=2 * JOURNAL_WATCHER_POLL_INTERVAL_S)
+    _watcher_thread = None
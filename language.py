@@ -191,6 +191,8 @@ TRANSLATIONS = {
         "status_shipyard_found_stations": "Results",
         "status_shipyard_db_update_finished": "Update DB finished",
         "settings_shipyard_radius_label": "Radius Shipyard (LY)",
+        "settings_region_cache_budget_label": "Market Region Cache (MB)",
+        "error_region_cache_budget_non_negative": "Market region cache budget must be zero or positive.",
         "tree_col_shipyard_pad_size": "Pad",
         "outfitting_tab_title": "Outfitting",
         "outfitting_category_label": "Category:",
@@ -301,7 +303,39 @@ TRANSLATIONS = {
         "multihop_status_loaded_saved_route": "Loaded previously saved route.",
         "multihop_status_no_saved_route": "No saved route found. Configure new route.",
         "multihop_status_route_saved": "Current route saved.",
-        "multihop_status_cleared_saved_route": "Saved route cleared. Configure new route."
+        "multihop_status_cleared_saved_route": "Saved route cleared. Configure new route.",
+
+        # --- Surveillance du Journal en Direct ---
+        "multihop_status_docked_at_leg_dest": "Docked at {station_name}: destination of leg {leg_num} reached.",
+
+        # --- Performance Tab ---
+        "performance_tab_title": "Performance",
+        "performance_reset_button": "Reset Metrics",
+        "performance_status_updated_at": "Metrics updated at {timestamp}",
+        "performance_operation_header": "Operation",
+        "performance_status_header": "Status",
+        "performance_started_header": "Started",
+        "performance_duration_header": "Duration",
+        "performance_breakdown_header": "Time by category",
+        "performance_status_running": "running",
+        "performance_section_network": "Network",
+        "performance_in_flight": "In flight:",
+        "performance_concurrency_limit": "Concurrency limit (fixed):",
+        "performance_responses": "Responses:",
+        "performance_section_caches": "Caches",
+        "performance_section_memory": "Memory and datasets",
+        "performance_process_memory": "Process memory:",
+        "performance_dataset_loaded": "loaded (v{version})",
+        "performance_dataset_not_loaded": "not loaded",
+        "performance_dataset_pending_write": "write pending",
+        "performance_section_stages": "Stage timings",
+        "performance_section_event_loop": "Tk event loop",
+        "performance_event_lag": "event lag",
+        "performance_no_data": "No data yet.",
+        "performance_profile_next_button": "Profile Next Operation",
+        "performance_profile_cancel_button": "Cancel Profiling",
+        "performance_profile_armed": "Profiler armed: the next analysis, hop plan or data update will be profiled (cProfile + tracemalloc).",
+        "performance_profile_saved": "Last profile ({operation}) saved: {report} (+ .pstats)"
     },
     "fr": {
         "app_title": "Elite: Dangerous Mission Optimizer 3.0 par Commandant SnakeDrake",
@@ -487,6 +521,8 @@ TRANSLATIONS = {
         "status_shipyard_found_stations": "Résultats",
         "status_shipyard_db_update_finished": "Maj DB terminée",
         "settings_shipyard_radius_label": "Rayon Chantier Naval (AL)",
+        "settings_region_cache_budget_label": "Cache des Régions de Marché (Mo)",
+        "error_region_cache_budget_non_negative": "Le budget du cache des régions de marché doit être positif ou nul.",
         "tree_col_shipyard_pad_size": "Aire",
         "outfitting_tab_title": "Équipement",
         "outfitting_category_label": "Catégorie :",
@@ -597,7 +633,39 @@ TRANSLATIONS = {
         "multihop_status_loaded_saved_route": "Dernier itinéraire sauvegardé chargé.",
         "multihop_status_no_saved_route": "Aucun itinéraire sauvegardé trouvé. Configurez un nouvel itinéraire.",
         "multihop_status_route_saved": "Itinéraire actuel sauvegardé.",
-        "multihop_status_cleared_saved_route": "Itinéraire sauvegardé effacé. Configurez un nouvel itinéraire."
+        "multihop_status_cleared_saved_route": "Itinéraire sauvegardé effacé. Configurez un nouvel itinéraire.",
+
+        # --- Surveillance du Journal en Direct ---
+        "multihop_status_docked_at_leg_dest": "Amarré à {station_name} : destination de l'étape {leg_num} atteinte.",
+
+        # --- Onglet Performance ---
+        "performance_tab_title": "Performance",
+        "performance_reset_button": "Remettre à zéro",
+        "performance_status_updated_at": "Métriques mises à jour à {timestamp}",
+        "performance_operation_header": "Opération",
+        "performance_status_header": "Statut",
+        "performance_started_header": "Début",
+        "performance_duration_header": "Durée",
+        "performance_breakdown_header": "Temps par catégorie",
+        "performance_status_running": "en cours",
+        "performance_section_network": "Réseau",
+        "performance_in_flight": "En cours :",
+        "performance_concurrency_limit": "Limite de concurrence (fixe) :",
+        "performance_responses": "Réponses :",
+        "performance_section_caches": "Caches",
+        "performance_section_memory": "Mémoire et jeux de données",
+        "performance_process_memory": "Mémoire du processus :",
+        "performance_dataset_loaded": "chargé (v{version})",
+        "performance_dataset_not_loaded": "non chargé",
+        "performance_dataset_pending_write": "écriture en attente",
+        "performance_section_stages": "Durées des étapes",
+        "performance_section_event_loop": "Boucle d'événements Tk",
+        "performance_event_lag": "retard",
+        "performance_no_data": "Pas encore de données.",
+        "performance_profile_next_button": "Profiler la prochaine opération",
+        "performance_profile_cancel_button": "Annuler le profilage",
+        "performance_profile_armed": "Profileur armé : la prochaine analyse, le prochain saut ou la prochaine mise à jour des données sera profilé (cProfile + tracemalloc).",
+        "performance_profile_saved": "Dernier profil ({operation}) enregistré : {report} (+ .pstats)"
     }
 }
 
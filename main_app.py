@@ -3,83 +3,116 @@ import tkinter as tk
 import tkinter.messagebox
 import logging # Importation de logging standard
 import sys
+import multiprocessing
 import os # Ajout pour la gestion des chemins de log
+import argparse
 
-# 1. Configurer le logging dès que possible, AVANT les autres imports de l'application
-# pour capturer les erreurs d'importation potentielles.
-# Déplacer la configuration du logger ici pour qu'elle soit la première chose après les imports standards.
-
-# --- Configuration Manuelle Minimale du Logging (avant logger_setup) ---
-# Ceci est un fallback si logger_setup lui-même a un problème ou n'est pas trouvé.
+# Rien d'autre que des imports standards au niveau module : les processus du pool de parsing des journaux
+# (méthode spawn sous Windows, exécutable PyInstaller) réimportent ce fichier sous le nom __mp_main__ et ne
+# doivent ni reconfigurer le logging (RotatingFileHandler partagé) ni charger l'interface.
 LOG_FILE_FALLBACK = 'mission_optimizer_startup.log'
-try:
-    # S'assurer que le répertoire du log existe (si LOG_FILE est dans un sous-répertoire)
-    log_dir = os.path.dirname(LOG_FILE_FALLBACK)
-    if log_dir and not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(module)s - %(funcName)s - %(message)s',
-        handlers=[
-            logging.FileHandler(LOG_FILE_FALLBACK, mode='a', encoding='utf-8'), # 'a' pour append
-            logging.StreamHandler(sys.stdout) # Afficher aussi sur la console
-        ]
-    )
-    logging.info("--- Fallback Basic Logging Initialized ---")
-except Exception as e:
-    print(f"CRITICAL: Failed to initialize fallback logging: {e}", file=sys.stderr)
-    # Si même ça échoue, il n'y a plus grand-chose à faire pour le logging.
-
-# --- Fin Configuration Manuelle Minimale du Logging ---
-
-# Maintenant, tenter d'importer et d'utiliser la configuration de logging plus avancée
-try:
-    import logger_setup
-    logger_setup.setup_logging() # Ceci va reconfigurer le root logger avec RotatingFileHandler, etc.
-    # Obtenir un logger pour ce module APRÈS la configuration
-    logger = logging.getLogger(__name__)
-    logger.info("--- Advanced Logging Initialized via logger_setup.py ---")
-except ImportError as e_log_setup:
-    logging.critical(f"Failed to import logger_setup: {e_log_setup}. Using fallback basicConfig logging.", exc_info=True)
-    logger = logging.getLogger(__name__) # Utiliser le logger configuré par basicConfig
-    logger.warning("Using fallback basicConfig logging due to logger_setup import error.")
-except Exception as e_log_setup_generic:
-    logging.critical(f"An error occurred during logger_setup.setup_logging(): {e_log_setup_generic}. Using fallback basicConfig logging.", exc_info=True)
-    logger = logging.getLogger(__name__)
-    logger.warning("Using fallback basicConfig logging due to logger_setup execution error.")
-
-
-# --- Importer les autres modules de l'application APRÈS le logging ---
-try:
-    import settings_manager
-    # Attention: L'import de gui_main va déclencher les imports de ses sous-modules (gui_analysis_tab, etc.)
-    # et ceux-ci importeront constants. Si constants.py a une erreur, elle surviendra ici.
-    import gui_main
-    from constants import LOG_FILE as CONST_LOG_FILE, KEY_LANGUAGE, DEFAULT_LANGUAGE # Renommer pour éviter conflit avec LOG_FILE_FALLBACK
-    import language as lang_module
-except ImportError as e_import:
-    logger.critical(f"Failed to import a core application module: {e_import}", exc_info=True)
-    # Afficher une erreur simple si Tkinter n'est pas encore prêt
-    print(f"Critical import error: {e_import}\nConsult {LOG_FILE_FALLBACK} or {CONST_LOG_FILE if 'CONST_LOG_FILE' in globals() else 'mission_optimizer.log'}", file=sys.stderr)
-    try: # Tenter d'afficher une messagebox même si l'UI complète ne peut se charger
-        error_root_tk = tk.Tk()
-        error_root_tk.withdraw()
-        tkinter.messagebox.showerror("Critical Import Error",
-                                     f"Could not import a required module:\n{e_import}\n\n"
-                                     f"Consult logs for details.\nThe application will now close.")
-        error_root_tk.destroy()
-    except Exception:
-        pass # L'erreur console devra suffire
-    sys.exit(1) # Quitter si un import critique échoue
-except Exception as e_generic_import_phase:
-    logger.critical(f"A non-ImportError exception occurred during the import phase: {e_generic_import_phase}", exc_info=True)
-    print(f"Critical error during import phase: {e_generic_import_phase}\nConsult {LOG_FILE_FALLBACK} or {CONST_LOG_FILE if 'CONST_LOG_FILE' in globals() else 'mission_optimizer.log'}", file=sys.stderr)
-    sys.exit(1)
+logger = logging.getLogger(__name__)
+
+
+def _setup_logging():
+    """Configure le logging dès que possible, AVANT les autres imports de l'application, pour capturer les erreurs d'importation potentielles."""
+    global logger
+    # --- Configuration Manuelle Minimale du Logging (avant logger_setup) ---
+    # Ceci est un fallback si logger_setup lui-même a un problème ou n'est pas trouvé.
+    try:
+        # S'assurer que le répertoire du log existe (si LOG_FILE est dans un sous-répertoire)
+        log_dir = os.path.dirname(LOG_FILE_FALLBACK)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+
+        logging.basicConfig(
+            level=logging.DEBUG,
+            format='%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(module)s - %(funcName)s - %(message)s',
+            handlers=[
+                logging.FileHandler(LOG_FILE_FALLBACK, mode='a', encoding='utf-8'), # 'a' pour append
+                logging.StreamHandler(sys.stdout) # Afficher aussi sur la console
+            ]
+        )
+        logging.info("--- Fallback Basic Logging Initialized ---")
+    except Exception as e:
+        print(f"CRITICAL: Failed to initialize fallback logging: {e}", file=sys.stderr)
+        # Si même ça échoue, il n'y a plus grand-chose à faire pour le logging.
+
+    # --- Fin Configuration Manuelle Minimale du Logging ---
+
+    # Maintenant, tenter d'importer et d'utiliser la configuration de logging plus avancée
+    try:
+        import logger_setup
+        logger_setup.setup_logging() # Ceci va reconfigurer le root logger avec RotatingFileHandler, etc.
+        # Obtenir un logger pour ce module APRÈS la configuration
+        logger = logging.getLogger(__name__)
+        logger.info("--- Advanced Logging Initialized via logger_setup.py ---")
+    except ImportError as e_log_setup:
+        logging.critical(f"Failed to import logger_setup: {e_log_setup}. Using fallback basicConfig logging.", exc_info=True)
+        logger = logging.getLogger(__name__) # Utiliser le logger configuré par basicConfig
+        logger.warning("Using fallback basicConfig logging due to logger_setup import error.")
+    except Exception as e_log_setup_generic:
+        logging.critical(f"An error occurred during logger_setup.setup_logging(): {e_log_setup_generic}. Using fallback basicConfig logging.", exc_info=True)
+        logger = logging.getLogger(__name__)
+        logger.warning("Using fallback basicConfig logging due to logger_setup execution error.")
+
+
+def _import_application_modules():
+    global settings_manager, gui_main, http_recorder, CONST_LOG_FILE, KEY_LANGUAGE, DEFAULT_LANGUAGE, lang_module
+    # --- Importer les autres modules de l'application APRÈS le logging ---
+    try:
+        import settings_manager
+        # Attention: L'import de gui_main va déclencher les imports de ses sous-modules (gui_analysis_tab, etc.)
+        # et ceux-ci importeront constants. Si constants.py a une erreur, elle surviendra ici.
+        import gui_main
+        import http_recorder
+        from constants import LOG_FILE as CONST_LOG_FILE, KEY_LANGUAGE, DEFAULT_LANGUAGE # Renommer pour éviter conflit avec LOG_FILE_FALLBACK
+        import language as lang_module
+    except ImportError as e_import:
+        logger.critical(f"Failed to import a core application module: {e_import}", exc_info=True)
+        # Afficher une erreur simple si Tkinter n'est pas encore prêt
+        print(f"Critical import error: {e_import}\nConsult {LOG_FILE_FALLBACK} or {CONST_LOG_FILE if 'CONST_LOG_FILE' in globals() else 'mission_optimizer.log'}", file=sys.stderr)
+        try: # Tenter d'afficher une messagebox même si l'UI complète ne peut se charger
+            error_root_tk = tk.Tk()
+            error_root_tk.withdraw()
+            tkinter.messagebox.showerror("Critical Import Error",
+                                         f"Could not import a required module:\n{e_import}\n\n"
+                                         f"Consult logs for details.\nThe application will now close.")
+            error_root_tk.destroy()
+        except Exception:
+            pass # L'erreur console devra suffire
+        sys.exit(1) # Quitter si un import critique échoue
+    except Exception as e_generic_import_phase:
+        logger.critical(f"A non-ImportError exception occurred during the import phase: {e_generic_import_phase}", exc_info=True)
+        print(f"Critical error during import phase: {e_generic_import_phase}\nConsult {LOG_FILE_FALLBACK} or {CONST_LOG_FILE if 'CONST_LOG_FILE' in globals() else 'mission_optimizer.log'}", file=sys.stderr)
+        sys.exit(1)
+
+
+def _parse_session_arguments():
+    """Options d'enregistrement / rejeu des appels API (voir http_recorder) ; les autres arguments sont ignorés."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--record-session", metavar="DIR")
+    parser.add_argument("--replay-session", metavar="DIR")
+    parser.add_argument("--replay-timing", choices=http_recorder.REPLAY_TIMINGS, default=http_recorder.REPLAY_TIMING_FAST)
+    args, _ = parser.parse_known_args()
+    return args
+
+
+def _start_http_session(args):
+    try:
+        if args.record_session:
+            http_recorder.start_recording(args.record_session, label="main_app")
+        elif args.replay_session:
+            http_recorder.start_replay(args.replay_session, args.replay_timing)
+    except (OSError, ValueError, http_recorder.ReplayError) as e:
+        logger.error(f"Could not start HTTP session recording/replay: {e}")
 
 
 def main():
+    _setup_logging()
+    _import_application_modules()
     logger.info("Application main() function starting...")
+    _start_http_session(_parse_session_arguments())
 
     # 2. Charger les paramètres
     try:
@@ -134,14 +167,9 @@ def main():
     except Exception as e_mainloop:
         logger.critical("Unhandled exception in Tkinter mainloop:", exc_info=True)
     finally:
+        http_recorder.stop()
         logger.info("Application shutting down.")
 
 if __name__ == "__main__":
-    # Assurer que le logger de plus haut niveau est prêt avant d'appeler main()
-    if 'logger' not in globals() or not isinstance(logger, logging.Logger):
-        # Si logger_setup a échoué de manière catastrophique, et que le fallback aussi.
-        print("CRITICAL: Logger was not initialized before main. Exiting.", file=sys.stderr)
-        sys.exit(1)
-    
-    logger.info("Starting main_app.py execution from __main__ guard.")
+    multiprocessing.freeze_support() # Requis pour le pool de processus du parsing des journaux dans l'exécutable PyInstaller
     main()
\ No newline at end of file
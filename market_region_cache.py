@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Cache LRU de plusieurs régions de marché (sphères autour d'un système source).
+
+LOCAL_SELLERS_DATA_FILE ne contient que la sphère active. Chaque sphère téléchargée est aussi gardée
+ici (un snapshot par système source, dans MARKET_REGION_CACHE_DIR) avec un index JSON :
+rayon, fraîcheur (updatedAt / oldestFetchedAt), dernier accès et taille sur disque.
+Au-delà du budget disque (réglage KEY_MARKET_REGION_CACHE_BUDGET_MB), les régions les moins
+récemment utilisées sont supprimées. Revenir dans une région connue ne coûte alors qu'une remise
+à niveau des systèmes périmés (voir api_handler.download_local_sellers_data, `previous_data`).
+"""
+import hashlib
+import json
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+from constants import (
+    MARKET_REGION_CACHE_DIR, LOCAL_SELLERS_DATA_FILE,
+    KEY_MARKET_REGION_CACHE_BUDGET_MB, DEFAULT_MARKET_REGION_CACHE_BUDGET_MB
+)
+import dataset_manager
+import settings_manager
+import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+REGION_INDEX_FILE = os.path.join(MARKET_REGION_CACHE_DIR, 'regions_index.json')
+REGION_SECTIONS_KEY = "station_markets"
+
+_index_lock = threading.RLock()
+_index_cache = None # région -> {"sourceSystem", "radius", "updatedAt", "oldestFetchedAt", "lastAccess", "size"}
+
+
+def region_id(system_name):
+    """Identifiant de fichier stable (insensible à la casse) pour un système source."""
+    return hashlib.sha1(system_name.strip().lower().encode('utf-8')).hexdigest()[:16]
+
+
+def _region_path(rid):
+    return os.path.join(MARKET_REGION_CACHE_DIR, f"region-{rid}.snap")
+
+
+def _load_index():
+    """Index des régions (à appeler sous _index_lock). Lu une fois, puis tenu à jour en mémoire."""
+    global _index_cache
+    if _index_cache is None:
+        _index_cache = {}
+        if os.path.exists(REGION_INDEX_FILE):
+            try:
+                with open(REGION_INDEX_FILE, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict):
+                    _index_cache = {rid: entry for rid, entry in loaded.items() if os.path.exists(_region_path(rid))}
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Market region index {REGION_INDEX_FILE} unreadable ({e}), starting empty.")
+    return _index_cache
+
+
+def _save_index():
+    os.makedirs(MARKET_REGION_CACHE_DIR, exist_ok=True)
+    payload = json.dumps(_load_index(), indent=2).encode('utf-8')
+    try:
+        snapshot_store.atomic_write_bytes(REGION_INDEX_FILE, payload)
+    except OSError as e:
+        logger.warning(f"Could not write market region index {REGION_INDEX_FILE}: {e}")
+
+
+def _budget_bytes():
+    budget_mb = settings_manager.get_setting(KEY_MARKET_REGION_CACHE_BUDGET_MB, DEFAULT_MARKET_REGION_CACHE_BUDGET_MB)
+    try:
+        return max(0.0, float(budget_mb)) * 1024 * 1024
+    except (TypeError, ValueError):
+        return DEFAULT_MARKET_REGION_CACHE_BUDGET_MB * 1024 * 1024
+
+
+def _parse_iso(value):
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def region_freshness(meta):
+    """Date de la donnée la plus ancienne de la région (oldestFetchedAt, sinon updatedAt), ou None."""
+    return _parse_iso(meta.get('oldestFetchedAt') or meta.get('updatedAt')) if meta else None
+
+
+def region_age_seconds(meta):
+    """Âge (secondes) de la donnée la plus ancienne de la région ; infini si inconnu."""
+    freshness = region_freshness(meta)
+    if freshness is None:
+        return float('inf')
+    return (datetime.now(timezone.utc) - freshness).total_seconds()
+
+
+def find_region(system_name, radius_ly):
+    """
+    Entrée d'index de la région centrée sur `system_name` couvrant au moins `radius_ly`, même périmée
+    (l'appelant décide entre utilisation directe et remise à niveau). None si aucune région ne convient.
+    """
+    if not system_name:
+        return None
+    with _index_lock:
+        entry = _load_index().get(region_id(system_name))
+        if entry and entry.get('radius', 0) >= radius_ly:
+            return dict(entry)
+    return None
+
+
+def find_region_any_radius(system_name):
+    """Entrée d'index de la région centrée sur `system_name`, quel que soit son rayon (pour une remise à niveau)."""
+    if not system_name:
+        return None
+    with _index_lock:
+        entry = _load_index().get(region_id(system_name))
+        return dict(entry) if entry else None
+
+
+def _touch(rid):
+    with _index_lock:
+        entry = _load_index().get(rid)
+        if entry:
+            entry['lastAccess'] = time.time()
+            _save_index()
+
+
+def load_region(system_name):
+    """Charge le snapshot de la région (sections décompressées à la demande) et la marque comme utilisée."""
+    rid = region_id(system_name)
+    data = snapshot_store.load_snapshot(_region_path(rid))
+    if data is None:
+        with _index_lock:
+            if _load_index().pop(rid, None) is not None:
+                _save_index()
+        return None
+    _touch(rid)
+    return data
+
+
+def activate_region(system_name):
+    """
+    Fait de la région en cache la sphère active : publiée comme jeu de données local (save_dataset),
+    ce qui remplace aussi une écriture de LOCAL_SELLERS_DATA_FILE encore en attente. Retourne les données ou None.
+    """
+    rid = region_id(system_name)
+    region_path = _region_path(rid)
+    data = snapshot_store.load_snapshot(region_path)
+    if data is None:
+        logger.warning(f"Could not activate cached market region for {system_name}: snapshot unreadable.")
+        return None
+    counts = (snapshot_store.read_snapshot_header(region_path) or {}).get("counts")
+    # Les sections sont recopiées compressées à l'écriture, sans décodage
+    dataset_manager.save_dataset(dataset_manager.DATASET_LOCAL_MARKET, data, counts)
+    _touch(rid)
+    logger.info(f"Cached market region for {system_name} activated, no download needed.")
+    return dataset_manager.get_dataset(dataset_manager.DATASET_LOCAL_MARKET)
+
+
+def _evict_over_budget(keep_rid=None):
+    """Supprime les régions les moins récemment utilisées tant que le total dépasse le budget (sous _index_lock)."""
+    index = _load_index()
+    budget = _budget_bytes()
+    total = sum(entry.get('size', 0) for entry in index.values())
+    for rid, entry in sorted(index.items(), key=lambda item: item[1].get('lastAccess', 0)):
+        if total <= budget:
+            break
+        if rid == keep_rid:
+            continue
+        try:
+            os.remove(_region_path(rid))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not evict market region {entry.get('sourceSystem')}: {e}")
+            continue
+        total -= entry.get('size', 0)
+        del index[rid]
+        logger.info(f"Market region {entry.get('sourceSystem')} evicted (LRU, budget {budget / 1048576:.0f} MB).")
+
+
+def _register_region(rid, meta, size):
+    """Ajoute ou remplace l'entrée d'index de la région puis applique le budget (sous _index_lock)."""
+    _load_index()[rid] = {
+        "sourceSystem": meta.get('sourceSystem'),
+        "radius": meta.get('radius', 0),
+        "updatedAt": meta.get('updatedAt'),
+        "oldestFetchedAt": meta.get('oldestFetchedAt'),
+        "lastAccess": time.time(),
+        "size": size
+    }
+    _evict_over_budget(keep_rid=rid)
+    _save_index()
+
+
+def store_region(local_market_data, counts=None):
+    """
+    Garde la sphère `local_market_data` dans le cache (écriture en arrière-plan). Une région existante
+    pour le même système source est remplacée. Le budget disque est appliqué une fois le fichier écrit.
+    """
+    source_system = local_market_data.get('sourceSystem')
+    if not source_system:
+        return
+    rid = region_id(source_system)
+    os.makedirs(MARKET_REGION_CACHE_DIR, exist_ok=True)
+    local_market_data = dataset_manager._snapshot_copy(local_market_data) # L'appelant peut continuer à modifier le sien
+
+    def _on_written(path):
+        with _index_lock:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            _register_region(rid, local_market_data, size)
+
+    snapshot_store.schedule_snapshot_write(_region_path(rid), local_market_data, REGION_SECTIONS_KEY, counts, _on_written)
+
+
+def adopt_active_snapshot():
+    """
+    Ajoute au cache la sphère active (LOCAL_SELLERS_DATA_FILE) si elle n'y est pas déjà à jour, avant
+    qu'un nouveau téléchargement ne la remplace (utile pour les caches créés avant le cache de régions).
+    """
+    dataset_manager.migrate_legacy_files() # Lecture directe du fichier : ancien cache JSON converti d'abord
+    header = snapshot_store.read_snapshot_header(LOCAL_SELLERS_DATA_FILE)
+    if not header or header.get("sectionsKey") != REGION_SECTIONS_KEY:
+        return
+    meta = header["meta"]
+    source_system = meta.get('sourceSystem')
+    if not source_system:
+        return
+    rid = region_id(source_system)
+    with _index_lock:
+        entry = _load_index().get(rid)
+        if entry and entry.get('updatedAt') == meta.get('updatedAt'):
+            return
+        try:
+            with open(LOCAL_SELLERS_DATA_FILE, 'rb') as f:
+                payload = f.read()
+            os.makedirs(MARKET_REGION_CACHE_DIR, exist_ok=True)
+            snapshot_store.atomic_write_bytes(_region_path(rid), payload)
+        except OSError as e:
+            logger.warning(f"Could not copy active market data into the region cache: {e}")
+            return
+        _register_region(rid, meta, len(payload))
+    logger.info(f"Active market data for {source_system} added to the region cache.")
+
+
+def adopt_region_file(snapshot_path):
+    """
+    Déplace dans le cache un snapshot de région construit ailleurs (ex. import en masse) et l'indexe.
+    Retourne le système source de la région, ou None si le fichier n'est pas un snapshot de marché valide.
+    """
+    header = snapshot_store.read_snapshot_header(snapshot_path)
+    if not header or header.get("sectionsKey") != REGION_SECTIONS_KEY or not header["meta"].get('sourceSystem'):
+        logger.warning(f"{snapshot_path} is not a market region snapshot, not added to the region cache.")
+        return None
+    meta = header["meta"]
+    rid = region_id(meta['sourceSystem'])
+    os.makedirs(MARKET_REGION_CACHE_DIR, exist_ok=True)
+    with _index_lock:
+        os.replace(snapshot_path, _region_path(rid))
+        _register_region(rid, meta, os.path.getsize(_region_path(rid)))
+    logger.info(f"Market region for {meta['sourceSystem']} (radius {meta.get('radius')} LY) added to the region cache.")
+    return meta['sourceSystem']
+
+
+def list_regions():
+    """Régions en cache (copies des entrées d'index), de la plus récemment utilisée à la plus ancienne."""
+    with _index_lock:
+        return sorted((dict(entry) for entry in _load_index().values()), key=lambda entry: entry.get('lastAccess', 0), reverse=True)
@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+"""
+Exceptions communes aux moteurs d'analyse et aux téléchargements.
+
+Module sans dépendance (ni aiohttp ni tkinter) : optimizer_logic et l'API d'analyse sans interface
+peuvent l'importer sans charger la couche réseau. api_handler la ré-exporte.
+"""
+
+
+class OperationCancelledError(Exception):
+    """Exception personnalisée pour les opérations annulées."""
+    pass
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Ligne de commande de l'optimiseur, sans interface graphique : `python -m optimizer_cli <commande>`.
+
+Commandes : analyze (comme l'onglet Analyse), missions, trades, hop, ship, modules, fleet (plusieurs
+profils de vaisseau en une passe, voir fleet_evaluation). Résultat en JSON
+sur la sortie standard. Position, vaisseau et filtres viennent du journal et des réglages, sauf
+options contraires. Les données en cache sont utilisées telles quelles ; --refresh les met à jour
+(téléchargement, nécessite aiohttp). Avec --service URL, la requête est envoyée à un service
+optimizer_service déjà démarré (données et index chauds partagés) au lieu d'être calculée ici.
+
+--record-session DIR enregistre les appels API de --refresh (voir http_recorder) avec la position,
+les filtres et les besoins des missions ; --replay-session DIR rejoue ces réponses sans réseau et
+reprend ce contexte (sauf options contraires) pour reproduire l'analyse. Le rejeu réécrit les jeux
+de données du dossier courant : le lancer depuis un dossier de travail.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from dataclasses import asdict
+
+import analysis_api
+import http_recorder
+import perf_trace
+
+logger = logging.getLogger(__name__)
+
+
+def _add_common_arguments(parser):
+    group = parser.add_argument_group("location / ship (default: from the journal)")
+    group.add_argument("--system", help="Current system")
+    group.add_argument("--station", help="Current station ('?' if not docked)")
+    group.add_argument("--ship", dest="ship_type", help="Ship type (pad size deduced unless --pad)")
+    group.add_argument("--cargo", dest="cargo_capacity", type=int, help="Cargo capacity in tons")
+    group.add_argument("--pad", dest="pad_size", type=int, choices=(1, 2, 3), help="Landing pad size (1=S, 2=M, 3=L)")
+    group = parser.add_argument_group("filters (default: from the settings)")
+    group.add_argument("--max-ls", dest="max_station_dist_ls", type=float, help="Max station distance to arrival (LS)")
+    group.add_argument("--no-planetary", dest="include_planetary", action="store_const", const=False, help="Exclude planetary stations")
+    group.add_argument("--no-fleet-carriers", dest="include_fleet_carriers", action="store_const", const=False, help="Exclude fleet carriers")
+    group.add_argument("--sort", dest="sort_by", choices=analysis_api.SORT_OPTIONS, help="Mission sourcing sort: d=distance LY, b=profit, s=distance LS")
+    group.add_argument("--radius", dest="radius_ly", type=float, help="Market data radius (LY)")
+    group.add_argument("--max-age-days", dest="max_age_days", type=int, help="Max market data age (days) before refresh")
+    group.add_argument("--max-routes", dest="max_general_trade_routes", type=int, help="Max general trade routes")
+    parser.add_argument("--refresh", action="store_true", help="Update market data if stale before the analysis (network)")
+    parser.add_argument("--service", metavar="URL", help="Send the query to a running optimizer_service, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--record-session", metavar="DIR", help="Record the API calls of --refresh into a session bundle")
+    parser.add_argument("--replay-session", metavar="DIR", help="Replay a recorded session bundle instead of the network (forces --refresh; "
+                                                                "run from a scratch directory, the datasets in the current directory are overwritten)")
+    parser.add_argument("--replay-timing", choices=http_recorder.REPLAY_TIMINGS, default=http_recorder.REPLAY_TIMING_FAST,
+                        help="Replay with the recorded response times (original) or without waiting (fast, default)")
+    parser.add_argument("--perf", action="store_true", help="Print the performance summary (time by stage, requests, cache hit rates) to stderr")
+    parser.add_argument("--indent", type=int, default=2, help="JSON indentation (0 for compact output)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="optimizer_cli", description="Headless ED Mission Optimizer: analyses with JSON output.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log to stderr")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    _add_common_arguments(subparsers.add_parser("analyze", help="Mission sourcing + round trips, or general trades without missions"))
+    _add_common_arguments(subparsers.add_parser("missions", help="Where to buy the commodities of the active missions"))
+    _add_common_arguments(subparsers.add_parser("trades", help="General trade routes around the current station"))
+    hop_parser = subparsers.add_parser("hop", help="Best outbound trades from a station (multi-hop planner)")
+    _add_common_arguments(hop_parser)
+    hop_parser.add_argument("--from-system", help="Source system (default: current system)")
+    hop_parser.add_argument("--from-station", help="Source station (default: current station)")
+    hop_parser.add_argument("--max-ly-per-hop", type=float, help="Hop radius in LY (default: --radius)")
+    ship_parser = subparsers.add_parser("ship", help="Stations selling a ship")
+    _add_common_arguments(ship_parser)
+    ship_parser.add_argument("ship_name", help="Ship name, e.g. 'Python' or 'Type-9 Heavy'")
+    ship_parser.add_argument("--max-ly", type=float, help="Max distance in LY")
+    modules_parser = subparsers.add_parser("modules", help="Stations selling all the given modules")
+    _add_common_arguments(modules_parser)
+    modules_parser.add_argument("module_ids", nargs="+", help="Module symbols, e.g. int_engine_size5_class1")
+    modules_parser.add_argument("--max-ly", type=float, help="Max distance in LY")
+    fleet_parser = subparsers.add_parser("fleet", help="Evaluate several ship profiles in one pass (fleet profit table)")
+    _add_common_arguments(fleet_parser)
+    fleet_parser.add_argument("profiles", help="JSON file: [{\"name\", \"cargo_capacity\", \"pad_size\", \"filters\": {...}}, ...]")
+    fleet_parser.add_argument("--table-only", action="store_true", help="Output only the per-profile profit table")
+    return parser
+
+
+def _mission_needs(args):
+    """Besoins des missions : ceux de la session rejouée s'ils y sont enregistrés, sinon ceux du journal."""
+    recorded = args.session_context.get("needs")
+    if recorded is not None:
+        return recorded, args.session_context.get("total_reward", 0.0)
+    return analysis_api.load_mission_needs()
+
+
+def _with_context(values, recorded):
+    """Options de la ligne de commande, complétées par celles de la session rejouée."""
+    return {name: value if value is not None else (recorded or {}).get(name) for name, value in values.items()}
+
+
+def _run_fleet(args, player, filters, snapshot):
+    import fleet_evaluation
+    with open(args.profiles, "r", encoding="utf-8") as f:
+        profiles = fleet_evaluation.load_profiles(json.load(f), filters)
+    needs, total_reward = _mission_needs(args)
+    result = fleet_evaluation.evaluate_fleet(profiles, player.system, player.station, snapshot, filters, needs, total_reward)
+    return result.profit_table() if args.table_only else {"table": result.profit_table(), "result": result}
+
+
+async def _run(args, player, filters, snapshot):
+    http_session = None
+    if args.refresh:
+        import aiohttp
+        import api_handler
+        http_session = aiohttp.ClientSession(headers=api_handler.HEADERS)
+    try:
+        if args.refresh:
+            # En rejeu, téléchargement forcé : les réponses enregistrées remplacent le cache local
+            snapshot = await analysis_api.refresh_market_data(http_session, player, filters, force_refresh=http_recorder.is_replaying())
+        if args.command == "fleet":
+            return _run_fleet(args, player, filters, snapshot)
+        if args.command == "analyze":
+            needs, total_reward = _mission_needs(args)
+            return await analysis_api.run_analysis(player, filters, snapshot, needs, total_reward, http_session)
+        if args.command == "missions":
+            needs, total_reward = _mission_needs(args)
+            sourcing = analysis_api.source_mission_commodities(needs, total_reward, player, filters, snapshot)
+            return {"missions": sourcing, "round_trips": await analysis_api.find_round_trips(sourcing, player, filters, snapshot, http_session)}
+        if args.command == "trades":
+            return await analysis_api.find_general_trades(player, filters, snapshot, http_session)
+        if args.command == "hop":
+            return await analysis_api.plan_next_hop(args.from_system or player.system, args.from_station or player.station,
+                                                    player, filters, snapshot, args.max_ly_per_hop, http_session)
+        if args.command == "ship":
+            return analysis_api.find_ship(args.ship_name, player, filters, snapshot, args.max_ly)
+        return analysis_api.find_modules(args.module_ids, player, filters, snapshot, args.max_ly)
+    finally:
+        if http_session is not None:
+            await http_session.close()
+
+
+async def _run_remote(args, player, filters):
+    """Même commande, calculée par le service (la position et les besoins des missions restent ceux de ce client)."""
+    import aiohttp
+    import optimizer_service
+    params = {}
+    if args.command in ("analyze", "missions"):
+        params["needs"], params["total_reward"] = analysis_api.load_mission_needs()
+    elif args.command == "hop":
+        params = {"source_system": args.from_system, "source_station": args.from_station, "max_ly_per_hop": args.max_ly_per_hop}
+    elif args.command == "ship":
+        params = {"ship_name": args.ship_name, "max_ly": args.max_ly}
+    elif args.command == "modules":
+        params = {"module_ids": args.module_ids, "max_ly": args.max_ly}
+    payload = optimizer_service.build_query_payload(player, filters, **params)
+    async with aiohttp.ClientSession() as http_session:
+        if args.refresh:
+            async with http_session.post(f"{args.service.rstrip('/')}/refresh", json=payload) as response:
+                if response.status != 200:
+                    raise optimizer_service.ServiceError(f"Refresh failed: HTTP {response.status}: {await response.text()}")
+        return (await optimizer_service.query_service(http_session, args.service, args.command, payload))["result"]
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.service and (args.command == "fleet" or args.record_session or args.replay_session):
+        print("The fleet command and session recording/replay run locally only (no --service).", file=sys.stderr)
+        return 2
+    if args.record_session and args.replay_session:
+        print("--record-session and --replay-session are mutually exclusive.", file=sys.stderr)
+        return 2
+    args.session_context = {}
+    if args.replay_session:
+        try:
+            args.session_context = http_recorder.read_manifest(args.replay_session).get("context") or {}
+        except (OSError, ValueError, http_recorder.ReplayError) as e:
+            print(f"Error: cannot read session {args.replay_session}: {e}", file=sys.stderr)
+            return 2
+        args.refresh = True
+    player = analysis_api.load_player_context(**_with_context({
+        "system": args.system, "station": args.station, "ship_type": args.ship_type,
+        "cargo_capacity": args.cargo_capacity, "pad_size": args.pad_size}, args.session_context.get("player")))
+    filters = analysis_api.AnalysisFilters.from_settings(**_with_context({
+        "max_station_dist_ls": args.max_station_dist_ls, "include_planetary": args.include_planetary,
+        "include_fleet_carriers": args.include_fleet_carriers, "sort_by": args.sort_by, "radius_ly": args.radius_ly,
+        "max_age_days": args.max_age_days, "max_general_trade_routes": args.max_general_trade_routes}, args.session_context.get("filters")))
+    try:
+        if args.record_session:
+            needs, total_reward = analysis_api.load_mission_needs()
+            http_recorder.start_recording(args.record_session, label=f"optimizer_cli {args.command}", context={
+                "player": asdict(player), "filters": asdict(filters), "needs": needs, "total_reward": total_reward})
+        elif args.replay_session:
+            http_recorder.start_replay(args.replay_session, args.replay_timing)
+    except (OSError, ValueError, http_recorder.ReplayError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    try:
+        with perf_trace.operation(f"cli.{args.command}", system=player.system, station=player.station, service=args.service) as trace_operation:
+            if args.service:
+                result = asyncio.run(_run_remote(args, player, filters))
+            else:
+                result = asyncio.run(_run(args, player, filters, analysis_api.DataSnapshot.from_datasets()))
+    except analysis_api.OperationCancelledError as e:
+        print(f"Cancelled: {e}", file=sys.stderr)
+        return 1
+    except (OSError, ValueError) as e: # Fichier de profils illisible ou invalide
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        summary = http_recorder.stop()
+        if summary is not None:
+            print(f"Session: {json.dumps(summary)}", file=sys.stderr)
+    if args.perf:
+        print(perf_trace.format_summary(trace_operation.name, trace_operation.status, trace_operation.summary()), file=sys.stderr)
+    json.dump(analysis_api.json_safe(result), sys.stdout, indent=args.indent or None, ensure_ascii=False, allow_nan=False)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 import logging
 import math
-import os
-import json
 from datetime import datetime, timezone
 import asyncio # Peut être nécessaire si find_best_outbound_trades_for_hop fait des appels asynchrones
 from collections import defaultdict
+from collections.abc import Mapping
 import threading
 
 from constants import (
@@ -14,21 +13,20 @@ from constants import (
     KEY_TOP_N_IMPORTS_FILTER, DEFAULT_TOP_N_IMPORTS_FILTER,
     KEY_MAX_GENERAL_TRADE_ROUTES, DEFAULT_MAX_GENERAL_TRADE_ROUTES
 )
-# api_handler n'est pas importé ici directement, mais find_best_outbound_trades_for_hop
-# pourrait en avoir besoin si on décide qu'il fait ses propres appels API pour des données manquantes.
-# Pour l'instant, on suppose qu'il travaille avec les données fournies.
-# import api_handler
-from api_handler import OperationCancelledError # Si utilisé
+# api_handler (et donc aiohttp) n'est importé qu'au moment d'un appel API de secours, avec une
+# session HTTP : sans session (analyse hors ligne, voir analysis_api), seules les données fournies sont utilisées.
+from operation_errors import OperationCancelledError
 import settings_manager
+import dataset_manager
+import perf_trace
 
 logger = logging.getLogger(__name__)
 
 def get_last_db_update_time_str():
     # ... (fonction existante inchangée)
-    if os.path.exists(LOCAL_SELLERS_DATA_FILE):
+    if dataset_manager.dataset_exists(dataset_manager.DATASET_LOCAL_MARKET):
         try:
-            with open(LOCAL_SELLERS_DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = (dataset_manager.get_dataset_header(dataset_manager.DATASET_LOCAL_MARKET) or {}).get("meta", {}) # En-tête seul
             updated_at_iso = data.get("updatedAt")
             if updated_at_iso:
                 try:
@@ -47,6 +45,7 @@ def get_last_db_update_time_str():
             return "Local DB: Date Read Error"
     return "Local DB: Not found"
 
+@perf_trace.traced("optimizer.purchase_suggestions")
 def generate_purchase_suggestions(
     required_commodities,
     local_market_data_new_struct,
@@ -122,7 +121,7 @@ def generate_purchase_suggestions(
     if cancel_event and cancel_event.is_set():
         raise OperationCancelledError("Purchase suggestion generation cancelled.")
 
-    if local_market_data_new_struct and isinstance(local_market_data_new_struct.get('station_markets'), dict):
+    if local_market_data_new_struct and isinstance(local_market_data_new_struct.get('station_markets'), Mapping):
         for system_name, system_market_detail in local_market_data_new_struct['station_markets'].items():
             if cancel_event and cancel_event.is_set():
                 raise OperationCancelledError("Purchase suggestion generation cancelled processing local markets.")
@@ -160,6 +159,17 @@ def generate_purchase_suggestions(
             is_from_current_station_raw_data_param=True
         )
 
+    full_supply_options, partial_supply_options, complementary_sources_for_best_partial = assemble_supply_options(required_commodities, station_candidates, cancel_event)
+    logger.info(f"Mission item suggestions: Found {len(full_supply_options)} full, {len(partial_supply_options)} partial options.")
+    return full_supply_options, partial_supply_options, complementary_sources_for_best_partial
+
+@perf_trace.traced("optimizer.supply_options")
+def assemble_supply_options(required_commodities, station_candidates, cancel_event: threading.Event = None):
+    """
+    Options d'approvisionnement à partir des stations candidates filtrées
+    ({(station, système): {'distance_ly', 'commodities': {nom: prix}, 'pad_size_int', 'distance_ls', 'stationType'}}).
+    Retourne (complètes, partielles triées, sources complémentaires de la meilleure partielle).
+    """
     full_supply_options = []; partial_supply_options = []
     for station_key_tuple, data_dict in station_candidates.items():
         if all(comm_name in data_dict['commodities'] for comm_name in required_commodities.keys()): full_supply_options.append({'station_name': station_key_tuple[0], 'system_name': station_key_tuple[1], **data_dict})
@@ -187,12 +197,10 @@ def generate_purchase_suggestions(
                     complementary_sources_for_best_partial[comm_to_find] = best_source_for_this_missing_commodity
                     logger.debug(f"Found complementary source for {comm_to_find}: {best_source_for_this_missing_commodity['station_name']} in {best_source_for_this_missing_commodity['system_name']}")
 
-    logger.info(f"Mission item suggestions: Found {len(full_supply_options)} full, {len(partial_supply_options)} partial options.")
     return full_supply_options, partial_supply_options, complementary_sources_for_best_partial
 
 def calculate_profitable_trades(player_buys_from_source_offers, player_sells_to_destination_offers, available_cargo_tons, cancel_event: threading.Event = None):
     # ... (fonction existante inchangée)
-    profitable_trades = []
     if not player_buys_from_source_offers or not player_sells_to_destination_offers or available_cargo_tons <= 0:
         logger.debug(f"calculate_profitable_trades: Initial conditions not met or zero cargo. Buys offers: {len(player_buys_from_source_offers if player_buys_from_source_offers else [])}, Sells offers: {len(player_sells_to_destination_offers if player_sells_to_destination_offers else [])}, Cargo: {available_cargo_tons}")
         return []
@@ -200,6 +208,16 @@ def calculate_profitable_trades(player_buys_from_source_offers, player_sells_to_
     if cancel_event and cancel_event.is_set():
         raise OperationCancelledError("Trade calculation cancelled.")
 
+    profitable_trades = fill_cargo_with_trades(rank_potential_trades(player_buys_from_source_offers, player_sells_to_destination_offers, cancel_event), available_cargo_tons, cancel_event)
+    logger.debug(f"calculate_profitable_trades: Generated {len(profitable_trades)} trade suggestions.")
+    return profitable_trades
+
+def rank_potential_trades(player_buys_from_source_offers, player_sells_to_destination_offers, cancel_event: threading.Event = None):
+    """
+    Jointure source/destination de calculate_profitable_trades : marchandises rentables triées par
+    bénéfice unitaire décroissant. Ne dépend pas de la soute, donc réutilisable pour plusieurs vaisseaux.
+    """
+    perf_trace.count("optimizer.trade_joins") # Appelée par station candidate : compteur plutôt qu'étape
     destination_player_revenue_map = {
         item['commodityName'].lower(): {
             'price': item['price'], 
@@ -238,6 +256,11 @@ def calculate_profitable_trades(player_buys_from_source_offers, player_sells_to_
     potential_trades.sort(key=lambda x: x['profit_per_unit'], reverse=True)
     logger.debug(f"calculate_profitable_trades: Found {len(potential_trades)} potential trade items, sorted by profit per unit.")
 
+    return potential_trades
+
+def fill_cargo_with_trades(potential_trades, available_cargo_tons, cancel_event: threading.Event = None):
+    """Remplit la soute avec les marchandises classées par rank_potential_trades (stock et demande bornent chaque lot)."""
+    profitable_trades = []
     remaining_cargo = float(available_cargo_tons)
     for trade_idx, trade in enumerate(potential_trades):
         if cancel_event and cancel_event.is_set() and trade_idx % 20 == 0: 
@@ -262,9 +285,9 @@ def calculate_profitable_trades(player_buys_from_source_offers, player_sells_to_
             remaining_cargo -= qty_to_trade
             logger.debug(f"Added trade for {trade['commodityName']}, Qty: {int(qty_to_trade)}. Remaining cargo: {remaining_cargo}")
 
-    logger.debug(f"calculate_profitable_trades: Generated {len(profitable_trades)} trade suggestions.")
     return profitable_trades
 
+@perf_trace.traced("optimizer.round_trip")
 async def suggest_round_trip_opportunities(
     http_session, # Nécessaire si on doit faire des appels API pour des données manquantes
     current_station_system_name, current_station_name,
@@ -318,6 +341,8 @@ async def suggest_round_trip_opportunities(
                 for offer in raw_departure_station_market_offers if offer.get('sellPrice', 0) > 0 and offer.get('demand', 0) > 0
             ]
             logger.info(f"Round trip (A->B): B is current station A. Used departure_data for imports of A ({len(player_sells_at_B_normalized)} items).")
+    elif http_session is None:
+        logger.warning(f"Round trip (A->B): Data for B ({pickup_station_name}@{pickup_station_system_name}) imports not in local cache and no HTTP session (offline). Skipping outbound leg.")
     else: 
         logger.warning(f"Round trip (A->B): Data for B ({pickup_station_name}@{pickup_station_system_name}) imports not in local cache. Fetching via API.")
         # Assurez-vous que api_handler est importé si vous utilisez cette ligne
@@ -371,6 +396,7 @@ async def suggest_round_trip_opportunities(
         
     return outbound_trades, return_trades
 
+@perf_trace.traced("optimizer.general_trades")
 async def find_general_market_trades(
     http_session, # Pour les appels API si des données manquent
     current_system_name, current_station_name,      
@@ -383,12 +409,16 @@ async def find_general_market_trades(
     current_player_pad_size_int: int, # Taille de pad du joueur (1,2,3 ou None)
     max_days_ago_api_param: int, # Pour les appels API si données manquantes
     include_fleet_carriers_api_param: bool, # Pour les appels API si données manquantes
-    cancel_event: threading.Event = None
+    cancel_event: threading.Event = None,
+    max_routes_to_display: int = None, # None : réglage KEY_MAX_GENERAL_TRADE_ROUTES
+    top_n_imports_filter: int = None # None : réglage KEY_TOP_N_IMPORTS_FILTER
 ):
     # ... (fonction existante inchangée)
     all_profitable_routes_unmerged = []
-    max_routes_to_display = int(settings_manager.get_setting(KEY_MAX_GENERAL_TRADE_ROUTES, DEFAULT_MAX_GENERAL_TRADE_ROUTES))
-    top_n_imports_filter = int(settings_manager.get_setting(KEY_TOP_N_IMPORTS_FILTER, DEFAULT_TOP_N_IMPORTS_FILTER))
+    if max_routes_to_display is None:
+        max_routes_to_display = int(settings_manager.get_setting(KEY_MAX_GENERAL_TRADE_ROUTES, DEFAULT_MAX_GENERAL_TRADE_ROUTES))
+    if top_n_imports_filter is None:
+        top_n_imports_filter = int(settings_manager.get_setting(KEY_TOP_N_IMPORTS_FILTER, DEFAULT_TOP_N_IMPORTS_FILTER))
     logger.info(f"Finding general market trades. Max routes: {max_routes_to_display}. Top N imports: {top_n_imports_filter}. Filters: LS Max={max_station_dist_ls_filter}, Planetary={include_planetary_filter}, FC (client)={include_fleet_carriers_filter}, Pad={current_player_pad_size_int}, API maxDaysAgo={max_days_ago_api_param}, API includeFC for new calls={include_fleet_carriers_api_param}")
     
     if cancel_event and cancel_event.is_set():
@@ -406,7 +436,7 @@ async def find_general_market_trades(
             if offer.get('sellPrice', 0) > 0 and offer.get('demand', 0) > 0 : 
                 player_sells_to_A_normalized.append({'commodityName': offer.get('commodityName'), 'commodity_localised': offer.get('commodity_localised', offer.get('commodityName')),'price': offer.get('sellPrice'), 'quantity_at_station': offer.get('demand')})
 
-    if player_buys_at_A_normalized and local_market_data and isinstance(local_market_data.get('station_markets'), dict):
+    if player_buys_at_A_normalized and local_market_data and isinstance(local_market_data.get('station_markets'), Mapping):
         logger.info(f"General Trades (A->X): Current station {current_station_name} offers {len(player_buys_at_A_normalized)} items for player to buy.")
         for system_idx, (nearby_system_name_X, system_market_content_X) in enumerate(local_market_data['station_markets'].items()):
             if cancel_event and cancel_event.is_set() and system_idx % 5 == 0 : 
@@ -451,7 +481,7 @@ async def find_general_market_trades(
     if cancel_event and cancel_event.is_set():
         raise OperationCancelledError("General market trade search (mid-point) cancelled.")
 
-    if player_sells_to_A_normalized and local_market_data and isinstance(local_market_data.get('station_markets'), dict):
+    if player_sells_to_A_normalized and local_market_data and isinstance(local_market_data.get('station_markets'), Mapping):
         logger.info(f"General Trades (X->A): Current station {current_station_name} might buy {len(player_sells_to_A_normalized)} items from player.")
         for system_idx, (nearby_system_name_X, system_market_content_X) in enumerate(local_market_data['station_markets'].items()):
             if cancel_event and cancel_event.is_set() and system_idx % 5 == 0:
@@ -520,6 +550,8 @@ async def find_general_market_trades(
                                 for offer in raw_departure_station_market_offers if offer.get('sellPrice',0) > 0 and offer.get('demand',0) > 0
                             ]
                             logger.debug(f"Prelim leg: Used current station departure data for imports to {prelim_dest_station}.")
+                    elif http_session is None:
+                        logger.debug(f"No cached import data for {prelim_dest_station} for prelim leg and no HTTP session (offline), skipping.")
                     else: # Fallback API call
                         logger.warning(f"No/Insufficient cached import data for {prelim_dest_station} for prelim leg, fetching via API...")
                         # Assurez-vous que api_handler est importé ou que http_session est disponible
@@ -553,6 +585,7 @@ async def find_general_market_trades(
 
 
 # --- NOUVELLE FONCTION pour le planificateur Multi-Hop ---
+@perf_trace.traced("optimizer.hop_trades")
 async def find_best_outbound_trades_for_hop(
     http_session, # Pour d'éventuels appels API si les données manquent (non utilisé pour l'instant)
     source_system_name: str,
@@ -609,7 +642,7 @@ async def find_best_outbound_trades_for_hop(
         logger.warning(f"No departure (export) data provided for source station {source_station_name}.")
         return []
     
-    if not local_market_data or not isinstance(local_market_data.get('station_markets'), dict):
+    if not local_market_data or not isinstance(local_market_data.get('station_markets'), Mapping):
         logger.warning("Local market data is missing or invalid for finding trades.")
         return []
 
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Service local optionnel (HTTP/JSON, aiohttp) : un processus « chaud » qui garde en mémoire les jeux
+de données (marché, chantiers, équipement) et leurs index, et répond aux requêtes des moteurs
+d'analyse pour plusieurs clients (CLI, autres copies de l'application du groupe).
+
+    python -m optimizer_service [--host 127.0.0.1] [--port 8765]
+
+Routes :
+  GET  /status              versions et en-têtes des jeux de données, statistiques du cache
+  POST /query/<commande>    analyze, missions, trades, hop, ship, modules (voir analysis_api)
+  POST /refresh             mise à jour des données de marché (un seul téléchargement à la fois)
+Corps des requêtes : {"player": {...PlayerContext}, "filters": {...AnalysisFilters}, + paramètres}.
+Les réponses sont mises en cache par (commande, position et filtres résolus, paramètres, versions des
+jeux de données utilisés) : une nouvelle version (téléchargement, EDDN, import) invalide naturellement
+les réponses concernées. Les données de marché téléchargées par /refresh sont gardées par position de
+client : le /refresh d'un autre client, ailleurs, ne change pas les réponses des autres.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, fields
+
+import aiohttp
+from aiohttp import web
+
+from constants import (
+    HEADERS, OPTIMIZER_SERVICE_HOST, OPTIMIZER_SERVICE_PORT, OPTIMIZER_SERVICE_CACHE_ENTRIES,
+    OPTIMIZER_SERVICE_WORKERS, OPTIMIZER_SERVICE_CLIENT_TIMEOUT_S, OPTIMIZER_SERVICE_CLIENT_MARKETS
+)
+import analysis_api
+import dataset_manager
+import outfitting_logic
+import shipyard_logic
+import snapshot_store
+
+logger = logging.getLogger(__name__)
+
+MARKET_DATASETS = (dataset_manager.DATASET_DEPARTURE, dataset_manager.DATASET_LOCAL_MARKET)
+COMMAND_DATASETS = { # Jeux de données dont dépend chaque commande (clé de cache)
+    "analyze": MARKET_DATASETS, "missions": MARKET_DATASETS, "trades": MARKET_DATASETS, "hop": MARKET_DATASETS,
+    "ship": (dataset_manager.DATASET_SHIPYARD,), "modules": (dataset_manager.DATASET_OUTFITTING,)
+}
+ALL_DATASETS = (dataset_manager.DATASET_DEPARTURE, dataset_manager.DATASET_LOCAL_MARKET,
+                dataset_manager.DATASET_SHIPYARD, dataset_manager.DATASET_OUTFITTING)
+
+_response_cache = OrderedDict() # clé -> corps JSON (LRU, boucle aiohttp uniquement)
+_in_flight = {} # clé -> asyncio.Future : requêtes identiques simultanées calculées une seule fois
+_cache_stats = {"hits": 0, "misses": 0, "shared": 0}
+_client_markets = OrderedDict() # (système, station) -> {"departure", "local_market", "version"} du dernier /refresh (LRU)
+_client_markets_lock = threading.Lock() # Lu depuis les threads de calcul
+_client_market_versions = itertools.count(1)
+
+
+class ServiceError(Exception):
+    """Réponse d'erreur du service (côté client)."""
+    pass
+
+
+# ---- Requêtes ----
+
+def _parse_dataclass_fields(cls, values, what):
+    if values is None:
+        return {}
+    if not isinstance(values, dict):
+        raise ValueError(f"'{what}' must be an object")
+    unknown = set(values) - {f.name for f in fields(cls)}
+    if unknown:
+        raise ValueError(f"Unknown '{what}' fields: {', '.join(sorted(unknown))}")
+    return values
+
+
+def parse_query(command, payload):
+    """(player, filters) d'une requête ; ValueError si la requête est invalide."""
+    if command not in COMMAND_DATASETS:
+        raise KeyError(command)
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    player_fields = _parse_dataclass_fields(analysis_api.PlayerContext, payload.get("player"), "player")
+    if command not in ("ship", "modules") and not player_fields.get("system"):
+        raise ValueError("'player.system' is required")
+    filters = analysis_api.AnalysisFilters.from_settings(**_parse_dataclass_fields(analysis_api.AnalysisFilters, payload.get("filters"), "filters"))
+    if filters.sort_by not in analysis_api.SORT_OPTIONS:
+        raise ValueError(f"'filters.sort_by' must be one of {', '.join(analysis_api.SORT_OPTIONS)}")
+    if command == "ship" and not payload.get("ship_name"):
+        raise ValueError("'ship_name' is required")
+    if command == "modules" and not payload.get("module_ids"):
+        raise ValueError("'module_ids' is required")
+    return analysis_api.PlayerContext(**player_fields), filters
+
+
+def _dataset_versions(names):
+    return {name: dataset_manager.get_dataset_version(name) for name in names}
+
+
+def _remember_client_market(player):
+    """Après un /refresh : garde les données de marché publiées pour la position de ce client."""
+    entry = {"departure": dataset_manager.get_dataset(dataset_manager.DATASET_DEPARTURE),
+             "local_market": dataset_manager.get_dataset(dataset_manager.DATASET_LOCAL_MARKET)}
+    with _client_markets_lock:
+        entry["version"] = next(_client_market_versions)
+        _client_markets[(player.system, player.station)] = entry
+        _client_markets.move_to_end((player.system, player.station))
+        while len(_client_markets) > OPTIMIZER_SERVICE_CLIENT_MARKETS:
+            _client_markets.popitem(last=False)
+
+
+def _is_centered_on(departure, local_market, player):
+    return bool(local_market and local_market.get("sourceSystem") == player.system and departure
+                and departure.get("system") == player.system and departure.get("station") == player.station)
+
+
+def _resolve_market(command, player):
+    """
+    (données de départ, sphère locale, versions) d'une requête : les jeux publiés s'ils sont centrés sur le
+    client (ou s'il n'a pas fait de /refresh), sinon ceux gardés lors de son dernier /refresh.
+    """
+    if COMMAND_DATASETS[command] != MARKET_DATASETS:
+        return None, None, _dataset_versions(COMMAND_DATASETS[command])
+    departure = dataset_manager.get_dataset(dataset_manager.DATASET_DEPARTURE)
+    local_market = dataset_manager.get_dataset(dataset_manager.DATASET_LOCAL_MARKET)
+    with _client_markets_lock:
+        entry = _client_markets.get((player.system, player.station))
+    if entry is not None and not _is_centered_on(departure, local_market, player):
+        return entry["departure"], entry["local_market"], {"client_market": entry["version"]}
+    return departure, local_market, _dataset_versions(MARKET_DATASETS)
+
+
+def _execute(command, payload, player, filters, departure, local_market):
+    """Calcul d'une requête (thread de calcul : chaque moteur async tourne dans sa propre boucle)."""
+    snapshot = analysis_api.DataSnapshot.from_datasets()
+    if COMMAND_DATASETS[command] == MARKET_DATASETS:
+        snapshot.departure, snapshot.local_market = departure, local_market
+    if command == "analyze":
+        result = asyncio.run(analysis_api.run_analysis(player, filters, snapshot, payload.get("needs") or {}, payload.get("total_reward", 0)))
+    elif command == "missions":
+        sourcing = analysis_api.source_mission_commodities(payload.get("needs") or {}, payload.get("total_reward", 0), player, filters, snapshot)
+        result = {"missions": sourcing, "round_trips": asyncio.run(analysis_api.find_round_trips(sourcing, player, filters, snapshot))}
+    elif command == "trades":
+        result = asyncio.run(analysis_api.find_general_trades(player, filters, snapshot))
+    elif command == "hop":
+        result = asyncio.run(analysis_api.plan_next_hop(payload.get("source_system") or player.system, payload.get("source_station") or player.station,
+                                                        player, filters, snapshot, payload.get("max_ly_per_hop")))
+    elif command == "ship":
+        result = analysis_api.find_ship(payload["ship_name"], player, filters, snapshot, payload.get("max_ly"))
+    else:
+        result = analysis_api.find_modules(payload["module_ids"], player, filters, snapshot, payload.get("max_ly"))
+    return analysis_api.json_safe(result)
+
+
+def _cache_put(key, body):
+    _response_cache[key] = body
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > OPTIMIZER_SERVICE_CACHE_ENTRIES:
+        _response_cache.popitem(last=False)
+
+
+def _cache_key(command, payload, player, filters, versions):
+    """Clé de cache sur la requête résolue (valeurs par défaut des filtres comprises), pas sur le corps brut."""
+    params = {name: value for name, value in payload.items() if name not in ("player", "filters")}
+    resolved = json.dumps({"player": asdict(player), "filters": asdict(filters), "params": params}, sort_keys=True, default=str)
+    return command, resolved, tuple(sorted(versions.items()))
+
+
+def _computation_done(key, future):
+    """Fin d'un calcul partagé : retiré des calculs en cours, mis en cache s'il a réussi."""
+    _in_flight.pop(key, None)
+    if not future.cancelled() and future.exception() is None: # exception() marque aussi l'erreur comme lue
+        _cache_put(key, future.result())
+
+
+async def _handle_query(request):
+    command = request.match_info["command"]
+    started = time.perf_counter()
+    try:
+        payload = await request.json()
+        player, filters = parse_query(command, payload)
+    except KeyError:
+        return web.json_response({"error": f"Unknown command '{command}'"}, status=404)
+    except (ValueError, TypeError) as e: # json.JSONDecodeError est une ValueError
+        return web.json_response({"error": str(e)}, status=400)
+
+    loop = asyncio.get_running_loop()
+    executor = request.app["executor"]
+    departure, local_market, versions = await loop.run_in_executor(executor, _resolve_market, command, player)
+    key = _cache_key(command, payload, player, filters, versions)
+    cached = key in _response_cache
+    if cached:
+        _cache_stats["hits"] += 1
+        _response_cache.move_to_end(key)
+        body = _response_cache[key]
+    else:
+        future = _in_flight.get(key)
+        if future is not None:
+            _cache_stats["shared"] += 1
+        else: # Calcul indépendant de cette requête : la déconnexion du premier client ne l'annule pas pour les autres
+            _cache_stats["misses"] += 1
+            future = asyncio.ensure_future(loop.run_in_executor(executor, _execute, command, payload, player, filters, departure, local_market))
+            _in_flight[key] = future
+            future.add_done_callback(lambda done, key=key: _computation_done(key, done))
+        try:
+            body = await asyncio.shield(future)
+        except Exception as e: # Chaque requête en attente reçoit sa propre réponse d'erreur
+            logger.error(f"Optimizer service: '{command}' query failed: {type(e).__name__}: {e}", exc_info=e)
+            return web.json_response({"error": f"{type(e).__name__}: {e}"}, status=500)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Optimizer service: '{command}' answered in {elapsed_ms:.1f} ms ({'cache' if cached else 'computed'}).")
+    return web.json_response({"command": command, "versions": versions, "cached": cached, "elapsedMs": round(elapsed_ms, 2), "result": body})
+
+
+def _status_body():
+    datasets = {}
+    for name in ALL_DATASETS:
+        header = dataset_manager.get_dataset_header(name)
+        datasets[name] = {
+            "version": dataset_manager.get_dataset_version(name) if header else None,
+            "meta": analysis_api.json_safe(header["meta"]) if header else None,
+            "counts": header["counts"] if header else None
+        }
+    return datasets
+
+
+async def _handle_status(request):
+    datasets = await asyncio.get_running_loop().run_in_executor(request.app["executor"], _status_body)
+    return web.json_response({
+        "uptimeSeconds": round(time.time() - request.app["started_at"], 1), "datasets": datasets,
+        "cache": dict(_cache_stats, entries=len(_response_cache), maxEntries=OPTIMIZER_SERVICE_CACHE_ENTRIES)
+    })
+
+
+async def _handle_refresh(request):
+    """Met à jour les données de marché pour la position du client ; les requêtes simultanées attendent le même verrou."""
+    try:
+        payload = await request.json()
+        player, filters = parse_query("trades", payload)
+    except (ValueError, TypeError) as e:
+        return web.json_response({"error": str(e)}, status=400)
+    async with request.app["refresh_lock"]:
+        try:
+            await analysis_api.refresh_market_data(request.app["http_session"], player, filters, force_refresh=bool(payload.get("force")))
+        except Exception as e:
+            logger.exception("Optimizer service: market data refresh failed.")
+            return web.json_response({"error": f"{type(e).__name__}: {e}"}, status=502)
+        await asyncio.get_running_loop().run_in_executor(request.app["executor"], _remember_client_market, player) # Sous le verrou : données de ce client
+    versions = await asyncio.get_running_loop().run_in_executor(request.app["executor"], _dataset_versions, ALL_DATASETS)
+    return web.json_response({"versions": versions})
+
+
+# ---- Cycle de vie ----
+
+def _warm_up():
+    """Charge les jeux de données et construit les index dérivés avant la première requête."""
+    for name in ALL_DATASETS:
+        dataset_manager.get_dataset(name)
+    dataset_manager.get_index(dataset_manager.DATASET_SHIPYARD, "ship_systems", shipyard_logic.build_ship_systems_index)
+    dataset_manager.get_index(dataset_manager.DATASET_OUTFITTING, "module_systems", outfitting_logic.build_module_systems_index)
+
+
+async def _on_startup(app):
+    app["executor"] = ThreadPoolExecutor(max_workers=OPTIMIZER_SERVICE_WORKERS, thread_name_prefix="OptimizerService")
+    app["http_session"] = aiohttp.ClientSession(headers=HEADERS)
+    app["refresh_lock"] = asyncio.Lock()
+    app["started_at"] = time.time()
+    started = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(app["executor"], _warm_up)
+    logger.info(f"Optimizer service: datasets and indexes loaded in {time.perf_counter() - started:.2f}s.")
+
+
+async def _on_cleanup(app):
+    await app["http_session"].close()
+    app["executor"].shutdown(wait=True)
+    snapshot_store.flush_pending_writes() # Données publiées par /refresh encore en cours d'écriture
+
+
+def create_app():
+    app = web.Application()
+    app.router.add_get("/status", _handle_status)
+    app.router.add_post("/query/{command}", _handle_query)
+    app.router.add_post("/refresh", _handle_refresh)
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+
+# ---- Client ----
+
+def build_query_payload(player, filters, **params):
+    """Corps de requête : position, filtres et paramètres de la commande (valeurs None omises)."""
+    payload = {"player": asdict(player), "filters": asdict(filters)}
+    payload.update({name: value for name, value in params.items() if value is not None})
+    return payload
+
+
+async def query_service(http_session, base_url, command, payload):
+    """Envoie une requête au service et retourne la réponse complète ({"result", "versions", "cached", ...})."""
+    url = f"{base_url.rstrip('/')}/query/{command}"
+    async with http_session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=OPTIMIZER_SERVICE_CLIENT_TIMEOUT_S)) as response:
+        try:
+            body = await response.json()
+        except (aiohttp.ContentTypeError, ValueError):
+            body = {"error": await response.text()}
+        if response.status != 200:
+            raise ServiceError(f"{url}: HTTP {response.status}: {body.get('error')}")
+        return body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="optimizer_service", description="Local optimizer service with a warm shared data cache.")
+    parser.add_argument("--host", default=OPTIMIZER_SERVICE_HOST, help=f"Listen address (default {OPTIMIZER_SERVICE_HOST})")
+    parser.add_argument("--port", type=int, default=OPTIMIZER_SERVICE_PORT, help=f"Listen port (default {OPTIMIZER_SERVICE_PORT})")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    web.run_app(create_app(), host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 import asyncio
 import aiohttp
-import json
-import os
 import logging
 from datetime import datetime, timezone
 import threading
@@ -15,6 +13,9 @@ from constants import (
     # DEFAULT_OUTFITTING_RADIUS_LY # Non utilisé directement ici, mais pour info
 )
 import edsm_api_handler # Pour les appels API EDSM
+import dataset_manager
+import perf_metrics
+import perf_trace
 # S'assurer d'importer la bonne exception OperationCancelledError
 # Si edsm_api_handler définit sa propre OperationCancelledError, il faut l'importer.
 # Sinon, si elle est globale (ex: définie dans api_handler.py et réutilisée), c'est bon.
@@ -24,6 +25,7 @@ from edsm_api_handler import OperationCancelledError as EdsOperationCancelledErr
 
 logger = logging.getLogger(__name__)
 
+@perf_trace.traced("db.outfitting_download")
 async def download_regional_outfitting_data(
     center_system_name: str,
     radius_ly: int,
@@ -85,8 +87,7 @@ async def download_regional_outfitting_data(
                 if progress_callback: progress_callback("Aucun système trouvé dans la sphère.", 100)
                 all_outfitting_data["updatedAt"] = datetime.now(timezone.utc).isoformat()
                 # Sauvegarder un fichier vide structuré pour indiquer que la recherche a eu lieu
-                with open(OUTFITTING_DATA_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(all_outfitting_data, f, indent=2)
+                _save_outfitting_data(all_outfitting_data)
                 return all_outfitting_data # Retourner les données vides structurées
 
             total_systems_in_sphere = len(sphere_systems)
@@ -94,6 +95,7 @@ async def download_regional_outfitting_data(
                 progress_callback(f"{total_systems_in_sphere} systèmes trouvés. Récupération des stations et équipements...", 5)
 
             semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT) # Limiter les appels concurrents
+            perf_metrics.set_gauge(perf_metrics.HTTP_CONCURRENCY_LIMIT, CONCURRENCY_LIMIT, "outfitting")
             systems_processed_count = 0
 
             async def process_system_for_outfitting(system_info_from_sphere):
@@ -179,8 +181,7 @@ async def download_regional_outfitting_data(
                     }
             
             all_outfitting_data["updatedAt"] = datetime.now(timezone.utc).isoformat()
-            with open(OUTFITTING_DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(all_outfitting_data, f, indent=2)
+            _save_outfitting_data(all_outfitting_data)
             
             logger.info(f"Données régionales d'équipement sauvegardées dans {OUTFITTING_DATA_FILE}.")
             if progress_callback:
@@ -200,26 +201,28 @@ async def download_regional_outfitting_data(
             raise
 
 
+def _save_outfitting_data(all_outfitting_data):
+    stations_count = sum(len(sys_data.get("stations", [])) for sys_data in all_outfitting_data["systems_with_outfitting"].values())
+    # Fin de rafraîchissement : publié immédiatement, écrit sur disque en arrière-plan
+    dataset_manager.save_dataset(dataset_manager.DATASET_OUTFITTING, all_outfitting_data, counts={"stations": stations_count})
+
+
 def load_outfitting_data_from_file():
-    """Charge les données d'équipement depuis le fichier local."""
-    if os.path.exists(OUTFITTING_DATA_FILE):
-        try:
-            with open(OUTFITTING_DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            logger.info(f"Données d'équipement chargées depuis {OUTFITTING_DATA_FILE}.")
-            return data
-        except json.JSONDecodeError as e_json:
-            logger.error(f"Erreur de décodage JSON lors du chargement de {OUTFITTING_DATA_FILE}: {e_json}. Le fichier est peut-être corrompu.")
-            return None # Ou lever une exception personnalisée
-        except Exception as e:
-            logger.exception(f"Erreur lors du chargement de {OUTFITTING_DATA_FILE}: {e}")
-            return None
+    """
+    Données d'équipement (lecture seule), partagées via dataset_manager :
+    le snapshot n'est relu que s'il a changé sur disque.
+    """
+    if dataset_manager.dataset_exists(dataset_manager.DATASET_OUTFITTING):
+        data = dataset_manager.get_dataset(dataset_manager.DATASET_OUTFITTING)
+        if data is None:
+            logger.error(f"Le snapshot {OUTFITTING_DATA_FILE} est illisible. Le fichier est peut-être corrompu.")
+        return data
     logger.info(f"Le fichier de données d'équipement {OUTFITTING_DATA_FILE} n'existe pas.")
     return None
 
 def get_outfitting_db_update_time_str():
-    """Retourne la date de dernière mise à jour de la BD d'équipement en format lisible."""
-    data = load_outfitting_data_from_file()
+    """Retourne la date de dernière mise à jour de la BD d'équipement en format lisible (lit seulement l'en-tête)."""
+    data = (dataset_manager.get_dataset_header(dataset_manager.DATASET_OUTFITTING) or {}).get("meta")
     if data and "updatedAt" in data:
         try:
             updated_at_iso = data["updatedAt"]
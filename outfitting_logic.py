@@ -7,11 +7,23 @@ from constants import (
     FLEET_CARRIER_STATION_TYPES,
     STATION_TYPE_TO_PAD_SIZE_LETTER # Nécessaire pour la déduction
 )
+import perf_trace
 # module_catalog_data n'est pas utilisé ici car on attend des ID EDSM
 # et la déduction de pad se base sur le type de station, pas sur le module.
 
 logger = logging.getLogger(__name__)
 
+def build_module_systems_index(all_outfitting_data):
+    """Index dérivé : ID de module EDSM -> ensemble des systèmes où au moins une station le vend."""
+    module_systems_index = {}
+    for system_name, system_data in all_outfitting_data.get("systems_with_outfitting", {}).items():
+        for station_entry in system_data.get("stations", []):
+            for module_data in station_entry.get("modules", []):
+                if isinstance(module_data, dict) and "id" in module_data:
+                    module_systems_index.setdefault(module_data["id"], set()).add(system_name)
+    return module_systems_index
+
+@perf_trace.traced("optimizer.modules_search")
 def find_stations_with_modules(
     requested_module_ids: list[str],
     all_outfitting_data: dict,
@@ -19,11 +31,14 @@ def find_stations_with_modules(
     max_distance_ly_filter: float = None,
     include_planetary: bool = True,
     include_fleet_carriers: bool = True,
-    max_station_dist_ls: float = None
+    max_station_dist_ls: float = None,
+    module_systems_index: dict = None
 ):
     """
     Recherche les stations vendant TOUS les modules spécifiés.
     Ajoute la taille de pad déduite à chaque station trouvée.
+    Avec `module_systems_index` (voir build_module_systems_index), seuls les systèmes vendant
+    tous les modules sont parcourus.
     """
     found_stations_details = []
     if not requested_module_ids:
@@ -37,7 +52,14 @@ def find_stations_with_modules(
     logger.info(f"Recherche des stations vendant les modules EDSM IDs: {requested_module_ids}")
     requested_module_ids_set = set(requested_module_ids)
 
-    for system_name, system_data in all_outfitting_data["systems_with_outfitting"].items():
+    systems_with_outfitting = all_outfitting_data["systems_with_outfitting"]
+    if module_systems_index is not None:
+        candidate_names = set.intersection(*(module_systems_index.get(mod_id, set()) for mod_id in requested_module_ids_set))
+        candidate_systems = ((name, systems_with_outfitting[name]) for name in candidate_names if name in systems_with_outfitting)
+    else:
+        candidate_systems = systems_with_outfitting.items()
+
+    for system_name, system_data in candidate_systems:
         system_coords = system_data.get("coords")
         distance_ly = float('inf')
 
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Registre de métriques en mémoire, lu par le panneau de performance (gui_performance_tab).
+
+Compteurs, jauges et histogrammes nommés, avec un libellé optionnel (hôte, service, cache, étape).
+Les mises à jour coûtent un verrou et quelques opérations sur un dict : api_handler,
+edsm_api_handler (tracked_request), les gestionnaires de données (via perf_trace.count_cache) et
+les étapes des opérations tracées (perf_trace) les alimentent en continu, y compris hors du panneau.
+Sans dépendance à tkinter ni à aiohttp.
+"""
+import bisect
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from constants import PERF_METRICS_LATENCY_BUCKETS_MS
+
+try:
+    import psutil
+except ImportError: # psutil non installé : mémoire lue via /proc ou l'API Windows
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+HTTP_IN_FLIGHT = "http.in_flight" # Jauge par hôte
+HTTP_LATENCY_MS = "http.latency_ms" # Histogramme par service
+HTTP_RESPONSES = "http.responses" # Compteur par "service:issue" (ok, ClientResponseError, TimeoutError…)
+HTTP_CONCURRENCY_LIMIT = "http.concurrency_limit" # Jauge par téléchargement (taille de son sémaphore)
+CACHE_HITS = "cache.hit" # Compteurs par cache
+CACHE_MISSES = "cache.miss"
+STAGE_MS = "stage.duration_ms" # Histogramme par étape tracée
+TK_EVENT_LAG_MS = "tk.event_lag_ms" # Histogramme (et jauge) du retard de la boucle Tk
+
+_lock = threading.Lock()
+_counters = {} # (nom, libellé) -> valeur
+_gauges = {}
+_histograms = {}
+_started_at = time.time()
+
+
+class _Histogram:
+    __slots__ = ("buckets", "count", "total", "max", "last")
+
+    def __init__(self):
+        self.buckets = [0] * (len(PERF_METRICS_LATENCY_BUCKETS_MS) + 1) # Dernier seau : au-delà de la dernière borne
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(PERF_METRICS_LATENCY_BUCKETS_MS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.last = value
+
+    def quantile(self, q):
+        """Borne supérieure du seau contenant le quantile `q`, sans dépasser le max observé."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(PERF_METRICS_LATENCY_BUCKETS_MS[index], self.max) if index < len(PERF_METRICS_LATENCY_BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "mean": round(self.total / self.count, 3) if self.count else None, "max": round(self.max, 3),
+                "last": round(self.last, 3), "p50": self.quantile(0.5), "p95": self.quantile(0.95), "buckets": list(self.buckets)}
+
+
+def increment(name, label=None, value=1):
+    with _lock:
+        _counters[(name, label)] = _counters.get((name, label), 0) + value
+
+
+def set_gauge(name, value, label=None):
+    with _lock:
+        _gauges[(name, label)] = value
+
+
+def add_to_gauge(name, delta, label=None):
+    with _lock:
+        _gauges[(name, label)] = _gauges.get((name, label), 0) + delta
+
+
+def observe(name, value, label=None):
+    """Ajoute une mesure (en ms pour les histogrammes de ce module) à l'histogramme `name`."""
+    with _lock:
+        histogram = _histograms.get((name, label))
+        if histogram is None:
+            histogram = _histograms[(name, label)] = _Histogram()
+        histogram.observe(value)
+
+
+def record_cache(cache_name, hit):
+    increment(CACHE_HITS if hit else CACHE_MISSES, cache_name)
+
+
+def _group(items, convert=lambda value: value):
+    grouped = {}
+    for (name, label), value in items:
+        grouped.setdefault(name, {})[label] = convert(value)
+    return grouped
+
+
+def snapshot():
+    """Copie des métriques : {"counters", "gauges", "histograms"} -> {nom: {libellé: valeur}}, plus la mémoire du processus."""
+    with _lock:
+        counters, gauges = _group(_counters.items()), _group(_gauges.items())
+        histograms = _group(_histograms.items(), _Histogram.to_dict)
+    return {"since": _started_at, "counters": counters, "gauges": gauges, "histograms": histograms,
+            "process_memory_bytes": process_memory_bytes()}
+
+
+def reset():
+    """Remet à zéro compteurs et histogrammes ; les jauges (requêtes en cours, limites) restent exactes."""
+    global _started_at
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _started_at = time.time()
+
+
+def tracked_request(service):
+    """
+    Décorateur des fonctions `async fetch(session, url, ...)` : requêtes en cours par hôte, latence par
+    service et issue de chaque requête (ok ou nom de l'exception).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(session, url, *args, **kwargs):
+            host = urlsplit(url).netloc or "?"
+            add_to_gauge(HTTP_IN_FLIGHT, 1, host)
+            started = time.perf_counter()
+            outcome = "ok"
+            try:
+                return await func(session, url, *args, **kwargs)
+            except BaseException as e:
+                outcome = type(e).__name__
+                raise
+            finally:
+                add_to_gauge(HTTP_IN_FLIGHT, -1, host)
+                observe(HTTP_LATENCY_MS, (time.perf_counter() - started) * 1000, service)
+                increment(HTTP_RESPONSES, f"{service}:{outcome}")
+        return wrapper
+    return decorator
+
+
+def process_memory_bytes():
+    """Mémoire résidente du processus (octets), ou None si indisponible."""
+    if psutil is not None:
+        try: return psutil.Process().memory_info().rss
+        except (OSError, psutil.Error): return None
+    if sys.platform == "win32":
+        return _windows_working_set()
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _windows_working_set():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+    try:
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize
+    except (AttributeError, OSError) as e:
+        logger.debug(f"Process memory unavailable: {e}")
+        return None
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Traces de performance par opération (analyse, plan de saut, mise à jour des données…).
+
+Une opération (operation() ou start_operation() / finish()) regroupe des étapes imbriquées (span(),
+@traced) chronométrées avec time.perf_counter(), et des compteurs (count()). Le nom d'une étape
+commence par sa catégorie : "journal.", "db.", "api.", "optimizer.", "ui.". Le bilan donne le temps
+de chaque catégorie (étapes concurrentes comptées une fois, sous-étapes comprises : db.update
+contient ses api.*), les étapes les plus lentes, les requêtes par service ("api.<service>") et le
+taux de succès des caches (compteurs "cache.<nom>.hit" / "cache.<nom>.miss") : une analyse lente
+se lit réseau, lecture ou calcul.
+
+À la fin de l'opération, ses étapes puis son bilan sont ajoutés en JSON lines à PERF_TRACE_FILE
+(à côté du log) par un thread d'écriture (finish() est souvent appelé depuis le thread Tk) et le
+bilan est résumé dans le log. L'opération courante suit le contexte
+(contextvars) : héritée par les tâches asyncio, pas par les threads (voir use()). Hors opération,
+span() et count() ne font rien. Les opérations en cours et les dernières terminées sont lisibles par
+active_operations() / recent_operations(), et chaque étape alimente aussi perf_metrics (panneau de performance).
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import perf_metrics
+import profiler_capture
+from constants import (
+    PERF_TRACE_FILE, PERF_TRACE_MAX_BYTES, PERF_TRACE_MAX_SPANS, PERF_TRACE_SLOWEST_STAGES, PERF_TRACE_RECENT_OPERATIONS,
+    PERF_TRACE_FLUSH_TIMEOUT_S
+)
+from operation_errors import OperationCancelledError
+
+logger = logging.getLogger(__name__)
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_CANCELLED = "cancelled"
+
+_current_operation = contextvars.ContextVar("perf_trace_operation", default=None)
+_current_span = contextvars.ContextVar("perf_trace_span", default=None)
+_write_queue = queue.Queue() # (étapes, en-tête) des opérations terminées, écrites par _writer_loop
+_writer_thread = None
+_writer_thread_lock = threading.Lock()
+_active_operations = weakref.WeakSet() # Opérations en cours et terminées récemment, pour le panneau de performance
+_recent_operations = deque(maxlen=PERF_TRACE_RECENT_OPERATIONS)
+_registry_lock = threading.Lock()
+
+
+def _category(stage_name):
+    return stage_name.split(".", 1)[0]
+
+
+def _covered_ms(intervals):
+    """Durée couverte par des intervalles (début, fin) qui peuvent se chevaucher (requêtes concurrentes)."""
+    total, current_start, current_end = 0.0, None, None
+    for start, end in sorted(intervals):
+        if current_end is not None and start <= current_end:
+            current_end = max(current_end, end)
+            continue
+        if current_end is not None:
+            total += current_end - current_start
+        current_start, current_end = start, end
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+class _NullSpan:
+    """Étape hors opération : aucun enregistrement."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("operation", "name", "attrs", "counters", "span_id", "parent_id", "start", "_token")
+
+    def __init__(self, operation, name, attrs):
+        self.operation = operation
+        self.name = name
+        self.attrs = attrs
+        self.counters = None
+
+    def set(self, **attrs):
+        """Ajoute des attributs à l'étape (code HTTP, nombre d'éléments…)."""
+        self.attrs.update(attrs)
+
+    def count(self, name, value=1):
+        self.counters = self.counters or {}
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None and parent.operation is self.operation else None
+        self.span_id = self.operation._next_span_id()
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        try:
+            _current_span.reset(self._token)
+        except ValueError: # Sortie dans un autre contexte (générateur asynchrone) : le parent reste celui du contexte courant
+            pass
+        record = {"type": "span", "trace": self.operation.trace_id, "id": self.span_id, "parent": self.parent_id, "name": self.name,
+                  "start_ms": round((self.start - self.operation.started) * 1000, 3), "duration_ms": round((end - self.start) * 1000, 3)}
+        if self.attrs:
+            record["attrs"] = self.attrs
+        if self.counters:
+            record["counters"] = self.counters
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        self.operation._add_span(record)
+        perf_metrics.observe(perf_metrics.STAGE_MS, record["duration_ms"], self.name)
+        return False
+
+
+class Operation:
+    """Trace d'une opération : étapes terminées, statistiques par étape, compteurs et bilan."""
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.status = None
+        self.spans = [] # Étapes terminées, dans l'ordre de fin (au plus PERF_TRACE_MAX_SPANS)
+        self.stages = {} # nom -> {"count", "total_ms", "max_ms", "errors"}, toutes étapes comprises
+        self.counters = {}
+        self.dropped_spans = 0
+        self._span_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.profile_capture = profiler_capture.claim(name) # Capture cProfile / tracemalloc armée depuis le panneau de performance
+        with _registry_lock:
+            _active_operations.add(self)
+
+    @property
+    def finished(self):
+        return self.status is not None
+
+    def _next_span_id(self):
+        with self._lock:
+            return next(self._span_ids)
+
+    def _add_span(self, record):
+        with self._lock:
+            stage = self.stages.get(record["name"])
+            if stage is None:
+                stage = self.stages[record["name"]] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0}
+            stage["count"] += 1
+            stage["total_ms"] += record["duration_ms"]
+            stage["max_ms"] = max(stage["max_ms"], record["duration_ms"])
+            if "error" in record:
+                stage["errors"] += 1
+            if len(self.spans) < PERF_TRACE_MAX_SPANS:
+                self.spans.append(record)
+            else:
+                self.dropped_spans += 1
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def leave_thread(self):
+        """Fin du thread de travail, avant de confier la suite (rendu, finish()) au thread Tk : arrête son profileur."""
+        if self.profile_capture is not None:
+            self.profile_capture.detach()
+
+    def summary(self):
+        """Bilan : temps par catégorie, étapes les plus lentes, requêtes par service, taux de succès des caches."""
+        with self._lock:
+            spans, stages, counters = list(self.spans), {name: dict(stage) for name, stage in self.stages.items()}, dict(self.counters)
+        intervals = {}
+        for record in spans:
+            intervals.setdefault(_category(record["name"]), []).append((record["start_ms"], record["start_ms"] + record["duration_ms"]))
+        slowest = sorted(stages.items(), key=lambda item: item[1]["total_ms"], reverse=True)[:PERF_TRACE_SLOWEST_STAGES]
+        requests = {}
+        for name, stage in stages.items():
+            if _category(name) == "api":
+                requests[name.split(".", 1)[-1]] = {"count": stage["count"], "errors": stage["errors"], "total_ms": round(stage["total_ms"], 3),
+                                                    "mean_ms": round(stage["total_ms"] / stage["count"], 3), "max_ms": round(stage["max_ms"], 3)}
+        caches = {}
+        for name, value in counters.items():
+            parts = name.split(".")
+            if len(parts) == 3 and parts[0] == "cache" and parts[2] in ("hit", "miss"):
+                cache = caches.setdefault(parts[1], {"hits": 0, "misses": 0})
+                cache["hits" if parts[2] == "hit" else "misses"] += value
+        for cache in caches.values():
+            cache["hit_rate"] = round(cache["hits"] / (cache["hits"] + cache["misses"]), 4)
+        duration_ms = self.duration_ms if self.duration_ms is not None else (time.perf_counter() - self.started) * 1000
+        return {
+            "duration_ms": round(duration_ms, 3),
+            "time_by_category_ms": {category: round(_covered_ms(values), 3) for category, values in sorted(intervals.items())},
+            "slowest_stages": [{"name": name, "count": stage["count"], "total_ms": round(stage["total_ms"], 3), "max_ms": round(stage["max_ms"], 3)}
+                               for name, stage in slowest],
+            "requests": requests,
+            "cache_hit_rates": caches,
+            "counters": {name: value for name, value in counters.items() if not name.startswith("cache.")},
+            "dropped_spans": self.dropped_spans,
+        }
+
+    def finish(self, status=STATUS_OK):
+        """Termine l'opération (une seule fois) : fait écrire la trace en arrière-plan et résume le bilan dans le log. Retourne le bilan."""
+        with self._lock:
+            if self.status is not None:
+                return None
+            self.status = status
+            self.duration_ms = (time.perf_counter() - self.started) * 1000
+            spans = list(self.spans) # Copie : une étape encore ouverte peut se terminer pendant l'écriture
+        if self.profile_capture is not None:
+            self.profile_capture.stop(self.trace_id, status)
+        summary = self.summary()
+        with _registry_lock:
+            _active_operations.discard(self)
+            _recent_operations.append({"name": self.name, "trace": self.trace_id, "startedAt": self.started_at,
+                                       "status": status, "attrs": self.attrs, "summary": summary})
+        _schedule_trace_write(spans, {"type": "operation", "trace": self.trace_id, "name": self.name, "startedAt": self.started_at,
+                                      "status": status, "attrs": self.attrs, "summary": summary})
+        logger.info(format_summary(self.name, status, summary))
+        return summary
+
+
+def _write_trace(spans, header):
+    try:
+        if os.path.exists(PERF_TRACE_FILE) and os.path.getsize(PERF_TRACE_FILE) > PERF_TRACE_MAX_BYTES:
+            os.replace(PERF_TRACE_FILE, PERF_TRACE_FILE + ".1")
+        with open(PERF_TRACE_FILE, "a", encoding="utf-8") as f:
+            for record in spans:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            f.write(json.dumps(header, ensure_ascii=False, default=str) + "\n") # Bilan en dernier : ligne complète = trace complète
+    except OSError as e:
+        logger.error(f"Could not write the performance trace to {PERF_TRACE_FILE}: {e}")
+
+
+def _writer_loop():
+    while True:
+        spans, header = _write_queue.get()
+        try:
+            _write_trace(spans, header)
+        except Exception:
+            logger.exception(f"Could not write the performance trace {header['trace']}.")
+        finally:
+            _write_queue.task_done()
+
+
+def _schedule_trace_write(spans, header):
+    """Met la trace en file pour le thread d'écriture (un seul écrivain : pas de verrou sur le fichier)."""
+    global _writer_thread
+    with _writer_thread_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, name="PerfTraceWriter", daemon=True)
+            _writer_thread.start()
+    _write_queue.put((spans, header))
+
+
+def flush_pending_traces(timeout=PERF_TRACE_FLUSH_TIMEOUT_S):
+    """Attend l'écriture des traces en file (appelé à la fermeture). Retourne False si le délai est dépassé."""
+    with _write_queue.all_tasks_done:
+        done = _write_queue.all_tasks_done.wait_for(lambda: not _write_queue.unfinished_tasks, timeout)
+    if not done:
+        logger.warning(f"Performance traces still pending after {timeout}s: {_write_queue.unfinished_tasks}")
+    return done
+
+
+atexit.register(flush_pending_traces)
+
+
+def format_summary(name, status, summary):
+    """Bilan sur une ligne, ex. 'Performance [analysis] 2.31s (ok): api 1.80s, db 1.95s, … | requests: ardent 42 (1 errors) | …'."""
+    parts = [f"Performance [{name}] {summary['duration_ms'] / 1000:.2f}s ({status})"]
+    if summary["time_by_category_ms"]:
+        parts.append(", ".join(f"{category} {ms / 1000:.2f}s" for category, ms in summary["time_by_category_ms"].items()))
+    if summary["requests"]:
+        parts.append("requests: " + ", ".join(f"{service} {stats['count']} ({stats['errors']} errors, mean {stats['mean_ms']:.0f} ms)"
+                                              for service, stats in summary["requests"].items()))
+    if summary["cache_hit_rates"]:
+        parts.append("caches: " + ", ".join(f"{cache} {stats['hit_rate']:.0%} of {stats['hits'] + stats['misses']}"
+                                            for cache, stats in summary["cache_hit_rates"].items()))
+    if summary["slowest_stages"]:
+        parts.append("slowest: " + ", ".join(f"{stage['name']} {stage['total_ms'] / 1000:.2f}s" for stage in summary["slowest_stages"][:3]))
+    return " | ".join(parts)
+
+
+def current_operation():
+    return _current_operation.get()
+
+
+def active_operations():
+    """Opérations en cours : [{"name", "trace", "startedAt", "attrs", "summary"}] (bilan partiel), plus anciennes en premier."""
+    with _registry_lock:
+        operations = sorted(_active_operations, key=lambda op: op.started)
+    return [{"name": op.name, "trace": op.trace_id, "startedAt": op.started_at, "status": None, "attrs": op.attrs, "summary": op.summary()}
+            for op in operations if not op.finished]
+
+
+def recent_operations():
+    """Dernières opérations terminées (au plus PERF_TRACE_RECENT_OPERATIONS), plus récentes en premier."""
+    with _registry_lock:
+        return list(reversed(_recent_operations))
+
+
+def start_operation(name, **attrs):
+    """Démarre une opération dans le contexte courant (thread de travail) ; la terminer par finish()."""
+    operation = Operation(name, attrs)
+    _current_operation.set(operation)
+    _current_span.set(None)
+    return operation
+
+
+@contextmanager
+def operation(name, **attrs):
+    """Opération limitée au bloc `with` ; son statut suit l'issue du bloc (ok, cancelled, error)."""
+    op = Operation(name, attrs)
+    operation_token, span_token = _current_operation.set(op), _current_span.set(None)
+    status = STATUS_OK
+    try:
+        yield op
+    except OperationCancelledError:
+        status = STATUS_CANCELLED
+        raise
+    except BaseException:
+        status = STATUS_ERROR
+        raise
+    finally:
+        _current_operation.reset(operation_token)
+        _current_span.reset(span_token)
+        op.finish(status)
+
+
+@contextmanager
+def use(op):
+    """Rattache les étapes du bloc à `op` (ex. rendu Tk d'une opération lancée dans un thread de travail), profil compris."""
+    operation_token, span_token = _current_operation.set(op), _current_span.set(None)
+    try:
+        if op is not None and op.profile_capture is not None:
+            with op.profile_capture.attach():
+                yield op
+        else:
+            yield op
+    finally:
+        _current_operation.reset(operation_token)
+        _current_span.reset(span_token)
+
+
+def span(name, **attrs):
+    """Étape chronométrée de l'opération courante (`with perf_trace.span("db.update", system=...)`)."""
+    op = _current_operation.get()
+    if op is None or op.status is not None:
+        return _NULL_SPAN
+    return _Span(op, name, attrs)
+
+
+def annotate(**attrs):
+    """Ajoute des attributs à l'étape en cours, s'il y en a une."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def count(name, value=1):
+    """Incrémente un compteur de l'opération courante (et de l'étape en cours)."""
+    op = _current_operation.get()
+    if op is None or op.status is not None:
+        return
+    op.count(name, value)
+    current = _current_span.get()
+    if current is not None and current.operation is op:
+        current.count(name, value)
+
+
+def count_cache(cache_name, hit):
+    """Succès ou échec d'un cache (compteurs cache.<nom>.hit / cache.<nom>.miss du bilan)."""
+    count(f"cache.{cache_name}.{'hit' if hit else 'miss'}")
+    perf_metrics.record_cache(cache_name, hit) # Compté aussi hors opération (panneau de performance)
+
+
+def traced(name):
+    """Décorateur : chaque appel de la fonction (synchrone ou coroutine) est une étape `name`."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def read_traces(path=PERF_TRACE_FILE):
+    """Opérations du fichier de traces : liste de (en-tête avec bilan, étapes), les plus anciennes d'abord."""
+    spans_by_trace, operations = {}, []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError: # Écriture interrompue
+                continue
+            if record.get("type") == "span":
+                spans_by_trace.setdefault(record["trace"], []).append(record)
+            elif record.get("type") == "operation":
+                operations.append((record, spans_by_trace.pop(record["trace"], [])))
+    return operations
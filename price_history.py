@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Historique des prix de marché (append-only, compressé) indexé par (système, station, marchandise).
+
+Chaque jour UTC a sa partition `PRICE_HISTORY_DIR/prices-AAAA-MM-JJ.gz`. Chaque ingestion y ajoute
+un membre gzip contenant un lot en colonnes (une liste par champ), regroupé par heure d'observation.
+Un fichier gzip multi-membres reste lisible d'un seul tenant, ce qui permet l'ajout sans réécriture.
+Un membre tronqué par un arrêt brutal est retiré avant l'ajout suivant (sinon les membres écrits après
+lui seraient illisibles), et la file d'ingestion est vidée à la fermeture.
+Les partitions plus anciennes que la durée de rétention sont supprimées. Un lot nommé (batch_id) écrit
+deux fois (import en masse repris après un arrêt) n'est lu qu'une fois, dans sa version la plus complète.
+Alimenté par les téléchargements Ardent (départ + marché local), Market.json et les imports en masse.
+"""
+import atexit
+import gzip
+import json
+import math
+import os
+import queue
+import logging
+import statistics
+import threading
+import time
+import zlib
+from datetime import datetime, timezone, timedelta
+
+from constants import PRICE_HISTORY_DIR, PRICE_HISTORY_RETENTION_DAYS, PRICE_HISTORY_FLUSH_TIMEOUT_S
+import journal_watcher
+
+logger = logging.getLogger(__name__)
+
+HISTORY_COLUMNS = ("t", "system", "station", "commodity", "buy", "sell", "stock", "demand")
+
+_ingest_queue = queue.Queue()
+_ingest_thread = None
+_ingest_thread_lock = threading.Lock()
+_write_lock = threading.RLock() # Partitions, _verified_sizes et _last_retention_day (ingestion + import en masse)
+_last_retention_day = None
+_verified_sizes = {} # partition -> taille après notre dernier ajout complet (pas de revérification si inchangée)
+
+
+def _partition_path(day):
+    return os.path.join(PRICE_HISTORY_DIR, f"prices-{day.isoformat()}.gz")
+
+
+def _commodity_key(name):
+    """Nom interne en minuscules : '$gold_name;' (Market.json) et 'gold' (Ardent) donnent 'gold'."""
+    if not name:
+        return None
+    name = name.strip().lower()
+    if name.startswith("$") and name.endswith("_name;"):
+        name = name[1:-len("_name;")]
+    return name
+
+
+def _parse_timestamp(value):
+    if not value:
+        return int(time.time())
+    try:
+        return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return int(time.time())
+
+
+# ---- Conversion des sources en lignes (t, system, station, commodity, buy, sell, stock, demand) ----
+
+def rows_from_local_market(local_market_data, systems=None):
+    """
+    Lignes d'historique depuis la structure LOCAL_SELLERS (sells_to_player / buys_from_player).
+    `systems` limite aux systèmes réellement téléchargés (les systèmes repris d'une région en cache
+    ne sont pas des nouvelles observations). Date d'observation : fetchedAt du système, sinon updatedAt.
+    """
+    default_observed_at = _parse_timestamp(local_market_data.get("updatedAt"))
+    systems_info = local_market_data.get("systems", {})
+    rows = []
+    for system_name, system_content in local_market_data.get("station_markets", {}).items():
+        if systems is not None and system_name not in systems:
+            continue
+        fetched_at = systems_info.get(system_name, {}).get("fetchedAt")
+        observed_at = _parse_timestamp(fetched_at) if fetched_at else default_observed_at
+        for station_name, station_data in system_content.get("stations_data", {}).items():
+            merged = {} # commodité -> [buy, sell, stock, demand]
+            for item in station_data.get("sells_to_player", []):
+                key = _commodity_key(item.get("commodityName"))
+                if key:
+                    entry = merged.setdefault(key, [0, 0, 0, 0])
+                    entry[0], entry[2] = item.get("price", 0), item.get("stock", 0)
+            for item in station_data.get("buys_from_player", []):
+                key = _commodity_key(item.get("commodityName"))
+                if key:
+                    entry = merged.setdefault(key, [0, 0, 0, 0])
+                    entry[1], entry[3] = item.get("price", 0), item.get("demand", 0)
+            rows.extend((observed_at, system_name, station_name, key, *values) for key, values in merged.items())
+    return rows
+
+
+def rows_from_departure_market(departure_data):
+    observed_at = _parse_timestamp(departure_data.get("updatedAt"))
+    return [(observed_at, departure_data.get("system"), departure_data.get("station"), _commodity_key(offer.get("commodityName")),
+             offer.get("buyPrice", 0), offer.get("sellPrice", 0), offer.get("stock", 0), offer.get("demand", 0))
+            for offer in departure_data.get("offers", []) if offer.get("commodityName")]
+
+
+def rows_from_market_json(market_data):
+    """Lignes depuis le Market.json écrit par le jeu à l'ouverture du marché d'une station."""
+    observed_at = _parse_timestamp(market_data.get("timestamp"))
+    return [(observed_at, market_data.get("StarSystem"), market_data.get("StationName"), _commodity_key(item.get("Name")),
+             item.get("BuyPrice", 0), item.get("SellPrice", 0), item.get("Stock", 0), item.get("Demand", 0))
+            for item in market_data.get("Items", []) if item.get("Name")]
+
+
+# ---- Écriture ----
+
+def _complete_members_size(path):
+    """Taille des membres gzip complets en tête du fichier (lu par blocs) ; une fin tronquée est exclue."""
+    complete_size, position = 0, 0
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) # Un membre gzip
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(1024 * 1024)
+            if not data:
+                return complete_size
+            while data:
+                try:
+                    decompressor.decompress(data)
+                except zlib.error:
+                    return complete_size
+                if not decompressor.eof:
+                    position += len(data)
+                    break
+                position += len(data) - len(decompressor.unused_data)
+                complete_size = position
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def _repair_partition(path):
+    """Retire un membre final incomplet (écriture interrompue) avant d'ajouter à la partition."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    if _verified_sizes.get(path) == size:
+        return
+    complete_size = _complete_members_size(path)
+    if complete_size < size:
+        logger.warning(f"Price history: partition {path} ends with a truncated member ({size - complete_size} bytes), removing it.")
+        with open(path, "r+b") as f:
+            f.truncate(complete_size)
+    _verified_sizes[path] = complete_size
+
+
+def append_rows(rows, source="unknown", batch_id=None):
+    """
+    Ajoute des lignes à l'historique (synchrone). Une partition par jour, un lot en colonnes par heure.
+    `batch_id` : identifiant stable d'un lot qui peut être rejoué (voir _latest_batches).
+    """
+    if not rows:
+        return 0
+    os.makedirs(PRICE_HISTORY_DIR, exist_ok=True)
+    batches = {} # (jour, heure) -> colonnes
+    for row in rows:
+        observed = datetime.fromtimestamp(row[0], timezone.utc)
+        columns = batches.setdefault((observed.date(), observed.hour), {col: [] for col in HISTORY_COLUMNS})
+        for col, value in zip(HISTORY_COLUMNS, row):
+            columns[col].append(value)
+    with _write_lock: # Un seul écrivain à la fois, sinon la réparation tronque le membre d'un autre thread
+        for (day, hour), columns in batches.items():
+            member_data = {"hour": hour, "source": source, "columns": columns}
+            if batch_id is not None:
+                member_data["batch"] = batch_id
+            member = json.dumps(member_data, separators=(",", ":"))
+            path = _partition_path(day)
+            _repair_partition(path)
+            _verified_sizes.pop(path, None) # Revérifiée au prochain ajout si l'écriture échoue
+            with gzip.open(path, "at", encoding="utf-8") as f: # Nouveau membre gzip en fin de fichier
+                f.write(member + "\n")
+            _verified_sizes[path] = os.path.getsize(path)
+        logger.info(f"Price history: {len(rows)} samples appended from {source}.")
+        apply_retention()
+    return len(rows)
+
+
+def _ingest_loop():
+    while True:
+        rows, source = _ingest_queue.get()
+        try:
+            append_rows(rows, source)
+        except Exception:
+            logger.exception(f"Price history: failed to append samples from {source}.")
+        finally:
+            _ingest_queue.task_done()
+
+
+def record_rows_async(rows, source):
+    """Met les lignes en file pour le thread d'ingestion (ne bloque pas le téléchargement)."""
+    global _ingest_thread
+    if not rows:
+        return
+    with _ingest_thread_lock:
+        if _ingest_thread is None or not _ingest_thread.is_alive():
+            _ingest_thread = threading.Thread(target=_ingest_loop, name="PriceHistoryIngest", daemon=True)
+            _ingest_thread.start()
+    _ingest_queue.put((rows, source))
+
+
+def flush_pending_rows(timeout=PRICE_HISTORY_FLUSH_TIMEOUT_S):
+    """Attend que la file d'ingestion soit écrite (appelé à la fermeture). Retourne False si le délai est dépassé."""
+    with _ingest_queue.all_tasks_done:
+        done = _ingest_queue.all_tasks_done.wait_for(lambda: not _ingest_queue.unfinished_tasks, timeout)
+    if not done:
+        logger.warning(f"Price history: {_ingest_queue.unfinished_tasks} batches still pending after {timeout}s.")
+    return done
+
+
+atexit.register(flush_pending_rows)
+
+
+def record_local_market(local_market_data, systems=None):
+    record_rows_async(rows_from_local_market(local_market_data, systems), "ardent_local")
+
+
+def record_departure_market(departure_data):
+    record_rows_async(rows_from_departure_market(departure_data), "ardent_departure")
+
+
+def apply_retention(retention_days=PRICE_HISTORY_RETENTION_DAYS):
+    """Supprime les partitions plus anciennes que la rétention (au plus une fois par jour)."""
+    global _last_retention_day
+    today = datetime.now(timezone.utc).date()
+    with _write_lock:
+        if _last_retention_day == today or not os.path.isdir(PRICE_HISTORY_DIR):
+            return
+        _last_retention_day = today
+        cutoff = today - timedelta(days=retention_days)
+        for fname in os.listdir(PRICE_HISTORY_DIR):
+            if not (fname.startswith("prices-") and fname.endswith(".gz")):
+                continue
+            try:
+                day = datetime.strptime(fname[len("prices-"):-len(".gz")], "%Y-%m-%d").date()
+            except ValueError:
+                continue
+            if day < cutoff:
+                path = os.path.join(PRICE_HISTORY_DIR, fname)
+                try:
+                    os.remove(path)
+                    _verified_sizes.pop(path, None)
+                    logger.info(f"Price history: partition {fname} removed (retention {retention_days} days).")
+                except OSError as e:
+                    logger.warning(f"Price history: could not remove {fname}: {e}")
+
+
+# ---- Lecture / analyse ----
+
+def _latest_batches(members):
+    """
+    Retire les lots rejoués : un lot nommé repart toujours du même point, ses lignes d'une heure donnée
+    sont donc un préfixe l'une de l'autre ; on garde la plus longue.
+    """
+    best = {} # (lot, heure) -> index du membre gardé
+    for index, member in enumerate(members):
+        if member.get("batch") is None:
+            continue
+        key = (member["batch"], member.get("hour"))
+        if key not in best or len(member["columns"]["t"]) > len(members[best[key]]["columns"]["t"]):
+            best[key] = index
+    kept = set(best.values())
+    return [member for index, member in enumerate(members) if member.get("batch") is None or index in kept]
+
+
+def load_samples(system=None, station=None, commodity=None, since_days=30):
+    """Échantillons (dicts) filtrés, triés par date d'observation, sur les `since_days` derniers jours."""
+    commodity = _commodity_key(commodity) if commodity else None
+    today = datetime.now(timezone.utc).date()
+    since_ts = time.time() - since_days * 86400
+    samples = []
+    for offset in range(since_days, -1, -1):
+        path = _partition_path(today - timedelta(days=offset))
+        if not os.path.exists(path):
+            continue
+        members = []
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    member = json.loads(line)
+                    member["columns"]["t"] # Membre incomplet : KeyError, comme un membre tronqué
+                    members.append(member)
+        except (OSError, EOFError, ValueError, KeyError) as e:
+            logger.warning(f"Price history: partition {path} unreadable or truncated ({e}), skipping remaining data.")
+        for member in _latest_batches(members):
+            columns = member["columns"]
+            for i in range(len(columns["t"])):
+                if (station and columns["station"][i] != station) or (system and columns["system"][i] != system) or \
+                   (commodity and columns["commodity"][i] != commodity) or columns["t"][i] < since_ts:
+                    continue
+                samples.append({col: columns[col][i] for col in HISTORY_COLUMNS})
+    samples.sort(key=lambda sample: sample["t"])
+    return samples
+
+
+def price_series(system, station, commodity, side="sell", since_days=30):
+    """[(timestamp, prix)] pour un côté du marché : 'buy' (le joueur achète) ou 'sell' (le joueur vend)."""
+    return [(sample["t"], sample[side]) for sample in load_samples(system, station, commodity, since_days) if sample[side]]
+
+
+def price_stats(system, station, commodity, side="sell", since_days=30):
+    """
+    Statistiques de prix : moyenne, min, max, écart-type, volatilité (écart-type / moyenne)
+    et tendance (pente en CR/jour, moindres carrés). None s'il n'y a pas d'échantillon.
+    """
+    series = price_series(system, station, commodity, side, since_days)
+    if not series:
+        return None
+    prices = [price for _t, price in series]
+    mean_price = statistics.fmean(prices)
+    stdev = statistics.pstdev(prices) if len(prices) > 1 else 0.0
+    trend_per_day = 0.0
+    if len(series) > 1:
+        days = [t / 86400 for t, _p in series]
+        mean_day = statistics.fmean(days)
+        variance_days = sum((d - mean_day) ** 2 for d in days)
+        if variance_days > 0:
+            trend_per_day = sum((d - mean_day) * (p - mean_price) for d, p in zip(days, prices)) / variance_days
+    return {
+        "count": len(prices), "mean": mean_price, "min": min(prices), "max": max(prices), "stdev": stdev,
+        "volatility": stdev / mean_price if mean_price else math.inf, "trend_per_day": trend_per_day,
+        "first_seen": series[0][0], "last_seen": series[-1][0]
+    }
+
+
+def price_stability_score(system, station, commodity, side="sell", since_days=30):
+    """Score de stabilité entre 0 (très volatil) et 1 (stable), ou None sans historique."""
+    stats = price_stats(system, station, commodity, side, since_days)
+    if not stats or stats["count"] < 2:
+        return None
+    return 1.0 / (1.0 + stats["volatility"] * 10)
+
+
+# ---- Market.json (journal) ----
+
+def _on_journal_update(update_type, event_data):
+    """Événement 'Market' du journal : le jeu vient d'écrire Market.json dans le répertoire des journaux."""
+    journal_dir = journal_watcher._resolve_journal_dir()
+    if not journal_dir:
+        return
+    market_json_path = os.path.join(journal_dir, "Market.json")
+    try:
+        with open(market_json_path, "r", encoding="utf-8") as f:
+            market_data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Price history: could not read {market_json_path}: {e}")
+        return
+    if market_data.get("MarketID") != event_data.get("MarketID"):
+        logger.debug("Price history: Market.json does not match the journal event (not yet rewritten), skipping.")
+        return
+    record_rows_async(rows_from_market_json(market_data), "market_json")
+
+
+def start_market_json_ingest():
+    """Alimente l'historique à chaque ouverture du marché en jeu (événement 'Market' + Market.json)."""
+    journal_watcher.subscribe(_on_journal_update, [journal_watcher.UPDATE_MARKET])
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Capture de profil à la demande : la prochaine opération profilable (analyse, plan de saut, mise à jour
+des données) est exécutée sous cProfile et tracemalloc, puis un fichier .pstats et un rapport des plus
+grosses allocations sont écrits à côté du log.
+
+arm() prépare une seule capture ; perf_trace la démarre à la création de l'opération suivante (dans son
+thread de travail : toutes les tâches asyncio de sa boucle sont couvertes), l'étend aux passages dans
+le thread Tk rattachés par perf_trace.use() (rendu des résultats) et l'arrête à finish(). Chaque thread
+a son propre profileur, fusionnés à la fin. À partir de Python 3.12, cProfile suit tous les threads du
+processus ; avant, seuls les threads rattachés à l'opération sont profilés, et chaque profileur doit être
+arrêté dans son thread (detach(), avant de confier la fin de l'opération au thread Tk). tracemalloc couvre
+tous les threads. Comparaison des instantanés, fusion des profils et écriture des fichiers se font dans
+un thread d'arrière-plan, pas dans celui qui termine l'opération (souvent le thread Tk).
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from constants import LOG_FILE, PROFILER_FILE_PREFIX, PROFILER_TRACEMALLOC_FRAMES, PROFILER_TOP_ALLOCATIONS
+
+logger = logging.getLogger(__name__)
+
+PROFILED_OPERATIONS = ("analysis", "hop_plan", "db_refresh", "shipyard_refresh", "outfitting_refresh")
+
+_lock = threading.Lock()
+_armed = False
+_last_result = None # {"operation", "status", "pstats", "report", "finishedAt"} de la dernière capture
+
+
+def arm():
+    """Profile la prochaine opération de PROFILED_OPERATIONS (une seule fois)."""
+    global _armed
+    with _lock:
+        _armed = True
+    logger.info(f"Profiler armed for the next operation ({', '.join(PROFILED_OPERATIONS)}).")
+
+
+def disarm():
+    global _armed
+    with _lock:
+        _armed = False
+
+
+def is_armed():
+    return _armed
+
+
+def last_result():
+    return _last_result
+
+
+def claim(operation_name):
+    """Appelée à la création d'une opération : démarre et retourne une capture si le profileur est armé, sinon None."""
+    global _armed
+    if not _armed or operation_name not in PROFILED_OPERATIONS:
+        return None
+    with _lock:
+        if not _armed:
+            return None
+        _armed = False
+    capture = Capture(operation_name)
+    capture.start()
+    return capture
+
+
+class Capture:
+    """Profileurs cProfile par thread et instantanés tracemalloc d'une opération."""
+
+    def __init__(self, operation_name):
+        self.operation_name = operation_name
+        self.profiles = {} # ident du thread -> (nom du thread, cProfile.Profile)
+        self.enabled_threads = set()
+        self.stopped = False
+        self.started_tracemalloc = False
+        self.baseline = None
+        self.started = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILER_TRACEMALLOC_FRAMES)
+            self.started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self.baseline = tracemalloc.take_snapshot()
+        self.started = time.perf_counter()
+        self._enable_in_current_thread()
+        logger.info(f"Profiling operation '{self.operation_name}'.")
+
+    def _enable_in_current_thread(self):
+        """Active un profileur pour le thread courant ; False si déjà actif ou couvert par un profileur global (3.12+)."""
+        ident = threading.get_ident()
+        with self._lock:
+            if self.stopped or ident in self.enabled_threads:
+                return False
+            _thread_name, profile = self.profiles.get(ident) or (None, cProfile.Profile()) # Réactivé : les mesures s'ajoutent
+            try:
+                profile.enable()
+            except ValueError: # Python 3.12+ : un seul profileur actif, qui suit déjà tous les threads
+                return False
+            self.profiles[ident] = (threading.current_thread().name, profile)
+            self.enabled_threads.add(ident)
+            return True
+
+    def detach(self):
+        """Arrête le profileur du thread courant s'il est actif (avant 3.12, un autre thread ne peut pas l'arrêter)."""
+        ident = threading.get_ident()
+        with self._lock:
+            if ident not in self.enabled_threads:
+                return
+            self.enabled_threads.discard(ident)
+            profile = self.profiles[ident][1]
+        profile.disable()
+
+    @contextmanager
+    def attach(self):
+        """Profile le bloc dans le thread courant (ex. rendu Tk d'une opération lancée dans un thread de travail)."""
+        enabled_here = self._enable_in_current_thread()
+        try:
+            yield self
+        finally:
+            if enabled_here:
+                self.detach()
+
+    def stop(self, trace_id, status):
+        """
+        Arrête la capture (instantané mémoire de fin compris) et confie l'écriture du .pstats et du rapport
+        d'allocations à un thread d'arrière-plan ; le résultat est lu ensuite par last_result().
+        """
+        self.detach()
+        with self._lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            still_enabled = set(self.enabled_threads)
+            self.enabled_threads.clear()
+            profiles = [(name, profile) for ident, (name, profile) in self.profiles.items()
+                        if ident not in still_enabled or sys.version_info >= (3, 12)]
+        if sys.version_info >= (3, 12):
+            for ident in still_enabled: # Profileur global : arrêtable depuis n'importe quel thread
+                self.profiles[ident][1].disable()
+        elif still_enabled:
+            logger.warning(f"Profile of '{self.operation_name}': {len(still_enabled)} thread(s) not detached before the end of the operation, left out.")
+        duration_s = time.perf_counter() - self.started
+        snapshot = tracemalloc.take_snapshot()
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        threading.Thread(target=self._write_results, args=(trace_id, status, duration_s, profiles, snapshot, current_bytes, peak_bytes),
+                         name="ProfilerCaptureWriter", daemon=True).start()
+
+    def _write_results(self, trace_id, status, duration_s, profiles, snapshot, current_bytes, peak_bytes):
+        global _last_result
+        base_path = os.path.join(os.path.dirname(os.path.abspath(LOG_FILE)),
+                                 f"{PROFILER_FILE_PREFIX}_{self.operation_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{trace_id}")
+        pstats_path, report_path = base_path + ".pstats", base_path + "_allocations.txt"
+        try:
+            stats = None
+            for _thread_name, profile in profiles:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            if stats is not None:
+                stats.dump_stats(pstats_path)
+            else:
+                pstats_path = None
+            with open(report_path, "w", encoding="utf-8") as f:
+                f.write(_allocation_report(self.operation_name, trace_id, status, duration_s, [name for name, _ in profiles],
+                                           snapshot, self.baseline, current_bytes, peak_bytes, stats))
+        except OSError as e:
+            logger.error(f"Could not write the profile of '{self.operation_name}' to {base_path}*: {e}")
+            return
+        _last_result = {"operation": self.operation_name, "status": status, "pstats": pstats_path, "report": report_path,
+                        "finishedAt": datetime.now().isoformat()}
+        logger.info(f"Profile of '{self.operation_name}' ({status}, {duration_s:.2f}s) saved: {pstats_path}, {report_path}")
+
+
+def _allocation_report(operation_name, trace_id, status, duration_s, thread_names, snapshot, baseline, current_bytes, peak_bytes, stats):
+    ignored = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+               tracemalloc.Filter(False, "<unknown>"))
+    snapshot, baseline = snapshot.filter_traces(ignored), baseline.filter_traces(ignored)
+    lines = [f"Operation: {operation_name} (trace {trace_id}), status: {status}, duration: {duration_s:.2f}s",
+             f"Profiled threads: {'all (global profiler)' if sys.version_info >= (3, 12) else ', '.join(thread_names)}",
+             f"Traced memory at the end: {current_bytes / 1024 / 1024:.1f} MB, peak during the operation: {peak_bytes / 1024 / 1024:.1f} MB",
+             "", f"Top {PROFILER_TOP_ALLOCATIONS} allocation sites by growth during the operation:"]
+    for stat in snapshot.compare_to(baseline, "lineno")[:PROFILER_TOP_ALLOCATIONS]:
+        lines.append(f"  {stat}")
+    lines += ["", f"Top {PROFILER_TOP_ALLOCATIONS} live allocation sites at the end:"]
+    for stat in snapshot.statistics("lineno")[:PROFILER_TOP_ALLOCATIONS]:
+        lines.append(f"  {stat}")
+    if stats is not None: # Aperçu lisible sans outil ; le détail est dans le .pstats (snakeviz, pstats…)
+        output = io.StringIO()
+        stats.stream = output
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILER_TOP_ALLOCATIONS)
+        lines += ["", "Top functions by cumulative time:", output.getvalue()]
+    return "\n".join(lines) + "\n"
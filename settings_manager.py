@@ -12,13 +12,17 @@ from constants import (
     DEFAULT_MAX_GENERAL_TRADE_ROUTES,
     DEFAULT_TOP_N_IMPORTS_FILTER,
     DEFAULT_LANGUAGE, # NOUVEAU
+    DEFAULT_MARKET_REGION_CACHE_BUDGET_MB,
+    DEFAULT_EDDN_LISTENER_ENABLED, DEFAULT_EDDN_RELAY_URL,
     KEY_RADIUS, KEY_MAX_AGE_DAYS, KEY_MAX_STATION_DISTANCE_LS,
     KEY_INCLUDE_PLANETARY, KEY_INCLUDE_FLEET_CARRIERS,
     KEY_CUSTOM_JOURNAL_DIR, KEY_CUSTOM_PAD_SIZES, KEY_SORT_OPTION,
     KEY_NUM_JOURNAL_FILES_MISSIONS, KEY_MAX_STATIONS_FOR_TRADE_LOOPS,
     KEY_MAX_GENERAL_TRADE_ROUTES,
     KEY_TOP_N_IMPORTS_FILTER,
-    KEY_LANGUAGE # NOUVEAU
+    KEY_LANGUAGE, # NOUVEAU
+    KEY_MARKET_REGION_CACHE_BUDGET_MB,
+    KEY_EDDN_LISTENER_ENABLED, KEY_EDDN_RELAY_URL
 )
 
 logger = logging.getLogger(__name__)
@@ -62,6 +66,9 @@ def load_settings():
     max_general_routes = settings_data.get(KEY_MAX_GENERAL_TRADE_ROUTES, DEFAULT_MAX_GENERAL_TRADE_ROUTES)
     top_n_imports_filter = settings_data.get(KEY_TOP_N_IMPORTS_FILTER, DEFAULT_TOP_N_IMPORTS_FILTER)
     language_setting = settings_data.get(KEY_LANGUAGE, DEFAULT_LANGUAGE) # NOUVEAU
+    region_cache_budget_mb = settings_data.get(KEY_MARKET_REGION_CACHE_BUDGET_MB, DEFAULT_MARKET_REGION_CACHE_BUDGET_MB)
+    eddn_listener_enabled = settings_data.get(KEY_EDDN_LISTENER_ENABLED, DEFAULT_EDDN_LISTENER_ENABLED)
+    eddn_relay_url = settings_data.get(KEY_EDDN_RELAY_URL, DEFAULT_EDDN_RELAY_URL)
 
     try: radius = float(radius); assert radius > 0
     except: radius = DEFAULT_RADIUS; logger.warning(f"Invalid radius, using default: {DEFAULT_RADIUS}")
@@ -81,6 +88,10 @@ def load_settings():
     except: max_general_routes = DEFAULT_MAX_GENERAL_TRADE_ROUTES; logger.warning(f"Invalid max_general_routes, using default: {DEFAULT_MAX_GENERAL_TRADE_ROUTES}")
     try: top_n_imports_filter = int(top_n_imports_filter); assert top_n_imports_filter >= 0
     except: top_n_imports_filter = DEFAULT_TOP_N_IMPORTS_FILTER; logger.warning(f"Invalid top_n_imports_filter, using default: {DEFAULT_TOP_N_IMPORTS_FILTER}")
+    try: region_cache_budget_mb = float(region_cache_budget_mb); assert region_cache_budget_mb >= 0
+    except: region_cache_budget_mb = DEFAULT_MARKET_REGION_CACHE_BUDGET_MB; logger.warning(f"Invalid market_region_cache_budget_mb, using default: {DEFAULT_MARKET_REGION_CACHE_BUDGET_MB}")
+    if not isinstance(eddn_listener_enabled, bool): eddn_listener_enabled = DEFAULT_EDDN_LISTENER_ENABLED; logger.warning(f"Invalid eddn_listener_enabled, using default: {DEFAULT_EDDN_LISTENER_ENABLED}")
+    if not isinstance(eddn_relay_url, str) or not eddn_relay_url: eddn_relay_url = DEFAULT_EDDN_RELAY_URL; logger.warning(f"Invalid eddn_relay_url, using default: {DEFAULT_EDDN_RELAY_URL}")
 
     # NOUVEAU: Validation de la langue
     import language as lang_module # Pour accéder aux langues disponibles
@@ -97,7 +108,9 @@ def load_settings():
         KEY_MAX_STATIONS_FOR_TRADE_LOOPS: max_stations_loops,
         KEY_MAX_GENERAL_TRADE_ROUTES: max_general_routes,
         KEY_TOP_N_IMPORTS_FILTER: top_n_imports_filter,
-        KEY_LANGUAGE: language_setting # NOUVEAU
+        KEY_LANGUAGE: language_setting, # NOUVEAU
+        KEY_MARKET_REGION_CACHE_BUDGET_MB: region_cache_budget_mb,
+        KEY_EDDN_LISTENER_ENABLED: eddn_listener_enabled, KEY_EDDN_RELAY_URL: eddn_relay_url
     }
     CUSTOM_SHIP_PAD_SIZES.clear(); CUSTOM_SHIP_PAD_SIZES.update(APP_SETTINGS[KEY_CUSTOM_PAD_SIZES])
     logger.debug(f"Final loaded APP_SETTINGS: {APP_SETTINGS}"); return APP_SETTINGS
@@ -1,8 +1,6 @@
 #!/usr/bin/env python3
 import asyncio
 import aiohttp
-import json
-import os
 import logging
 from datetime import datetime, timezone
 import threading
@@ -12,10 +10,14 @@ from constants import (
     CONCURRENCY_LIMIT # Assurez-vous qu'elle est définie dans constants.py
 )
 import edsm_api_handler
+import dataset_manager
+import perf_metrics
+import perf_trace
 from edsm_api_handler import OperationCancelledError
 
 logger = logging.getLogger(__name__)
 
+@perf_trace.traced("db.shipyard_download")
 async def download_regional_shipyard_data(
     center_system_name: str,
     radius_ly: int,
@@ -66,8 +68,7 @@ async def download_regional_shipyard_data(
                 if progress_callback: progress_callback("Aucun système trouvé dans la sphère.", 100)
                 # Sauvegarder un fichier vide structuré pour indiquer que la recherche a eu lieu
                 all_shipyards_data["updatedAt"] = datetime.now(timezone.utc).isoformat()
-                with open(SHIPYARD_DATA_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(all_shipyards_data, f, indent=2)
+                _save_shipyard_data(all_shipyards_data)
                 return all_shipyards_data
 
 
@@ -76,6 +77,7 @@ async def download_regional_shipyard_data(
                 progress_callback(f"{total_systems_in_sphere} systèmes trouvés. Récupération des stations...", 5)
 
             semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
+            perf_metrics.set_gauge(perf_metrics.HTTP_CONCURRENCY_LIMIT, CONCURRENCY_LIMIT, "shipyard")
             systems_processed_count = 0
 
             async def process_system(system_info_from_sphere):
@@ -159,8 +161,7 @@ async def download_regional_shipyard_data(
                     }
             
             all_shipyards_data["updatedAt"] = datetime.now(timezone.utc).isoformat()
-            with open(SHIPYARD_DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(all_shipyards_data, f, indent=2)
+            _save_shipyard_data(all_shipyards_data)
             
             logger.info(f"Données régionales des chantiers navals sauvegardées dans {SHIPYARD_DATA_FILE}.")
             if progress_callback:
@@ -179,23 +180,24 @@ async def download_regional_shipyard_data(
             return None # Ou lever l'exception
 
 
+def _save_shipyard_data(all_shipyards_data):
+    stations_count = sum(len(sys_data.get("stations", [])) for sys_data in all_shipyards_data["systems_with_shipyards"].values())
+    # Fin de rafraîchissement : publié immédiatement, écrit sur disque en arrière-plan
+    dataset_manager.save_dataset(dataset_manager.DATASET_SHIPYARD, all_shipyards_data, counts={"stations": stations_count})
+
+
 def load_shipyard_data_from_file():
-    # ... (code inchangé) ...
-    if os.path.exists(SHIPYARD_DATA_FILE):
-        try:
-            with open(SHIPYARD_DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            logger.info(f"Données de chantier naval chargées depuis {SHIPYARD_DATA_FILE}.")
-            return data
-        except Exception as e:
-            logger.exception(f"Erreur lors du chargement de {SHIPYARD_DATA_FILE}: {e}")
-            return None
+    """
+    Données des chantiers navals (lecture seule), partagées via dataset_manager :
+    le snapshot n'est relu que s'il a changé sur disque.
+    """
+    if dataset_manager.dataset_exists(dataset_manager.DATASET_SHIPYARD):
+        return dataset_manager.get_dataset(dataset_manager.DATASET_SHIPYARD)
     logger.info(f"Le fichier de données de chantier naval {SHIPYARD_DATA_FILE} n'existe pas.")
     return None
 
 def get_shipyard_db_update_time_str():
-    # ... (code inchangé) ...
-    data = load_shipyard_data_from_file()
+    data = (dataset_manager.get_dataset_header(dataset_manager.DATASET_SHIPYARD) or {}).get("meta") # En-tête seul
     if data and "updatedAt" in data:
         try:
             updated_at_iso = data["updatedAt"]
@@ -9,6 +9,7 @@ from constants import (
     # STATION_PAD_SIZE_MAP, # Non utilisé directement ici, mais utile pour référence
     STATION_TYPE_TO_PAD_SIZE_LETTER # NOUVEL IMPORT
 )
+import perf_trace
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +19,19 @@ def normalize_ship_name(name: str) -> str:
         return ""
     return name.lower().replace(" ", "").replace("-", "").replace("_", "").replace("mk", "mark")
 
+def build_ship_systems_index(all_shipyard_data):
+    """Index dérivé : nom de vaisseau EDSM normalisé -> ensemble des systèmes où au moins une station le vend."""
+    ship_systems_index = {}
+    for system_name, system_data in all_shipyard_data.get("systems_with_shipyards", {}).items():
+        for station_details in system_data.get("stations", []):
+            for ship_sold_entry in station_details.get("ships", []):
+                ship_sold_name_edsm = ship_sold_entry if isinstance(ship_sold_entry, str) else \
+                    ship_sold_entry.get("name") if isinstance(ship_sold_entry, dict) else None
+                if isinstance(ship_sold_name_edsm, str) and ship_sold_name_edsm:
+                    ship_systems_index.setdefault(normalize_ship_name(ship_sold_name_edsm), set()).add(system_name)
+    return ship_systems_index
+
+@perf_trace.traced("optimizer.ship_search")
 def find_stations_selling_ship(
     ship_name_to_find: str,
     all_shipyard_data: dict,
@@ -25,11 +39,13 @@ def find_stations_selling_ship(
     max_distance_ly_filter: float = None,
     include_planetary: bool = True,
     include_fleet_carriers: bool = True,
-    max_station_dist_ls: float = None
+    max_station_dist_ls: float = None,
+    ship_systems_index: dict = None
 ):
     """
     Trouve les stations vendant un vaisseau spécifique, avec filtres optionnels.
-    Ajoute la taille de pad déduite.
+    Ajoute la taille de pad déduite. Avec `ship_systems_index` (voir build_ship_systems_index),
+    seuls les systèmes vendant le vaisseau sont parcourus.
     """
     if not all_shipyard_data or "systems_with_shipyards" not in all_shipyard_data:
         logger.warning("find_stations_selling_ship: Pas de données de chantier naval fournies ou format incorrect.")
@@ -57,7 +73,14 @@ def find_stations_selling_ship(
 
     logger.info(f"Recherche du vaisseau normalisé (EDSM key/name): '{normalized_target_ship_edsm_name}' (basé sur la sélection: '{ship_name_to_find}')")
 
-    for system_name, system_data in all_shipyard_data["systems_with_shipyards"].items():
+    systems_with_shipyards = all_shipyard_data["systems_with_shipyards"]
+    if ship_systems_index is not None:
+        candidate_systems = ((name, systems_with_shipyards[name]) for name in ship_systems_index.get(normalized_target_ship_edsm_name, ())
+                             if name in systems_with_shipyards)
+    else:
+        candidate_systems = systems_with_shipyards.items()
+
+    for system_name, system_data in candidate_systems:
         system_coords = system_data.get("coords")
         distance_ly = float('inf')
 
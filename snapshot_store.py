@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Format de snapshot compact et versionné pour les caches de données (marchés, chantiers, équipement).
+
+Structure du fichier :
+    MAGIC (8 octets) | longueur de l'en-tête (uint32 LE) | en-tête JSON | corps
+L'en-tête (non compressé, quelques centaines d'octets quel que soit le nombre de sections) contient
+les métadonnées scalaires (updatedAt, sourceSystem, radius, ...), des compteurs et la position des
+sections "rest" et "index" dans le corps. Le corps contient une section zlib par système (clé
+`sectionsKey`), la section "rest" pour les autres champs, puis "index" (nom -> position de chaque
+section). Les vérifications de fraîcheur ne lisent que l'en-tête ; l'index n'est décodé qu'au
+chargement et les sections qu'à leur premier accès. Les fichiers au format 1 (index dans l'en-tête)
+restent lisibles.
+"""
+import atexit
+import json
+import os
+import shutil
+import struct
+import threading
+import zlib
+import logging
+from collections.abc import Mapping
+
+from constants import SNAPSHOT_FORMAT_VERSION, SNAPSHOT_COMPRESSION_LEVEL, SNAPSHOT_WRITE_COALESCE_DELAY_S, SNAPSHOT_FLUSH_TIMEOUT_S
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"EDMOSNAP"
+_HEADER_LEN_STRUCT = struct.Struct("<I")
+_PREFIX_SIZE = len(SNAPSHOT_MAGIC) + _HEADER_LEN_STRUCT.size
+_LEGACY_FORMATS = (1,) # Index des sections dans l'en-tête
+
+# ---- Écriture différée (write-behind) ----
+_pending_writes = {} # chemin -> (data, sections_key, counts, on_written) ; seule la dernière demande par fichier est gardée
+_writes_in_progress = set()
+_writes_cond = threading.Condition()
+_writer_thread = None
+
+
+class LazySectionMap(Mapping):
+    """
+    Mapping en lecture seule {système: données} dont chaque valeur est décompressée au premier accès.
+    `overrides` (voir with_updates) remplace ou ajoute des sections sans toucher au corps compressé.
+    """
+
+    def __init__(self, body, section_index, overrides=None, decoded=None):
+        self._body = body
+        self._index = section_index # nom -> (offset, longueur) dans le corps
+        self._overrides = overrides or {}
+        self._decoded = decoded if decoded is not None else {} # Partagé entre versions : même corps, mêmes valeurs
+
+    def __getitem__(self, name):
+        if name in self._overrides:
+            return self._overrides[name]
+        try:
+            return self._decoded[name]
+        except KeyError:
+            offset, length = self._index[name] # KeyError si la section n'existe pas
+            value = self._decoded[name] = _decode_blob(self._body, offset, length)
+            return value
+
+    def __iter__(self):
+        yield from self._index
+        yield from (name for name in self._overrides if name not in self._index)
+
+    def __len__(self):
+        return len(self._index) + sum(1 for name in self._overrides if name not in self._index)
+
+    def __contains__(self, name):
+        return name in self._index or name in self._overrides
+
+    def decoded_count(self):
+        return len(self._decoded)
+
+    def raw_blob(self, name):
+        """Section encore compressée telle que lue sur disque (réutilisable à l'écriture), ou None si remplacée."""
+        if name in self._overrides or name not in self._index:
+            return None
+        offset, length = self._index[name]
+        return self._body[offset:offset + length]
+
+    def with_updates(self, updates):
+        """Nouvelle version avec les sections `updates` remplacées ou ajoutées (l'original n'est pas modifié)."""
+        return LazySectionMap(self._body, self._index, {**self._overrides, **updates}, self._decoded)
+
+
+def _encode_blob(value):
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode('utf-8'), SNAPSHOT_COMPRESSION_LEVEL)
+
+
+def _decode_blob(body, offset, length):
+    return json.loads(zlib.decompress(body[offset:offset + length]).decode('utf-8'))
+
+
+def split_snapshot_fields(data, sections_key=None):
+    """Sépare les champs scalaires (en-tête) des autres champs (section "rest") ; ignore `sections_key`."""
+    meta, rest = {}, {}
+    for key, value in data.items():
+        if key == sections_key:
+            continue
+        if value is None or isinstance(value, (str, int, float, bool)):
+            meta[key] = value
+        else:
+            rest[key] = value
+    return meta, rest
+
+
+def encode_snapshot(data, sections_key=None, counts=None):
+    """
+    Sérialise `data` (dict) au format snapshot. `data[sections_key]` (dict système -> données) est découpé
+    en sections ; les champs scalaires vont dans l'en-tête, les autres dans la section "rest".
+    """
+    meta, rest = split_snapshot_fields(data, sections_key)
+
+    blobs, section_index, offset = [], {}, 0
+    sections = (data.get(sections_key) or {}) if sections_key else {}
+    for name in sections:
+        # Sections inchangées d'un snapshot chargé : recopiées compressées, sans décodage ni recompression
+        blob = sections.raw_blob(name) if isinstance(sections, LazySectionMap) else None
+        if blob is None:
+            blob = _encode_blob(sections[name])
+        section_index[name] = [offset, len(blob)]
+        blobs.append(blob); offset += len(blob)
+    tail, header = _encode_tail(meta, rest, section_index, offset, sections_key, counts)
+    header_bytes = json.dumps(header, separators=(",", ":")).encode('utf-8')
+    return b"".join([SNAPSHOT_MAGIC, _HEADER_LEN_STRUCT.pack(len(header_bytes)), header_bytes] + blobs + [tail])
+
+
+def _encode_tail(meta, rest, section_index, sections_size, sections_key, counts):
+    """Sections "rest" et "index" qui suivent les sections du corps, et l'en-tête qui les référence."""
+    rest_blob, index_blob = _encode_blob(rest or {}), _encode_blob(section_index)
+    header = {
+        "format": SNAPSHOT_FORMAT_VERSION,
+        "meta": meta,
+        "counts": dict(counts or {}, sections=len(section_index)),
+        "sectionsKey": sections_key,
+        "rest": [sections_size, len(rest_blob)],
+        "index": [sections_size + len(rest_blob), len(index_blob)]
+    }
+    return rest_blob + index_blob, header
+
+
+def atomic_write_bytes(path, payload):
+    """Écrit dans un fichier temporaire, fsync, puis renomme : un crash ne laisse jamais un fichier tronqué."""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path) # Atomique sur le même volume (POSIX et Windows)
+    except OSError:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+
+def write_snapshot(path, data, sections_key=None, counts=None):
+    """Écrit `data` au format snapshot de façon synchrone et atomique (voir encode_snapshot)."""
+    payload = encode_snapshot(data, sections_key, counts)
+    atomic_write_bytes(path, payload)
+    logger.debug(f"Snapshot written to {path}: {len(payload)} bytes.")
+
+
+class SnapshotBuilder:
+    """
+    Construction incrémentale d'un snapshot, section par section, en mémoire bornée : chaque section est
+    compressée puis ajoutée à un fichier de travail. `checkpoint()` retourne un état (index + taille) qui
+    permet de reprendre la construction après une interruption (voir bulk_importer).
+    """
+
+    def __init__(self, work_path, state=None):
+        self.work_path = work_path
+        self.section_index = dict((state or {}).get("sections", {}))
+        self.size = (state or {}).get("size", 0)
+        if state and os.path.exists(work_path):
+            self._file = open(work_path, 'r+b')
+            self._file.truncate(self.size) # Oublie les sections écrites après le dernier point de reprise
+            self._file.seek(self.size)
+        else:
+            self.section_index, self.size = {}, 0
+            self._file = open(work_path, 'wb')
+
+    def add_section(self, name, value):
+        blob = _encode_blob(value)
+        self._file.write(blob)
+        self.section_index[name] = [self.size, len(blob)] # Un doublon remplace la section précédente
+        self.size += len(blob)
+
+    def __contains__(self, name):
+        return name in self.section_index
+
+    def checkpoint(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {"sections": dict(self.section_index), "size": self.size}
+
+    def finish(self, path, meta, rest=None, sections_key=None, counts=None):
+        """Écrit le snapshot final (en-tête + sections + "rest") de façon atomique et supprime le fichier de travail."""
+        self._file.close()
+        tail, header = _encode_tail(meta, rest, self.section_index, self.size, sections_key, counts)
+        header_bytes = json.dumps(header, separators=(",", ":")).encode('utf-8')
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as out, open(self.work_path, 'rb') as body:
+                out.write(SNAPSHOT_MAGIC + _HEADER_LEN_STRUCT.pack(len(header_bytes)) + header_bytes)
+                shutil.copyfileobj(body, out, 1024 * 1024) # Copie par blocs : le corps n'est jamais chargé en entier
+                out.write(tail)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, path)
+        except OSError:
+            try: os.remove(tmp_path)
+            except OSError: pass
+            raise
+        self.discard()
+        logger.info(f"Snapshot {path} built incrementally: {len(self.section_index)} sections, {self.size} bytes of sections.")
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+        try: os.remove(self.work_path)
+        except OSError: pass
+
+
+def _writer_loop():
+    while True:
+        with _writes_cond:
+            while not _pending_writes:
+                _writes_cond.wait()
+        # Laisse arriver les demandes rapprochées : seule la plus récente par fichier sera écrite
+        threading.Event().wait(SNAPSHOT_WRITE_COALESCE_DELAY_S)
+        with _writes_cond:
+            path = next(iter(_pending_writes))
+            data, sections_key, counts, on_written = _pending_writes.pop(path)
+            _writes_in_progress.add(path)
+        try:
+            write_snapshot(path, data, sections_key, counts)
+            logger.info(f"Snapshot {path} persisted in background.")
+            if on_written:
+                on_written(path)
+        except Exception:
+            logger.exception(f"Background write of snapshot {path} failed.")
+        finally:
+            with _writes_cond:
+                _writes_in_progress.discard(path)
+                _writes_cond.notify_all()
+
+
+def schedule_snapshot_write(path, data, sections_key=None, counts=None, on_written=None):
+    """
+    Demande l'écriture de `data` par le thread d'écriture (sérialisation + compression + écriture atomique).
+    Retourne immédiatement ; `data` ne doit plus être modifié. Les demandes successives pour un même
+    fichier sont fusionnées. `on_written(path)` est appelé depuis le thread d'écriture après succès.
+    """
+    global _writer_thread
+    with _writes_cond:
+        if path in _pending_writes:
+            logger.debug(f"Snapshot write for {path} coalesced with a pending one.")
+        _pending_writes[path] = (data, sections_key, counts, on_written)
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, name="SnapshotWriter", daemon=True)
+            _writer_thread.start()
+        _writes_cond.notify_all()
+
+
+def flush_pending_writes(timeout=SNAPSHOT_FLUSH_TIMEOUT_S):
+    """Attend la fin des écritures en attente (appelé à la fermeture). Retourne False si le délai est dépassé."""
+    with _writes_cond:
+        done = _writes_cond.wait_for(lambda: not _pending_writes and not _writes_in_progress, timeout)
+    if not done:
+        logger.warning(f"Snapshot writes still pending after {timeout}s: {list(_pending_writes) + list(_writes_in_progress)}")
+    return done
+
+
+atexit.register(flush_pending_writes)
+
+
+def _read_header_from(f, path):
+    prefix = f.read(_PREFIX_SIZE)
+    if len(prefix) < _PREFIX_SIZE or not prefix.startswith(SNAPSHOT_MAGIC):
+        logger.warning(f"{path} is not a valid snapshot file.")
+        return None
+    (header_len,) = _HEADER_LEN_STRUCT.unpack(prefix[len(SNAPSHOT_MAGIC):])
+    header = json.loads(f.read(header_len).decode('utf-8'))
+    if header.get("format") != SNAPSHOT_FORMAT_VERSION and header.get("format") not in _LEGACY_FORMATS:
+        logger.info(f"Snapshot {path} has format {header.get('format')}, expected {SNAPSHOT_FORMAT_VERSION}. Ignoring it.")
+        return None
+    return header
+
+
+def read_snapshot_header(path):
+    """Lit uniquement l'en-tête (meta, counts, positions de "rest" et "index"). Retourne None si absent ou invalide."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return _read_header_from(f, path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"Could not read snapshot header from {path}: {e}")
+        return None
+
+
+def read_snapshot_meta(path):
+    """Métadonnées scalaires (updatedAt, sourceSystem, radius, ...) du snapshot, ou None."""
+    header = read_snapshot_header(path)
+    return header["meta"] if header else None
+
+
+def load_snapshot(path):
+    """
+    Charge un snapshot : retourne un dict avec les champs d'origine, où `data[sectionsKey]` est un
+    LazySectionMap (sections décompressées à la demande). Retourne None si absent ou invalide.
+    Le corps compressé est gardé en mémoire plutôt que mappé (mmap) : un fichier mappé ne peut pas
+    être remplacé sous Windows pendant qu'un onglet garde le snapshot.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            header = _read_header_from(f, path)
+            if not header:
+                return None
+            body = f.read()
+        data = dict(header["meta"])
+        rest_offset, rest_length = header["rest"]
+        data.update(_decode_blob(body, rest_offset, rest_length))
+        if header.get("sectionsKey"):
+            section_index = header["sections"] if "sections" in header else _decode_blob(body, *header["index"])
+            data[header["sectionsKey"]] = LazySectionMap(body, {name: tuple(pos) for name, pos in section_index.items()})
+        return data
+    except (OSError, ValueError, KeyError, zlib.error, struct.error) as e:
+        logger.error(f"Could not load snapshot {path}: {e}")
+        return None